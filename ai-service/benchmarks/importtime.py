@@ -0,0 +1,98 @@
+"""
+启动导入耗时分析 - 基于 python -X importtime
+
+在子进程中导入 main，按顶层包汇总导入耗时，并记录是否导入了深度学习框架和进程内存峰值。
+
+用法（在 ai-service 目录下）:
+    python -m benchmarks.importtime --profile api --profile full
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+from typing import Dict, Any, List
+
+SERVICE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# api部署模式下不应出现的模块
+HEAVY_MODULES = ["torch", "diffusers", "transformers", "audiocraft", "librosa", "numpy"]
+
+_PROBE = """
+import json, resource, sys, time
+start = time.perf_counter()
+import main
+elapsed = time.perf_counter() - start
+peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({
+    "wall_ms": round(elapsed * 1000, 1),
+    "peak_rss_bytes": peak if sys.platform == "darwin" else peak * 1024,
+    "heavy_modules": [name for name in %r if name in sys.modules],
+    "module_count": len(sys.modules)
+}))
+""" % (HEAVY_MODULES,)
+
+def parse_importtime(stderr: str) -> Dict[str, float]:
+    """把 -X importtime 输出按顶层包汇总为自身耗时（毫秒）"""
+    totals: Dict[str, float] = defaultdict(float)
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3:
+            continue
+        self_us, _, name = parts
+        try:
+            totals[name.strip().split(".")[0]] += int(self_us) / 1000
+        except ValueError:
+            continue
+    return dict(totals)
+
+def measure(profile: str, top: int = 15) -> Dict[str, Any]:
+    """测量指定部署模式下导入 main 的耗时"""
+    env = {**os.environ, "DEPLOYMENT_PROFILE": profile}
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _PROBE],
+        cwd=SERVICE_ROOT, env=env, capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        return {"profile": profile, "error": proc.stderr.strip().splitlines()[-1:] or ["unknown error"]}
+
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    packages = parse_importtime(proc.stderr)
+    result.update({
+        "profile": profile,
+        "import_total_ms": round(sum(packages.values()), 1),
+        "top_packages_ms": {
+            name: round(ms, 1) for name, ms in sorted(packages.items(), key=lambda item: -item[1])[:top]
+        }
+    })
+    return result
+
+def measure_profiles(profiles: List[str]) -> Dict[str, Any]:
+    return {profile: measure(profile) for profile in profiles}
+
+def main():
+    parser = argparse.ArgumentParser(description="AI服务启动导入耗时")
+    parser.add_argument("--profile", action="append", choices=["api", "full"],
+                        help="部署模式，可重复，默认 api 和 full")
+    parser.add_argument("--output", default="", help="结果写入JSON文件")
+    args = parser.parse_args()
+
+    report = measure_profiles(args.profile or ["api", "full"])
+    for profile, result in report.items():
+        if "error" in result:
+            print(f"{profile:5s} 失败: {result['error'][0]}")
+            continue
+        print(f"{profile:5s} 导入 {result['wall_ms']:.0f}ms  峰值内存 {result['peak_rss_bytes'] / 2**20:.0f}MB  "
+              f"深度学习模块: {', '.join(result['heavy_modules']) or '无'}")
+        for name, ms in result["top_packages_ms"].items():
+            print(f"      {name:30s} {ms:8.1f}ms")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+闭环负载生成与延迟统计
+"""
+import asyncio
+import math
+import time
+from collections import Counter
+from typing import Awaitable, Callable, Dict, List, Any
+
+# 单次请求：返回 "ok" 或失败原因（HTTP状态码、工作流终态等）
+RequestFn = Callable[[int], Awaitable[str]]
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """最近秩百分位数"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(q / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+def summarize(latencies: List[float], outcomes: Counter, wall_seconds: float) -> Dict[str, Any]:
+    """汇总一轮负载的吞吐和延迟（毫秒）"""
+    ordered = sorted(latencies)
+    total = sum(outcomes.values())
+    ok = outcomes.get("ok", 0)
+    return {
+        "requests": total,
+        "ok": ok,
+        "error_rate": round((total - ok) / total, 4) if total else 0.0,
+        "outcomes": dict(outcomes),
+        "wall_seconds": round(wall_seconds, 3),
+        "throughput_rps": round(ok / wall_seconds, 3) if wall_seconds else 0.0,
+        "latency_ms": {
+            "mean": round(sum(ordered) / len(ordered) * 1000, 2) if ordered else 0.0,
+            "p50": round(percentile(ordered, 50) * 1000, 2),
+            "p95": round(percentile(ordered, 95) * 1000, 2),
+            "p99": round(percentile(ordered, 99) * 1000, 2),
+            "max": round(ordered[-1] * 1000, 2) if ordered else 0.0
+        }
+    }
+
+async def run_load(request: RequestFn, concurrency: int, total_requests: int) -> Dict[str, Any]:
+    """
+    以固定并发执行 total_requests 个请求
+
+    每个worker完成一个请求后立即发起下一个（闭环），因此吞吐量反映服务在该并发下的处理能力。
+    延迟只统计成功的请求，失败按原因分类计数。
+    """
+    latencies: List[float] = []
+    outcomes: Counter = Counter()
+    next_index = 0
+
+    async def worker():
+        nonlocal next_index
+        while next_index < total_requests:
+            index = next_index
+            next_index += 1
+            start = time.perf_counter()
+            try:
+                outcome = await request(index)
+            except Exception as e:
+                outcome = type(e).__name__
+            if outcome == "ok":
+                latencies.append(time.perf_counter() - start)
+            outcomes[outcome] += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(min(concurrency, total_requests))))
+    return summarize(latencies, outcomes, time.perf_counter() - start)
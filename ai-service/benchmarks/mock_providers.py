@@ -0,0 +1,344 @@
+"""
+本地模拟AI提供商 - 离线基准测试使用
+
+模拟 Groq、Hugging Face、Stability、Replicate 和 Ollama 的HTTP接口，
+每个提供商单独监听一个端口，延迟、错误率和限流都可以配置。
+
+单独运行:
+    python -m benchmarks.mock_providers --profile huggingface:latency=800,error=0.2
+"""
+import argparse
+import base64
+import io
+import json
+import random
+import struct
+import threading
+import time
+import uuid
+import wave
+import zlib
+from dataclasses import dataclass, asdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+PROVIDERS = ["groq", "huggingface", "stability", "replicate", "ollama"]
+
+@dataclass
+class ProviderProfile:
+    """模拟提供商的行为"""
+    latency_ms: float = 200.0
+    jitter_ms: float = 50.0
+    error_rate: float = 0.0
+    rate_limit: int = 0  # 每秒允许的请求数，0表示不限流
+
+    def sample_latency(self) -> float:
+        return max(0.0, random.gauss(self.latency_ms, self.jitter_ms)) / 1000
+
+    @classmethod
+    def parse(cls, spec: str) -> "ProviderProfile":
+        """解析 latency=200,jitter=50,error=0.1,rps=20"""
+        keys = {"latency": "latency_ms", "jitter": "jitter_ms", "error": "error_rate", "rps": "rate_limit"}
+        values = {}
+        for item in filter(None, spec.split(",")):
+            key, _, value = item.partition("=")
+            if key not in keys:
+                raise ValueError(f"未知的配置项: {key}")
+            values[keys[key]] = int(value) if key == "rps" else float(value)
+        return cls(**values)
+
+# 默认延迟大致对应各提供商的真实量级
+DEFAULT_PROFILES: Dict[str, ProviderProfile] = {
+    "groq": ProviderProfile(latency_ms=300, jitter_ms=80),
+    "huggingface": ProviderProfile(latency_ms=800, jitter_ms=200, error_rate=0.05),
+    "stability": ProviderProfile(latency_ms=1500, jitter_ms=300),
+    "replicate": ProviderProfile(latency_ms=3000, jitter_ms=500),
+    "ollama": ProviderProfile(latency_ms=600, jitter_ms=150)
+}
+
+def _png(width: int = 64, height: int = 64) -> bytes:
+    """生成纯色PNG，不依赖PIL"""
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        body = kind + data
+        return struct.pack(">I", len(data)) + body + struct.pack(">I", zlib.crc32(body) & 0xFFFFFFFF)
+    rows = b"".join(b"\x00" + bytes((135, 206, 235)) * width for _ in range(height))
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(rows)) + chunk(b"IEND", b"")
+
+def _wav(seconds: float = 1.0, sample_rate: int = 16000) -> bytes:
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(b"\x00\x00" * int(seconds * sample_rate))
+    return buffer.getvalue()
+
+_PNG = _png()
+_WAV = _wav()
+
+class _RateLimiter:
+    """按秒计数的固定窗口限流"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._window = 0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        if self.limit <= 0:
+            return True
+        with self._lock:
+            window = int(time.time())
+            if window != self._window:
+                self._window, self._count = window, 0
+            self._count += 1
+            return self._count <= self.limit
+
+class MockProviderServer(ThreadingHTTPServer):
+    """单个模拟提供商"""
+    daemon_threads = True
+
+    def __init__(self, provider: str, profile: ProviderProfile, host: str = "127.0.0.1", port: int = 0):
+        if provider not in PROVIDERS:
+            raise ValueError(f"不支持的提供商: {provider}")
+        super().__init__((host, port), _MockHandler)
+        self.provider = provider
+        self.profile = profile
+        self.limiter = _RateLimiter(profile.rate_limit)
+        self.predictions: Dict[str, float] = {}  # Replicate预测ID -> 完成时间
+        self.stats = {"requests": 0, "errors": 0, "rate_limited": 0}
+        self._stats_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, key: str):
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    def start(self) -> "MockProviderServer":
+        self._thread = threading.Thread(target=self.serve_forever, name=f"mock-{self.provider}", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+class _MockHandler(BaseHTTPRequestHandler):
+    server: MockProviderServer
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: bytes, content_type: str = "application/json", headers: Optional[Dict] = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _json(self, status: int, payload, headers: Optional[Dict] = None):
+        self._send(status, json.dumps(payload, ensure_ascii=False).encode(), headers=headers)
+
+    def _stream_chat(self, model: str, content: str, chunk_chars: int = 8, interval: float = 0.02):
+        """以OpenAI兼容的SSE格式分块返回（分块传输编码），每块之间间隔 interval 秒"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        pieces = [content[i:i + chunk_chars] for i in range(0, len(content), chunk_chars)]
+        events = [
+            {"id": completion_id, "model": model, "choices": [{"index": 0, "delta": {"content": piece}}]}
+            for piece in pieces
+        ]
+        events.append({"id": completion_id, "model": model,
+                       "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                       "x_groq": {"usage": {"total_tokens": len(content)}}})
+        for event in events:
+            self._write_chunk(f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode())
+            time.sleep(interval)
+        self._write_chunk(b"data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def _read_json(self) -> Dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return {}
+        try:
+            return json.loads(self.rfile.read(length))
+        except ValueError:
+            return {}
+
+    def _admit(self, simulate_latency: bool = True) -> bool:
+        """限流、延迟和随机错误，返回False表示已经回复了错误"""
+        server = self.server
+        server.count("requests")
+        if not server.limiter.allow():
+            server.count("rate_limited")
+            self._json(429, {"error": "rate limited"}, headers={"Retry-After": "1"})
+            return False
+        if simulate_latency:
+            time.sleep(server.profile.sample_latency())
+        if random.random() < server.profile.error_rate:
+            server.count("errors")
+            self._json(503, {"error": f"mock {server.provider} unavailable"})
+            return False
+        return True
+
+    def do_GET(self):
+        provider = self.server.provider
+        if provider == "ollama" and self.path == "/api/tags":
+            self._json(200, {"models": [{"name": "llama2:latest"}, {"name": "mistral:latest"}]})
+        elif provider == "replicate" and self.path.startswith("/v1/predictions/"):
+            prediction_id = self.path.rsplit("/", 1)[-1]
+            ready_at = self.server.predictions.get(prediction_id)
+            if ready_at is None:
+                self._json(404, {"detail": "Not found"})
+            elif time.time() < ready_at:
+                self._json(200, {"id": prediction_id, "status": "processing"})
+            else:
+                self._json(200, {
+                    "id": prediction_id,
+                    "status": "succeeded",
+                    "output": f"{self.server.base_url}/files/{prediction_id}.wav"
+                })
+        elif provider == "replicate" and self.path.startswith("/files/"):
+            self._send(200, _WAV, "audio/wav")
+        # 就绪探测，不计入统计也不模拟延迟
+        elif provider == "groq" and self.path.endswith("/models"):
+            self._json(200, {"object": "list", "data": [{"id": "llama3-8b-8192"}]})
+        elif provider == "huggingface" and self.path.startswith("/models/"):
+            self._json(200, {"loaded": True})
+        elif provider == "stability" and self.path.endswith("/engines/list"):
+            self._json(200, [{"id": "stable-diffusion-v1-6", "type": "PICTURE"}])
+        elif provider == "replicate" and self.path == "/v1/account":
+            self._json(200, {"type": "user", "username": "mock"})
+        else:
+            self._json(404, {"error": "not found"})
+
+    def do_POST(self):
+        provider = self.server.provider
+        body = self._read_json()
+
+        if provider == "groq" and self.path.endswith("/chat/completions"):
+            if not self._admit():
+                return
+            prompt = body.get("messages", [{}])[-1].get("content", "")
+            if body.get("stream"):
+                self._stream_chat(body.get("model"), f"模拟回复: {prompt[:200]}")
+                return
+            self._json(200, {
+                "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+                "model": body.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": f"模拟回复: {prompt[:200]}"},
+                             "finish_reason": "stop"}]
+            })
+
+        elif provider == "huggingface" and self.path.startswith("/models/"):
+            if not self._admit():
+                return
+            model = self.path[len("/models/"):]
+            if "diffusion" in model:
+                self._send(200, _PNG, "image/png")
+            else:
+                self._json(200, [{"generated_text": f"{body.get('inputs', '')} 模拟生成的文本内容。"}])
+
+        elif provider == "stability" and self.path.endswith("/text-to-image"):
+            if not self._admit():
+                return
+            self._json(200, {"artifacts": [
+                {"base64": base64.b64encode(_PNG).decode(), "seed": 0, "finishReason": "SUCCESS"}
+            ]})
+
+        elif provider == "replicate" and self.path == "/v1/predictions":
+            # 预测在后台"运行"，轮询时按延迟决定是否完成
+            if not self._admit(simulate_latency=False):
+                return
+            prediction_id = uuid.uuid4().hex
+            self.server.predictions[prediction_id] = time.time() + self.server.profile.sample_latency()
+            self._json(201, {"id": prediction_id, "status": "starting"})
+
+        elif provider == "ollama" and self.path == "/api/generate":
+            if not self._admit():
+                return
+            self._json(200, {"model": body.get("model"), "response": f"模拟回复: {body.get('prompt', '')[:200]}",
+                             "done": True})
+
+        else:
+            self._json(404, {"error": "not found"})
+
+def start_mock_providers(profiles: Optional[Dict[str, ProviderProfile]] = None) -> Dict[str, MockProviderServer]:
+    """启动所有模拟提供商，未配置的使用默认参数"""
+    merged = dict(DEFAULT_PROFILES)
+    merged.update(profiles or {})
+    return {name: MockProviderServer(name, merged[name]).start() for name in PROVIDERS}
+
+def provider_env(servers: Dict[str, MockProviderServer]) -> Dict[str, str]:
+    """让AI服务指向模拟提供商的环境变量"""
+    return {
+        "GROQ_BASE_URL": f"{servers['groq'].base_url}/openai/v1",
+        "GROQ_API_KEY": "mock-groq-key",
+        "HUGGINGFACE_BASE_URL": f"{servers['huggingface'].base_url}/models",
+        "HUGGINGFACE_TOKEN": "mock-hf-token",
+        "STABILITY_BASE_URL": f"{servers['stability'].base_url}/v1",
+        "STABILITY_API_KEY": "mock-stability-key",
+        "REPLICATE_BASE_URL": f"{servers['replicate'].base_url}/v1",
+        "REPLICATE_API_TOKEN": "mock-replicate-token",
+        "REPLICATE_POLL_INTERVAL": "0.1",
+        "OLLAMA_BASE_URL": servers["ollama"].base_url,
+        # 未模拟的提供商保持禁用，避免访问外网
+        "OPENROUTER_API_KEY": "",
+        "TOGETHER_API_KEY": "",
+        # 客户端限流与模拟提供商的限流一致，未设置rps的提供商不限流
+        "PROVIDER_RATE_LIMITS": json.dumps({
+            name: {"rpm": server.profile.rate_limit * 60}
+            for name, server in servers.items() if server.profile.rate_limit
+        })
+    }
+
+def parse_profiles(specs: List[str]) -> Dict[str, ProviderProfile]:
+    """解析 --profile groq:latency=100,error=0.1"""
+    profiles = {}
+    for spec in specs:
+        name, _, options = spec.partition(":")
+        if name not in PROVIDERS:
+            raise ValueError(f"不支持的提供商: {name}")
+        profiles[name] = ProviderProfile.parse(options)
+    return profiles
+
+def main():
+    parser = argparse.ArgumentParser(description="启动模拟AI提供商")
+    parser.add_argument("--profile", action="append", default=[],
+                        help="提供商行为，如 huggingface:latency=800,jitter=100,error=0.2,rps=10")
+    args = parser.parse_args()
+
+    servers = start_mock_providers(parse_profiles(args.profile))
+    for name, server in servers.items():
+        print(f"{name:12s} {server.base_url}  {asdict(server.profile)}")
+    print("\n# AI服务环境变量")
+    for key, value in provider_env(servers).items():
+        print(f"export {key}={value!r}")
+
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        for server in servers.values():
+            server.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""
+AI服务离线基准测试
+
+启动模拟提供商和一个指向它们的AI服务进程，在不同并发下测量各接口的吞吐和延迟，
+结果写入JSON文件，可与之前的结果对比发现性能回退。
+
+用法（在 ai-service 目录下）:
+    python -m benchmarks.run --concurrency 1,4,16 --requests 40
+    python -m benchmarks.run --scenarios text_generate --profile huggingface:error=0.3
+    python -m benchmarks.run --baseline benchmarks/results/baseline.json --threshold 0.2
+    python -m benchmarks.run --import-time --deployment-profile api
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from .importtime import measure_profiles
+from .load import run_load
+from .mock_providers import PROVIDERS, parse_profiles, provider_env, start_mock_providers
+from .scenarios import Scenario, default_scenarios
+
+SERVICE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(SERVICE_ROOT, "benchmarks", "results")
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=SERVICE_ROOT, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def start_service(env: Dict[str, str], port: int) -> subprocess.Popen:
+    """在子进程中启动AI服务"""
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        cwd=SERVICE_ROOT,
+        env={**os.environ, **env}
+    )
+
+async def wait_for_service(base_url: str, timeout: float = 120.0) -> List[str]:
+    """等待服务就绪，返回已挂载的路由"""
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url, timeout=5.0) as client:
+        while time.monotonic() < deadline:
+            try:
+                response = await client.get("/openapi.json")
+                if response.status_code == 200:
+                    return list(response.json().get("paths", {}))
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.5)
+    raise TimeoutError(f"AI服务在 {timeout}s 内未就绪: {base_url}")
+
+async def run_scenario(base_url: str, scenario: Scenario, levels: List[int], requests: int,
+                       warmup: int) -> Dict[str, Any]:
+    """按并发级别依次压测单个场景"""
+    limits = httpx.Limits(max_connections=max(levels) * 2, max_keepalive_connections=max(levels) * 2)
+    async with httpx.AsyncClient(base_url=base_url, timeout=scenario.timeout, limits=limits) as client:
+        await scenario.setup(client)
+        if warmup:
+            await run_load(lambda i: scenario.request(client, i), 1, warmup)
+
+        results = {}
+        for level in levels:
+            summary = await run_load(lambda i: scenario.request(client, i), level, max(requests, level))
+            results[str(level)] = summary
+            print(f"  {scenario.name:30s} c={level:<4d} "
+                  f"{summary['throughput_rps']:8.2f} req/s  "
+                  f"p50={summary['latency_ms']['p50']:8.1f}ms  p95={summary['latency_ms']['p95']:8.1f}ms  "
+                  f"p99={summary['latency_ms']['p99']:8.1f}ms  errors={summary['error_rate']:.1%}")
+        return results
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[Dict[str, Any]]:
+    """
+    与基线结果对比，返回超过阈值的回退项
+
+    p95延迟上升或吞吐下降超过 threshold（比例）即视为回退；只对比两边都有的场景和并发级别。
+    """
+    regressions = []
+    for name, levels in current["scenarios"].items():
+        for level, summary in levels.items():
+            base = baseline.get("scenarios", {}).get(name, {}).get(level)
+            if not base:
+                continue
+            checks = [
+                ("p95_ms", base["latency_ms"]["p95"], summary["latency_ms"]["p95"], True),
+                ("throughput_rps", base["throughput_rps"], summary["throughput_rps"], False)
+            ]
+            for metric, before, after, higher_is_worse in checks:
+                if not before:
+                    continue
+                change = (after - before) / before
+                if (change > threshold) if higher_is_worse else (change < -threshold):
+                    regressions.append({
+                        "scenario": name, "concurrency": int(level), "metric": metric,
+                        "baseline": before, "current": after, "change": round(change, 4)
+                    })
+    return regressions
+
+async def run_benchmarks(args) -> Dict[str, Any]:
+    levels = [int(level) for level in args.concurrency.split(",")]
+    selected = set(args.scenarios.split(",")) if args.scenarios else None
+    scenarios = [s for s in default_scenarios() if selected is None or s.name in selected]
+
+    servers = start_mock_providers(parse_profiles(args.profile))
+    service = None
+    try:
+        if args.base_url:
+            base_url = args.base_url
+        else:
+            port = _free_port()
+            env = provider_env(servers)
+            env["TEXT_MODEL_PROVIDER"] = args.text_provider
+            env["CODE_MODEL_PROVIDER"] = args.text_provider
+            env["DEPLOYMENT_PROFILE"] = args.deployment_profile
+            service = start_service(env, port)
+            base_url = f"http://127.0.0.1:{port}"
+
+        routes = await wait_for_service(base_url)
+        print(f"AI服务就绪: {base_url}")
+
+        results: Dict[str, Any] = {}
+        skipped = []
+        for scenario in scenarios:
+            if not scenario.is_available(routes):
+                skipped.append(scenario.name)
+                print(f"  {scenario.name:30s} 跳过（路由未挂载）")
+                continue
+            results[scenario.name] = await run_scenario(base_url, scenario, levels, args.requests, args.warmup)
+
+        return {
+            "meta": {
+                "timestamp": datetime.now().isoformat(),
+                "commit": _git_commit(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "concurrency": levels,
+                "requests_per_level": args.requests,
+                "text_provider": args.text_provider,
+                "deployment_profile": args.deployment_profile,
+                "providers": {name: vars(server.profile) for name, server in servers.items()},
+                "skipped": skipped
+            },
+            "provider_stats": {name: dict(server.stats) for name, server in servers.items()},
+            "scenarios": results
+        }
+    finally:
+        if service is not None:
+            service.terminate()
+            try:
+                service.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                service.kill()
+        for server in servers.values():
+            server.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description="YouCreator.AI 离线基准测试")
+    parser.add_argument("--scenarios", default="", help="逗号分隔的场景名，默认全部")
+    parser.add_argument("--concurrency", default="1,4,16", help="逗号分隔的并发级别")
+    parser.add_argument("--requests", type=int, default=32, help="每个并发级别的请求数")
+    parser.add_argument("--warmup", type=int, default=2, help="每个场景的预热请求数")
+    parser.add_argument("--profile", action="append", default=[],
+                        help=f"模拟提供商行为，可重复，如 huggingface:latency=800,error=0.2,rps=10 "
+                             f"（提供商: {', '.join(PROVIDERS)}）")
+    parser.add_argument("--text-provider", default="multi", choices=["multi", "groq"],
+                        help="文本/代码生成使用的提供商")
+    parser.add_argument("--deployment-profile", default="full", choices=["full", "api"],
+                        help="AI服务部署模式")
+    parser.add_argument("--import-time", action="store_true", help="同时记录两种部署模式的启动导入耗时")
+    parser.add_argument("--base-url", default="", help="使用已运行的AI服务，不再启动子进程")
+    parser.add_argument("--output", default="", help="结果文件路径，默认 benchmarks/results/<时间>.json")
+    parser.add_argument("--baseline", default="", help="用于对比的基线结果文件")
+    parser.add_argument("--threshold", type=float, default=0.15, help="判定回退的变化比例")
+    args = parser.parse_args()
+
+    report = asyncio.run(run_benchmarks(args))
+    if args.import_time:
+        report["import_time"] = measure_profiles(["api", "full"])
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        report["regressions"] = compare(report, baseline, args.threshold)
+        report["meta"]["baseline"] = {"path": args.baseline, "commit": baseline.get("meta", {}).get("commit")}
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已写入 {output}")
+
+    for regression in report.get("regressions", []):
+        print(f"  回退: {regression['scenario']} c={regression['concurrency']} {regression['metric']} "
+              f"{regression['baseline']} -> {regression['current']} ({regression['change']:+.1%})")
+    if report.get("regressions"):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+基准测试场景 - 每个场景对应AI服务的一类接口
+"""
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+
+WORKFLOW_TERMINAL_STATES = {"completed", "failed", "cancelled"}
+
+@dataclass
+class Scenario:
+    """
+    一个基准测试场景
+
+    path 用于检查路由是否已挂载（媒体路由依赖本地模型，可能未加载）；
+    payload 根据请求序号生成请求体，避免所有请求完全相同。
+    """
+    name: str
+    path: str
+    payload: Callable[[int], Dict[str, Any]] = field(default=lambda i: {})
+    method: str = "POST"
+    timeout: float = 300.0
+
+    def is_available(self, routes: List[str]) -> bool:
+        return self.path in routes
+
+    async def setup(self, client: httpx.AsyncClient):
+        """场景开始前的准备工作"""
+
+    async def request(self, client: httpx.AsyncClient, index: int) -> str:
+        response = await client.request(self.method, self.path, json=self.payload(index), timeout=self.timeout)
+        return "ok" if response.is_success else str(response.status_code)
+
+@dataclass
+class WorkflowScenario(Scenario):
+    """
+    工作流执行：提交后轮询状态直到终态，延迟为端到端耗时
+
+    提供 definition 时通过 /api/v1/workflow/create 创建该工作流，否则实例化模板 template_id。
+    执行未完成（失败/取消/超时）按 workflow_<状态> 计为失败。
+    """
+    template_id: str = "blog_post_workflow"
+    definition: Optional[Dict[str, Any]] = None
+    poll_interval: float = 0.1
+    workflow_id: Optional[str] = None
+
+    async def setup(self, client: httpx.AsyncClient):
+        if self.definition is not None:
+            response = await client.post("/api/v1/workflow/create", json=self.definition)
+        else:
+            response = await client.post(f"/api/v1/workflow/templates/{self.template_id}/instantiate")
+        response.raise_for_status()
+        self.workflow_id = response.json()["data"]["workflow_id"]
+
+    async def request(self, client: httpx.AsyncClient, index: int) -> str:
+        response = await client.post(self.path, json={
+            "workflow_id": self.workflow_id,
+            "input_data": self.payload(index)
+        })
+        if not response.is_success:
+            return str(response.status_code)
+        execution_id = response.json()["data"]["execution_id"]
+
+        deadline = time.monotonic() + self.timeout
+        while time.monotonic() < deadline:
+            await asyncio.sleep(self.poll_interval)
+            status = await client.get(f"/api/v1/workflow/execution/{execution_id}/status")
+            if not status.is_success:
+                return str(status.status_code)
+            state = status.json()["data"]["status"]
+            if state in WORKFLOW_TERMINAL_STATES:
+                return "ok" if state == "completed" else f"workflow_{state}"
+        return "workflow_timeout"
+
+_TOPICS = ["春天的森林", "城市夜景", "海边日落", "雪山徒步", "咖啡馆的午后", "未来科技城市", "宁静的湖泊", "热闹的集市"]
+
+def _topic(i: int) -> str:
+    return f"{_TOPICS[i % len(_TOPICS)]} #{i}"
+
+# 博客模板中的文本部分（大纲 -> 正文）：模板的配图、分析、优化节点需要的服务在启动时没有注册执行器
+TEXT_WORKFLOW = {
+    "name": "benchmark text",
+    "description": "基准测试用的纯文本工作流",
+    "nodes": [
+        {"id": "input_topic", "type": "input", "config": {"input_fields": ["topic", "target_audience", "tone"]}},
+        {"id": "generate_outline", "type": "text_generation", "config": {
+            "prompt": "为主题'{topic}'生成一个详细的博客文章大纲，目标受众是{target_audience}，语调要{tone}。",
+            "max_length": 300
+        }},
+        {"id": "generate_content", "type": "text_generation", "config": {
+            "prompt": "根据以下大纲写一篇完整的博客文章：{text}",
+            "max_length": 2000
+        }},
+        {"id": "output_result", "type": "output", "config": {"output_fields": ["text"]}}
+    ],
+    "edges": [
+        {"from": "input_topic", "to": "generate_outline"},
+        {"from": "generate_outline", "to": "generate_content"},
+        {"from": "generate_content", "to": "output_result"}
+    ]
+}
+
+def default_scenarios() -> List[Scenario]:
+    """所有场景，按接口分组"""
+    return [
+        Scenario("text_generate", "/api/v1/text/generate",
+                 lambda i: {"prompt": f"写一段关于{_topic(i)}的短文", "max_length": 200}),
+        Scenario("code_generate", "/api/v1/code/generate",
+                 lambda i: {"prompt": f"实现第{i}个斐波那契数的计算", "language": "python"}),
+        Scenario("multimodal_text_to_image", "/api/v1/multimodal/text-to-image",
+                 lambda i: {"text": _topic(i), "style": "realistic", "width": 512, "height": 512}),
+        Scenario("multimodal_text_to_music", "/api/v1/multimodal/text-to-music",
+                 lambda i: {"text": _topic(i), "duration": 5}),
+        Scenario("multimodal_image_to_music", "/api/v1/multimodal/image-to-music",
+                 lambda i: {"image_description": f"一张{_topic(i)}的照片", "duration": 5}),
+        Scenario("multimodal_complete_content", "/api/v1/multimodal/complete-content",
+                 lambda i: {"text": f"{_topic(i)}，让人感到平静和快乐", "music_duration": 5}),
+        Scenario("media_batch_generate", "/api/v1/media/batch-generate",
+                 lambda i: {"requests": [
+                     {"id": f"{i}-image", "type": "text_to_image", "params": {"text": _topic(i)}},
+                     {"id": f"{i}-music", "type": "text_to_music", "params": {"text": _topic(i), "duration": 5}}
+                 ]}),
+        Scenario("bagel_batch_generate", "/api/v1/bagel/batch-generate",
+                 lambda i: {"requests": [
+                     {"id": f"{i}-image", "type": "text_to_image", "params": {"text": _topic(i)}}
+                 ]}),
+        WorkflowScenario("workflow_execution", "/api/v1/workflow/execute",
+                         lambda i: {"topic": _topic(i), "target_audience": "大众读者", "tone": "轻松"},
+                         definition=TEXT_WORKFLOW)
+    ]
@@ -5,17 +5,28 @@ YouCreator.AI - AI Service
 """
 
 import uvicorn
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 from contextlib import asynccontextmanager
+import importlib.util
 import logging
 import os
+import sys
+import time
 
 # 导入多提供商模型管理器
 from src.models.multi_provider_manager import MultiProviderModelManager
 from src.api.routes import router
 from src.api.multimodal_routes import router as multimodal_router
 from src.utils.config import settings
+from src.utils.metrics import registry as metrics_registry, HTTP_REQUEST_DURATION
+from src.utils.tracing import tracer, parse_traceparent, STATUS_ERROR
+from src.utils.deadline import DeadlineMiddleware
+from src.utils.admission import AdmissionController, AdmissionMiddleware
+from src.utils.prompt_cache import prompt_caches
+from src.utils.image_ingest import UploadLimitMiddleware
+from src.utils.model_hub import model_hub
 
 # 配置日志
 logging.basicConfig(
@@ -34,6 +45,7 @@ async def lifespan(app: FastAPI):
     
     # 启动时初始化模型
     logger.info("🚀 启动 YouCreator.AI 多模态服务...")
+    tracer.configure(settings.TRACING_ENABLED, settings.TRACE_EXPORT_PATH)
     model_manager = MultiProviderModelManager()
     
     # 异步初始化模型（不阻塞启动）
@@ -46,13 +58,30 @@ async def lifespan(app: FastAPI):
     # 将模型管理器添加到应用状态
     app.state.model_manager = model_manager
     
+    # 工作进程模式：工作流执行交给独立的工作进程
+    from services.workflow_engine import workflow_engine, NodeType, TextGenerationExecutor, ModelManagerTextService
+    from services.workflow_scheduler import WorkflowScheduler
+    workflow_engine.scheduler = WorkflowScheduler.from_settings(settings)
+    workflow_engine.register_executor(
+        NodeType.TEXT_GENERATION, TextGenerationExecutor(ModelManagerTextService(model_manager))
+    )
+    if settings.WORKFLOW_EXECUTION_MODE == "worker":
+        from services.workflow_broker import create_broker
+        workflow_engine.attach_broker(create_broker(settings.WORKFLOW_BROKER_URL))
+        logger.info("🔀 工作流执行模式: worker")
+    
+    if settings.DEPLOYMENT_PROFILE == "api" and "torch" in sys.modules:
+        logger.warning("⚠️ api部署模式下导入了torch，请检查是否有模块在顶层导入深度学习框架")
+    
     logger.info("✅ AI服务启动完成")
     yield
     
     # 关闭时清理资源
     logger.info("🛑 关闭AI服务...")
+    await workflow_engine.shutdown(settings.WORKFLOW_DRAIN_TIMEOUT)
     if model_manager:
         await model_manager.cleanup()
+    tracer.flush()
 
 # 创建FastAPI应用
 app = FastAPI(
@@ -62,36 +91,90 @@ app = FastAPI(
     lifespan=lifespan
 )
 
-# 配置CORS
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """按路由模板统计请求耗时，并接续Go后端传入的traceparent开启server span"""
+    start = time.perf_counter()
+    status = 500
+    parent = parse_traceparent(request.headers.get("traceparent"))
+    with tracer.start_span(f"{request.method} {request.url.path}", kind="server", parent=parent) as span:
+        span.set_attribute("http.method", request.method)
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            response.headers["traceparent"] = span.traceparent
+            return response
+        finally:
+            route = getattr(request.scope.get("route"), "path", "unmatched")
+            HTTP_REQUEST_DURATION.observe(
+                time.perf_counter() - start,
+                method=request.method,
+                route=route,
+                status=str(status)
+            )
+            span.name = f"{request.method} {route}"
+            span.set_attribute("http.route", route)
+            span.set_attribute("http.status_code", status)
+            if status >= 500:
+                span.set_status(STATUS_ERROR, f"HTTP {status}")
+
+# 生成类请求的准入控制
+admission_controller = AdmissionController.from_settings(settings)
+app.add_middleware(AdmissionMiddleware, controller=admission_controller)
+
+# 图片上传在接收请求体时限制大小，超限的上传不进入准入排队
+app.add_middleware(UploadLimitMiddleware, max_bytes=settings.MAX_UPLOAD_BYTES)
+
+# 请求截止时间和断开取消，放在准入控制外层使所有处理（包括准入排队）都能读到截止时间
+app.add_middleware(DeadlineMiddleware, default_timeout=settings.REQUEST_TIMEOUT)
+
+# 配置CORS，放在最外层：准入控制的429、上传超限的413等由中间件直接返回的响应也带上跨域响应头，
+# 浏览器才能读取响应和 Retry-After
 app.add_middleware(
     CORSMiddleware,
     allow_origins=settings.ALLOWED_ORIGINS,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Retry-After"],
 )
 
 # 注册路由
 app.include_router(router, prefix="/api/v1")
 app.include_router(multimodal_router, prefix="/api/v1/multimodal")
 
-# 添加媒体生成路由
-try:
-    from routers.media import router as media_router
-    app.include_router(media_router)
-    logger.info("✅ 媒体生成路由已加载")
-except ImportError as e:
-    logger.warning(f"⚠️ 媒体生成路由加载失败: {e}")
-    logger.info("服务将继续运行，但媒体生成功能不可用")
+# 本地模型路由，api部署模式下不挂载
+if settings.DEPLOYMENT_PROFILE == "api":
+    logger.info("🪶 api部署模式：跳过本地模型路由（媒体生成、Bagel）")
+elif importlib.util.find_spec("torch") is None:
+    # 模型改为按需加载后，导入路由不再触发ImportError，这里提前检查依赖是否安装
+    logger.warning("⚠️ 未安装torch，媒体生成和Bagel功能不可用")
+else:
+    # 添加媒体生成路由
+    try:
+        from routers.media import router as media_router
+        app.include_router(media_router)
+        logger.info("✅ 媒体生成路由已加载")
+    except ImportError as e:
+        logger.warning(f"⚠️ 媒体生成路由加载失败: {e}")
+        logger.info("服务将继续运行，但媒体生成功能不可用")
 
-# 添加Bagel媒体生成路由
+    # 添加Bagel媒体生成路由
+    try:
+        from routers.bagel_media import router as bagel_media_router
+        app.include_router(bagel_media_router)
+        logger.info("✅ Bagel媒体生成路由已加载")
+    except ImportError as e:
+        logger.warning(f"⚠️ Bagel媒体生成路由加载失败: {e}")
+        logger.info("服务将继续运行，但Bagel功能不可用")
+
+# 添加工作流路由
 try:
-    from routers.bagel_media import router as bagel_media_router
-    app.include_router(bagel_media_router)
-    logger.info("✅ Bagel媒体生成路由已加载")
+    from routers.workflow import router as workflow_router
+    app.include_router(workflow_router)
+    logger.info("✅ 工作流路由已加载")
 except ImportError as e:
-    logger.warning(f"⚠️ Bagel媒体生成路由加载失败: {e}")
-    logger.info("服务将继续运行，但Bagel功能不可用")
+    logger.warning(f"⚠️ 工作流路由加载失败: {e}")
 
 @app.get("/")
 async def root():
@@ -164,7 +247,10 @@ async def health_check():
         return {
             "status": "healthy",
             "service": "youcreator-ai-multimodal",
-            "models": model_status
+            "models": model_status,
+            "admission": admission_controller.stats(),
+            "prompt_cache": prompt_caches.stats(),
+            "local_models": model_hub.loaded()
         }
     except Exception as e:
         logger.error(f"健康检查失败: {e}")
@@ -173,6 +259,37 @@ async def health_check():
             "error": str(e)
         }
 
+@app.get("/health/live")
+async def liveness_check():
+    """存活检查：进程能响应请求，且提供商探测的后台任务没有异常退出"""
+    manager = getattr(app.state, "model_manager", None)
+    live = manager is None or manager.readiness.is_live()
+    return JSONResponse(
+        status_code=200 if live else 503,
+        content={"status": "alive" if live else "dead"}
+    )
+
+@app.get("/health/ready")
+async def readiness_check():
+    """就绪检查：首轮提供商探测完成后才就绪，可配置为要求至少一个提供商可用"""
+    manager = getattr(app.state, "model_manager", None)
+    if manager is None:
+        return JSONResponse(status_code=503, content={"status": "starting"})
+    
+    ready = manager.readiness.is_ready(settings.READINESS_REQUIRE_PROVIDER)
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"status": "ready" if ready else "not_ready", **manager.readiness.snapshot()}
+    )
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus指标"""
+    return PlainTextResponse(
+        metrics_registry.render(),
+        media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
 @app.get("/models")
 async def get_models_info():
     """获取模型信息"""
@@ -2,10 +2,15 @@
 Bagel模型媒体生成API路由
 """
 from fastapi import APIRouter, HTTPException, UploadFile, File, Form
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
+import json
 import logging
 from services.media_generation_bagel import bagel_media_service
+from src.utils.config import settings
+from src.utils.image_ingest import ImageIngestError, open_upload
+from src.utils.media_encoding import UnsupportedFormat, negotiate
 
 logger = logging.getLogger(__name__)
 
@@ -22,12 +27,24 @@ class BagelTextToImageRequest(BaseModel):
     negative_prompt: Optional[str] = Field(default=None, description="负面提示词")
     num_images: int = Field(default=1, ge=1, le=4, description="生成图片数量")
     seed: Optional[int] = Field(default=None, description="随机种子")
+    quality: Optional[str] = Field(
+        default=None, pattern="^(preview|draft|normal|high|ultra)$",
+        description="质量档位，指定时覆盖推理步数和引导强度；preview/draft 使用少步数蒸馏适配器"
+    )
+    output_format: Optional[str] = Field(default=None, description="图片格式 (png/jpeg/webp/avif)，默认png")
+    output_quality: Optional[int] = Field(default=None, ge=1, le=100, description="有损图片格式的质量")
+
+class BagelTextToImageStreamRequest(BagelTextToImageRequest):
+    preview_interval: int = Field(default=5, ge=1, le=50, description="每隔多少步发送一次预览")
 
 class ImageVariationsRequest(BaseModel):
     base_image: str = Field(..., description="基础图像base64数据")
     prompt: str = Field(..., description="变体描述")
     num_variations: int = Field(default=4, ge=1, le=8, description="变体数量")
     variation_strength: float = Field(default=0.7, ge=0.1, le=1.0, description="变体强度")
+    seed: Optional[int] = Field(default=None, description="随机种子，第i个变体使用 seed + i")
+    output_format: Optional[str] = Field(default=None, description="图片格式 (png/jpeg/webp/avif)，默认png")
+    output_quality: Optional[int] = Field(default=None, ge=1, le=100, description="有损图片格式的质量")
 
 class ImageUpscaleRequest(BaseModel):
     image_data: str = Field(..., description="图像base64数据")
@@ -40,6 +57,14 @@ class TextToMusicRequest(BaseModel):
     temperature: float = Field(default=1.0, ge=0.1, le=2.0, description="生成温度")
     top_k: int = Field(default=250, ge=50, le=500, description="top-k采样")
     top_p: float = Field(default=0.0, ge=0.0, le=1.0, description="top-p采样")
+    output_format: Optional[str] = Field(default=None, description="音频格式 (wav/flac/mp3/opus)，默认wav")
+
+class TextToMusicStreamRequest(BaseModel):
+    text: str = Field(..., description="音乐描述文字")
+    duration: int = Field(default=30, ge=5, le=settings.MAX_STREAMING_MUSIC_DURATION, description="音乐时长(秒)")
+    temperature: float = Field(default=1.0, ge=0.1, le=2.0, description="生成温度")
+    top_k: int = Field(default=250, ge=50, le=500, description="top-k采样")
+    top_p: float = Field(default=0.0, ge=0.0, le=1.0, description="top-p采样")
 
 class ImageToMusicRequest(BaseModel):
     image_base64: str = Field(..., description="图片base64数据")
@@ -49,6 +74,13 @@ class ImageToMusicRequest(BaseModel):
 class BatchGenerateRequest(BaseModel):
     requests: List[Dict[str, Any]] = Field(..., description="批量生成请求")
 
+def _check_format(output_format: Optional[str]):
+    """请求了不可用的图片格式时返回400"""
+    try:
+        negotiate("image", output_format)
+    except UnsupportedFormat as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 # 响应模型
 class MediaResponse(BaseModel):
     success: bool
@@ -61,6 +93,7 @@ async def bagel_text_to_image(request: BagelTextToImageRequest):
     """
     使用Bagel模型根据文字描述生成图片
     """
+    _check_format(request.output_format)
     try:
         logger.info(f"Bagel text-to-image: {request.text[:50]}...")
         
@@ -73,7 +106,10 @@ async def bagel_text_to_image(request: BagelTextToImageRequest):
             guidance_scale=request.guidance_scale,
             negative_prompt=request.negative_prompt,
             num_images=request.num_images,
-            seed=request.seed
+            seed=request.seed,
+            quality=request.quality,
+            output_format=request.output_format,
+            output_quality=request.output_quality
         )
         
         if result["success"]:
@@ -85,11 +121,56 @@ async def bagel_text_to_image(request: BagelTextToImageRequest):
         logger.error(f"Error in Bagel text-to-image: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@router.post("/text-to-image/stream")
+async def bagel_text_to_image_stream(request: BagelTextToImageStreamRequest):
+    """
+    生成图片并通过SSE推送中间预览
+    
+    生成过程中每 preview_interval 步发送一个 preview 事件（1/8分辨率的近似图像），
+    最后发送 result 事件（与 /text-to-image 的响应相同）或 error 事件。
+    客户端断开连接即取消生成，剩余步数不再计算。
+    """
+    _check_format(request.output_format)
+    logger.info(f"Bagel text-to-image stream: {request.text[:50]}...")
+    
+    async def events():
+        async for event, data in bagel_media_service.stream_text_to_image(
+            preview_interval=request.preview_interval,
+            text=request.text,
+            style=request.style,
+            width=request.width,
+            height=request.height,
+            num_inference_steps=request.num_inference_steps,
+            guidance_scale=request.guidance_scale,
+            negative_prompt=request.negative_prompt,
+            num_images=request.num_images,
+            seed=request.seed,
+            quality=request.quality,
+            output_format=request.output_format,
+            output_quality=request.output_quality
+        ):
+            if event == "preview":
+                yield _sse("preview", data)
+            elif data["success"]:
+                yield _sse("result", MediaResponse(success=True, data=data, model="bagel").model_dump())
+            else:
+                yield _sse("error", {"error": data.get("error", "Generation failed"), "model": "bagel"})
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @router.post("/image-variations", response_model=MediaResponse)
 async def generate_image_variations(request: ImageVariationsRequest):
     """
     生成图像变体
     """
+    _check_format(request.output_format)
     try:
         logger.info(f"Generating {request.num_variations} image variations...")
         
@@ -97,7 +178,10 @@ async def generate_image_variations(request: ImageVariationsRequest):
             base_image=request.base_image,
             prompt=request.prompt,
             num_variations=request.num_variations,
-            variation_strength=request.variation_strength
+            variation_strength=request.variation_strength,
+            seed=request.seed,
+            output_format=request.output_format,
+            output_quality=request.output_quality
         )
         
         if result["success"]:
@@ -132,6 +216,33 @@ async def upscale_image(request: ImageUpscaleRequest):
         logger.error(f"Error in image upscaling: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/upscale-image/stream")
+async def upscale_image_stream(request: ImageUpscaleRequest):
+    """
+    分块放大图像，直接以 image/png 流式返回
+    
+    图像按分块并行放大，PNG边编码边发送，服务端内存只与分块大小有关，与输出尺寸无关。
+    """
+    try:
+        chunks = await bagel_media_service.upscale_image_stream(
+            image_data=request.image_data,
+            scale_factor=request.scale_factor,
+            enhance_quality=request.enhance_quality
+        )
+    except ImageIngestError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"无效的图像数据: {e}")
+    except Exception as e:
+        logger.error(f"Error in streaming upscale: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    return StreamingResponse(
+        chunks,
+        media_type="image/png",
+        headers={"Content-Disposition": "attachment; filename=upscaled.png"}
+    )
+
 @router.post("/text-to-music", response_model=MediaResponse)
 async def bagel_text_to_music(request: TextToMusicRequest):
     """
@@ -145,7 +256,8 @@ async def bagel_text_to_music(request: TextToMusicRequest):
             duration=request.duration,
             temperature=request.temperature,
             top_k=request.top_k,
-            top_p=request.top_p
+            top_p=request.top_p,
+            output_format=request.output_format
         )
         
         if result["success"]:
@@ -157,6 +269,26 @@ async def bagel_text_to_music(request: TextToMusicRequest):
         logger.error(f"Error in text-to-music: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/text-to-music/stream")
+async def stream_music_from_text(request: TextToMusicStreamRequest):
+    """
+    分段流式生成音乐，以 audio/wav 边生成边返回
+    
+    每段生成完成后立即发送，首段（默认15秒）生成后即可开始播放；客户端断开后不再生成后续段。
+    """
+    logger.info(f"Streaming music from text ({request.duration}s): {request.text[:50]}...")
+    return StreamingResponse(
+        bagel_media_service.stream_text_to_music(
+            text=request.text,
+            duration=request.duration,
+            temperature=request.temperature,
+            top_k=request.top_k,
+            top_p=request.top_p
+        ),
+        media_type="audio/wav",
+        headers={"Content-Disposition": "attachment; filename=text_to_music.wav"}
+    )
+
 @router.post("/image-to-music", response_model=MediaResponse)
 async def bagel_image_to_music(request: ImageToMusicRequest):
     """
@@ -190,17 +322,16 @@ async def upload_image_and_generate_music(
     上传图片并生成音乐
     """
     try:
-        # 验证文件类型
-        if not file.content_type.startswith('image/'):
-            raise HTTPException(status_code=400, detail="File must be an image")
-        
-        # 读取图片数据
-        image_data = await file.read()
+        # 验证文件并打开图片，像素在标注前按模型输入尺寸解码
+        try:
+            image = await open_upload(file)
+        except ImageIngestError as e:
+            raise HTTPException(status_code=e.status_code, detail=str(e))
         
         logger.info(f"Generating music from uploaded image: {file.filename}")
         
         result = await bagel_media_service.image_to_music(
-            image_data=image_data,
+            image_data=image,
             duration=duration,
             temperature=temperature
         )
@@ -210,6 +341,8 @@ async def upload_image_and_generate_music(
         else:
             raise HTTPException(status_code=500, detail=result.get("error", "Music generation failed"))
             
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error in upload-image-to-music: {e}")
         raise HTTPException(status_code=500, detail=str(e))
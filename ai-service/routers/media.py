@@ -2,10 +2,15 @@
 媒体生成API路由
 """
 from fastapi import APIRouter, HTTPException, UploadFile, File, Form
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
 import logging
 from services.media_generation import media_service
+from services.captioning import caption_service
+from src.utils.config import settings
+from src.utils.image_ingest import ImageIngestError, open_upload
+from src.utils.media_encoding import UnsupportedFormat, negotiate
 
 logger = logging.getLogger(__name__)
 
@@ -19,6 +24,8 @@ class TextToImageRequest(BaseModel):
     height: int = Field(default=512, ge=256, le=1024, description="图片高度")
     num_inference_steps: int = Field(default=20, ge=10, le=50, description="推理步数")
     guidance_scale: float = Field(default=7.5, ge=1.0, le=20.0, description="引导强度")
+    output_format: Optional[str] = Field(default=None, description="图片格式 (png/jpeg/webp/avif)，默认png")
+    output_quality: Optional[int] = Field(default=None, ge=1, le=100, description="有损图片格式的质量")
 
 class TextToMusicRequest(BaseModel):
     text: str = Field(..., description="音乐描述文字")
@@ -26,12 +33,23 @@ class TextToMusicRequest(BaseModel):
     temperature: float = Field(default=1.0, ge=0.1, le=2.0, description="生成温度")
     top_k: int = Field(default=250, ge=50, le=500, description="top-k采样")
     top_p: float = Field(default=0.0, ge=0.0, le=1.0, description="top-p采样")
+    output_format: Optional[str] = Field(default=None, description="音频格式 (wav/flac/mp3/opus)，默认wav")
+
+class TextToMusicStreamRequest(BaseModel):
+    text: str = Field(..., description="音乐描述文字")
+    duration: int = Field(default=30, ge=5, le=settings.MAX_STREAMING_MUSIC_DURATION, description="音乐时长(秒)")
+    temperature: float = Field(default=1.0, ge=0.1, le=2.0, description="生成温度")
+    top_k: int = Field(default=250, ge=50, le=500, description="top-k采样")
+    top_p: float = Field(default=0.0, ge=0.0, le=1.0, description="top-p采样")
 
 class ImageToMusicRequest(BaseModel):
     image_base64: str = Field(..., description="图片base64数据")
     duration: int = Field(default=10, ge=5, le=30, description="音乐时长(秒)")
     temperature: float = Field(default=1.0, ge=0.1, le=2.0, description="生成温度")
 
+class CaptionRequest(BaseModel):
+    images: List[str] = Field(..., min_length=1, max_length=64, description="图片base64数据列表")
+
 class BatchGenerateRequest(BaseModel):
     requests: List[Dict[str, Any]] = Field(..., description="批量生成请求")
 
@@ -47,6 +65,11 @@ async def generate_image_from_text(request: TextToImageRequest):
     """
     根据文字描述生成图片
     """
+    try:
+        negotiate("image", request.output_format)
+    except UnsupportedFormat as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
     try:
         logger.info(f"Generating image from text: {request.text[:50]}...")
         
@@ -56,7 +79,9 @@ async def generate_image_from_text(request: TextToImageRequest):
             width=request.width,
             height=request.height,
             num_inference_steps=request.num_inference_steps,
-            guidance_scale=request.guidance_scale
+            guidance_scale=request.guidance_scale,
+            output_format=request.output_format,
+            output_quality=request.output_quality
         )
         
         if result["success"]:
@@ -81,7 +106,8 @@ async def generate_music_from_text(request: TextToMusicRequest):
             duration=request.duration,
             temperature=request.temperature,
             top_k=request.top_k,
-            top_p=request.top_p
+            top_p=request.top_p,
+            output_format=request.output_format
         )
         
         if result["success"]:
@@ -93,6 +119,26 @@ async def generate_music_from_text(request: TextToMusicRequest):
         logger.error(f"Error in text-to-music generation: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/text-to-music/stream")
+async def stream_music_from_text(request: TextToMusicStreamRequest):
+    """
+    分段流式生成音乐，以 audio/wav 边生成边返回
+    
+    每段生成完成后立即发送，首段（默认15秒）生成后即可开始播放；客户端断开后不再生成后续段。
+    """
+    logger.info(f"Streaming music from text ({request.duration}s): {request.text[:50]}...")
+    return StreamingResponse(
+        media_service.stream_text_to_music(
+            text=request.text,
+            duration=request.duration,
+            temperature=request.temperature,
+            top_k=request.top_k,
+            top_p=request.top_p
+        ),
+        media_type="audio/wav",
+        headers={"Content-Disposition": "attachment; filename=text_to_music.wav"}
+    )
+
 @router.post("/image-to-music", response_model=MediaResponse)
 async def generate_music_from_image(request: ImageToMusicRequest):
     """
@@ -126,17 +172,16 @@ async def upload_image_and_generate_music(
     上传图片并生成音乐
     """
     try:
-        # 验证文件类型
-        if not file.content_type.startswith('image/'):
-            raise HTTPException(status_code=400, detail="File must be an image")
-        
-        # 读取图片数据
-        image_data = await file.read()
+        # 验证文件并打开图片，像素在标注前按模型输入尺寸解码
+        try:
+            image = await open_upload(file)
+        except ImageIngestError as e:
+            raise HTTPException(status_code=e.status_code, detail=str(e))
         
         logger.info(f"Generating music from uploaded image: {file.filename}")
         
         result = await media_service.image_to_music(
-            image_data=image_data,
+            image_data=image,
             duration=duration,
             temperature=temperature
         )
@@ -146,10 +191,30 @@ async def upload_image_and_generate_music(
         else:
             raise HTTPException(status_code=500, detail=result.get("error", "Generation failed"))
             
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error in upload-image-to-music: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/caption", response_model=MediaResponse)
+async def caption_images(request: CaptionRequest):
+    """
+    批量生成图片描述，并发请求中的图片合并为一次模型前向
+    """
+    try:
+        logger.info(f"Captioning {len(request.images)} images...")
+        
+        captions = await caption_service.caption_many(request.images)
+        
+        return MediaResponse(success=True, data={"captions": captions, "count": len(captions)})
+        
+    except ImageIngestError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error in image captioning: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.post("/batch-generate", response_model=List[MediaResponse])
 async def batch_generate_media(request: BatchGenerateRequest):
     """
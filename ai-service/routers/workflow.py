@@ -1,12 +1,14 @@
 """
 AI工作流API路由
 """
-from fastapi import APIRouter, HTTPException, BackgroundTasks
+from fastapi import APIRouter, HTTPException, BackgroundTasks, Query
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
 import logging
-from services.workflow_engine import workflow_engine, WorkflowDefinition, WorkflowExecution, WorkflowStatus
+from services.workflow_engine import workflow_engine, WorkflowDefinition, WorkflowExecution, WorkflowNode, WorkflowStatus, NodeType
 from services.workflow_templates import WorkflowTemplates
+from services.workflow_profiler import profile_execution, to_chrome_trace, aggregate_profiles
 
 logger = logging.getLogger(__name__)
 
@@ -44,7 +46,7 @@ async def create_workflow(request: CreateWorkflowRequest):
             name=request.name,
             description=request.description,
             version="1.0",
-            nodes=[],  # 需要转换节点格式
+            nodes=[WorkflowNode.from_dict(node) for node in request.nodes],
             edges=request.edges,
             variables=request.variables,
             metadata=request.metadata
@@ -98,7 +100,7 @@ async def get_execution_status(execution_id: str):
     获取工作流执行状态
     """
     try:
-        execution = workflow_engine.get_execution_status(execution_id)
+        execution = await workflow_engine.sync_execution(execution_id)
         
         if not execution:
             raise HTTPException(status_code=404, detail="执行实例不存在")
@@ -130,7 +132,7 @@ async def cancel_execution(execution_id: str):
     取消工作流执行
     """
     try:
-        success = workflow_engine.cancel_execution(execution_id)
+        success = await workflow_engine.cancel_execution(execution_id)
         
         if not success:
             raise HTTPException(status_code=404, detail="执行实例不存在或无法取消")
@@ -149,6 +151,55 @@ async def cancel_execution(execution_id: str):
         logger.error(f"Failed to cancel execution: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/execution/{execution_id}/profile")
+async def get_execution_profile(
+    execution_id: str,
+    format: str = Query("json", description="json 或 chrome（Chrome trace-event格式）")
+):
+    """
+    获取工作流执行的性能分析：关键路径、节点耗时、排队等待和并行度
+    """
+    try:
+        execution = await workflow_engine.sync_execution(execution_id)
+        
+        if not execution:
+            raise HTTPException(status_code=404, detail="执行实例不存在")
+        
+        workflow = workflow_engine.get_workflow(execution.workflow_id)
+        if not workflow:
+            raise HTTPException(status_code=404, detail="工作流不存在")
+        
+        profile = profile_execution(workflow, execution)
+        
+        if format == "chrome":
+            return JSONResponse(
+                content=to_chrome_trace(profile),
+                headers={"Content-Disposition": f'attachment; filename="workflow-{execution_id}.trace.json"'}
+            )
+        
+        return WorkflowResponse(success=True, data=profile)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Failed to profile execution: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/scheduler/stats", response_model=WorkflowResponse)
+async def get_scheduler_stats():
+    """
+    获取调度器状态：并发槽位、排队数量和用户配额
+    """
+    try:
+        return WorkflowResponse(
+            success=True,
+            data=workflow_engine.scheduler.get_stats()
+        )
+        
+    except Exception as e:
+        logger.error(f"Failed to get scheduler stats: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.get("/templates", response_model=WorkflowResponse)
 async def get_workflow_templates():
     """
@@ -298,6 +349,37 @@ async def get_workflow(workflow_id: str):
         logger.error(f"Failed to get workflow: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/{workflow_id}/profile", response_model=WorkflowResponse)
+async def get_workflow_profile(workflow_id: str):
+    """
+    汇总工作流已完成执行的节点耗时，按对总延迟的影响排序
+    """
+    try:
+        workflow = workflow_engine.get_workflow(workflow_id)
+        
+        if not workflow:
+            raise HTTPException(status_code=404, detail="工作流不存在")
+        
+        profiles = [
+            profile_execution(workflow, execution)
+            for execution in workflow_engine.list_executions(workflow_id)
+            if execution.status == WorkflowStatus.COMPLETED
+        ]
+        
+        return WorkflowResponse(
+            success=True,
+            data={
+                "workflow_id": workflow_id,
+                **aggregate_profiles(profiles)
+            }
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Failed to aggregate workflow profile: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.delete("/{workflow_id}", response_model=WorkflowResponse)
 async def delete_workflow(workflow_id: str):
     """
@@ -329,7 +411,7 @@ async def get_execution_result(execution_id: str):
     获取工作流执行结果
     """
     try:
-        execution = workflow_engine.get_execution_status(execution_id)
+        execution = await workflow_engine.sync_execution(execution_id)
         
         if not execution:
             raise HTTPException(status_code=404, detail="执行实例不存在")
@@ -5,71 +5,116 @@ import asyncio
 import base64
 import io
 import logging
-import torch
+import random
+import threading
 from PIL import Image
-from diffusers import StableDiffusionPipeline, DPMSolverMultistepScheduler
-from transformers import CLIPTextModel, CLIPTokenizer
-import numpy as np
-from typing import Dict, List, Optional, Any
-import requests
+from typing import Callable, Dict, Iterator, List, Optional, Any
 import tempfile
 import os
 
+from src.utils.device import get_device
+from src.utils.image_ingest import open_image
+from src.utils.latent_preview import GenerationCancelled, PreviewCallback
+from src.utils.media_encoding import encode_image, negotiate, to_data_url
+from src.utils.metrics import track_provider
+from src.utils.model_hub import model_hub
+from src.utils.prompt_embeddings import prompt_embeddings
+from src.utils.tiled_upscale import TileUpscaler, iter_upscaled_png, resample_upscaler
+
 logger = logging.getLogger(__name__)
 
 class BagelImageGenerator:
     """Bagel模型图像生成器"""
     
+    BASE_NEGATIVE_PROMPT = "low quality, blurry, distorted, ugly, bad anatomy, bad proportions, deformed, duplicate, cropped, out of frame"
+    
+    STYLE_NEGATIVE_PROMPTS = {
+        "realistic": "cartoon, anime, painting, drawing, illustration, rendered",
+        "anime": "realistic, photographic, 3d render, western cartoon",
+        "cartoon": "realistic, photographic, anime, dark, scary",
+        "sketch": "colored, painted, photographic, realistic",
+        "oil_painting": "digital, photographic, modern, cartoon",
+        "watercolor": "digital, photographic, oil painting, acrylic",
+        "digital_art": "traditional media, hand drawn, photographic",
+        "fantasy": "modern, contemporary, realistic photography",
+        "sci_fi": "medieval, fantasy, traditional, historical",
+        "portrait": "full body, landscape, multiple people, crowd",
+        "landscape": "portrait, close up, indoor, people, characters",
+        "abstract": "realistic, photographic, representational, literal"
+    }
+    
+    # 质量档位：preview/draft 使用少步数蒸馏适配器（LCM-LoRA）和对应调度器，CPU上几秒出图；
+    # 其余档位使用完整采样。引导强度为1时不做无分类器引导，每步只需一次UNet前向
+    QUALITY_TIERS = {
+        "preview": {"steps": 2, "guidance_scale": 1.0, "scheduler": "lcm", "adapter": "lcm"},
+        "draft": {"steps": 4, "guidance_scale": 1.0, "scheduler": "lcm", "adapter": "lcm"},
+        "normal": {"steps": 20, "guidance_scale": 7.5, "scheduler": "dpm", "adapter": None},
+        "high": {"steps": 25, "guidance_scale": 8.0, "scheduler": "dpm", "adapter": None},
+        "ultra": {"steps": 30, "guidance_scale": 9.0, "scheduler": "dpm", "adapter": None}
+    }
+    
     def __init__(self):
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        self.pipeline = None
         self.model_id = "bagel-model/bagel-v1"  # 替换为实际的Bagel模型ID
         self.backup_model_id = "runwayml/stable-diffusion-v1-5"
-        self._initialize_model()
+        self.loaded_model_id = None  # 实际加载的模型
+        self._load_lock = threading.Lock()
+        self._unavailable_adapters = set()  # 加载失败的适配器，不再重试
+        self.upscaler: Optional[TileUpscaler] = None  # 可替换为CPU超分辨率模型，按分块调用
     
-    def _initialize_model(self):
-        """初始化Bagel模型"""
-        try:
-            logger.info("Loading Bagel image generation model...")
-            
-            # 尝试加载Bagel模型
-            try:
-                self.pipeline = StableDiffusionPipeline.from_pretrained(
-                    self.model_id,
-                    torch_dtype=torch.float16 if self.device == "cuda" else torch.float32,
-                    safety_checker=None,
-                    requires_safety_checker=False,
-                    use_auth_token=True  # 如果需要认证
+    @property
+    def device(self) -> str:
+        return get_device()
+    
+    def _get_pipeline(self, task: str = "txt2img", tier: Optional[Dict[str, Any]] = None):
+        """
+        第一次生成时加载模型
+        
+        Bagel模型不可用时回退到Stable Diffusion；权重由 model_hub 加载，与媒体服务共用，
+        文生图和图生图流水线、各质量档位的调度器和适配器都共用同一组组件。
+        """
+        with self._load_lock:
+            if self.loaded_model_id is None:
+                logger.info("Loading Bagel image generation model...")
+                try:
+                    model_hub.stable_diffusion(self.model_id, use_auth_token=True)  # 如果需要认证
+                    self.loaded_model_id = self.model_id
+                    logger.info("Bagel model loaded successfully")
+                except Exception as e:
+                    logger.warning(f"Failed to load Bagel model: {e}, falling back to Stable Diffusion")
+                    self.loaded_model_id = self.backup_model_id
+                
+                # 预先编码各风格的负面提示词，图生图流水线共用同一个文本编码器
+                prompt_embeddings.warm(
+                    model_hub.stable_diffusion(self.loaded_model_id),
+                    [self._get_default_negative_prompt(style) for style in [None, *self.STYLE_NEGATIVE_PROMPTS]]
                 )
-                logger.info("Bagel model loaded successfully")
+        if tier is None:
+            return model_hub.stable_diffusion(self.loaded_model_id, task=task)
+        return model_hub.stable_diffusion(
+            self.loaded_model_id, task=task, scheduler=tier["scheduler"], adapter=tier["adapter"]
+        )
+    
+    def _select_tier(self, quality: Optional[str], task: str = "txt2img"):
+        """
+        按质量档位取流水线，返回 (实际运行的档位, 流水线)
+        
+        适配器不可用（未安装peft、无法下载等）时回退到 normal 档位。
+        """
+        if quality is None:
+            return None, self._get_pipeline(task)
+        if quality not in self.QUALITY_TIERS:
+            raise ValueError(f"Unknown quality tier: {quality}")
+        
+        tier = self.QUALITY_TIERS[quality]
+        if tier["adapter"] is not None and tier["adapter"] not in self._unavailable_adapters:
+            try:
+                return quality, self._get_pipeline(task, tier)
             except Exception as e:
-                logger.warning(f"Failed to load Bagel model: {e}, falling back to Stable Diffusion")
-                # 回退到Stable Diffusion
-                self.pipeline = StableDiffusionPipeline.from_pretrained(
-                    self.backup_model_id,
-                    torch_dtype=torch.float16 if self.device == "cuda" else torch.float32,
-                    safety_checker=None,
-                    requires_safety_checker=False
-                )
-            
-            # 优化调度器
-            self.pipeline.scheduler = DPMSolverMultistepScheduler.from_config(
-                self.pipeline.scheduler.config
-            )
-            
-            # 移动到设备
-            self.pipeline = self.pipeline.to(self.device)
-            
-            # 启用内存优化
-            if self.device == "cuda":
-                self.pipeline.enable_memory_efficient_attention()
-                self.pipeline.enable_xformers_memory_efficient_attention()
-            
-            logger.info("Image generation pipeline initialized successfully")
-            
-        except Exception as e:
-            logger.error(f"Error initializing Bagel model: {e}")
-            raise
+                logger.warning(f"Adapter {tier['adapter']} unavailable: {e}, falling back to normal tier")
+                self._unavailable_adapters.add(tier["adapter"])
+        elif tier["adapter"] is None:
+            return quality, self._get_pipeline(task, tier)
+        return "normal", self._get_pipeline(task, self.QUALITY_TIERS["normal"])
     
     async def generate_image(self, 
                            prompt: str,
@@ -80,7 +125,13 @@ class BagelImageGenerator:
                            num_inference_steps: int = 20,
                            guidance_scale: float = 7.5,
                            num_images: int = 1,
-                           seed: int = None) -> Dict[str, Any]:
+                           seed: int = None,
+                           quality: Optional[str] = None,
+                           on_preview: Optional[Callable[[int, int, Image.Image], None]] = None,
+                           preview_interval: int = 0,
+                           cancel: Optional[threading.Event] = None,
+                           output_format: Optional[str] = None,
+                           output_quality: Optional[int] = None) -> Dict[str, Any]:
         """
         使用Bagel模型生成图像
         
@@ -94,11 +145,25 @@ class BagelImageGenerator:
             guidance_scale: 引导强度
             num_images: 生成图像数量
             seed: 随机种子
+            quality: 质量档位（QUALITY_TIERS），指定时覆盖推理步数和引导强度
+            on_preview: 每 preview_interval 步以 (步数, 总步数, 预览图) 调用，在推理线程中执行
+            preview_interval: 预览间隔步数，0 表示不生成预览
+            cancel: 设置后在下一步结束时中止生成，返回 cancelled 为 True 的结果
+            output_format: 图片格式 (png/jpeg/webp/avif)，默认png
+            output_quality: 有损格式的质量 (1-100)
             
         Returns:
             包含生成图像的字典
         """
         try:
+            import torch
+            image_format = negotiate("image", output_format)
+            tier_name, pipeline = self._select_tier(quality)
+            if tier_name is not None:
+                tier = self.QUALITY_TIERS[tier_name]
+                num_inference_steps = tier["steps"]
+                guidance_scale = tier["guidance_scale"]
+            
             # 增强提示词
             enhanced_prompt = self._enhance_prompt(prompt, style)
             
@@ -113,31 +178,44 @@ class BagelImageGenerator:
             
             logger.info(f"Generating image with Bagel model: {enhanced_prompt[:100]}...")
             
-            # 生成图像
-            with torch.autocast(self.device):
-                result = self.pipeline(
-                    prompt=enhanced_prompt,
-                    negative_prompt=negative_prompt,
-                    width=width,
-                    height=height,
-                    num_inference_steps=num_inference_steps,
-                    guidance_scale=guidance_scale,
-                    num_images_per_prompt=num_images,
-                    generator=generator
-                )
+            callback = PreviewCallback(num_inference_steps, preview_interval, on_preview, cancel)
+            
+            def run():
+                with track_provider("local", self.loaded_model_id, "image") as call, torch.autocast(self.device):
+                    try:
+                        return pipeline(
+                            **prompt_embeddings.embed_kwargs(pipeline, enhanced_prompt, negative_prompt),
+                            width=width,
+                            height=height,
+                            num_inference_steps=num_inference_steps,
+                            guidance_scale=guidance_scale,
+                            num_images_per_prompt=num_images,
+                            generator=generator,
+                            callback_on_step_end=callback
+                        )
+                    except GenerationCancelled:
+                        call.outcome = "cancelled"
+                        return None
+            
+            # 在线程中推理，不阻塞事件循环，预览可以在生成过程中发出
+            result = await asyncio.to_thread(run)
+            if result is None:
+                logger.info(f"Image generation cancelled after {callback.cancelled_at}/{num_inference_steps} steps")
+                return {
+                    "success": False,
+                    "cancelled": True,
+                    "error": f"Generation cancelled after {callback.cancelled_at} of {num_inference_steps} steps",
+                    "model": "bagel"
+                }
             
             # 处理生成的图像
-            images = []
-            for i, image in enumerate(result.images):
-                # 转换为base64
-                buffer = io.BytesIO()
-                image.save(buffer, format='PNG', quality=95)
-                image_base64 = base64.b64encode(buffer.getvalue()).decode()
-                
-                images.append({
-                    "image": f"data:image/png;base64,{image_base64}",
-                    "index": i
-                })
+            encoded = await asyncio.gather(*(
+                encode_image(image, image_format, output_quality) for image in result.images
+            ))
+            images = [
+                {"image": to_data_url(data, image_format), "index": i, "format": image_format.name}
+                for i, data in enumerate(encoded)
+            ]
             
             return {
                 "success": True,
@@ -152,6 +230,12 @@ class BagelImageGenerator:
                     "guidance_scale": guidance_scale,
                     "seed": seed
                 },
+                "quality": {
+                    "requested": quality,
+                    "tier": tier_name,
+                    "scheduler": self.QUALITY_TIERS[tier_name]["scheduler"] if tier_name else "dpm",
+                    "adapter": self.QUALITY_TIERS[tier_name]["adapter"] if tier_name else None
+                },
                 "metadata": {
                     "generation_time": None,  # 可以添加时间统计
                     "device": self.device,
@@ -196,49 +280,42 @@ class BagelImageGenerator:
     
     def _get_default_negative_prompt(self, style: str) -> str:
         """获取默认的负面提示词"""
-        
-        base_negative = "low quality, blurry, distorted, ugly, bad anatomy, bad proportions, deformed, duplicate, cropped, out of frame"
-        
-        style_specific_negative = {
-            "realistic": "cartoon, anime, painting, drawing, illustration, rendered",
-            "anime": "realistic, photographic, 3d render, western cartoon",
-            "cartoon": "realistic, photographic, anime, dark, scary",
-            "sketch": "colored, painted, photographic, realistic",
-            "oil_painting": "digital, photographic, modern, cartoon",
-            "watercolor": "digital, photographic, oil painting, acrylic",
-            "digital_art": "traditional media, hand drawn, photographic",
-            "fantasy": "modern, contemporary, realistic photography",
-            "sci_fi": "medieval, fantasy, traditional, historical",
-            "portrait": "full body, landscape, multiple people, crowd",
-            "landscape": "portrait, close up, indoor, people, characters",
-            "abstract": "realistic, photographic, representational, literal"
-        }
-        
-        style_neg = style_specific_negative.get(style, "")
+        style_neg = self.STYLE_NEGATIVE_PROMPTS.get(style, "")
         
         if style_neg:
-            return f"{base_negative}, {style_neg}"
+            return f"{self.BASE_NEGATIVE_PROMPT}, {style_neg}"
         else:
-            return base_negative
+            return self.BASE_NEGATIVE_PROMPT
     
     async def generate_variations(self, 
                                 base_image: str,
                                 prompt: str,
                                 num_variations: int = 4,
-                                variation_strength: float = 0.7) -> Dict[str, Any]:
+                                variation_strength: float = 0.7,
+                                seed: Optional[int] = None,
+                                output_format: Optional[str] = None,
+                                output_quality: Optional[int] = None) -> Dict[str, Any]:
         """
         基于基础图像生成变体
         
+        基础图像只经过一次VAE编码，所有变体在一次批量图生图调用中生成，
+        每个变体使用独立的随机数生成器，种子为 seed + 序号。
+        
         Args:
             base_image: 基础图像的base64数据
             prompt: 变体描述
             num_variations: 变体数量
             variation_strength: 变体强度
+            seed: 随机种子，不指定时随机选取
+            output_format: 图片格式 (png/jpeg/webp/avif)，默认png
+            output_quality: 有损格式的质量 (1-100)
             
         Returns:
             包含变体图像的字典
         """
         try:
+            image_format = negotiate("image", output_format)
+            
             # 解码基础图像
             if base_image.startswith('data:image'):
                 base_image = base_image.split(',')[1]
@@ -246,41 +323,50 @@ class BagelImageGenerator:
             image_data = base64.b64decode(base_image)
             base_pil_image = Image.open(io.BytesIO(image_data)).convert('RGB')
             
-            # 如果pipeline支持img2img，使用img2img生成变体
-            if hasattr(self.pipeline, 'img2img'):
-                results = []
-                for i in range(num_variations):
-                    result = self.pipeline.img2img(
-                        prompt=prompt,
-                        image=base_pil_image,
+            # 图生图流水线与文生图共用同一组模型组件
+            import torch
+            pipeline = self._get_pipeline("img2img")
+            if seed is None:
+                seed = random.randrange(2 ** 31)
+            seeds = [seed + i for i in range(num_variations)]
+            
+            def run():
+                with track_provider("local", self.loaded_model_id, "image_variation"), torch.autocast(self.device):
+                    init_latents = self._encode_image(pipeline, base_pil_image)
+                    # 输入为4通道潜变量时流水线跳过VAE编码，按批量大小复制后为每个变体分别加噪
+                    return pipeline(
+                        **prompt_embeddings.embed_kwargs(pipeline, prompt),
+                        image=init_latents,
                         strength=variation_strength,
                         guidance_scale=7.5,
-                        num_inference_steps=20
+                        num_inference_steps=20,
+                        num_images_per_prompt=num_variations,
+                        generator=[torch.Generator(device=self.device).manual_seed(s) for s in seeds]
                     )
-                    
-                    # 转换为base64
-                    buffer = io.BytesIO()
-                    result.images[0].save(buffer, format='PNG')
-                    image_base64 = base64.b64encode(buffer.getvalue()).decode()
-                    
-                    results.append({
-                        "image": f"data:image/png;base64,{image_base64}",
-                        "index": i,
-                        "variation_strength": variation_strength
-                    })
-                
-                return {
-                    "success": True,
-                    "variations": results,
-                    "base_prompt": prompt,
-                    "model": "bagel"
+            
+            result = await asyncio.to_thread(run)
+            
+            encoded = await asyncio.gather(*(
+                encode_image(image, image_format, output_quality) for image in result.images
+            ))
+            results = [
+                {
+                    "image": to_data_url(data, image_format),
+                    "index": i,
+                    "seed": variation_seed,
+                    "format": image_format.name,
+                    "variation_strength": variation_strength
                 }
-            else:
-                # 如果不支持img2img，生成新的图像
-                return await self.generate_image(
-                    prompt=prompt,
-                    num_images=num_variations
-                )
+                for i, (data, variation_seed) in enumerate(zip(encoded, seeds))
+            ]
+            
+            return {
+                "success": True,
+                "variations": results,
+                "base_prompt": prompt,
+                "seed": seed,
+                "model": "bagel"
+            }
                 
         except Exception as e:
             logger.error(f"Error generating variations: {e}")
@@ -289,6 +375,39 @@ class BagelImageGenerator:
                 "error": str(e)
             }
     
+    def _encode_image(self, pipeline, image: Image.Image):
+        """把图片编码为初始潜变量（取分布的均值，结果确定），形状为 (1, 4, 高/8, 宽/8)"""
+        import torch
+        
+        pixels = pipeline.image_processor.preprocess(image).to(device=self.device, dtype=pipeline.vae.dtype)
+        with torch.no_grad():
+            latents = pipeline.vae.encode(pixels).latent_dist.mode()
+        return latents * pipeline.vae.config.scaling_factor
+    
+    def _decode_upscale_input(self, image_data: str) -> Image.Image:
+        if image_data.startswith('data:image'):
+            image_data = image_data.split(',')[1]
+        return open_image(base64.b64decode(image_data))
+    
+    def iter_upscaled_png(self, 
+                          image_data: str,
+                          scale_factor: int = 2,
+                          enhance_quality: bool = True) -> Iterator[bytes]:
+        """
+        分块放大图像，逐块产出PNG字节（同步迭代器，在线程中消费）
+        
+        设置了 self.upscaler（CPU超分辨率模型）且 enhance_quality 时用它放大每个分块，
+        否则使用Lanczos（enhance_quality）或双三次重采样。
+        """
+        return self._upscale_chunks(self._decode_upscale_input(image_data), scale_factor, enhance_quality)
+    
+    def _upscale_chunks(self, image: Image.Image, scale_factor: int, enhance_quality: bool) -> Iterator[bytes]:
+        if enhance_quality:
+            upscaler = self.upscaler or resample_upscaler(Image.Resampling.LANCZOS)
+        else:
+            upscaler = resample_upscaler(Image.Resampling.BICUBIC)
+        return iter_upscaled_png(image, scale_factor, upscaler)
+    
     async def upscale_image(self, 
                           image_data: str,
                           scale_factor: int = 2,
@@ -305,38 +424,19 @@ class BagelImageGenerator:
             放大后的图像
         """
         try:
-            # 解码图像
-            if image_data.startswith('data:image'):
-                image_data = image_data.split(',')[1]
-            
-            image_bytes = base64.b64decode(image_data)
-            image = Image.open(io.BytesIO(image_bytes)).convert('RGB')
-            
-            # 计算新尺寸
-            original_width, original_height = image.size
-            new_width = original_width * scale_factor
-            new_height = original_height * scale_factor
-            
-            # 使用高质量重采样
-            if enhance_quality:
-                # 可以集成Real-ESRGAN或其他超分辨率模型
-                upscaled_image = image.resize(
-                    (new_width, new_height), 
-                    Image.Resampling.LANCZOS
-                )
-            else:
-                upscaled_image = image.resize((new_width, new_height))
+            # 分块放大并流式编码，内存中只保留一行分块和压缩后的PNG
+            def run():
+                image = self._decode_upscale_input(image_data)
+                chunks = self._upscale_chunks(image, scale_factor, enhance_quality)
+                return image.size, base64.b64encode(b"".join(chunks)).decode()
             
-            # 转换为base64
-            buffer = io.BytesIO()
-            upscaled_image.save(buffer, format='PNG', quality=95)
-            upscaled_base64 = base64.b64encode(buffer.getvalue()).decode()
+            (original_width, original_height), upscaled_base64 = await asyncio.to_thread(run)
             
             return {
                 "success": True,
                 "image": f"data:image/png;base64,{upscaled_base64}",
                 "original_size": {"width": original_width, "height": original_height},
-                "new_size": {"width": new_width, "height": new_height},
+                "new_size": {"width": original_width * scale_factor, "height": original_height * scale_factor},
                 "scale_factor": scale_factor,
                 "model": "bagel_upscale"
             }
@@ -353,7 +453,8 @@ class BagelImageGenerator:
         return {
             "model_name": "Bagel",
             "model_id": self.model_id,
-            "device": self.device,
+            # 模型未加载时不为了探测设备而导入torch
+            "device": self.device if self.loaded_model_id is not None else "not_loaded",
             "supported_features": [
                 "text_to_image",
                 "style_transfer",
@@ -0,0 +1,131 @@
+"""
+图像描述服务 - BLIP标注的微批处理
+
+并发的标注请求在很短的聚合窗口内合并成一次 generate 调用，在线程中执行，不阻塞事件循环；
+同一请求中重复的图片只标注一次，标注过的图片按解码后像素的内容哈希直接返回缓存的描述。
+BLIP 在第一次使用时才导入和加载。
+"""
+import asyncio
+import logging
+import threading
+import time
+from typing import List, Optional, Tuple, Union
+
+from PIL import Image
+
+from src.utils.config import settings
+from src.utils.device import get_device
+from src.utils.image_ingest import caption_cache, image_digest, load_image
+from src.utils.metrics import CAPTION_BATCH_SIZE, QUEUE_DEPTH, track_provider, record_model_load
+
+logger = logging.getLogger(__name__)
+
+CAPTION_MODEL_ID = "Salesforce/blip-image-captioning-base"
+
+
+class CaptionService:
+    """BLIP图像描述，所有媒体服务共用一个模型和批处理队列"""
+
+    def __init__(self, max_batch_size: int = 16, max_wait: float = 0.02, max_length: int = 50):
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait
+        self.max_length = max_length
+        self.processor = None
+        self.model = None
+        self._load_lock = threading.Lock()
+        self._pending: List[Tuple[Image.Image, asyncio.Future]] = []
+        self._worker: Optional[asyncio.Task] = None
+
+    @property
+    def device(self) -> str:
+        return get_device()
+
+    def _get_model(self):
+        """第一次使用时加载BLIP图像描述模型，返回 (processor, model)"""
+        with self._load_lock:
+            if self.model is None:
+                from transformers import BlipProcessor, BlipForConditionalGeneration
+
+                logger.info("Loading BLIP model for image captioning...")
+                start = time.perf_counter()
+                self.processor = BlipProcessor.from_pretrained(CAPTION_MODEL_ID)
+                model = BlipForConditionalGeneration.from_pretrained(CAPTION_MODEL_ID)
+                self.model = model.to(self.device).eval()
+                record_model_load("blip-image-captioning-base", time.perf_counter() - start, self.model, self.device)
+            return self.processor, self.model
+
+    def _caption_batch(self, images: List[Image.Image]) -> List[str]:
+        """一次前向标注一批图片"""
+        import torch
+
+        processor, model = self._get_model()
+        inputs = processor(images=images, return_tensors="pt").to(self.device)
+        CAPTION_BATCH_SIZE.observe(len(images))
+        with track_provider("local", "blip-image-captioning-base", "caption"), torch.inference_mode():
+            out = model.generate(**inputs, max_length=self.max_length)
+        return [caption.strip() for caption in processor.batch_decode(out, skip_special_tokens=True)]
+
+    async def caption(self, image_data: Union[str, bytes, Image.Image]) -> str:
+        """标注一张图片"""
+        return (await self.caption_many([image_data]))[0]
+
+    async def caption_many(self, images: List[Union[str, bytes, Image.Image]]) -> List[str]:
+        """
+        标注多张图片，按输入顺序返回描述
+
+        Args:
+            images: 图片列表 (base64字符串、字节或已打开的图片)
+        """
+        decoded = await asyncio.to_thread(lambda: [load_image(image) for image in images])
+        hashes = [image_digest(image) for image in decoded]
+        captions: List[Optional[str]] = [caption_cache.get(image_hash) for image_hash in hashes]
+
+        pending = {}
+        for image, image_hash, caption in zip(decoded, hashes, captions):
+            if caption is None and image_hash not in pending:
+                pending[image_hash] = self._submit(image)
+        if pending:
+            resolved = dict(zip(pending, await asyncio.gather(*pending.values())))
+            for image_hash, caption in resolved.items():
+                caption_cache.put(image_hash, caption)
+            captions = [caption if caption is not None else resolved[image_hash]
+                        for caption, image_hash in zip(captions, hashes)]
+        return captions
+
+    def _submit(self, image: Image.Image) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((image, future))
+        QUEUE_DEPTH.set(len(self._pending), queue="caption")
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+        return future
+
+    async def _run(self):
+        """逐批标注：队列不足一批时先等待聚合窗口，再取出最多 max_batch_size 张图片"""
+        while self._pending:
+            if len(self._pending) < self.max_batch_size:
+                await asyncio.sleep(self.max_wait)
+            batch = [(image, future) for image, future in self._pending[:self.max_batch_size] if not future.done()]
+            del self._pending[:self.max_batch_size]
+            QUEUE_DEPTH.set(len(self._pending), queue="caption")
+            if not batch:
+                continue
+
+            try:
+                captions = await asyncio.to_thread(self._caption_batch, [image for image, _ in batch])
+            except Exception as e:
+                logger.error(f"Caption batch of {len(batch)} failed: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            else:
+                for (_, future), caption in zip(batch, captions):
+                    if not future.done():
+                        future.set_result(caption)
+
+
+# 全局服务实例
+caption_service = CaptionService(
+    max_batch_size=settings.CAPTION_MAX_BATCH_SIZE,
+    max_wait=settings.CAPTION_BATCH_WAIT
+)
@@ -1,71 +1,60 @@
 """
 AI媒体生成服务 - 文字配图、文字配乐、图片配乐
+
+torch/diffusers/transformers/audiocraft 在对应模型第一次使用时才导入和加载，
+导入本模块本身不会加载任何深度学习框架。
 """
 import asyncio
 import base64
-import io
 import logging
-from typing import Dict, List, Optional, Union
+from typing import AsyncIterator, Dict, List, Optional, Union
 from PIL import Image
-import torch
-from diffusers import StableDiffusionPipeline, DPMSolverMultistepScheduler
-from transformers import pipeline, BlipProcessor, BlipForConditionalGeneration
-import librosa
-import numpy as np
-from audiocraft.models import MusicGen
-from audiocraft.data.audio import audio_write
-import tempfile
-import os
+
+from src.utils.device import get_device
+from src.utils.audio import normalize_loudness
+from src.utils.media_encoding import encode_audio, encode_image, negotiate, to_data_url
+from src.utils.metrics import track_provider
+from src.utils.model_hub import model_hub
+from src.utils.prompt_embeddings import prompt_embeddings
+
+from .captioning import caption_service
+from .music_streaming import stream_music_wav
 
 logger = logging.getLogger(__name__)
 
 class MediaGenerationService:
-    def __init__(self):
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        self.image_pipeline = None
-        self.music_pipeline = None
-        self.image_caption_processor = None
-        self.image_caption_model = None
-        self._initialize_models()
+    # 模型由 model_hub 在第一次使用时加载，与Bagel服务共用同一份权重
+    IMAGE_MODEL_ID = "runwayml/stable-diffusion-v1-5"
+    MUSIC_MODEL_ID = "facebook/musicgen-medium"
+    NEGATIVE_PROMPT = "blurry, low quality, distorted, ugly, bad anatomy"
+    
+    _negative_prompt_warmed = False
+    
+    @property
+    def device(self) -> str:
+        return get_device()
+    
+    def _get_image_pipeline(self):
+        """Stable Diffusion 文生图流水线，第一次使用时预先编码负面提示词"""
+        pipeline = model_hub.stable_diffusion(self.IMAGE_MODEL_ID)
+        if not self._negative_prompt_warmed:
+            prompt_embeddings.warm(pipeline, [self.NEGATIVE_PROMPT])
+            self._negative_prompt_warmed = True
+        return pipeline
+    
+    def _get_music_pipeline(self):
+        """MusicGen"""
+        return model_hub.musicgen(self.MUSIC_MODEL_ID)
     
-    def _initialize_models(self):
-        """初始化AI模型"""
-        try:
-            # 初始化图像生成模型
-            logger.info("Loading Stable Diffusion model...")
-            self.image_pipeline = StableDiffusionPipeline.from_pretrained(
-                "runwayml/stable-diffusion-v1-5",
-                torch_dtype=torch.float16 if self.device == "cuda" else torch.float32,
-                safety_checker=None,
-                requires_safety_checker=False
-            )
-            self.image_pipeline.scheduler = DPMSolverMultistepScheduler.from_config(
-                self.image_pipeline.scheduler.config
-            )
-            self.image_pipeline = self.image_pipeline.to(self.device)
-            
-            # 初始化音乐生成模型
-            logger.info("Loading MusicGen model...")
-            self.music_pipeline = MusicGen.get_pretrained('facebook/musicgen-medium')
-            
-            # 初始化图像描述模型
-            logger.info("Loading BLIP model for image captioning...")
-            self.image_caption_processor = BlipProcessor.from_pretrained("Salesforce/blip-image-captioning-base")
-            self.image_caption_model = BlipForConditionalGeneration.from_pretrained("Salesforce/blip-image-captioning-base")
-            
-            logger.info("All models loaded successfully")
-            
-        except Exception as e:
-            logger.error(f"Error initializing models: {e}")
-            raise
-
     async def text_to_image(self, 
                            text: str, 
                            style: str = "realistic",
                            width: int = 512, 
                            height: int = 512,
                            num_inference_steps: int = 20,
-                           guidance_scale: float = 7.5) -> Dict:
+                           guidance_scale: float = 7.5,
+                           output_format: Optional[str] = None,
+                           output_quality: Optional[int] = None) -> Dict:
         """
         文字生成图片
         
@@ -76,11 +65,15 @@ class MediaGenerationService:
             height: 图片高度
             num_inference_steps: 推理步数
             guidance_scale: 引导强度
+            output_format: 图片格式 (png/jpeg/webp/avif)，默认png
+            output_quality: 有损格式的质量 (1-100)
             
         Returns:
             包含生成图片的字典
         """
         try:
+            image_format = negotiate("image", output_format)
+            
             # 根据风格调整提示词
             style_prompts = {
                 "realistic": "photorealistic, high quality, detailed",
@@ -92,29 +85,31 @@ class MediaGenerationService:
             }
             
             enhanced_prompt = f"{text}, {style_prompts.get(style, 'high quality')}"
-            negative_prompt = "blurry, low quality, distorted, ugly, bad anatomy"
             
-            # 生成图片
-            with torch.autocast(self.device):
-                result = self.image_pipeline(
-                    prompt=enhanced_prompt,
-                    negative_prompt=negative_prompt,
-                    width=width,
-                    height=height,
-                    num_inference_steps=num_inference_steps,
-                    guidance_scale=guidance_scale,
-                    generator=torch.Generator(device=self.device).manual_seed(42)
-                )
+            import torch
+            image_pipeline = self._get_image_pipeline()
+            
+            def generate():
+                with track_provider("local", "stable-diffusion-v1-5", "image"), torch.autocast(self.device):
+                    return image_pipeline(
+                        **prompt_embeddings.embed_kwargs(image_pipeline, enhanced_prompt, self.NEGATIVE_PROMPT),
+                        width=width,
+                        height=height,
+                        num_inference_steps=num_inference_steps,
+                        guidance_scale=guidance_scale,
+                        generator=torch.Generator(device=self.device).manual_seed(42)
+                    )
             
-            # 转换为base64
-            image = result.images[0]
-            buffer = io.BytesIO()
-            image.save(buffer, format='PNG')
-            image_base64 = base64.b64encode(buffer.getvalue()).decode()
+            # 流水线与Bagel服务共用，调用在流水线的推理锁内进行，在线程中等待和推理，不阻塞事件循环
+            result = await asyncio.to_thread(generate)
+            
+            # 在线程中按请求的格式编码
+            image_bytes = await encode_image(result.images[0], image_format, output_quality)
             
             return {
                 "success": True,
-                "image": f"data:image/png;base64,{image_base64}",
+                "image": to_data_url(image_bytes, image_format),
+                "format": image_format.name,
                 "prompt": enhanced_prompt,
                 "style": style,
                 "dimensions": {"width": width, "height": height}
@@ -132,7 +127,8 @@ class MediaGenerationService:
                            duration: int = 10,
                            temperature: float = 1.0,
                            top_k: int = 250,
-                           top_p: float = 0.0) -> Dict:
+                           top_p: float = 0.0,
+                           output_format: Optional[str] = None) -> Dict:
         """
         文字生成音乐
         
@@ -142,46 +138,39 @@ class MediaGenerationService:
             temperature: 生成温度
             top_k: top-k采样
             top_p: top-p采样
+            output_format: 音频格式 (wav/flac/mp3/opus)，默认wav
             
         Returns:
             包含生成音乐的字典
         """
         try:
-            # 设置生成参数
-            self.music_pipeline.set_generation_params(
-                duration=duration,
-                temperature=temperature,
-                top_k=top_k,
-                top_p=top_p
-            )
+            audio_format = negotiate("audio", output_format)
+            music_pipeline = self._get_music_pipeline()
             
-            # 生成音乐
-            descriptions = [text]
-            wav = self.music_pipeline.generate(descriptions)
+            def generate():
+                # 生成参数保存在共享的模型上，设置参数和生成在模型的推理锁内完成
+                with model_hub.generation_lock(music_pipeline):
+                    music_pipeline.set_generation_params(
+                        duration=duration,
+                        temperature=temperature,
+                        top_k=top_k,
+                        top_p=top_p
+                    )
+                    with track_provider("local", "musicgen-medium", "music"):
+                        wav = music_pipeline.generate([text])
+                return normalize_loudness(wav[0], music_pipeline.sample_rate)
             
-            # 保存到临时文件
-            with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as tmp_file:
-                audio_write(
-                    tmp_file.name[:-4],  # 去掉.wav后缀，audio_write会自动添加
-                    wav[0].cpu(), 
-                    self.music_pipeline.sample_rate,
-                    strategy="loudness"
-                )
-                
-                # 读取生成的音频文件
-                with open(tmp_file.name, 'rb') as f:
-                    audio_data = f.read()
-                    audio_base64 = base64.b64encode(audio_data).decode()
-                
-                # 清理临时文件
-                os.unlink(tmp_file.name)
+            # 在线程中生成并归一化响度，波形直接在内存中编码，不经过临时文件
+            waveform = await asyncio.to_thread(generate)
+            audio_data = await encode_audio((waveform, music_pipeline.sample_rate), audio_format)
             
             return {
                 "success": True,
-                "audio": f"data:audio/wav;base64,{audio_base64}",
+                "audio": to_data_url(audio_data, audio_format),
+                "format": audio_format.name,
                 "description": text,
                 "duration": duration,
-                "sample_rate": self.music_pipeline.sample_rate
+                "sample_rate": music_pipeline.sample_rate
             }
             
         except Exception as e:
@@ -191,15 +180,29 @@ class MediaGenerationService:
                 "error": str(e)
             }
 
+    def stream_text_to_music(self,
+                             text: str,
+                             duration: int = 30,
+                             temperature: float = 1.0,
+                             top_k: int = 250,
+                             top_p: float = 0.0) -> AsyncIterator[bytes]:
+        """
+        分段流式生成音乐，逐段产出WAV字节（见 music_streaming），
+        首段生成完即可开始播放，内存占用与总时长无关
+        """
+        return stream_music_wav(
+            self._get_music_pipeline, text, duration, temperature=temperature, top_k=top_k, top_p=top_p
+        )
+
     async def image_to_music(self, 
-                            image_data: Union[str, bytes],
+                            image_data: Union[str, bytes, Image.Image],
                             duration: int = 10,
                             temperature: float = 1.0) -> Dict:
         """
         图片生成音乐
         
         Args:
-            image_data: 图片数据 (base64字符串或字节)
+            image_data: 图片数据 (base64字符串、字节或已打开的图片)
             duration: 音乐时长(秒)
             temperature: 生成温度
             
@@ -207,22 +210,8 @@ class MediaGenerationService:
             包含生成音乐的字典
         """
         try:
-            # 处理图片数据
-            if isinstance(image_data, str):
-                if image_data.startswith('data:image'):
-                    # 处理base64格式
-                    image_data = image_data.split(',')[1]
-                image_bytes = base64.b64decode(image_data)
-            else:
-                image_bytes = image_data
-            
-            # 加载图片
-            image = Image.open(io.BytesIO(image_bytes)).convert('RGB')
-            
-            # 生成图片描述
-            inputs = self.image_caption_processor(image, return_tensors="pt")
-            out = self.image_caption_model.generate(**inputs, max_length=50)
-            caption = self.image_caption_processor.decode(out[0], skip_special_tokens=True)
+            # 生成图片描述（与其他并发请求合并批处理，标注过的图片直接复用）
+            caption = await caption_service.caption(image_data)
             
             # 将图片描述转换为音乐描述
             music_description = self._image_caption_to_music_prompt(caption)
@@ -247,6 +236,29 @@ class MediaGenerationService:
                 "error": str(e)
             }
 
+    async def caption_image(self, image_data: Union[str, bytes, Image.Image]) -> Dict:
+        """
+        生成图片描述
+        
+        Args:
+            image_data: 图片数据 (base64字符串、字节或已打开的图片)
+            
+        Returns:
+            包含图片描述的字典
+        """
+        try:
+            caption = await caption_service.caption(image_data)
+            return {
+                "success": True,
+                "caption": caption
+            }
+        except Exception as e:
+            logger.error(f"Error in caption_image: {e}")
+            return {
+                "success": False,
+                "error": str(e)
+            }
+
     def _image_caption_to_music_prompt(self, caption: str) -> str:
         """
         将图片描述转换为音乐生成提示词
@@ -293,10 +305,19 @@ class MediaGenerationService:
         """
         results = []
         
-        for request in requests:
+        # 标注请求同时提交，由标注服务合并为批次
+        caption_tasks = {
+            index: asyncio.ensure_future(self.caption_image(**request.get("params", {})))
+            for index, request in enumerate(requests)
+            if request.get("type") == "image_caption"
+        }
+        
+        for index, request in enumerate(requests):
             request_type = request.get("type")
             
-            if request_type == "text_to_image":
+            if request_type == "image_caption":
+                result = await caption_tasks[index]
+            elif request_type == "text_to_image":
                 result = await self.text_to_image(**request.get("params", {}))
             elif request_type == "text_to_music":
                 result = await self.text_to_music(**request.get("params", {}))
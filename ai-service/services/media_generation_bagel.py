@@ -1,58 +1,46 @@
 """
 AI媒体生成服务 - 集成Bagel模型进行图像生成
+
+模型在第一次使用时才导入和加载，见 media_generation.py
 """
 import asyncio
 import base64
-import io
+import itertools
 import logging
-from typing import Dict, List, Optional, Union
+import threading
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple, Union
 from PIL import Image
-import torch
-from transformers import BlipProcessor, BlipForConditionalGeneration
-import librosa
-import numpy as np
-from audiocraft.models import MusicGen
-from audiocraft.data.audio import audio_write
-import tempfile
-import os
+
+from src.utils.device import get_device
+from src.utils.audio import normalize_loudness
+from src.utils.latent_preview import encode_preview
+from src.utils.media_encoding import encode_audio, negotiate, to_data_url
+from src.utils.metrics import track_provider
+from src.utils.model_hub import model_hub
 
 # 导入Bagel图像生成器
 from .bagel_image_generation import bagel_generator
+from .captioning import caption_service
+from .music_streaming import stream_music_wav
 
 logger = logging.getLogger(__name__)
 
 class BagelMediaGenerationService:
     """集成Bagel模型的媒体生成服务"""
     
+    MUSIC_MODEL_ID = "facebook/musicgen-medium"
+    
     def __init__(self):
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
         self.bagel_generator = bagel_generator  # 使用Bagel生成器
-        self.music_pipeline = None
-        self.image_caption_processor = None
-        self.image_caption_model = None
-        self._initialize_models()
     
-    def _initialize_models(self):
-        """初始化AI模型"""
-        try:
-            # Bagel图像生成器已经在导入时初始化
-            logger.info("Bagel image generator ready")
-            
-            # 初始化音乐生成模型
-            logger.info("Loading MusicGen model...")
-            self.music_pipeline = MusicGen.get_pretrained('facebook/musicgen-medium')
-            
-            # 初始化图像描述模型
-            logger.info("Loading BLIP model for image captioning...")
-            self.image_caption_processor = BlipProcessor.from_pretrained("Salesforce/blip-image-captioning-base")
-            self.image_caption_model = BlipForConditionalGeneration.from_pretrained("Salesforce/blip-image-captioning-base")
-            
-            logger.info("All models loaded successfully")
-            
-        except Exception as e:
-            logger.error(f"Error initializing models: {e}")
-            raise
-
+    @property
+    def device(self) -> str:
+        return get_device()
+    
+    def _get_music_pipeline(self):
+        """MusicGen，由 model_hub 加载，与媒体服务共用"""
+        return model_hub.musicgen(self.MUSIC_MODEL_ID)
+    
     async def text_to_image(self, 
                            text: str, 
                            style: str = "realistic",
@@ -62,7 +50,13 @@ class BagelMediaGenerationService:
                            guidance_scale: float = 7.5,
                            negative_prompt: str = None,
                            num_images: int = 1,
-                           seed: int = None) -> Dict:
+                           seed: int = None,
+                           quality: str = None,
+                           on_preview=None,
+                           preview_interval: int = 0,
+                           cancel: Optional[threading.Event] = None,
+                           output_format: Optional[str] = None,
+                           output_quality: Optional[int] = None) -> Dict:
         """
         使用Bagel模型进行文字生成图片
         
@@ -76,6 +70,12 @@ class BagelMediaGenerationService:
             negative_prompt: 负面提示词
             num_images: 生成图片数量
             seed: 随机种子
+            quality: 质量档位 (preview/draft/normal/high/ultra)，指定时覆盖推理步数和引导强度
+            on_preview: 生成过程中的预览回调，见 stream_text_to_image
+            preview_interval: 预览间隔步数，0 表示不生成预览
+            cancel: 设置后在下一步结束时中止生成
+            output_format: 图片格式 (png/jpeg/webp/avif)，默认png
+            output_quality: 有损格式的质量 (1-100)
             
         Returns:
             包含生成图片的字典
@@ -93,7 +93,13 @@ class BagelMediaGenerationService:
                 num_inference_steps=num_inference_steps,
                 guidance_scale=guidance_scale,
                 num_images=num_images,
-                seed=seed
+                seed=seed,
+                quality=quality,
+                on_preview=on_preview,
+                preview_interval=preview_interval,
+                cancel=cancel,
+                output_format=output_format,
+                output_quality=output_quality
             )
             
             if result["success"]:
@@ -109,12 +115,14 @@ class BagelMediaGenerationService:
                     "dimensions": {"width": width, "height": height},
                     "model": "bagel",
                     "parameters": result["parameters"],
+                    "quality": result["quality"],
                     "metadata": result["metadata"]
                 }
             else:
                 return {
                     "success": False,
                     "error": result["error"],
+                    "cancelled": result.get("cancelled", False),
                     "model": "bagel"
                 }
             
@@ -126,11 +134,50 @@ class BagelMediaGenerationService:
                 "model": "bagel"
             }
 
+    async def stream_text_to_image(self, preview_interval: int = 5, **kwargs) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """
+        生成图片并在生成过程中产出预览
+        
+        依次产出 ("preview", {step, total_steps, image}) 若干次，最后产出 ("result", text_to_image 的结果)。
+        调用方提前停止迭代（如客户端断开）时，生成在下一步结束时中止，剩余步数不再计算。
+        
+        Args:
+            preview_interval: 预览间隔步数
+            kwargs: 传给 text_to_image 的参数
+        """
+        loop = asyncio.get_running_loop()
+        previews: asyncio.Queue = asyncio.Queue()
+        cancel = threading.Event()
+        
+        def on_preview(step: int, total_steps: int, image: Image.Image):
+            # 在推理线程中编码，事件循环只负责转发
+            event = {"step": step, "total_steps": total_steps, "image": encode_preview(image)}
+            loop.call_soon_threadsafe(previews.put_nowait, event)
+        
+        task = asyncio.create_task(self.text_to_image(
+            on_preview=on_preview, preview_interval=preview_interval, cancel=cancel, **kwargs
+        ))
+        try:
+            while True:
+                next_preview = asyncio.ensure_future(previews.get())
+                done, _ = await asyncio.wait({next_preview, task}, return_when=asyncio.FIRST_COMPLETED)
+                if next_preview not in done:
+                    next_preview.cancel()
+                    break
+                yield "preview", next_preview.result()
+            yield "result", task.result()
+        finally:
+            # 正常结束时无影响；提前停止时让推理线程在下一步结束时退出
+            cancel.set()
+
     async def generate_image_variations(self,
                                       base_image: str,
                                       prompt: str,
                                       num_variations: int = 4,
-                                      variation_strength: float = 0.7) -> Dict:
+                                      variation_strength: float = 0.7,
+                                      seed: Optional[int] = None,
+                                      output_format: Optional[str] = None,
+                                      output_quality: Optional[int] = None) -> Dict:
         """
         生成图像变体
         
@@ -139,6 +186,9 @@ class BagelMediaGenerationService:
             prompt: 变体描述
             num_variations: 变体数量
             variation_strength: 变体强度
+            seed: 随机种子，第i个变体使用 seed + i
+            output_format: 图片格式 (png/jpeg/webp/avif)，默认png
+            output_quality: 有损格式的质量 (1-100)
             
         Returns:
             包含变体图像的字典
@@ -150,7 +200,10 @@ class BagelMediaGenerationService:
                 base_image=base_image,
                 prompt=prompt,
                 num_variations=num_variations,
-                variation_strength=variation_strength
+                variation_strength=variation_strength,
+                seed=seed,
+                output_format=output_format,
+                output_quality=output_quality
             )
             
             return result
@@ -195,12 +248,29 @@ class BagelMediaGenerationService:
                 "error": str(e)
             }
 
+    async def upscale_image_stream(self,
+                                   image_data: str,
+                                   scale_factor: int = 2,
+                                   enhance_quality: bool = True) -> Iterator[bytes]:
+        """
+        分块放大图像，返回PNG字节的同步迭代器（供流式响应在线程中消费）
+        
+        第一个块（PNG文件头）在返回前生成，输入无效或放大后超过像素上限时在这里抛出 ImageIngestError。
+        """
+        logger.info(f"Streaming {scale_factor}x upscale...")
+        chunks = await asyncio.to_thread(
+            self.bagel_generator.iter_upscaled_png, image_data, scale_factor, enhance_quality
+        )
+        first = await asyncio.to_thread(next, chunks)
+        return itertools.chain([first], chunks)
+    
     async def text_to_music(self, 
                            text: str, 
                            duration: int = 10,
                            temperature: float = 1.0,
                            top_k: int = 250,
-                           top_p: float = 0.0) -> Dict:
+                           top_p: float = 0.0,
+                           output_format: Optional[str] = None) -> Dict:
         """
         文字生成音乐
         
@@ -210,46 +280,39 @@ class BagelMediaGenerationService:
             temperature: 生成温度
             top_k: top-k采样
             top_p: top-p采样
+            output_format: 音频格式 (wav/flac/mp3/opus)，默认wav
             
         Returns:
             包含生成音乐的字典
         """
         try:
-            # 设置生成参数
-            self.music_pipeline.set_generation_params(
-                duration=duration,
-                temperature=temperature,
-                top_k=top_k,
-                top_p=top_p
-            )
-            
-            # 生成音乐
-            descriptions = [text]
-            wav = self.music_pipeline.generate(descriptions)
-            
-            # 保存到临时文件
-            with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as tmp_file:
-                audio_write(
-                    tmp_file.name[:-4],  # 去掉.wav后缀，audio_write会自动添加
-                    wav[0].cpu(), 
-                    self.music_pipeline.sample_rate,
-                    strategy="loudness"
-                )
-                
-                # 读取生成的音频文件
-                with open(tmp_file.name, 'rb') as f:
-                    audio_data = f.read()
-                    audio_base64 = base64.b64encode(audio_data).decode()
-                
-                # 清理临时文件
-                os.unlink(tmp_file.name)
+            audio_format = negotiate("audio", output_format)
+            music_pipeline = self._get_music_pipeline()
+            
+            def generate():
+                # 生成参数保存在共享的模型上，设置参数和生成在模型的推理锁内完成
+                with model_hub.generation_lock(music_pipeline):
+                    music_pipeline.set_generation_params(
+                        duration=duration,
+                        temperature=temperature,
+                        top_k=top_k,
+                        top_p=top_p
+                    )
+                    with track_provider("local", "musicgen-medium", "music"):
+                        wav = music_pipeline.generate([text])
+                return normalize_loudness(wav[0], music_pipeline.sample_rate)
+            
+            # 在线程中生成并归一化响度，波形直接在内存中编码，不经过临时文件
+            waveform = await asyncio.to_thread(generate)
+            audio_data = await encode_audio((waveform, music_pipeline.sample_rate), audio_format)
             
             return {
                 "success": True,
-                "audio": f"data:audio/wav;base64,{audio_base64}",
+                "audio": to_data_url(audio_data, audio_format),
+                "format": audio_format.name,
                 "description": text,
                 "duration": duration,
-                "sample_rate": self.music_pipeline.sample_rate
+                "sample_rate": music_pipeline.sample_rate
             }
             
         except Exception as e:
@@ -259,15 +322,29 @@ class BagelMediaGenerationService:
                 "error": str(e)
             }
 
+    def stream_text_to_music(self,
+                             text: str,
+                             duration: int = 30,
+                             temperature: float = 1.0,
+                             top_k: int = 250,
+                             top_p: float = 0.0) -> AsyncIterator[bytes]:
+        """
+        分段流式生成音乐，逐段产出WAV字节（见 music_streaming），
+        首段生成完即可开始播放，内存占用与总时长无关
+        """
+        return stream_music_wav(
+            self._get_music_pipeline, text, duration, temperature=temperature, top_k=top_k, top_p=top_p
+        )
+
     async def image_to_music(self, 
-                            image_data: Union[str, bytes],
+                            image_data: Union[str, bytes, Image.Image],
                             duration: int = 10,
                             temperature: float = 1.0) -> Dict:
         """
         图片生成音乐
         
         Args:
-            image_data: 图片数据 (base64字符串或字节)
+            image_data: 图片数据 (base64字符串、字节或已打开的图片)
             duration: 音乐时长(秒)
             temperature: 生成温度
             
@@ -275,22 +352,8 @@ class BagelMediaGenerationService:
             包含生成音乐的字典
         """
         try:
-            # 处理图片数据
-            if isinstance(image_data, str):
-                if image_data.startswith('data:image'):
-                    # 处理base64格式
-                    image_data = image_data.split(',')[1]
-                image_bytes = base64.b64decode(image_data)
-            else:
-                image_bytes = image_data
-            
-            # 加载图片
-            image = Image.open(io.BytesIO(image_bytes)).convert('RGB')
-            
-            # 生成图片描述
-            inputs = self.image_caption_processor(image, return_tensors="pt")
-            out = self.image_caption_model.generate(**inputs, max_length=50)
-            caption = self.image_caption_processor.decode(out[0], skip_special_tokens=True)
+            # 生成图片描述（与其他并发请求合并批处理，标注过的图片直接复用）
+            caption = await caption_service.caption(image_data)
             
             # 将图片描述转换为音乐描述
             music_description = self._image_caption_to_music_prompt(caption)
@@ -396,7 +459,7 @@ class BagelMediaGenerationService:
                 "model_id": "facebook/musicgen-medium",
                 "supported_features": ["text_to_music", "image_to_music"],
                 "max_duration": 30,
-                "sample_rate": self.music_pipeline.sample_rate if self.music_pipeline else 32000
+                "sample_rate": self._get_music_pipeline().sample_rate if model_hub.is_loaded(("musicgen", self.MUSIC_MODEL_ID)) else 32000
             },
             "image_captioning": {
                 "model_name": "BLIP",
@@ -0,0 +1,117 @@
+"""
+分段流式生成音乐
+
+MusicGen 一次生成的时长越长，听到第一段音频前的等待时间和峰值内存越大。这里按固定窗口分段生成：
+第一段直接生成，之后每段以上一段末尾 context 秒为提示调用 generate_continuation 续写，
+续写结果开头重新生成的提示部分与上一段保留的尾部交叉淡化。
+每段完成后立即以16位PCM WAV的形式发出，响度增益按第一段确定，后续各段沿用，音量不会逐段跳变。
+生成参数保存在共享的模型上，每段的设置参数和生成都在模型的推理锁内完成，段与段之间其他请求可以使用模型。
+"""
+import asyncio
+import logging
+import math
+from typing import AsyncIterator, Callable, Iterator
+
+from src.utils.audio import crossfade, loudness_gain
+from src.utils.config import settings
+from src.utils.media_encoding import pcm16, wav_header
+from src.utils.metrics import track_provider
+from src.utils.model_hub import model_hub
+
+logger = logging.getLogger(__name__)
+
+
+def iter_music_segments(model,
+                        text: str,
+                        duration: float,
+                        temperature: float = 1.0,
+                        top_k: int = 250,
+                        top_p: float = 0.0,
+                        window: float = None,
+                        context: float = None,
+                        fade: float = None) -> Iterator:
+    """
+    逐段生成音乐，产出 (采样点, 声道) 的float32数组，总长度恰好为 duration 秒
+
+    同步生成器，每次 next() 运行一次模型推理，应在线程中消费。
+
+    Args:
+        model: MusicGen 模型
+        window: 每段生成的总时长（秒，含续写提示），默认 settings.MUSIC_STREAM_WINDOW
+        context: 续写提示的时长（秒），默认 settings.MUSIC_STREAM_CONTEXT
+        fade: 相邻两段交叉淡化的时长（秒），默认 settings.MUSIC_STREAM_CROSSFADE
+    """
+    import numpy as np
+
+    window = window or settings.MUSIC_STREAM_WINDOW
+    context = context or settings.MUSIC_STREAM_CONTEXT
+    fade = settings.MUSIC_STREAM_CROSSFADE if fade is None else fade
+    if context + fade >= window:
+        raise ValueError("MUSIC_STREAM_WINDOW must be longer than the context plus the crossfade")
+
+    sample_rate = model.sample_rate
+    total_frames = int(round(duration * sample_rate))
+    fade_frames = int(fade * sample_rate)
+    emitted = 0
+    gain = None
+    tail = None  # 上一段保留的尾部，与下一段交叉淡化后再发出
+
+    params = {"temperature": temperature, "top_k": top_k, "top_p": top_p}
+    lock = model_hub.generation_lock(model)
+    with lock:
+        model.set_generation_params(duration=min(window, duration), **params)
+        with track_provider("local", "musicgen-medium", "music_segment"):
+            output = model.generate([text])[0]
+    prompt_frames = 0
+
+    while True:
+        if gain is None:
+            gain = loudness_gain(output, sample_rate)
+        segment = output.detach().float().cpu().numpy()
+        if tail is not None:
+            # 续写结果以重新生成的提示开头，提示末尾与上一段的尾部对齐
+            blended = crossfade(tail, segment[:, prompt_frames - fade_frames:prompt_frames])
+            segment = np.concatenate([blended, segment[:, prompt_frames:]], axis=1)
+
+        remaining = total_frames - emitted
+        if segment.shape[1] >= remaining:
+            yield np.clip(segment[:, :remaining].T * gain, -1.0, 1.0)
+            return
+        tail = segment[:, segment.shape[1] - fade_frames:]
+        chunk = segment[:, :segment.shape[1] - fade_frames]
+        emitted += chunk.shape[1]
+        yield np.clip(chunk.T * gain, -1.0, 1.0)
+
+        # 下一段需要生成的新内容：剩余长度（含保留的尾部）减去交叉淡化部分，不超过一个窗口
+        prompt = output[..., -int(context * sample_rate):]
+        prompt_frames = prompt.shape[-1]
+        new_seconds = min(window - context, math.ceil((total_frames - emitted - fade_frames) / sample_rate))
+        with lock:
+            model.set_generation_params(duration=prompt_frames / sample_rate + max(new_seconds, 1), **params)
+            with track_provider("local", "musicgen-medium", "music_segment"):
+                output = model.generate_continuation(prompt, sample_rate, [text])[0]
+
+
+async def stream_music_wav(load_model: Callable, text: str, duration: float, **params) -> AsyncIterator[bytes]:
+    """
+    流式生成WAV：先发出按总时长写好的文件头，之后每生成一段发出一段PCM
+
+    模型加载和每段推理都在线程中执行；调用方停止迭代时不再生成后续段。
+
+    Args:
+        load_model: 返回 MusicGen 模型的函数（第一次调用时加载）
+        params: 传给 iter_music_segments 的生成参数
+    """
+    model = await asyncio.to_thread(load_model)
+    channels = getattr(model, "audio_channels", 1)
+    yield wav_header(model.sample_rate, channels, int(round(duration * model.sample_rate)))
+
+    segments = iter_music_segments(model, text, duration, **params)
+    index = 0
+    while True:
+        segment = await asyncio.to_thread(next, segments, None)
+        if segment is None:
+            break
+        index += 1
+        logger.info(f"Streamed music segment {index} ({segment.shape[0] / model.sample_rate:.1f}s)")
+        yield await asyncio.to_thread(pcm16, segment)
@@ -0,0 +1,234 @@
+"""
+工作流任务Broker - API进程与工作进程之间的执行队列
+"""
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+class WorkflowBroker(ABC):
+    """工作流任务Broker基类"""
+
+    @abstractmethod
+    async def enqueue(self, execution_id: str, workflow: Dict[str, Any], input_data: Dict[str, Any]):
+        """提交一个待执行的工作流"""
+        pass
+
+    @abstractmethod
+    async def claim(self, worker_id: str, lease_timeout: float) -> Optional[Dict[str, Any]]:
+        """工作进程认领一个待执行任务，没有任务时返回None"""
+        pass
+
+    @abstractmethod
+    async def heartbeat(self, execution_id: str, worker_id: str, snapshot: Dict[str, Any],
+                        lease_timeout: float) -> bool:
+        """续租并上报执行快照，返回是否收到取消请求"""
+        pass
+
+    @abstractmethod
+    async def complete(self, execution_id: str, worker_id: str, snapshot: Dict[str, Any]):
+        """上报最终执行结果"""
+        pass
+
+    @abstractmethod
+    async def release(self, execution_id: str, worker_id: str):
+        """归还未完成的任务，供其他工作进程重新认领"""
+        pass
+
+    @abstractmethod
+    async def request_cancel(self, execution_id: str) -> bool:
+        """请求取消执行"""
+        pass
+
+    @abstractmethod
+    async def get(self, execution_id: str) -> Optional[Dict[str, Any]]:
+        """获取任务状态及最新快照"""
+        pass
+
+    async def close(self):
+        """释放资源"""
+        pass
+
+class SQLiteWorkflowBroker(WorkflowBroker):
+    """基于SQLite的本地Broker，多个进程通过同一个数据库文件协作"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30.0, isolation_level=None, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS workflow_jobs (
+                id TEXT PRIMARY KEY,
+                workflow_id TEXT NOT NULL,
+                workflow TEXT NOT NULL,
+                input_data TEXT NOT NULL,
+                status TEXT NOT NULL,
+                worker_id TEXT,
+                lease_expires REAL,
+                cancel_requested INTEGER NOT NULL DEFAULT 0,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                snapshot TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_workflow_jobs_status ON workflow_jobs (status, created_at)"
+        )
+
+    def __repr__(self) -> str:
+        return f"SQLiteWorkflowBroker({self.path})"
+
+    async def _run(self, func, *args):
+        """在线程中执行阻塞的数据库操作"""
+        return await asyncio.to_thread(func, *args)
+
+    def _execute(self, sql: str, params: tuple = ()) -> sqlite3.Cursor:
+        with self._lock:
+            return self._conn.execute(sql, params)
+
+    async def enqueue(self, execution_id: str, workflow: Dict[str, Any], input_data: Dict[str, Any]):
+        now = time.time()
+        await self._run(
+            self._execute,
+            "INSERT INTO workflow_jobs (id, workflow_id, workflow, input_data, status, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, 'pending', ?, ?)",
+            (execution_id, workflow["id"], json.dumps(workflow, default=str),
+             json.dumps(input_data, default=str), now, now)
+        )
+
+    def _claim(self, worker_id: str, lease_timeout: float) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # 回收租约过期的任务（工作进程崩溃或失联）
+                self._conn.execute(
+                    "UPDATE workflow_jobs SET status = 'pending', worker_id = NULL, updated_at = ? "
+                    "WHERE status = 'running' AND lease_expires < ?",
+                    (now, now)
+                )
+                row = self._conn.execute(
+                    "SELECT * FROM workflow_jobs WHERE status = 'pending' AND cancel_requested = 0 "
+                    "ORDER BY created_at LIMIT 1"
+                ).fetchone()
+                if row is None:
+                    self._conn.execute("COMMIT")
+                    return None
+                self._conn.execute(
+                    "UPDATE workflow_jobs SET status = 'running', worker_id = ?, lease_expires = ?, "
+                    "attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                    (worker_id, now + lease_timeout, now, row["id"])
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+        return {
+            "id": row["id"],
+            "workflow_id": row["workflow_id"],
+            "workflow": json.loads(row["workflow"]),
+            "input_data": json.loads(row["input_data"]),
+            "attempts": row["attempts"] + 1
+        }
+
+    async def claim(self, worker_id: str, lease_timeout: float) -> Optional[Dict[str, Any]]:
+        return await self._run(self._claim, worker_id, lease_timeout)
+
+    def _heartbeat(self, execution_id: str, worker_id: str, snapshot: Dict[str, Any],
+                   lease_timeout: float) -> bool:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE workflow_jobs SET lease_expires = ?, snapshot = ?, updated_at = ? "
+                "WHERE id = ? AND worker_id = ? AND status = 'running'",
+                (now + lease_timeout, json.dumps(snapshot, default=str), now, execution_id, worker_id)
+            )
+            row = self._conn.execute(
+                "SELECT cancel_requested FROM workflow_jobs WHERE id = ?", (execution_id,)
+            ).fetchone()
+        return bool(row and row["cancel_requested"])
+
+    async def heartbeat(self, execution_id: str, worker_id: str, snapshot: Dict[str, Any],
+                        lease_timeout: float) -> bool:
+        return await self._run(self._heartbeat, execution_id, worker_id, snapshot, lease_timeout)
+
+    async def complete(self, execution_id: str, worker_id: str, snapshot: Dict[str, Any]):
+        await self._run(
+            self._execute,
+            "UPDATE workflow_jobs SET status = ?, snapshot = ?, lease_expires = NULL, updated_at = ? "
+            "WHERE id = ? AND worker_id = ?",
+            (snapshot["status"], json.dumps(snapshot, default=str), time.time(), execution_id, worker_id)
+        )
+
+    async def release(self, execution_id: str, worker_id: str):
+        await self._run(
+            self._execute,
+            "UPDATE workflow_jobs SET status = 'pending', worker_id = NULL, lease_expires = NULL, "
+            "snapshot = NULL, updated_at = ? WHERE id = ? AND worker_id = ? AND status = 'running'",
+            (time.time(), execution_id, worker_id)
+        )
+
+    def _request_cancel(self, execution_id: str) -> bool:
+        now = time.time()
+        with self._lock:
+            # 尚未被认领的任务直接取消
+            cursor = self._conn.execute(
+                "UPDATE workflow_jobs SET status = 'cancelled', cancel_requested = 1, updated_at = ? "
+                "WHERE id = ? AND status = 'pending'",
+                (now, execution_id)
+            )
+            if cursor.rowcount:
+                return True
+            # 运行中的任务由工作进程在下次心跳时取消
+            cursor = self._conn.execute(
+                "UPDATE workflow_jobs SET cancel_requested = 1, updated_at = ? "
+                "WHERE id = ? AND status = 'running'",
+                (now, execution_id)
+            )
+            return bool(cursor.rowcount)
+
+    async def request_cancel(self, execution_id: str) -> bool:
+        return await self._run(self._request_cancel, execution_id)
+
+    def _get(self, execution_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, workflow_id, input_data, status, worker_id, attempts, snapshot "
+                "FROM workflow_jobs WHERE id = ?",
+                (execution_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "id": row["id"],
+            "workflow_id": row["workflow_id"],
+            "input_data": json.loads(row["input_data"]),
+            "status": row["status"],
+            "worker_id": row["worker_id"],
+            "attempts": row["attempts"],
+            "snapshot": json.loads(row["snapshot"]) if row["snapshot"] else None
+        }
+
+    async def get(self, execution_id: str) -> Optional[Dict[str, Any]]:
+        return await self._run(self._get, execution_id)
+
+    async def close(self):
+        with self._lock:
+            self._conn.close()
+
+def create_broker(url: str) -> WorkflowBroker:
+    """根据URL创建Broker，例如 sqlite:///./workflow_broker.db（SQLite Broker要求API进程和工作进程在同一台主机上）"""
+    if url.startswith("sqlite:///"):
+        return SQLiteWorkflowBroker(url[len("sqlite:///"):])
+    raise ValueError(f"Unsupported workflow broker url: {url}")
@@ -4,13 +4,19 @@ AI工作流引擎 - 智能内容生产工作流
 import asyncio
 import json
 import logging
+import time
 import uuid
 from datetime import datetime
 from enum import Enum
-from typing import Dict, List, Optional, Any, Callable
+from typing import Dict, List, Optional, Any, Callable, AsyncIterator
 from dataclasses import dataclass, asdict
 from abc import ABC, abstractmethod
 
+from .workflow_scheduler import WorkflowScheduler
+from .workflow_streaming import StreamingInput
+from src.utils.metrics import registry as metrics_registry, WORKFLOW_EXECUTIONS, WORKFLOW_NODE_DURATION
+from src.utils.deadline import set_deadline
+
 logger = logging.getLogger(__name__)
 
 class WorkflowStatus(Enum):
@@ -36,6 +42,17 @@ class NodeType(Enum):
     MERGE = "merge"
     OUTPUT = "output"
 
+# 调用AI服务的节点类型，用于估算执行成本
+GENERATION_NODE_TYPES = {
+    NodeType.TEXT_GENERATION,
+    NodeType.IMAGE_GENERATION,
+    NodeType.MUSIC_GENERATION
+}
+
+def _parse_datetime(value: Optional[str]) -> Optional[datetime]:
+    """解析ISO格式时间"""
+    return datetime.fromisoformat(value) if value else None
+
 @dataclass
 class WorkflowNode:
     """工作流节点"""
@@ -61,6 +78,33 @@ class WorkflowNode:
         if self.position is None:
             self.position = {"x": 0, "y": 0}
 
+    def to_dict(self) -> Dict[str, Any]:
+        """序列化节点定义（不含运行时状态）"""
+        return {
+            "id": self.id,
+            "type": self.type.value,
+            "name": self.name,
+            "description": self.description,
+            "config": self.config,
+            "inputs": self.inputs,
+            "outputs": self.outputs,
+            "position": self.position
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "WorkflowNode":
+        """从字典恢复节点定义"""
+        return cls(
+            id=data["id"],
+            type=NodeType(data["type"]),
+            name=data.get("name", data["id"]),
+            description=data.get("description", ""),
+            config=data.get("config", {}),
+            inputs=data.get("inputs"),
+            outputs=data.get("outputs"),
+            position=data.get("position")
+        )
+
 @dataclass
 class WorkflowDefinition:
     """工作流定义"""
@@ -85,6 +129,37 @@ class WorkflowDefinition:
         if self.updated_at is None:
             self.updated_at = datetime.now()
 
+    def to_dict(self) -> Dict[str, Any]:
+        """序列化工作流定义，用于跨进程传递"""
+        return {
+            "id": self.id,
+            "name": self.name,
+            "description": self.description,
+            "version": self.version,
+            "nodes": [node.to_dict() for node in self.nodes],
+            "edges": self.edges,
+            "variables": self.variables,
+            "metadata": self.metadata,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "WorkflowDefinition":
+        """从字典恢复工作流定义"""
+        return cls(
+            id=data["id"],
+            name=data.get("name", data["id"]),
+            description=data.get("description", ""),
+            version=data.get("version", "1.0"),
+            nodes=[WorkflowNode.from_dict(node) for node in data.get("nodes", [])],
+            edges=data.get("edges", []),
+            variables=data.get("variables"),
+            metadata=data.get("metadata"),
+            created_at=_parse_datetime(data.get("created_at")),
+            updated_at=_parse_datetime(data.get("updated_at"))
+        )
+
 @dataclass
 class WorkflowExecution:
     """工作流执行实例"""
@@ -98,15 +173,45 @@ class WorkflowExecution:
     start_time: datetime = None
     end_time: datetime = None
     error: str = None
+    node_timings: Dict[str, Dict[str, Any]] = None  # 节点排队/开始/结束时间
 
     def __post_init__(self):
         if self.output_data is None:
             self.output_data = {}
         if self.execution_log is None:
             self.execution_log = []
+        if self.node_timings is None:
+            self.node_timings = {}
         if self.start_time is None:
             self.start_time = datetime.now()
 
+    def to_dict(self) -> Dict[str, Any]:
+        """导出执行状态快照，用于工作进程上报"""
+        return {
+            "id": self.id,
+            "workflow_id": self.workflow_id,
+            "status": self.status.value,
+            "input_data": self.input_data,
+            "output_data": self.output_data,
+            "current_node": self.current_node,
+            "execution_log": self.execution_log,
+            "start_time": self.start_time.isoformat() if self.start_time else None,
+            "end_time": self.end_time.isoformat() if self.end_time else None,
+            "error": self.error,
+            "node_timings": self.node_timings
+        }
+
+    def update_from_dict(self, data: Dict[str, Any]):
+        """用工作进程上报的快照更新执行状态"""
+        self.status = WorkflowStatus(data.get("status", self.status.value))
+        self.output_data = data.get("output_data") or {}
+        self.current_node = data.get("current_node")
+        self.execution_log = data.get("execution_log") or []
+        self.start_time = _parse_datetime(data.get("start_time")) or self.start_time
+        self.end_time = _parse_datetime(data.get("end_time"))
+        self.error = data.get("error")
+        self.node_timings = data.get("node_timings") or {}
+
 class WorkflowNodeExecutor(ABC):
     """工作流节点执行器基类"""
     
@@ -119,6 +224,28 @@ class WorkflowNodeExecutor(ABC):
     def validate_config(self, config: Dict[str, Any]) -> bool:
         """验证节点配置"""
         pass
+    
+    async def execute_stream(self, node: WorkflowNode, context: Dict[str, Any]) -> AsyncIterator[Any]:
+        """流式执行节点，依次产出部分结果，最后一个为完整结果；默认不支持流式"""
+        yield await self.execute(node, context)
+
+class ModelManagerTextService:
+    """把多提供商模型管理器适配为文本生成节点使用的文本服务"""
+    
+    def __init__(self, model_manager):
+        self.model_manager = model_manager
+    
+    async def generate_text(self, prompt: str, max_length: int = 500, temperature: float = 0.7,
+                            model: str = "default") -> Dict[str, Any]:
+        text = await self.model_manager.generate_text(prompt, max_tokens=max_length, temperature=temperature)
+        return {"text": text, "metadata": {"provider": self.model_manager.providers["text"]}}
+    
+    async def generate_text_stream(self, prompt: str, max_length: int = 500, temperature: float = 0.7,
+                                   model: str = "default") -> AsyncIterator[str]:
+        async for chunk in self.model_manager.generate_text_stream(
+            prompt, max_tokens=max_length, temperature=temperature
+        ):
+            yield chunk
 
 class TextGenerationExecutor(WorkflowNodeExecutor):
     """文本生成节点执行器"""
@@ -126,14 +253,18 @@ class TextGenerationExecutor(WorkflowNodeExecutor):
     def __init__(self, text_service):
         self.text_service = text_service
     
-    async def execute(self, node: WorkflowNode, context: Dict[str, Any]) -> Any:
-        """执行文本生成"""
-        config = node.config
+    def _build_prompt(self, config: Dict[str, Any], context: Dict[str, Any]) -> str:
         prompt = config.get("prompt", "")
         
         # 支持模板变量替换
         for key, value in context.items():
             prompt = prompt.replace(f"{{{key}}}", str(value))
+        return prompt
+    
+    async def execute(self, node: WorkflowNode, context: Dict[str, Any]) -> Any:
+        """执行文本生成"""
+        config = node.config
+        prompt = self._build_prompt(config, context)
         
         # 调用文本生成服务
         result = await self.text_service.generate_text(
@@ -150,6 +281,31 @@ class TextGenerationExecutor(WorkflowNodeExecutor):
             "metadata": result.get("metadata", {})
         }
     
+    async def execute_stream(self, node: WorkflowNode, context: Dict[str, Any]) -> AsyncIterator[Any]:
+        """流式文本生成，文本服务未提供 generate_text_stream 时退化为一次性生成"""
+        if not hasattr(self.text_service, "generate_text_stream"):
+            yield await self.execute(node, context)
+            return
+        
+        config = node.config
+        prompt = self._build_prompt(config, context)
+        text = ""
+        async for chunk in self.text_service.generate_text_stream(
+            prompt=prompt,
+            max_length=config.get("max_length", 500),
+            temperature=config.get("temperature", 0.7),
+            model=config.get("model", "default")
+        ):
+            text += chunk
+            yield {"text": text, "prompt": prompt, "model": config.get("model", "default"), "partial": True}
+        
+        yield {
+            "text": text,
+            "prompt": prompt,
+            "model": config.get("model", "default"),
+            "metadata": {"streamed": True}
+        }
+    
     def validate_config(self, config: Dict[str, Any]) -> bool:
         """验证配置"""
         return "prompt" in config
@@ -384,14 +540,54 @@ class ConditionExecutor(WorkflowNodeExecutor):
         """验证配置"""
         return "condition" in config
 
+class InputExecutor(WorkflowNodeExecutor):
+    """输入节点执行器：从执行输入中取出 input_fields 声明的字段"""
+    
+    async def execute(self, node: WorkflowNode, context: Dict[str, Any]) -> Any:
+        """检查并返回输入字段"""
+        fields = node.config.get("input_fields", [])
+        missing = [field for field in fields if field not in context]
+        if missing:
+            raise ValueError(f"Missing input fields: {', '.join(missing)}")
+        return {field: context[field] for field in fields}
+    
+    def validate_config(self, config: Dict[str, Any]) -> bool:
+        """验证配置"""
+        return isinstance(config.get("input_fields", []), list)
+
+class OutputExecutor(WorkflowNodeExecutor):
+    """输出节点执行器：把 output_fields 声明的字段汇总到 output"""
+    
+    async def execute(self, node: WorkflowNode, context: Dict[str, Any]) -> Any:
+        """汇总上下文中已有的输出字段"""
+        fields = node.config.get("output_fields", [])
+        return {"output": {field: context[field] for field in fields if field in context}}
+    
+    def validate_config(self, config: Dict[str, Any]) -> bool:
+        """验证配置"""
+        return isinstance(config.get("output_fields", []), list)
+
 class WorkflowEngine:
     """AI工作流引擎"""
     
-    def __init__(self):
-        self.executors: Dict[NodeType, WorkflowNodeExecutor] = {}
+    def __init__(self, broker=None, scheduler: Optional[WorkflowScheduler] = None):
+        # 输入/输出节点不依赖外部服务，默认注册；生成类节点的执行器由启动代码按可用的服务注册
+        self.executors: Dict[NodeType, WorkflowNodeExecutor] = {
+            NodeType.INPUT: InputExecutor(),
+            NodeType.OUTPUT: OutputExecutor()
+        }
         self.workflows: Dict[str, WorkflowDefinition] = {}
         self.executions: Dict[str, WorkflowExecution] = {}
         self.running_executions: Dict[str, asyncio.Task] = {}
+        # 配置了broker时，执行任务交给工作进程，本进程只负责入队和查询
+        self.broker = broker
+        # 执行级/节点级并发控制
+        self.scheduler = scheduler or WorkflowScheduler()
+    
+    def attach_broker(self, broker):
+        """切换到工作进程模式"""
+        self.broker = broker
+        logger.info(f"Workflow engine attached to broker: {broker}")
     
     def register_executor(self, node_type: NodeType, executor: WorkflowNodeExecutor):
         """注册节点执行器"""
@@ -443,6 +639,16 @@ class WorkflowEngine:
         
         self.executions[execution_id] = execution
         
+        # 工作进程模式：入队后由工作进程认领执行
+        if self.broker is not None:
+            await self.broker.enqueue(
+                execution_id,
+                self.workflows[workflow_id].to_dict(),
+                input_data
+            )
+            logger.info(f"Enqueued workflow execution: {execution_id}")
+            return execution_id
+        
         # 异步执行工作流
         task = asyncio.create_task(self._run_workflow(execution))
         self.running_executions[execution_id] = task
@@ -452,19 +658,54 @@ class WorkflowEngine:
     
     async def _run_workflow(self, execution: WorkflowExecution):
         """运行工作流"""
+        # 执行在后台进行，不受提交请求的截止时间限制（任务创建时复制了请求的上下文）
+        set_deadline(None)
         try:
-            execution.status = WorkflowStatus.RUNNING
             workflow = self.workflows[execution.workflow_id]
+            user_id = self._resolve_user_id(workflow, execution.input_data)
             
-            # 构建执行上下文
-            context = execution.input_data.copy()
+            # 等待调度器分配执行槽位
+            async with self.scheduler.execution_slot(user_id, cost=self._execution_cost(workflow)):
+                context = await self._run_nodes(workflow, execution, user_id)
             
-            # 构建节点依赖图
-            dependency_graph = self._build_dependency_graph(workflow)
+            # 工作流执行完成
+            execution.status = WorkflowStatus.COMPLETED
+            execution.output_data = context
+            execution.end_time = datetime.now()
             
-            # 按拓扑顺序执行节点
-            executed_nodes = set()
+            logger.info(f"Workflow execution completed: {execution.id}")
             
+        except Exception as e:
+            execution.status = WorkflowStatus.FAILED
+            execution.error = str(e)
+            execution.end_time = datetime.now()
+            logger.error(f"Workflow execution failed: {execution.id}, error: {e}")
+        
+        finally:
+            WORKFLOW_EXECUTIONS.inc(status=execution.status.value)
+            # 清理运行中的任务
+            if execution.id in self.running_executions:
+                del self.running_executions[execution.id]
+    
+    async def _run_nodes(self, workflow: WorkflowDefinition, execution: WorkflowExecution, user_id: str) -> Dict[str, Any]:
+        """按依赖顺序执行所有节点，返回最终上下文"""
+        execution.status = WorkflowStatus.RUNNING
+        
+        # 构建执行上下文
+        context = execution.input_data.copy()
+        
+        # 构建节点依赖图
+        dependency_graph = self._build_dependency_graph(workflow)
+        
+        # 声明了 stream_from 的节点可以在上游部分结果可用时推测执行
+        streaming_inputs = self._streaming_inputs(workflow, dependency_graph)
+        speculations: Dict[str, Dict[str, Any]] = {}
+        results: Dict[str, Any] = {}
+        
+        # 按拓扑顺序执行节点
+        executed_nodes = set()
+        
+        try:
             while len(executed_nodes) < len(workflow.nodes):
                 # 找到可以执行的节点（所有依赖都已执行）
                 ready_nodes = []
@@ -480,7 +721,23 @@ class WorkflowEngine:
                 # 并行执行准备好的节点
                 tasks = []
                 for node in ready_nodes:
-                    task = asyncio.create_task(self._execute_node(node, context, execution))
+                    speculation = speculations.pop(node.id, None)
+                    if speculation is not None:
+                        # 推测执行已通过校验，直接复用
+                        task = speculation["task"]
+                    else:
+                        node_context = context
+                        streaming_input = streaming_inputs.get(node.id)
+                        if streaming_input is not None:
+                            view = streaming_input.view(results.get(streaming_input.source), final=True) or {}
+                            node_context = {**context, **view}
+                        on_partial = self._speculation_callback(
+                            node, workflow, dependency_graph, streaming_inputs, speculations,
+                            executed_nodes, context, execution, user_id
+                        )
+                        task = asyncio.create_task(
+                            self._execute_node(node, node_context, execution, user_id, on_partial)
+                        )
                     tasks.append((node, task))
                 
                 # 等待所有任务完成
@@ -488,6 +745,7 @@ class WorkflowEngine:
                     try:
                         result = await task
                         context.update(result)
+                        results[node.id] = result
                         executed_nodes.add(node.id)
                         
                         # 记录执行日志
@@ -509,24 +767,91 @@ class WorkflowEngine:
                             "timestamp": datetime.now().isoformat()
                         })
                         raise
-            
-            # 工作流执行完成
-            execution.status = WorkflowStatus.COMPLETED
-            execution.output_data = context
-            execution.end_time = datetime.now()
-            
-            logger.info(f"Workflow execution completed: {execution.id}")
-            
-        except Exception as e:
-            execution.status = WorkflowStatus.FAILED
-            execution.error = str(e)
-            execution.end_time = datetime.now()
-            logger.error(f"Workflow execution failed: {execution.id}, error: {e}")
-        
         finally:
-            # 清理运行中的任务
-            if execution.id in self.running_executions:
-                del self.running_executions[execution.id]
+            for speculation in speculations.values():
+                speculation["task"].cancel()
+        
+        return context
+    
+    def _streaming_inputs(self, workflow: WorkflowDefinition,
+                          dependency_graph: Dict[str, List[str]]) -> Dict[str, StreamingInput]:
+        """收集声明了部分依赖的节点，上游必须是其直接依赖"""
+        streaming_inputs = {}
+        for node in workflow.nodes:
+            streaming_input = StreamingInput.from_config(node.config)
+            if streaming_input is None:
+                continue
+            if streaming_input.source not in dependency_graph.get(node.id, []):
+                logger.warning(f"Ignoring stream_from on {node.id}: {streaming_input.source} is not an upstream node")
+                continue
+            streaming_inputs[node.id] = streaming_input
+        return streaming_inputs
+    
+    def _speculation_callback(self, source: WorkflowNode, workflow: WorkflowDefinition,
+                              dependency_graph: Dict[str, List[str]],
+                              streaming_inputs: Dict[str, StreamingInput],
+                              speculations: Dict[str, Dict[str, Any]], executed_nodes: set,
+                              context: Dict[str, Any], execution: WorkflowExecution,
+                              user_id: str) -> Optional[Callable[[Any, bool], None]]:
+        """
+        为流式上游节点生成部分结果回调
+
+        下游节点的其他依赖都已完成、且所需的部分结果可用时立即推测执行；
+        上游完成后若最终结果与推测时使用的部分不一致，取消推测任务，由正常流程重新执行。
+        """
+        dependents = [
+            node for node in workflow.nodes
+            if node.id in streaming_inputs and streaming_inputs[node.id].source == source.id
+        ]
+        if not dependents:
+            return None
+        
+        def on_partial(result: Any, final: bool):
+            for node in dependents:
+                streaming_input = streaming_inputs[node.id]
+                view = streaming_input.view(result, final)
+                speculation = speculations.get(node.id)
+                
+                if speculation is not None:
+                    if final and view != speculation["view"]:
+                        speculation["task"].cancel()
+                        del speculations[node.id]
+                        execution.node_timings.setdefault(node.id, {})["speculation"] = "miss"
+                        logger.info(f"Speculative execution of {node.id} invalidated by final output of {source.id}")
+                    elif final:
+                        execution.node_timings.setdefault(node.id, {})["speculation"] = "hit"
+                    continue
+                
+                if final or view is None:
+                    continue
+                other_dependencies = [dep for dep in dependency_graph.get(node.id, []) if dep != source.id]
+                if not all(dep in executed_nodes for dep in other_dependencies):
+                    continue
+                
+                logger.info(f"Speculatively starting {node.id} from partial output of {source.id}")
+                execution.node_timings.setdefault(node.id, {})["speculative"] = True
+                speculations[node.id] = {
+                    "view": view,
+                    "task": asyncio.create_task(
+                        self._execute_node(node, {**context, **view}, execution, user_id)
+                    )
+                }
+        
+        return on_partial
+    
+    def _resolve_user_id(self, workflow: WorkflowDefinition, input_data: Dict[str, Any]) -> str:
+        """确定执行所属用户：优先取输入数据，其次取平台发布节点配置的user_id"""
+        if input_data.get("user_id") is not None:
+            return str(input_data["user_id"])
+        for node in workflow.nodes:
+            if node.type == NodeType.PLATFORM_PUBLISH and node.config.get("user_id") is not None:
+                return str(node.config["user_id"])
+        return "anonymous"
+    
+    def _execution_cost(self, workflow: WorkflowDefinition) -> float:
+        """执行成本按AI生成节点数量计算，用于公平排队"""
+        generation_nodes = [node for node in workflow.nodes if node.type in GENERATION_NODE_TYPES]
+        return float(max(1, len(generation_nodes)))
     
     def _build_dependency_graph(self, workflow: WorkflowDefinition) -> Dict[str, List[str]]:
         """构建节点依赖图"""
@@ -544,37 +869,102 @@ class WorkflowEngine:
         
         return dependency_graph
     
-    async def _execute_node(self, node: WorkflowNode, context: Dict[str, Any], execution: WorkflowExecution) -> Dict[str, Any]:
-        """执行单个节点"""
-        execution.current_node = node.id
-        node.status = WorkflowStatus.RUNNING
-        node.start_time = datetime.now()
-        
-        try:
-            if node.type in self.executors:
-                executor = self.executors[node.type]
-                result = await executor.execute(node, context)
-                
-                node.status = WorkflowStatus.COMPLETED
-                node.result = result
+    async def _execute_node(self, node: WorkflowNode, context: Dict[str, Any], execution: WorkflowExecution,
+                            user_id: str = "anonymous",
+                            on_partial: Optional[Callable[[Any, bool], None]] = None) -> Dict[str, Any]:
+        """执行单个节点，提供on_partial时以流式方式执行并回调部分结果"""
+        timing = execution.node_timings.setdefault(node.id, {})
+        timing["queued_at"] = datetime.now().isoformat()
+        
+        # 等待该节点类型的并发槽位
+        async with self.scheduler.node_slot(node.type.value, user_id):
+            execution.current_node = node.id
+            node.status = WorkflowStatus.RUNNING
+            node.start_time = datetime.now()
+            timing["started_at"] = node.start_time.isoformat()
+            
+            try:
+                if node.type in self.executors:
+                    executor = self.executors[node.type]
+                    provider_start = time.perf_counter()
+                    if on_partial is None:
+                        result = await executor.execute(node, context)
+                    else:
+                        result = None
+                        async for partial in executor.execute_stream(node, context):
+                            if result is not None:
+                                on_partial(result, False)
+                            result = partial
+                        on_partial(result, True)
+                    timing["provider_ms"] = round((time.perf_counter() - provider_start) * 1000, 3)
+                    
+                    node.status = WorkflowStatus.COMPLETED
+                    node.result = result
+                    node.end_time = datetime.now()
+                    timing["ended_at"] = node.end_time.isoformat()
+                    WORKFLOW_NODE_DURATION.observe(
+                        (node.end_time - node.start_time).total_seconds(),
+                        node_type=node.type.value, status="completed"
+                    )
+                    
+                    return result
+                else:
+                    raise ValueError(f"No executor found for node type: {node.type}")
+                    
+            except Exception as e:
+                node.status = WorkflowStatus.FAILED
+                node.error = str(e)
                 node.end_time = datetime.now()
-                
-                return result
-            else:
-                raise ValueError(f"No executor found for node type: {node.type}")
-                
-        except Exception as e:
-            node.status = WorkflowStatus.FAILED
-            node.error = str(e)
-            node.end_time = datetime.now()
-            raise
+                timing["ended_at"] = node.end_time.isoformat()
+                WORKFLOW_NODE_DURATION.observe(
+                    (node.end_time - node.start_time).total_seconds(),
+                    node_type=node.type.value, status="failed"
+                )
+                raise
+    
+    def list_executions(self, workflow_id: str) -> List[WorkflowExecution]:
+        """列出工作流在本进程中的执行记录"""
+        return [execution for execution in self.executions.values() if execution.workflow_id == workflow_id]
     
     def get_execution_status(self, execution_id: str) -> Optional[WorkflowExecution]:
         """获取执行状态"""
         return self.executions.get(execution_id)
     
-    def cancel_execution(self, execution_id: str) -> bool:
+    async def sync_execution(self, execution_id: str) -> Optional[WorkflowExecution]:
+        """获取执行状态，工作进程模式下先从broker同步最新快照"""
+        if self.broker is None:
+            return self.get_execution_status(execution_id)
+        
+        job = await self.broker.get(execution_id)
+        if job is None:
+            return self.executions.get(execution_id)
+        
+        execution = self.executions.get(execution_id)
+        if execution is None:
+            # 由其他API实例入队的执行
+            execution = WorkflowExecution(
+                id=execution_id,
+                workflow_id=job["workflow_id"],
+                status=WorkflowStatus.PENDING,
+                input_data=job["input_data"]
+            )
+            self.executions[execution_id] = execution
+        
+        if job.get("snapshot"):
+            execution.update_from_dict(job["snapshot"])
+        else:
+            execution.status = WorkflowStatus(job["status"])
+        return execution
+    
+    async def cancel_execution(self, execution_id: str) -> bool:
         """取消执行"""
+        if self.broker is not None:
+            cancelled = await self.broker.request_cancel(execution_id)
+            if cancelled and execution_id in self.executions:
+                self.executions[execution_id].status = WorkflowStatus.CANCELLED
+                self.executions[execution_id].end_time = datetime.now()
+            return cancelled
+        
         if execution_id in self.running_executions:
             task = self.running_executions[execution_id]
             task.cancel()
@@ -586,6 +976,26 @@ class WorkflowEngine:
             return True
         return False
     
+    async def shutdown(self, timeout: float = 30.0):
+        """优雅停机：等待运行中的执行完成，超时后取消"""
+        tasks = list(self.running_executions.values())
+        if tasks:
+            logger.info(f"Draining {len(tasks)} running workflow executions (timeout {timeout}s)")
+            _, pending = await asyncio.wait(tasks, timeout=timeout)
+            for execution_id, task in list(self.running_executions.items()):
+                if task in pending:
+                    task.cancel()
+                    execution = self.executions.get(execution_id)
+                    if execution:
+                        execution.status = WorkflowStatus.CANCELLED
+                        execution.end_time = datetime.now()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+                logger.warning(f"Cancelled {len(pending)} workflow executions on shutdown")
+        
+        if self.broker is not None:
+            await self.broker.close()
+    
     def list_workflows(self) -> List[WorkflowDefinition]:
         """列出所有工作流"""
         return list(self.workflows.values())
@@ -603,3 +1013,6 @@ class WorkflowEngine:
 
 # 全局工作流引擎实例
 workflow_engine = WorkflowEngine()
+
+# 抓取指标时刷新调度队列深度
+metrics_registry.register_collector(lambda: workflow_engine.scheduler.update_metrics())
@@ -0,0 +1,202 @@
+"""
+工作流性能分析 - 关键路径、节点耗时、排队等待和并行度
+"""
+import logging
+from datetime import datetime
+from typing import Dict, List, Any, Optional
+
+from .workflow_engine import WorkflowDefinition, WorkflowExecution
+
+logger = logging.getLogger(__name__)
+
+def _ms(start: Optional[datetime], end: Optional[datetime]) -> float:
+    if start is None or end is None:
+        return 0.0
+    return round((end - start).total_seconds() * 1000, 3)
+
+def _parse(value: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value else None
+
+def _dependencies(workflow: WorkflowDefinition) -> Dict[str, List[str]]:
+    dependencies = {node.id: [] for node in workflow.nodes}
+    for edge in workflow.edges:
+        if edge["to"] in dependencies:
+            dependencies[edge["to"]].append(edge["from"])
+    return dependencies
+
+def profile_execution(workflow: WorkflowDefinition, execution: WorkflowExecution) -> Dict[str, Any]:
+    """
+    分析单次执行
+
+    每个节点的时间拆分为：
+    - scheduling_delay_ms: 依赖全部完成到节点提交之间的时间（按波次执行造成的空等）
+    - queue_wait_ms: 提交后等待节点类型并发槽位的时间
+    - wall_ms: 节点实际运行时间，其中 provider_ms 为执行器（调用AI服务）的耗时
+    """
+    dependencies = _dependencies(workflow)
+    node_types = {node.id: node.type.value for node in workflow.nodes}
+    node_names = {node.id: node.name for node in workflow.nodes}
+    origin = execution.start_time
+
+    timings = {}
+    for node_id, raw in execution.node_timings.items():
+        timings[node_id] = {
+            "queued_at": _parse(raw.get("queued_at")),
+            "started_at": _parse(raw.get("started_at")),
+            "ended_at": _parse(raw.get("ended_at")),
+            "provider_ms": raw.get("provider_ms", 0.0)
+        }
+
+    nodes = {}
+    for node_id, timing in timings.items():
+        upstream_ends = [
+            timings[dep]["ended_at"] for dep in dependencies.get(node_id, [])
+            if dep in timings and timings[dep]["ended_at"]
+        ]
+        ready_at = max(upstream_ends) if upstream_ends else origin
+        nodes[node_id] = {
+            "node_id": node_id,
+            "name": node_names.get(node_id, node_id),
+            "type": node_types.get(node_id),
+            "start_offset_ms": _ms(origin, timing["started_at"]),
+            "end_offset_ms": _ms(origin, timing["ended_at"]),
+            "scheduling_delay_ms": max(0.0, _ms(ready_at, timing["queued_at"])),
+            "queue_wait_ms": _ms(timing["queued_at"], timing["started_at"]),
+            "wall_ms": _ms(timing["started_at"], timing["ended_at"]),
+            "provider_ms": timing["provider_ms"],
+            "finished": timing["ended_at"] is not None,
+            "on_critical_path": False
+        }
+
+    # 实际关键路径：从最后结束的节点出发，沿最晚结束的上游节点回溯
+    critical_path = []
+    finished = [node_id for node_id in nodes if timings[node_id]["ended_at"]]
+    if finished:
+        current = max(finished, key=lambda node_id: timings[node_id]["ended_at"])
+        while current:
+            critical_path.append(current)
+            upstream = [dep for dep in dependencies.get(current, []) if dep in finished]
+            current = max(upstream, key=lambda dep: timings[dep]["ended_at"]) if upstream else None
+        critical_path.reverse()
+    for node_id in critical_path:
+        nodes[node_id]["on_critical_path"] = True
+
+    # 理想关键路径：只按节点运行时间计算的最长路径，即无限并发下的最短完成时间
+    longest: Dict[str, float] = {}
+
+    def _longest(node_id: str, visiting: frozenset) -> float:
+        if node_id in longest:
+            return longest[node_id]
+        if node_id in visiting:
+            return 0.0
+        own = nodes[node_id]["wall_ms"] if node_id in nodes else 0.0
+        upstream = [_longest(dep, visiting | {node_id}) for dep in dependencies.get(node_id, [])]
+        longest[node_id] = own + max(upstream, default=0.0)
+        return longest[node_id]
+
+    ideal_ms = max((_longest(node_id, frozenset()) for node_id in dependencies), default=0.0)
+
+    end_time = execution.end_time or max(
+        (timing["ended_at"] for timing in timings.values() if timing["ended_at"]), default=None
+    )
+    total_ms = _ms(origin, end_time)
+    busy_ms = sum(node["wall_ms"] for node in nodes.values())
+
+    return {
+        "execution_id": execution.id,
+        "workflow_id": execution.workflow_id,
+        "status": execution.status.value,
+        "total_ms": total_ms,
+        "critical_path": critical_path,
+        "critical_path_ms": round(sum(nodes[node_id]["wall_ms"] for node_id in critical_path), 3),
+        "ideal_critical_path_ms": round(ideal_ms, 3),
+        "parallelism": {
+            # 实际并行度 = 节点总运行时间 / 执行总时间；可达并行度以理想关键路径为分母
+            "achieved": round(busy_ms / total_ms, 3) if total_ms else 0.0,
+            "possible": round(busy_ms / ideal_ms, 3) if ideal_ms else 0.0
+        },
+        "totals": {
+            "wall_ms": round(busy_ms, 3),
+            "provider_ms": round(sum(node["provider_ms"] for node in nodes.values()), 3),
+            "queue_wait_ms": round(sum(node["queue_wait_ms"] for node in nodes.values()), 3),
+            "scheduling_delay_ms": round(sum(node["scheduling_delay_ms"] for node in nodes.values()), 3)
+        },
+        "nodes": sorted(nodes.values(), key=lambda node: node["start_offset_ms"])
+    }
+
+def to_chrome_trace(profile: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    导出为Chrome trace-event格式，可在 chrome://tracing 或 Perfetto 中打开
+
+    同时运行的节点分配到不同的线程行，排队等待单独显示为 queue 事件。
+    """
+    events = [{
+        "name": "process_name", "ph": "M", "pid": 1,
+        "args": {"name": f"workflow {profile['workflow_id']} / {profile['execution_id']}"}
+    }]
+    lane_ends: List[float] = []
+    critical = set(profile["critical_path"])
+
+    for node in profile["nodes"]:
+        queue_start = node["start_offset_ms"] - node["queue_wait_ms"]
+        lane = next((i for i, end in enumerate(lane_ends) if end <= queue_start), len(lane_ends))
+        if lane == len(lane_ends):
+            lane_ends.append(0.0)
+        lane_ends[lane] = node["end_offset_ms"] if node["finished"] else node["start_offset_ms"]
+        tid = lane + 1
+
+        if node["queue_wait_ms"] > 0:
+            events.append({
+                "name": f"{node['name']} (queued)", "cat": "queue", "ph": "X", "pid": 1, "tid": tid,
+                "ts": queue_start * 1000, "dur": node["queue_wait_ms"] * 1000
+            })
+        events.append({
+            "name": node["name"],
+            "cat": "critical" if node["node_id"] in critical else node["type"],
+            "ph": "X", "pid": 1, "tid": tid,
+            "ts": node["start_offset_ms"] * 1000, "dur": node["wall_ms"] * 1000,
+            "args": {
+                "node_id": node["node_id"],
+                "type": node["type"],
+                "provider_ms": node["provider_ms"],
+                "scheduling_delay_ms": node["scheduling_delay_ms"]
+            }
+        })
+
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+def aggregate_profiles(profiles: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """汇总同一工作流多次执行的节点耗时，找出主导延迟的节点"""
+    per_node: Dict[str, Dict[str, Any]] = {}
+    for profile in profiles:
+        critical = set(profile["critical_path"])
+        for node in profile["nodes"]:
+            stats = per_node.setdefault(node["node_id"], {
+                "node_id": node["node_id"], "name": node["name"], "type": node["type"],
+                "samples": [], "queue_wait_ms": 0.0, "critical_count": 0
+            })
+            stats["samples"].append(node["wall_ms"])
+            stats["queue_wait_ms"] += node["queue_wait_ms"]
+            stats["critical_count"] += node["node_id"] in critical
+
+    nodes = []
+    for stats in per_node.values():
+        samples = sorted(stats["samples"])
+        count = len(samples)
+        nodes.append({
+            "node_id": stats["node_id"],
+            "name": stats["name"],
+            "type": stats["type"],
+            "count": count,
+            "mean_wall_ms": round(sum(samples) / count, 3),
+            "p95_wall_ms": samples[min(count - 1, int(count * 0.95))],
+            "mean_queue_wait_ms": round(stats["queue_wait_ms"] / count, 3),
+            "critical_path_ratio": round(stats["critical_count"] / count, 3)
+        })
+
+    total = [profile["total_ms"] for profile in profiles]
+    return {
+        "executions": len(profiles),
+        "mean_total_ms": round(sum(total) / len(total), 3) if total else 0.0,
+        "nodes": sorted(nodes, key=lambda node: node["mean_wall_ms"] * node["critical_path_ratio"], reverse=True)
+    }
@@ -0,0 +1,179 @@
+"""
+工作流调度器 - 执行级与节点级并发限制、用户配额和加权公平排队
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Optional
+
+from src.utils.metrics import QUEUE_DEPTH
+
+logger = logging.getLogger(__name__)
+
+class _Waiter:
+    """排队中的请求"""
+    __slots__ = ("user_id", "future", "cancelled")
+
+    def __init__(self, user_id: str, future: asyncio.Future):
+        self.user_id = user_id
+        self.future = future
+        self.cancelled = False
+
+class FairQueue:
+    """
+    带容量上限和每用户配额的加权公平队列
+
+    使用开始时间公平排队(SFQ)：每个请求的虚拟开始时间为
+    max(当前虚拟时间, 该用户上一个请求的虚拟结束时间)，结束时间为开始时间加上 cost / weight。
+    按开始时间从小到大放行，提交大量任务的用户会排在刚到达的交互式用户之后。
+    """
+
+    def __init__(self, name: str, capacity: int, per_user_limit: Optional[int] = None):
+        self.name = name
+        self.capacity = capacity
+        self.per_user_limit = per_user_limit
+        self.active = 0
+        self.active_by_user: Dict[str, int] = defaultdict(int)
+        self._heap = []
+        self._seq = itertools.count()
+        self._virtual_time = 0.0
+        self._last_finish: Dict[str, float] = {}
+
+    @property
+    def waiting(self) -> int:
+        return sum(1 for _, _, waiter in self._heap if not waiter.cancelled)
+
+    def _user_has_quota(self, user_id: str) -> bool:
+        return self.per_user_limit is None or self.active_by_user.get(user_id, 0) < self.per_user_limit
+
+    def _tag(self, user_id: str, cost: float, weight: float) -> float:
+        start = max(self._virtual_time, self._last_finish.get(user_id, 0.0))
+        self._last_finish[user_id] = start + cost / max(weight, 1e-6)
+        return start
+
+    def _grant(self, user_id: str, start_tag: float):
+        self.active += 1
+        self.active_by_user[user_id] += 1
+        self._virtual_time = max(self._virtual_time, start_tag)
+
+    async def acquire(self, user_id: str, cost: float = 1.0, weight: float = 1.0):
+        """获取一个槽位，必要时排队等待"""
+        start_tag = self._tag(user_id, cost, weight)
+
+        if self.active < self.capacity and self._user_has_quota(user_id) and not self.waiting:
+            self._grant(user_id, start_tag)
+            return
+
+        waiter = _Waiter(user_id, asyncio.get_running_loop().create_future())
+        heapq.heappush(self._heap, (start_tag, next(self._seq), waiter))
+        self._dispatch()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # 已被放行但调用方已取消，归还槽位
+                self.release(user_id)
+            else:
+                waiter.cancelled = True
+            raise
+
+    def release(self, user_id: str):
+        """归还槽位并放行下一个符合条件的请求"""
+        self.active -= 1
+        self.active_by_user[user_id] -= 1
+        if self.active_by_user[user_id] <= 0:
+            del self.active_by_user[user_id]
+        self._dispatch()
+
+    def _dispatch(self):
+        skipped = []
+        while self._heap and self.active < self.capacity:
+            start_tag, seq, waiter = heapq.heappop(self._heap)
+            if waiter.cancelled:
+                continue
+            if not self._user_has_quota(waiter.user_id):
+                # 该用户已达配额，跳过但保留其排队位置
+                skipped.append((start_tag, seq, waiter))
+                continue
+            self._grant(waiter.user_id, start_tag)
+            waiter.future.set_result(None)
+        for item in skipped:
+            heapq.heappush(self._heap, item)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "capacity": self.capacity,
+            "per_user_limit": self.per_user_limit,
+            "active": self.active,
+            "waiting": self.waiting,
+            "active_by_user": dict(self.active_by_user)
+        }
+
+class WorkflowScheduler:
+    """工作流调度器"""
+
+    def __init__(self,
+                 max_concurrent_executions: int = 4,
+                 node_type_limits: Optional[Dict[str, int]] = None,
+                 user_quota: Optional[int] = 2,
+                 user_weights: Optional[Dict[str, float]] = None):
+        self.user_weights = user_weights or {}
+        self.executions = FairQueue("executions", max_concurrent_executions, user_quota)
+        # 节点类型并发限制，未配置的类型不限制
+        self.node_queues: Dict[str, FairQueue] = {
+            node_type: FairQueue(node_type, limit)
+            for node_type, limit in (node_type_limits or {}).items()
+        }
+
+    @classmethod
+    def from_settings(cls, settings) -> "WorkflowScheduler":
+        """根据服务配置创建调度器"""
+        return cls(
+            max_concurrent_executions=settings.WORKFLOW_MAX_CONCURRENT_EXECUTIONS,
+            node_type_limits=settings.WORKFLOW_NODE_CONCURRENCY,
+            user_quota=settings.WORKFLOW_USER_QUOTA or None,
+            user_weights=settings.WORKFLOW_USER_WEIGHTS
+        )
+
+    def _weight(self, user_id: str) -> float:
+        return float(self.user_weights.get(user_id, 1.0))
+
+    @asynccontextmanager
+    async def execution_slot(self, user_id: str, cost: float = 1.0):
+        """执行级槽位：全局并发上限 + 每用户配额"""
+        await self.executions.acquire(user_id, cost, self._weight(user_id))
+        try:
+            yield
+        finally:
+            self.executions.release(user_id)
+
+    @asynccontextmanager
+    async def node_slot(self, node_type: str, user_id: str):
+        """节点级槽位：按节点类型限制并发"""
+        queue = self.node_queues.get(node_type)
+        if queue is None:
+            yield
+            return
+
+        await queue.acquire(user_id, 1.0, self._weight(user_id))
+        try:
+            yield
+        finally:
+            queue.release(user_id)
+
+    def update_metrics(self):
+        """导出各队列的排队数量"""
+        QUEUE_DEPTH.set(self.executions.waiting, queue="workflow_executions")
+        for name, queue in self.node_queues.items():
+            QUEUE_DEPTH.set(queue.waiting, queue=f"workflow_node:{name}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取调度器状态"""
+        return {
+            "executions": self.executions.get_stats(),
+            "node_types": {name: queue.get_stats() for name, queue in self.node_queues.items()},
+            "user_weights": self.user_weights
+        }
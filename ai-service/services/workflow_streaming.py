@@ -0,0 +1,70 @@
+"""
+流式数据流 - 下游节点只依赖上游结果的一部分时，提前推测执行
+"""
+import re
+from dataclasses import dataclass
+from typing import Dict, Any, Optional
+
+# 英文单词/数字算一个token，中文按字计算，标点单独计算
+_TOKEN_PATTERN = re.compile(r"[A-Za-z0-9_]+|[一-鿿]|[^\sA-Za-z0-9_一-鿿]")
+
+def extract_title(text: str, final: bool) -> Optional[str]:
+    """取第一行非空文本作为标题，流式输出时需要等到该行结束"""
+    lines = text.split("\n")
+    complete = lines if final else lines[:-1]
+    for line in complete:
+        title = line.strip().lstrip("#").strip()
+        if title:
+            return title
+    return None
+
+@dataclass
+class StreamingInput:
+    """
+    节点对上游结果的部分依赖，配置示例：
+    {"stream_from": {"node": "generate_copy", "tokens": 32}}
+    {"stream_from": {"node": "generate_copy", "field": "title"}}
+    """
+    source: str
+    tokens: Optional[int] = None
+    field: Optional[str] = None
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> Optional["StreamingInput"]:
+        spec = config.get("stream_from")
+        if not spec or "node" not in spec:
+            return None
+        if spec.get("tokens") is None and spec.get("field") is None:
+            return None
+        return cls(
+            source=spec["node"],
+            tokens=max(1, int(spec["tokens"])) if spec.get("tokens") is not None else None,
+            field=spec.get("field")
+        )
+
+    def view(self, result: Dict[str, Any], final: bool) -> Optional[Dict[str, Any]]:
+        """
+        从上游结果中取出该节点需要的部分，数据尚不完整时返回None
+
+        推测执行和正常执行都使用同一个视图，保证两者的输入一致。
+        """
+        if not isinstance(result, dict):
+            return None
+
+        if self.field is not None:
+            if self.field in result:
+                return {self.field: result[self.field]}
+            if self.field == "title" and isinstance(result.get("text"), str):
+                title = extract_title(result["text"], final)
+                return {"title": title} if title is not None else None
+            return {} if final else None
+
+        text = result.get("text")
+        if not isinstance(text, str):
+            return {} if final else None
+        matches = list(_TOKEN_PATTERN.finditer(text))
+        # 流式输出时需要看到第N+1个token，才能确定第N个token已完整
+        if len(matches) > self.tokens or (final and matches):
+            end = matches[min(self.tokens, len(matches)) - 1].end()
+            return {"text": text[:end]}
+        return {"text": ""} if final else None
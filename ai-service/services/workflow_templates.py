@@ -2,6 +2,7 @@
 预定义AI工作流模板
 """
 from datetime import datetime
+from typing import List
 from .workflow_engine import WorkflowDefinition, WorkflowNode, NodeType, WorkflowStatus
 
 class WorkflowTemplates:
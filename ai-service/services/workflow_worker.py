@@ -0,0 +1,235 @@
+"""
+工作流工作进程 - 从Broker认领执行任务并上报状态
+
+用法:
+    python -m services.workflow_worker --workers 4
+"""
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import uuid
+from typing import Dict, Optional
+
+from .workflow_broker import WorkflowBroker, create_broker
+from .workflow_engine import WorkflowEngine, WorkflowDefinition, WorkflowExecution, WorkflowStatus
+
+logger = logging.getLogger(__name__)
+
+class WorkflowWorker:
+    """工作流工作进程"""
+
+    def __init__(self,
+                 engine: WorkflowEngine,
+                 broker: WorkflowBroker,
+                 worker_id: Optional[str] = None,
+                 concurrency: int = 2,
+                 poll_interval: float = 1.0,
+                 heartbeat_interval: float = 5.0,
+                 lease_timeout: float = 30.0):
+        self.engine = engine
+        self.broker = broker
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.lease_timeout = lease_timeout
+        self.active_jobs: Dict[str, asyncio.Task] = {}
+        self._draining: set = set()
+        self._stopping = asyncio.Event()
+
+    def request_stop(self):
+        """停止认领新任务，进入排空阶段"""
+        if not self._stopping.is_set():
+            logger.info(f"Worker {self.worker_id} stopping, {len(self.active_jobs)} jobs in flight")
+            self._stopping.set()
+
+    async def run(self, drain_timeout: float = 30.0):
+        """认领并执行任务，直到收到停止信号"""
+        logger.info(f"Worker {self.worker_id} started (concurrency={self.concurrency})")
+
+        while not self._stopping.is_set():
+            if len(self.active_jobs) >= self.concurrency:
+                await asyncio.wait(list(self.active_jobs.values()), return_when=asyncio.FIRST_COMPLETED)
+                continue
+
+            try:
+                job = await self.broker.claim(self.worker_id, self.lease_timeout)
+            except Exception as e:
+                logger.error(f"Worker {self.worker_id} failed to claim job: {e}")
+                job = None
+
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            self.active_jobs[job["id"]] = asyncio.create_task(self._run_job(job))
+
+        await self.drain(drain_timeout)
+        logger.info(f"Worker {self.worker_id} stopped")
+
+    async def drain(self, timeout: float):
+        """等待运行中的任务完成，超时的任务归还给Broker"""
+        if not self.active_jobs:
+            return
+
+        _, pending = await asyncio.wait(list(self.active_jobs.values()), timeout=timeout)
+        for execution_id, task in list(self.active_jobs.items()):
+            if task in pending:
+                self._draining.add(execution_id)
+                task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+            logger.warning(f"Worker {self.worker_id} released {len(pending)} unfinished jobs")
+
+    async def _run_job(self, job: Dict):
+        """执行单个工作流任务"""
+        execution_id = job["id"]
+        workflow = WorkflowDefinition.from_dict(job["workflow"])
+        self.engine.workflows[workflow.id] = workflow
+
+        execution = WorkflowExecution(
+            id=execution_id,
+            workflow_id=workflow.id,
+            status=WorkflowStatus.PENDING,
+            input_data=job["input_data"]
+        )
+        self.engine.executions[execution_id] = execution
+        logger.info(f"Worker {self.worker_id} claimed execution {execution_id} (attempt {job['attempts']})")
+
+        run_task = asyncio.create_task(self.engine._run_workflow(execution))
+        try:
+            while not run_task.done():
+                done, _ = await asyncio.wait({run_task}, timeout=self.heartbeat_interval)
+                if done:
+                    break
+                cancel_requested = await self.broker.heartbeat(
+                    execution_id, self.worker_id, execution.to_dict(), self.lease_timeout
+                )
+                if cancel_requested:
+                    run_task.cancel()
+                    await asyncio.gather(run_task, return_exceptions=True)
+                    execution.status = WorkflowStatus.CANCELLED
+                    break
+
+            if run_task.cancelled() and execution.status != WorkflowStatus.CANCELLED:
+                execution.status = WorkflowStatus.CANCELLED
+            await self.broker.complete(execution_id, self.worker_id, execution.to_dict())
+
+        except asyncio.CancelledError:
+            # 排空超时：停止执行并把任务交还给其他工作进程
+            run_task.cancel()
+            await asyncio.gather(run_task, return_exceptions=True)
+            if execution_id in self._draining:
+                await self.broker.release(execution_id, self.worker_id)
+            raise
+
+        except Exception as e:
+            # 心跳或上报失败：停止执行并交还租约，由其他工作进程重试
+            logger.error(f"Worker {self.worker_id} lost execution {execution_id}: {e}")
+            run_task.cancel()
+            await asyncio.gather(run_task, return_exceptions=True)
+            try:
+                await self.broker.release(execution_id, self.worker_id)
+            except Exception as release_error:
+                logger.error(f"Worker {self.worker_id} failed to release execution {execution_id}: {release_error}")
+
+        finally:
+            self.active_jobs.pop(execution_id, None)
+            self._draining.discard(execution_id)
+            self.engine.executions.pop(execution_id, None)
+            # 同一工作流的其他任务可能已经换上了自己的定义
+            if self.engine.workflows.get(workflow.id) is workflow:
+                del self.engine.workflows[workflow.id]
+
+async def _worker_main(broker_url: str, concurrency: int, heartbeat_interval: float,
+                       lease_timeout: float, drain_timeout: float):
+    """单个工作进程的入口"""
+    from src.utils.config import settings
+    from src.models.multi_provider_manager import MultiProviderModelManager
+    from .workflow_engine import workflow_engine, NodeType, TextGenerationExecutor, ModelManagerTextService
+    from .workflow_scheduler import WorkflowScheduler
+
+    workflow_engine.scheduler = WorkflowScheduler.from_settings(settings)
+    model_manager = MultiProviderModelManager()
+    await model_manager.initialize()
+    workflow_engine.register_executor(
+        NodeType.TEXT_GENERATION, TextGenerationExecutor(ModelManagerTextService(model_manager))
+    )
+
+    broker = create_broker(broker_url)
+    worker = WorkflowWorker(
+        engine=workflow_engine,
+        broker=broker,
+        concurrency=concurrency,
+        heartbeat_interval=heartbeat_interval,
+        lease_timeout=lease_timeout
+    )
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, worker.request_stop)
+
+    try:
+        await worker.run(drain_timeout=drain_timeout)
+    finally:
+        await broker.close()
+        await model_manager.cleanup()
+
+def _worker_process(*args):
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    asyncio.run(_worker_main(*args))
+
+def run_workers(num_workers: int, broker_url: str, concurrency: int, heartbeat_interval: float,
+                lease_timeout: float, drain_timeout: float):
+    """启动多个工作进程，收到SIGTERM/SIGINT时通知所有进程排空后退出"""
+    ctx = multiprocessing.get_context("spawn")
+    args = (broker_url, concurrency, heartbeat_interval, lease_timeout, drain_timeout)
+    processes = [
+        ctx.Process(target=_worker_process, args=args, name=f"workflow-worker-{i}")
+        for i in range(num_workers)
+    ]
+    for process in processes:
+        process.start()
+
+    def _forward(signum, frame):
+        for process in processes:
+            if process.is_alive():
+                os.kill(process.pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, _forward)
+    signal.signal(signal.SIGINT, _forward)
+
+    for process in processes:
+        process.join()
+
+def main():
+    from src.utils.config import settings
+
+    parser = argparse.ArgumentParser(description="YouCreator.AI 工作流工作进程")
+    parser.add_argument("--workers", type=int, default=1, help="工作进程数量")
+    parser.add_argument("--broker-url", default=settings.WORKFLOW_BROKER_URL, help="Broker地址")
+    parser.add_argument("--concurrency", type=int, default=settings.WORKFLOW_WORKER_CONCURRENCY,
+                        help="每个进程同时执行的工作流数量")
+    args = parser.parse_args()
+
+    run_workers(
+        num_workers=args.workers,
+        broker_url=args.broker_url,
+        concurrency=args.concurrency,
+        heartbeat_interval=settings.WORKFLOW_HEARTBEAT_INTERVAL,
+        lease_timeout=settings.WORKFLOW_LEASE_TIMEOUT,
+        drain_timeout=settings.WORKFLOW_DRAIN_TIMEOUT
+    )
+
+if __name__ == "__main__":
+    main()
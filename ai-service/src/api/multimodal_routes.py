@@ -3,7 +3,7 @@
 支持文字配图、文字配乐、图片配乐等功能
 """
 
-from fastapi import APIRouter, HTTPException, Request, File, UploadFile
+from fastapi import APIRouter, HTTPException, Request, File, UploadFile, Query
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 from typing import Optional, Dict, Any, List
@@ -13,6 +13,12 @@ import io
 import base64
 from PIL import Image
 
+from ..utils.image_ingest import ImageIngestError, open_upload
+from ..utils.image_features import describe, extract_features, music_hints
+from ..utils.media_encoding import (
+    MediaFormat, UnsupportedFormat, encode_image, negotiate, response_headers, transcode_audio
+)
+
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
@@ -41,6 +47,9 @@ class CompleteContentRequest(BaseModel):
     music_duration: Optional[int] = Field(30, description="音乐时长")
     image_width: Optional[int] = Field(512, description="图像宽度")
     image_height: Optional[int] = Field(512, description="图像高度")
+    image_format: Optional[str] = Field(None, description="配图格式 (png/jpeg/webp/avif)，默认png")
+    image_quality: Optional[int] = Field(None, ge=1, le=100, description="有损图片格式的质量")
+    music_format: Optional[str] = Field(None, description="配乐格式 (wav/flac/mp3/opus)，默认wav")
 
 # 响应模型定义
 class MultimodalResponse(BaseModel):
@@ -49,6 +58,18 @@ class MultimodalResponse(BaseModel):
     message: Optional[str] = None
     metadata: Optional[Dict[str, Any]] = None
 
+def _negotiate(kind: str, requested: Optional[str], req: Request) -> MediaFormat:
+    """按 output_format 参数或 Accept 头选择输出格式，指定了不可用的格式时返回400"""
+    try:
+        return negotiate(kind, requested, req.headers.get("accept"))
+    except UnsupportedFormat as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# 二进制接口的输出格式参数，未指定时按 Accept 头协商
+_IMAGE_FORMAT_QUERY = Query(None, description="图片格式 (png/jpeg/webp/avif)，未指定时按Accept协商")
+_AUDIO_FORMAT_QUERY = Query(None, description="音频格式 (wav/flac/mp3/opus)，未指定时按Accept协商")
+_QUALITY_QUERY = Query(None, ge=1, le=100, description="有损图片格式的质量")
+
 def get_multimodal_manager(request: Request):
     """获取多模态内容管理器"""
     if hasattr(request.app.state, 'model_manager'):
@@ -58,10 +79,13 @@ def get_multimodal_manager(request: Request):
     raise HTTPException(status_code=503, detail="多模态服务未初始化")
 
 @router.post("/text-to-image", response_class=StreamingResponse)
-async def text_to_image(request: TextToImageRequest, req: Request):
+async def text_to_image(request: TextToImageRequest, req: Request,
+                        output_format: Optional[str] = _IMAGE_FORMAT_QUERY,
+                        output_quality: Optional[int] = _QUALITY_QUERY):
     """文字配图 - 为文字生成配图"""
     try:
         multimodal_manager = get_multimodal_manager(req)
+        image_format = _negotiate("image", output_format, req)
         
         logger.info(f"🎨 文字配图请求: {request.text[:50]}...")
         
@@ -72,23 +96,27 @@ async def text_to_image(request: TextToImageRequest, req: Request):
             height=request.height
         )
         
+        image_bytes = await encode_image(image_bytes, image_format, output_quality)
+        
         return StreamingResponse(
             io.BytesIO(image_bytes),
-            media_type="image/png",
-            headers={
-                "Content-Disposition": f"attachment; filename=text_to_image.png"
-            }
+            media_type=image_format.media_type,
+            headers=response_headers(image_format, "text_to_image")
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"文字配图失败: {e}")
         raise HTTPException(status_code=500, detail=f"文字配图失败: {str(e)}")
 
 @router.post("/text-to-music", response_class=StreamingResponse)
-async def text_to_music(request: TextToMusicRequest, req: Request):
+async def text_to_music(request: TextToMusicRequest, req: Request,
+                        output_format: Optional[str] = _AUDIO_FORMAT_QUERY):
     """文字配乐 - 为文字生成配乐"""
     try:
         multimodal_manager = get_multimodal_manager(req)
+        audio_format = _negotiate("audio", output_format, req)
         
         logger.info(f"🎵 文字配乐请求: {request.text[:50]}...")
         
@@ -97,23 +125,27 @@ async def text_to_music(request: TextToMusicRequest, req: Request):
             duration=request.duration
         )
         
+        music_bytes, audio_format = await transcode_audio(music_bytes, audio_format)
+        
         return StreamingResponse(
             io.BytesIO(music_bytes),
-            media_type="audio/wav",
-            headers={
-                "Content-Disposition": f"attachment; filename=text_to_music.wav"
-            }
+            media_type=audio_format.media_type,
+            headers=response_headers(audio_format, "text_to_music")
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"文字配乐失败: {e}")
         raise HTTPException(status_code=500, detail=f"文字配乐失败: {str(e)}")
 
 @router.post("/image-to-music", response_class=StreamingResponse)
-async def image_to_music(request: ImageToMusicRequest, req: Request):
+async def image_to_music(request: ImageToMusicRequest, req: Request,
+                         output_format: Optional[str] = _AUDIO_FORMAT_QUERY):
     """图片配乐 - 为图片生成配乐"""
     try:
         multimodal_manager = get_multimodal_manager(req)
+        audio_format = _negotiate("audio", output_format, req)
         
         logger.info(f"🎵 图片配乐请求: {request.image_description[:50]}...")
         
@@ -122,14 +154,16 @@ async def image_to_music(request: ImageToMusicRequest, req: Request):
             duration=request.duration
         )
         
+        music_bytes, audio_format = await transcode_audio(music_bytes, audio_format)
+        
         return StreamingResponse(
             io.BytesIO(music_bytes),
-            media_type="audio/wav",
-            headers={
-                "Content-Disposition": f"attachment; filename=image_to_music.wav"
-            }
+            media_type=audio_format.media_type,
+            headers=response_headers(audio_format, "image_to_music")
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"图片配乐失败: {e}")
         raise HTTPException(status_code=500, detail=f"图片配乐失败: {str(e)}")
@@ -138,38 +172,41 @@ async def image_to_music(request: ImageToMusicRequest, req: Request):
 async def upload_image_for_music(
     file: UploadFile = File(...),
     duration: int = 30,
-    req: Request = None
+    req: Request = None,
+    output_format: Optional[str] = _AUDIO_FORMAT_QUERY
 ):
     """上传图片生成配乐"""
     try:
         multimodal_manager = get_multimodal_manager(req)
+        audio_format = _negotiate("audio", output_format, req)
         
-        # 验证文件类型
-        if not file.content_type.startswith('image/'):
-            raise HTTPException(status_code=400, detail="请上传图片文件")
-        
-        # 读取图片
-        image_data = await file.read()
-        image = Image.open(io.BytesIO(image_data))
+        # 验证文件并读取图片头，像素在分析时按缩略图尺寸解码
+        try:
+            image = await open_upload(file)
+        except ImageIngestError as e:
+            raise HTTPException(status_code=e.status_code, detail=str(e))
         
-        # 分析图片内容（简单实现）
-        image_description = await analyze_uploaded_image(image)
+        # 分析图片的颜色和纹理特征
+        analysis = await analyze_uploaded_image(image)
         
-        logger.info(f"🎵 上传图片配乐请求: {image_description[:50]}...")
+        logger.info(f"🎵 上传图片配乐请求: {analysis['description'][:50]}...")
         
         music_bytes = await multimodal_manager.music_client.generate_music_for_image(
-            image_description=image_description,
-            duration=duration
+            image_description=analysis["description"],
+            duration=duration,
+            hints=analysis["hints"]
         )
         
+        music_bytes, audio_format = await transcode_audio(music_bytes, audio_format)
+        
         return StreamingResponse(
             io.BytesIO(music_bytes),
-            media_type="audio/wav",
-            headers={
-                "Content-Disposition": f"attachment; filename=uploaded_image_music.wav"
-            }
+            media_type=audio_format.media_type,
+            headers=response_headers(audio_format, "uploaded_image_music")
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"上传图片配乐失败: {e}")
         raise HTTPException(status_code=500, detail=f"上传图片配乐失败: {str(e)}")
@@ -179,6 +216,11 @@ async def create_complete_content(request: CompleteContentRequest, req: Request)
     """创建完整多模态内容 - 文字+配图+配乐"""
     try:
         multimodal_manager = get_multimodal_manager(req)
+        try:
+            image_format = negotiate("image", request.image_format)
+            audio_format = negotiate("audio", request.music_format)
+        except UnsupportedFormat as e:
+            raise HTTPException(status_code=400, detail=str(e))
         
         logger.info(f"🎯 完整内容创建请求: {request.text[:50]}...")
         
@@ -199,17 +241,19 @@ async def create_complete_content(request: CompleteContentRequest, req: Request)
         }
         
         if result["image"]:
+            image_bytes = await encode_image(result["image"], image_format, request.image_quality)
             response_data["image"] = {
-                "data": base64.b64encode(result["image"]).decode('utf-8'),
-                "format": "png",
-                "size": len(result["image"])
+                "data": base64.b64encode(image_bytes).decode('utf-8'),
+                "format": image_format.name,
+                "size": len(image_bytes)
             }
         
         if result["music"]:
+            music_bytes, music_format = await transcode_audio(result["music"], audio_format)
             response_data["music"] = {
-                "data": base64.b64encode(result["music"]).decode('utf-8'),
-                "format": "wav",
-                "size": len(result["music"])
+                "data": base64.b64encode(music_bytes).decode('utf-8'),
+                "format": music_format.name,
+                "size": len(music_bytes)
             }
         
         return MultimodalResponse(
@@ -218,6 +262,8 @@ async def create_complete_content(request: CompleteContentRequest, req: Request)
             message="完整多模态内容创建成功"
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"完整内容创建失败: {e}")
         raise HTTPException(status_code=500, detail=f"完整内容创建失败: {str(e)}")
@@ -274,40 +320,19 @@ async def get_supported_styles():
         message="支持的风格列表"
     )
 
-async def analyze_uploaded_image(image: Image.Image) -> str:
-    """分析上传的图片内容"""
-    # 简单的图片分析实现
-    # 在实际应用中，可以使用更复杂的图像识别API
-    
-    width, height = image.size
-    mode = image.mode
-    
-    # 基于图片属性进行简单分析
-    if width > height:
-        orientation = "landscape"
-    elif height > width:
-        orientation = "portrait"
-    else:
-        orientation = "square"
-    
-    # 分析颜色模式
-    if mode == "RGB":
-        color_type = "colorful"
-    elif mode == "L":
-        color_type = "grayscale"
-    else:
-        color_type = "mixed"
-    
-    # 生成描述
-    description = f"{orientation} {color_type} image, {width}x{height} pixels"
-    
-    # 可以添加更多分析逻辑
-    if width * height > 500000:  # 大图
-        description += ", high resolution, detailed"
-    else:
-        description += ", standard resolution"
+async def analyze_uploaded_image(image: Image.Image) -> Dict[str, Any]:
+    """
+    分析上传的图片内容
     
-    return description
+    在缩略图上提取颜色和纹理特征，返回描述、配乐提示和特征；未安装numpy时只根据尺寸和颜色模式描述。
+    """
+    size, mode = image.size, image.mode
+    features = await asyncio.to_thread(extract_features, image)
+    return {
+        "description": describe(size, mode, features),
+        "hints": music_hints(features) if features else None,
+        "features": features
+    }
 
 @router.get("/multimodal-status")
 async def get_multimodal_status(req: Request):
@@ -2,7 +2,7 @@
 AI服务API路由 - 开源模型版本
 """
 
-from fastapi import APIRouter, HTTPException, Request
+from fastapi import APIRouter, HTTPException, Request, Query
 from pydantic import BaseModel, Field
 from typing import Optional, Dict, Any
 import asyncio
@@ -10,6 +10,10 @@ import logging
 from fastapi.responses import StreamingResponse
 import io
 
+from ..utils.media_encoding import UnsupportedFormat, encode_image, negotiate, response_headers
+from ..utils.metrics import track_placeholders
+from ..utils.prompt_cache import prompt_caches, cache_key
+
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
@@ -49,6 +53,28 @@ def get_model_manager(request: Request):
         return request.app.state.model_manager
     raise HTTPException(status_code=503, detail="模型管理器未初始化")
 
+async def _generate_with_cache(endpoint: str, prompt: str, params: Dict[str, Any], generate):
+    """
+    启用提示缓存时先查缓存，未命中再生成；占位/备用内容不写入缓存
+
+    返回 (结果, 缓存信息)，未启用缓存时缓存信息为None。
+    """
+    cache = prompt_caches.get(endpoint)
+    if cache is None:
+        return await generate(), None
+    
+    key = cache_key(**params)
+    cached = cache.get(prompt, key)
+    if cached is not None:
+        logger.info(f"🧠 {endpoint} 提示缓存命中")
+        return cached, {"hit": True}
+    
+    with track_placeholders() as placeholders:
+        result = await generate()
+    if not placeholders:
+        cache.put(prompt, key, result)
+    return result, {"hit": False}
+
 @router.post("/text/generate", response_model=GenerationResponse)
 async def generate_text(request: TextGenerationRequest, req: Request):
     """生成文本内容"""
@@ -57,10 +83,14 @@ async def generate_text(request: TextGenerationRequest, req: Request):
         
         logger.info(f"📝 文本生成请求: {request.prompt[:50]}...")
         
-        generated_text = await model_manager.generate_text(
-            prompt=request.prompt,
-            max_length=request.max_length,
-            temperature=request.temperature
+        generated_text, cache_info = await _generate_with_cache(
+            "text", request.prompt,
+            {"max_length": request.max_length, "temperature": request.temperature},
+            lambda: model_manager.generate_text(
+                prompt=request.prompt,
+                max_length=request.max_length,
+                temperature=request.temperature
+            )
         )
         
         return GenerationResponse(
@@ -75,7 +105,8 @@ async def generate_text(request: TextGenerationRequest, req: Request):
                 "parameters": {
                     "max_length": request.max_length,
                     "temperature": request.temperature
-                }
+                },
+                "cache": cache_info
             }
         )
         
@@ -84,8 +115,15 @@ async def generate_text(request: TextGenerationRequest, req: Request):
         raise HTTPException(status_code=500, detail=f"文本生成失败: {str(e)}")
 
 @router.post("/image/generate")
-async def generate_image(request: ImageGenerationRequest, req: Request):
+async def generate_image(request: ImageGenerationRequest, req: Request,
+                         output_format: Optional[str] = Query(None, description="图片格式 (png/jpeg/webp/avif)，未指定时按Accept协商"),
+                         output_quality: Optional[int] = Query(None, ge=1, le=100, description="有损图片格式的质量")):
     """生成图像内容"""
+    try:
+        image_format = negotiate("image", output_format, req.headers.get("accept"))
+    except UnsupportedFormat as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
     try:
         model_manager = get_model_manager(req)
         
@@ -98,12 +136,12 @@ async def generate_image(request: ImageGenerationRequest, req: Request):
             steps=request.steps
         )
         
+        image_bytes = await encode_image(image_bytes, image_format, output_quality)
+        
         return StreamingResponse(
             io.BytesIO(image_bytes),
-            media_type="image/png",
-            headers={
-                "Content-Disposition": "attachment; filename=generated_image.png"
-            }
+            media_type=image_format.media_type,
+            headers=response_headers(image_format, "generated_image")
         )
         
     except Exception as e:
@@ -155,10 +193,14 @@ async def generate_code(request: CodeGenerationRequest, req: Request):
         
         logger.info(f"💻 代码生成请求: {request.prompt[:50]}...")
         
-        generated_code = await model_manager.generate_code(
-            prompt=request.prompt,
-            language=request.language,
-            max_length=request.max_length
+        generated_code, cache_info = await _generate_with_cache(
+            "code", request.prompt,
+            {"language": request.language, "max_length": request.max_length},
+            lambda: model_manager.generate_code(
+                prompt=request.prompt,
+                language=request.language,
+                max_length=request.max_length
+            )
         )
         
         return GenerationResponse(
@@ -174,7 +216,8 @@ async def generate_code(request: CodeGenerationRequest, req: Request):
                 "parameters": {
                     "language": request.language,
                     "max_length": request.max_length
-                }
+                },
+                "cache": cache_info
             }
         )
         
@@ -4,12 +4,18 @@ Groq API客户端
 """
 
 import os
+import json
 import httpx
 import asyncio
 import logging
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, AsyncIterator
 from dotenv import load_dotenv
 
+from ..utils.metrics import track_provider, PLACEHOLDER_RESPONSES
+from .readiness import check_probe_response
+from ..utils.rate_limit import rate_limiters, estimate_tokens, RateLimitExceeded
+from ..utils.deadline import timeout_for
+
 # 加载环境变量
 load_dotenv()
 
@@ -22,7 +28,7 @@ class GroqClient:
     def __init__(self):
         self.api_key = os.getenv("GROQ_API_KEY")
         # 使用标准的OpenAI兼容端点
-        self.base_url = "https://api.groq.com/openai/v1"
+        self.base_url = os.getenv("GROQ_BASE_URL", "https://api.groq.com/openai/v1")
         self.text_model = os.getenv("GROQ_MODEL_TEXT", "llama3-8b-8192")
         self.code_model = os.getenv("GROQ_MODEL_CODE", "llama3-8b-8192")
         
@@ -37,9 +43,11 @@ class GroqClient:
     async def generate_text(self, prompt: str, **kwargs) -> str:
         """使用Groq生成文本"""
         if not self.enabled:
+            PLACEHOLDER_RESPONSES.inc(component="groq_text")
             return self._generate_fallback_text(prompt, **kwargs)
         
         try:
+            limiter = rate_limiters.get("groq")
             max_tokens = min(kwargs.get("max_tokens", 1000), 4000)
             temperature = kwargs.get("temperature", 0.7)
             
@@ -72,18 +80,29 @@ class GroqClient:
                     "stream": False
                 }
                 
+                try:
+                    reserved = await limiter.acquire(estimate_tokens(prompt, max_tokens))
+                except RateLimitExceeded as e:
+                    logger.warning(f"⚠️ {e}，不再尝试其他Groq模型")
+                    break
+                
                 logger.info(f"🚀 尝试Groq模型 {model}: {prompt[:50]}...")
                 
+                used = 0  # 没有成功的尝试（非200、超时、异常）退还全部预留
                 try:
-                    async with httpx.AsyncClient(timeout=30.0) as client:
-                        response = await client.post(
-                            f"{self.base_url}/chat/completions",
-                            headers=headers,
-                            json=data
-                        )
+                    async with httpx.AsyncClient(timeout=timeout_for(30.0)) as client:
+                        with track_provider("groq", model, "text") as call:
+                            response = await client.post(
+                                f"{self.base_url}/chat/completions",
+                                headers=headers,
+                                json=data
+                            )
+                            call.outcome = "success" if response.status_code == 200 else "error"
+                        limiter.update(response.status_code, response.headers)
                         
                         if response.status_code == 200:
                             result = response.json()
+                            used = result.get("usage", {}).get("total_tokens")
                             generated_text = result["choices"][0]["message"]["content"]
                             logger.info(f"✅ Groq文本生成成功 ({model})，长度: {len(generated_text)}")
                             return generated_text
@@ -93,6 +112,9 @@ class GroqClient:
                         elif response.status_code == 404:
                             logger.warning(f"⚠️ 模型 {model} 不可用，尝试下一个...")
                             continue
+                        elif response.status_code == 429:
+                            logger.warning("⚠️ Groq限流，等待配额后尝试下一个模型...")
+                            continue
                         else:
                             logger.warning(f"⚠️ Groq API返回 {response.status_code}: {response.text[:100]}")
                             continue
@@ -100,21 +122,103 @@ class GroqClient:
                 except Exception as e:
                     logger.warning(f"⚠️ 模型 {model} 请求失败: {e}")
                     continue
+                finally:
+                    limiter.settle(reserved, used)
             
             # 如果所有模型都失败，使用备用方案
             logger.warning("⚠️ 所有Groq模型都不可用，使用备用方案")
+            PLACEHOLDER_RESPONSES.inc(component="groq_text")
             return self._generate_fallback_text(prompt, **kwargs)
                     
         except Exception as e:
             logger.error(f"❌ Groq文本生成失败: {e}")
+            PLACEHOLDER_RESPONSES.inc(component="groq_text")
             return self._generate_fallback_text(prompt, **kwargs)
     
+    async def generate_text_stream(self, prompt: str, **kwargs) -> AsyncIterator[str]:
+        """
+        使用Groq流式生成文本（OpenAI兼容的 stream: true），逐块产出增量文本
+
+        收到第一块文本之前失败时改用 generate_text（依次尝试其他模型，最后使用备用文本）并一次性产出；
+        已经产出部分文本后失败直接抛出异常。
+        """
+        if not self.enabled:
+            yield await self.generate_text(prompt, **kwargs)
+            return
+        
+        limiter = rate_limiters.get("groq")
+        max_tokens = min(kwargs.get("max_tokens", 1000), 4000)
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json",
+            "User-Agent": "YouCreator.AI/1.0"
+        }
+        data = {
+            "model": self.text_model,
+            "messages": [{"role": "user", "content": prompt}],
+            "max_tokens": max_tokens,
+            "temperature": kwargs.get("temperature", 0.7),
+            "stream": True
+        }
+        
+        streamed = False
+        try:
+            reserved = await limiter.acquire(estimate_tokens(prompt, max_tokens))
+            used = 0  # 没有产出文本就失败的请求退还全部预留；已经产出部分文本时提供商已计费，保留预留
+            logger.info(f"🚀 Groq流式生成 {self.text_model}: {prompt[:50]}...")
+            try:
+                async with httpx.AsyncClient(timeout=timeout_for(30.0)) as client:
+                    request = client.build_request("POST", f"{self.base_url}/chat/completions", headers=headers, json=data)
+                    # 只统计到响应头返回（首字节延迟），读取响应体时不占用当前span
+                    with track_provider("groq", self.text_model, "text_stream") as call:
+                        response = await client.send(request, stream=True)
+                        call.outcome = "success" if response.status_code == 200 else "error"
+                    try:
+                        limiter.update(response.status_code, response.headers)
+                        if response.status_code != 200:
+                            await response.aread()
+                            raise Exception(f"Groq API返回 {response.status_code}: {response.text[:100]}")
+                    
+                        usage = None
+                        async for line in response.aiter_lines():
+                            if not line.startswith("data:"):
+                                continue
+                            payload = line[len("data:"):].strip()
+                            if payload == "[DONE]":
+                                break
+                            event = json.loads(payload)
+                            # Groq在最后一个事件的 x_groq.usage 中返回用量
+                            usage = event.get("usage") or event.get("x_groq", {}).get("usage") or usage
+                            choices = event.get("choices") or []
+                            content = choices[0].get("delta", {}).get("content") if choices else None
+                            if content:
+                                streamed = True
+                                yield content
+                        used = (usage or {}).get("total_tokens")
+                    finally:
+                        await response.aclose()
+            finally:
+                limiter.settle(reserved, None if streamed and used == 0 else used)
+        except Exception as e:
+            if streamed:
+                logger.error(f"❌ Groq流式生成中断: {e}")
+                raise
+            logger.warning(f"⚠️ Groq流式生成失败，改用非流式生成: {e}")
+            yield await self.generate_text(prompt, **kwargs)
+            return
+        
+        if not streamed:
+            logger.warning("⚠️ Groq流式生成没有返回内容，改用非流式生成")
+            yield await self.generate_text(prompt, **kwargs)
+    
     async def generate_code(self, prompt: str, **kwargs) -> str:
         """使用Groq生成代码"""
         if not self.enabled:
+            PLACEHOLDER_RESPONSES.inc(component="groq_code")
             return self._generate_enhanced_code_template(prompt, kwargs.get("language", "python"))
         
         try:
+            limiter = rate_limiters.get("groq")
             language = kwargs.get("language", "python")
             max_tokens = min(kwargs.get("max_tokens", 1000), 4000)
             
@@ -156,18 +260,29 @@ class GroqClient:
                     "stream": False
                 }
                 
+                try:
+                    reserved = await limiter.acquire(estimate_tokens(code_prompt, max_tokens))
+                except RateLimitExceeded as e:
+                    logger.warning(f"⚠️ {e}，不再尝试其他Groq模型")
+                    break
+                
                 logger.info(f"🚀 尝试Groq代码生成 {model}: {prompt[:50]}...")
                 
+                used = 0  # 没有成功的尝试（非200、超时、异常）退还全部预留
                 try:
-                    async with httpx.AsyncClient(timeout=30.0) as client:
-                        response = await client.post(
-                            f"{self.base_url}/chat/completions",
-                            headers=headers,
-                            json=data
-                        )
+                    async with httpx.AsyncClient(timeout=timeout_for(30.0)) as client:
+                        with track_provider("groq", model, "code") as call:
+                            response = await client.post(
+                                f"{self.base_url}/chat/completions",
+                                headers=headers,
+                                json=data
+                            )
+                            call.outcome = "success" if response.status_code == 200 else "error"
+                        limiter.update(response.status_code, response.headers)
                         
                         if response.status_code == 200:
                             result = response.json()
+                            used = result.get("usage", {}).get("total_tokens")
                             generated_code = result["choices"][0]["message"]["content"]
                             logger.info(f"✅ Groq代码生成成功 ({model})，长度: {len(generated_code)}")
                             return generated_code
@@ -177,6 +292,9 @@ class GroqClient:
                         elif response.status_code == 404:
                             logger.warning(f"⚠️ 模型 {model} 不可用，尝试下一个...")
                             continue
+                        elif response.status_code == 429:
+                            logger.warning("⚠️ Groq限流，等待配额后尝试下一个模型...")
+                            continue
                         else:
                             logger.warning(f"⚠️ Groq API返回 {response.status_code}")
                             continue
@@ -184,13 +302,17 @@ class GroqClient:
                 except Exception as e:
                     logger.warning(f"⚠️ 模型 {model} 请求失败: {e}")
                     continue
+                finally:
+                    limiter.settle(reserved, used)
             
             # 如果所有模型都失败，使用备用方案
             logger.warning("⚠️ 所有Groq模型都不可用，使用备用方案")
+            PLACEHOLDER_RESPONSES.inc(component="groq_code")
             return self._generate_enhanced_code_template(prompt, language)
                     
         except Exception as e:
             logger.error(f"❌ Groq代码生成失败: {e}")
+            PLACEHOLDER_RESPONSES.inc(component="groq_code")
             return self._generate_enhanced_code_template(prompt, language)
     
     def _generate_fallback_text(self, prompt: str, **kwargs) -> str:
@@ -373,6 +495,16 @@ func main() {{
         
         return templates.get(language, f"// {prompt}\n// TODO: 实现功能")
     
+    async def probe(self) -> Dict[str, Any]:
+        """探测API是否可达、密钥是否有效（不消耗生成额度）"""
+        async with httpx.AsyncClient(timeout=10.0) as client:
+            response = await client.get(
+                f"{self.base_url}/models",
+                headers={"Authorization": f"Bearer {self.api_key}"}
+            )
+        check_probe_response(response)
+        return {"status_code": response.status_code}
+    
     async def test_connection(self) -> bool:
         """测试Groq连接"""
         if not self.enabled:
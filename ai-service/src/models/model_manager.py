@@ -11,10 +11,10 @@ from transformers import (
     AutoTokenizer, AutoModelForCausalLM,
     pipeline, Pipeline
 )
-from diffusers import StableDiffusionPipeline
 import gc
 
 from ..utils.config import settings
+from ..utils.model_hub import model_hub
 
 logger = logging.getLogger(__name__)
 
@@ -85,15 +85,8 @@ class ModelManager:
         try:
             logger.info(f"Loading image model: {settings.IMAGE_MODEL}")
             
-            self.pipelines['image'] = StableDiffusionPipeline.from_pretrained(
-                settings.IMAGE_MODEL,
-                torch_dtype=torch.float16 if self.device == "cuda" else torch.float32,
-                safety_checker=None,
-                requires_safety_checker=False
-            )
-            
-            if self.device == "cuda":
-                self.pipelines['image'] = self.pipelines['image'].to("cuda")
+            # 与其他服务共用同一份权重
+            self.pipelines['image'] = model_hub.stable_diffusion(settings.IMAGE_MODEL, scheduler="default")
             
             logger.info("Image model loaded successfully")
             
@@ -172,12 +165,15 @@ class ModelManager:
             height = min(kwargs.get('height', 512), settings.MAX_IMAGE_SIZE)
             steps = kwargs.get('steps', 20)
             
-            image = self.pipelines['image'](
+            # 共享的流水线调用会等待其他请求的推理，在线程中执行
+            result = await asyncio.to_thread(
+                self.pipelines['image'],
                 prompt,
                 width=width,
                 height=height,
                 num_inference_steps=steps
-            ).images[0]
+            )
+            image = result.images[0]
             
             # 将PIL图像转换为bytes
             import io
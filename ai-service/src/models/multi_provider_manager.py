@@ -4,12 +4,14 @@
 """
 
 import os
-import asyncio
 import logging
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, AsyncIterator
 from .opensource_api_clients import MultiProviderAIClient
 from .groq_client import GroqClient
 from .multimodal_clients import MultimodalContentMatcher
+from .readiness import ReadinessMonitor
+from ..utils.config import settings
+from ..utils.metrics import PLACEHOLDER_RESPONSES
 
 logger = logging.getLogger(__name__)
 
@@ -21,6 +23,11 @@ class MultiProviderModelManager:
         self.multi_client = MultiProviderAIClient()
         self.groq_client = GroqClient()
         self.multimodal_matcher = MultimodalContentMatcher()
+        self.readiness = ReadinessMonitor(
+            timeout=settings.PROVIDER_PROBE_TIMEOUT,
+            interval=settings.PROVIDER_PROBE_INTERVAL
+        )
+        self._register_probes()
         
         self.providers = {
             "text": os.getenv("TEXT_MODEL_PROVIDER", "multi"),
@@ -45,8 +52,8 @@ class MultiProviderModelManager:
         logger.info("🚀 初始化多提供商模型管理器...")
         
         try:
-            # 等待多提供商客户端初始化
-            await asyncio.sleep(2)
+            # 并发探测所有提供商，完成后再统计可用状态
+            await self.readiness.run_once()
             
             # 获取可用提供商状态
             provider_status = self.multi_client.get_status()
@@ -71,12 +78,27 @@ class MultiProviderModelManager:
                 logger.warning("⚠️ 没有可用的AI提供商，将使用备用方案")
             
             self._initialized = True
+            self.readiness.start()
             logger.info("✅ 多提供商模型管理器初始化完成")
             
         except Exception as e:
             logger.error(f"❌ 初始化失败: {e}")
             # 不抛出异常，允许服务继续运行
     
+    def _register_probes(self):
+        """注册已配置提供商的健康探测，Ollama无需密钥，总是探测"""
+        for name, client in self.multi_client.providers.items():
+            if client.enabled or name == "ollama":
+                self.readiness.register(name, client.probe)
+        
+        if self.groq_client.enabled:
+            self.readiness.register("groq", self.groq_client.probe)
+        
+        image_client = self.multimodal_matcher.image_client
+        for name in ("stability", "replicate"):
+            if image_client.providers[name]["enabled"]:
+                self.readiness.register(name, lambda name=name: image_client.probe(name))
+    
     async def generate_text(self, prompt: str, **kwargs) -> str:
         """生成文本"""
         provider = self.providers["text"]
@@ -95,8 +117,21 @@ class MultiProviderModelManager:
         except Exception as e:
             logger.error(f"文本生成失败: {e}")
             # 最终备用方案
+            PLACEHOLDER_RESPONSES.inc(component="text")
             return self._generate_ultimate_fallback_text(prompt, **kwargs)
     
+    async def generate_text_stream(self, prompt: str, **kwargs) -> AsyncIterator[str]:
+        """
+        流式生成文本，逐块产出增量文本
+
+        文本提供商为Groq时使用其流式接口；其他提供商不支持流式，一次性产出完整结果。
+        """
+        if self.providers["text"] == "groq" and self.groq_client.enabled:
+            async for chunk in self.groq_client.generate_text_stream(prompt, **kwargs):
+                yield chunk
+        else:
+            yield await self.generate_text(prompt, **kwargs)
+    
     async def generate_image(self, prompt: str, **kwargs) -> bytes:
         """生成图像"""
         provider = self.providers["image"]
@@ -149,6 +184,7 @@ class MultiProviderModelManager:
         except Exception as e:
             logger.error(f"代码生成失败: {e}")
             # 最终备用方案
+            PLACEHOLDER_RESPONSES.inc(component="code")
             return self._generate_ultimate_fallback_code(prompt, **kwargs)
     
     # 多模态功能
@@ -470,6 +506,7 @@ try {{
         return {
             "initialized": self._initialized,
             "providers": self.providers,
+            "readiness": self.readiness.snapshot(),
             "multi_provider_status": multi_status,
             "groq_status": groq_status,
             "multimodal_status": {
@@ -501,5 +538,6 @@ try {{
     async def cleanup(self):
         """清理资源"""
         logger.info("🧹 清理多提供商模型管理器资源...")
-        # 多提供商客户端无需特殊清理
+        await self.readiness.stop()
+        self._initialized = False
         logger.info("✅ 资源清理完成")
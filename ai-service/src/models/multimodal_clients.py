@@ -9,12 +9,18 @@ import asyncio
 import logging
 import base64
 import json
+import time
 from typing import Dict, Any, Optional, List, Union
 from dotenv import load_dotenv
 import io
 from PIL import Image
 import random
 
+from ..utils.metrics import track_provider, PLACEHOLDER_RESPONSES, PROVIDER_FALLBACKS
+from ..utils.tracing import start_span
+from .readiness import check_probe_response
+from ..utils.deadline import timeout_for
+
 # 加载环境变量
 load_dotenv()
 
@@ -29,17 +35,17 @@ class ImageGenerationClient:
         self.providers = {
             "stability": {
                 "api_key": os.getenv("STABILITY_API_KEY"),
-                "base_url": "https://api.stability.ai/v1",
+                "base_url": os.getenv("STABILITY_BASE_URL", "https://api.stability.ai/v1"),
                 "enabled": bool(os.getenv("STABILITY_API_KEY"))
             },
             "replicate": {
                 "api_key": os.getenv("REPLICATE_API_TOKEN"),
-                "base_url": "https://api.replicate.com/v1",
+                "base_url": os.getenv("REPLICATE_BASE_URL", "https://api.replicate.com/v1"),
                 "enabled": bool(os.getenv("REPLICATE_API_TOKEN"))
             },
             "huggingface": {
                 "api_key": os.getenv("HUGGINGFACE_TOKEN"),
-                "base_url": "https://api-inference.huggingface.co/models",
+                "base_url": os.getenv("HUGGINGFACE_BASE_URL", "https://api-inference.huggingface.co/models"),
                 "enabled": bool(os.getenv("HUGGINGFACE_TOKEN"))
             }
         }
@@ -58,6 +64,19 @@ class ImageGenerationClient:
         enabled_providers = [name for name, config in self.providers.items() if config["enabled"]]
         logger.info(f"🎨 图像生成客户端初始化，可用提供商: {enabled_providers}")
     
+    async def probe(self, provider_name: str) -> Dict[str, Any]:
+        """探测图像提供商是否可达、密钥是否有效（Replicate同时用于音乐生成）"""
+        provider = self.providers[provider_name]
+        path = {"stability": "/engines/list", "replicate": "/account"}[provider_name]
+        auth = "Token" if provider_name == "replicate" else "Bearer"
+        async with httpx.AsyncClient(timeout=10.0) as client:
+            response = await client.get(
+                f"{provider['base_url']}{path}",
+                headers={"Authorization": f"{auth} {provider['api_key']}"}
+            )
+        check_probe_response(response)
+        return {"status_code": response.status_code}
+    
     async def generate_image_for_text(self, text: str, style: str = "realistic", **kwargs) -> bytes:
         """为文字生成配图"""
         # 分析文本内容，生成合适的图像提示
@@ -178,21 +197,24 @@ class ImageGenerationClient:
                     return await self._generate_with_provider(provider_name, prompt, width, height)
                 except Exception as e:
                     logger.warning(f"⚠️ {provider_name} 图像生成失败: {e}")
+                    PROVIDER_FALLBACKS.inc(component="image", provider=provider_name)
                     continue
         
         # 如果所有提供商都失败，生成占位符图像
+        PLACEHOLDER_RESPONSES.inc(component="image")
         return self._generate_placeholder_image(prompt, width, height)
     
     async def _generate_with_provider(self, provider_name: str, prompt: str, width: int, height: int) -> bytes:
-        """使用指定提供商生成图像"""
-        if provider_name == "huggingface":
-            return await self._generate_with_huggingface(prompt, width, height)
-        elif provider_name == "stability":
-            return await self._generate_with_stability(prompt, width, height)
-        elif provider_name == "replicate":
-            return await self._generate_with_replicate(prompt, width, height)
-        else:
-            raise ValueError(f"不支持的提供商: {provider_name}")
+        """使用指定提供商生成图像，每次尝试记录为一个span"""
+        with start_span("image.generate_with_provider", attributes={"ai.provider": provider_name}):
+            if provider_name == "huggingface":
+                return await self._generate_with_huggingface(prompt, width, height)
+            elif provider_name == "stability":
+                return await self._generate_with_stability(prompt, width, height)
+            elif provider_name == "replicate":
+                return await self._generate_with_replicate(prompt, width, height)
+            else:
+                raise ValueError(f"不支持的提供商: {provider_name}")
     
     async def _generate_with_huggingface(self, prompt: str, width: int, height: int) -> bytes:
         """使用Hugging Face生成图像"""
@@ -213,12 +235,14 @@ class ImageGenerationClient:
                     }
                 }
                 
-                async with httpx.AsyncClient(timeout=60.0) as client:
-                    response = await client.post(
-                        f"{provider['base_url']}/{model}",
-                        headers=headers,
-                        json=data
-                    )
+                async with httpx.AsyncClient(timeout=timeout_for(60.0)) as client:
+                    with track_provider("huggingface", model, "image") as call:
+                        response = await client.post(
+                            f"{provider['base_url']}/{model}",
+                            headers=headers,
+                            json=data
+                        )
+                        call.outcome = "success" if response.status_code == 200 else "error"
                     
                     if response.status_code == 200:
                         return response.content
@@ -249,12 +273,14 @@ class ImageGenerationClient:
             "samples": 1
         }
         
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            response = await client.post(
-                f"{provider['base_url']}/generation/stable-diffusion-v1-6/text-to-image",
-                headers=headers,
-                json=data
-            )
+        async with httpx.AsyncClient(timeout=timeout_for(60.0)) as client:
+            with track_provider("stability", "stable-diffusion-v1-6", "image") as call:
+                response = await client.post(
+                    f"{provider['base_url']}/generation/stable-diffusion-v1-6/text-to-image",
+                    headers=headers,
+                    json=data
+                )
+                call.outcome = "success" if response.status_code == 200 else "error"
             
             if response.status_code == 200:
                 result = response.json()
@@ -307,12 +333,13 @@ class MusicGenerationClient:
         self.providers = {
             "replicate": {
                 "api_key": os.getenv("REPLICATE_API_TOKEN"),
-                "base_url": "https://api.replicate.com/v1",
-                "enabled": bool(os.getenv("REPLICATE_API_TOKEN"))
+                "base_url": os.getenv("REPLICATE_BASE_URL", "https://api.replicate.com/v1"),
+                "enabled": bool(os.getenv("REPLICATE_API_TOKEN")),
+                "poll_interval": float(os.getenv("REPLICATE_POLL_INTERVAL", "2"))
             },
             "huggingface": {
                 "api_key": os.getenv("HUGGINGFACE_TOKEN"),
-                "base_url": "https://api-inference.huggingface.co/models",
+                "base_url": os.getenv("HUGGINGFACE_BASE_URL", "https://api-inference.huggingface.co/models"),
                 "enabled": bool(os.getenv("HUGGINGFACE_TOKEN"))
             }
         }
@@ -341,10 +368,15 @@ class MusicGenerationClient:
         
         return await self.generate_music(music_style, duration, **kwargs)
     
-    async def generate_music_for_image(self, image_description: str, duration: int = 30, **kwargs) -> bytes:
-        """为图片生成配乐"""
-        # 分析图像描述，生成音乐风格
-        music_style = self._analyze_image_for_music(image_description)
+    async def generate_music_for_image(self, image_description: str, duration: int = 30,
+                                       hints: Optional[Dict[str, str]] = None, **kwargs) -> bytes:
+        """为图片生成配乐，hints 为图片特征给出的情绪(mood)、速度(tempo)和曲风(genre)提示"""
+        if hints:
+            music_style = f"{hints['mood']}, {hints['tempo']} tempo, {hints['genre']} style"
+            logger.info(f"🎵 按图片特征生成音乐风格: {music_style}")
+        else:
+            # 分析图像描述，生成音乐风格
+            music_style = self._analyze_image_for_music(image_description)
         
         return await self.generate_music(music_style, duration, **kwargs)
     
@@ -433,22 +465,31 @@ class MusicGenerationClient:
                     return await self._generate_with_provider(provider_name, style_description, duration)
                 except Exception as e:
                     logger.warning(f"⚠️ {provider_name} 音乐生成失败: {e}")
+                    PROVIDER_FALLBACKS.inc(component="music", provider=provider_name)
                     continue
         
         # 如果所有提供商都失败，生成占位符音频
+        PLACEHOLDER_RESPONSES.inc(component="music")
         return self._generate_placeholder_audio(style_description, duration)
     
     async def _generate_with_provider(self, provider_name: str, style: str, duration: int) -> bytes:
-        """使用指定提供商生成音乐"""
-        if provider_name == "replicate":
-            return await self._generate_with_replicate(style, duration)
-        elif provider_name == "huggingface":
-            return await self._generate_with_huggingface(style, duration)
-        else:
-            raise ValueError(f"不支持的提供商: {provider_name}")
+        """使用指定提供商生成音乐，每次尝试记录为一个span"""
+        with start_span("music.generate_with_provider", attributes={"ai.provider": provider_name}):
+            if provider_name == "replicate":
+                return await self._generate_with_replicate(style, duration)
+            elif provider_name == "huggingface":
+                return await self._generate_with_huggingface(style, duration)
+            else:
+                raise ValueError(f"不支持的提供商: {provider_name}")
     
     async def _generate_with_replicate(self, style: str, duration: int) -> bytes:
         """使用Replicate生成音乐"""
+        # 包含创建预测、轮询和下载的总耗时
+        with track_provider("replicate", "musicgen", "music"):
+            return await self._replicate_musicgen(style, duration)
+    
+    async def _replicate_musicgen(self, style: str, duration: int) -> bytes:
+        """调用Replicate MusicGen预测接口"""
         provider = self.providers["replicate"]
         headers = {
             "Authorization": f"Token {provider['api_key']}",
@@ -468,7 +509,7 @@ class MusicGenerationClient:
             }
         }
         
-        async with httpx.AsyncClient(timeout=120.0) as client:
+        async with httpx.AsyncClient(timeout=timeout_for(120.0)) as client:
             # 创建预测
             response = await client.post(
                 f"{provider['base_url']}/predictions",
@@ -482,11 +523,12 @@ class MusicGenerationClient:
                 
                 # 轮询结果
                 for _ in range(30):  # 最多等待30次
-                    await asyncio.sleep(2)
+                    await asyncio.sleep(provider["poll_interval"])
                     
                     status_response = await client.get(
                         f"{provider['base_url']}/predictions/{prediction_id}",
-                        headers=headers
+                        headers=headers,
+                        timeout=timeout_for(120.0)
                     )
                     
                     if status_response.status_code == 200:
@@ -494,7 +536,7 @@ class MusicGenerationClient:
                         if result["status"] == "succeeded":
                             audio_url = result["output"]
                             # 下载音频文件
-                            audio_response = await client.get(audio_url)
+                            audio_response = await client.get(audio_url, timeout=timeout_for(120.0))
                             return audio_response.content
                         elif result["status"] == "failed":
                             raise Exception("音乐生成失败")
@@ -546,45 +588,48 @@ class MultimodalContentMatcher:
     async def create_complete_content(self, text: str, include_image: bool = True, 
                                     include_music: bool = True, **kwargs) -> Dict[str, Any]:
         """为文本创建完整的多模态内容"""
-        result = {
-            "text": text,
-            "image": None,
-            "music": None,
-            "metadata": {
-                "style_analysis": self._analyze_content_style(text),
-                "generation_time": None
+        with start_span("MultimodalContentMatcher.create_complete_content", attributes={
+            "content.include_image": include_image,
+            "content.include_music": include_music
+        }):
+            result = {
+                "text": text,
+                "image": None,
+                "music": None,
+                "metadata": {
+                    "style_analysis": self._analyze_content_style(text),
+                    "generation_time": None
+                }
             }
-        }
         
-        import time
-        start_time = time.time()
+            start_time = time.time()
         
-        tasks = []
+            tasks = []
         
-        if include_image:
-            image_style = kwargs.get("image_style", "realistic")
-            tasks.append(self._generate_image_task(text, image_style, kwargs))
+            if include_image:
+                image_style = kwargs.get("image_style", "realistic")
+                tasks.append(self._generate_image_task(text, image_style, kwargs))
         
-        if include_music:
-            music_duration = kwargs.get("music_duration", 30)
-            tasks.append(self._generate_music_task(text, music_duration, kwargs))
+            if include_music:
+                music_duration = kwargs.get("music_duration", 30)
+                tasks.append(self._generate_music_task(text, music_duration, kwargs))
         
-        # 并行生成图像和音乐
-        if tasks:
-            results = await asyncio.gather(*tasks, return_exceptions=True)
+            # 并行生成图像和音乐
+            if tasks:
+                results = await asyncio.gather(*tasks, return_exceptions=True)
             
-            task_index = 0
-            if include_image:
-                if not isinstance(results[task_index], Exception):
-                    result["image"] = results[task_index]
-                task_index += 1
+                task_index = 0
+                if include_image:
+                    if not isinstance(results[task_index], Exception):
+                        result["image"] = results[task_index]
+                    task_index += 1
             
-            if include_music:
-                if not isinstance(results[task_index], Exception):
-                    result["music"] = results[task_index]
+                if include_music:
+                    if not isinstance(results[task_index], Exception):
+                        result["music"] = results[task_index]
         
-        result["metadata"]["generation_time"] = time.time() - start_time
-        return result
+            result["metadata"]["generation_time"] = time.time() - start_time
+            return result
     
     async def _generate_image_task(self, text: str, style: str, kwargs: Dict) -> bytes:
         """图像生成任务"""
@@ -11,6 +11,11 @@ from typing import Dict, Any, Optional, List
 from dotenv import load_dotenv
 import json
 
+from ..utils.metrics import track_provider, PLACEHOLDER_RESPONSES, PROVIDER_FALLBACKS
+from .readiness import check_probe_response
+from ..utils.rate_limit import rate_limiters, estimate_tokens, RateLimitExceeded
+from ..utils.deadline import timeout_for
+
 # 加载环境变量
 load_dotenv()
 
@@ -22,7 +27,7 @@ class HuggingFaceClient:
     
     def __init__(self):
         self.api_key = os.getenv("HUGGINGFACE_TOKEN")
-        self.base_url = "https://api-inference.huggingface.co/models"
+        self.base_url = os.getenv("HUGGINGFACE_BASE_URL", "https://api-inference.huggingface.co/models")
         self.enabled = bool(self.api_key)
         
         # 推荐的开源模型
@@ -44,6 +49,16 @@ class HuggingFaceClient:
         else:
             logger.warning("⚠️ Hugging Face Token未配置")
     
+    async def probe(self) -> Dict[str, Any]:
+        """探测推理API是否可达、Token是否有效"""
+        async with httpx.AsyncClient(timeout=10.0) as client:
+            response = await client.get(
+                f"{self.base_url}/{self.text_models[0]}",
+                headers={"Authorization": f"Bearer {self.api_key}"}
+            )
+        check_probe_response(response)
+        return {"status_code": response.status_code}
+    
     async def generate_text(self, prompt: str, **kwargs) -> str:
         """使用Hugging Face生成文本"""
         if not self.enabled:
@@ -67,12 +82,14 @@ class HuggingFaceClient:
                     }
                 }
                 
-                async with httpx.AsyncClient(timeout=30.0) as client:
-                    response = await client.post(
-                        f"{self.base_url}/{model}",
-                        headers=headers,
-                        json=data
-                    )
+                async with httpx.AsyncClient(timeout=timeout_for(30.0)) as client:
+                    with track_provider("huggingface", model, "text") as call:
+                        response = await client.post(
+                            f"{self.base_url}/{model}",
+                            headers=headers,
+                            json=data
+                        )
+                        call.outcome = "success" if response.status_code == 200 else "error"
                     
                     if response.status_code == 200:
                         result = response.json()
@@ -120,12 +137,14 @@ class HuggingFaceClient:
                     }
                 }
                 
-                async with httpx.AsyncClient(timeout=30.0) as client:
-                    response = await client.post(
-                        f"{self.base_url}/{model}",
-                        headers=headers,
-                        json=data
-                    )
+                async with httpx.AsyncClient(timeout=timeout_for(30.0)) as client:
+                    with track_provider("huggingface", model, "code") as call:
+                        response = await client.post(
+                            f"{self.base_url}/{model}",
+                            headers=headers,
+                            json=data
+                        )
+                        call.outcome = "success" if response.status_code == 200 else "error"
                     
                     if response.status_code == 200:
                         result = response.json()
@@ -155,25 +174,28 @@ class OllamaClient:
         self.base_url = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
         self.enabled = False
         self.available_models = []
-        
-        # 检查Ollama是否可用
-        asyncio.create_task(self._check_availability())
     
-    async def _check_availability(self):
-        """检查Ollama服务是否可用"""
+    async def probe(self) -> Dict[str, Any]:
+        """检查Ollama服务是否可用，并刷新可用模型列表（由就绪探测调用）"""
         try:
             async with httpx.AsyncClient(timeout=5.0) as client:
                 response = await client.get(f"{self.base_url}/api/tags")
-                if response.status_code == 200:
-                    result = response.json()
-                    self.available_models = [model["name"] for model in result.get("models", [])]
-                    self.enabled = len(self.available_models) > 0
-                    if self.enabled:
-                        logger.info(f"✅ Ollama客户端可用，模型: {self.available_models}")
-                    else:
-                        logger.info("⚠️ Ollama服务可用但无模型")
-        except Exception as e:
-            logger.info(f"⚠️ Ollama服务不可用: {e}")
+            response.raise_for_status()
+        except Exception:
+            self.enabled = False
+            raise
+        
+        models = [model["name"] for model in response.json().get("models", [])]
+        if models != self.available_models:
+            if models:
+                logger.info(f"✅ Ollama客户端可用，模型: {models}")
+            else:
+                logger.info("⚠️ Ollama服务可用但无模型")
+        self.available_models = models
+        self.enabled = len(models) > 0
+        if not self.enabled:
+            raise Exception("Ollama服务可用但无模型")
+        return {"models": models}
     
     async def generate_text(self, prompt: str, **kwargs) -> str:
         """使用Ollama生成文本"""
@@ -201,11 +223,13 @@ class OllamaClient:
                     }
                 }
                 
-                async with httpx.AsyncClient(timeout=60.0) as client:
-                    response = await client.post(
-                        f"{self.base_url}/api/generate",
-                        json=data
-                    )
+                async with httpx.AsyncClient(timeout=timeout_for(60.0)) as client:
+                    with track_provider("ollama", model, "text") as call:
+                        response = await client.post(
+                            f"{self.base_url}/api/generate",
+                            json=data
+                        )
+                        call.outcome = "success" if response.status_code == 200 else "error"
                     
                     if response.status_code == 200:
                         result = response.json()
@@ -244,6 +268,16 @@ class OpenRouterClient:
         else:
             logger.info("⚠️ OpenRouter API密钥未配置")
     
+    async def probe(self) -> Dict[str, Any]:
+        """探测API是否可达、密钥是否有效"""
+        async with httpx.AsyncClient(timeout=10.0) as client:
+            response = await client.get(
+                f"{self.base_url}/models",
+                headers={"Authorization": f"Bearer {self.api_key}"}
+            )
+        check_probe_response(response)
+        return {"status_code": response.status_code}
+    
     async def generate_text(self, prompt: str, **kwargs) -> str:
         """使用OpenRouter生成文本"""
         if not self.enabled:
@@ -256,8 +290,13 @@ class OpenRouterClient:
             "X-Title": "YouCreator.AI"
         }
         
+        limiter = rate_limiters.get("openrouter")
+        max_tokens = min(kwargs.get("max_tokens", 200), 1000)
+        
         for model in self.models:
+            reserved, used = 0, 0  # 没有成功的尝试（非200、超时、异常）退还全部预留
             try:
+                reserved = await limiter.acquire(estimate_tokens(prompt, max_tokens))
                 logger.info(f"🚀 尝试OpenRouter模型: {model}")
                 
                 data = {
@@ -268,28 +307,37 @@ class OpenRouterClient:
                             "content": prompt
                         }
                     ],
-                    "max_tokens": min(kwargs.get("max_tokens", 200), 1000),
+                    "max_tokens": max_tokens,
                     "temperature": kwargs.get("temperature", 0.7)
                 }
                 
-                async with httpx.AsyncClient(timeout=30.0) as client:
-                    response = await client.post(
-                        f"{self.base_url}/chat/completions",
-                        headers=headers,
-                        json=data
-                    )
+                async with httpx.AsyncClient(timeout=timeout_for(30.0)) as client:
+                    with track_provider("openrouter", model, "text") as call:
+                        response = await client.post(
+                            f"{self.base_url}/chat/completions",
+                            headers=headers,
+                            json=data
+                        )
+                        call.outcome = "success" if response.status_code == 200 else "error"
+                    limiter.update(response.status_code, response.headers)
                     
                     if response.status_code == 200:
                         result = response.json()
+                        used = result.get("usage", {}).get("total_tokens")
                         generated_text = result["choices"][0]["message"]["content"]
                         logger.info(f"✅ OpenRouter文本生成成功 ({model})")
                         return generated_text
                     
                     logger.warning(f"⚠️ OpenRouter模型 {model} 返回: {response.status_code}")
                     
+            except RateLimitExceeded as e:
+                logger.warning(f"⚠️ {e}，不再尝试其他OpenRouter模型")
+                break
             except Exception as e:
                 logger.warning(f"⚠️ OpenRouter模型 {model} 失败: {e}")
                 continue
+            finally:
+                limiter.settle(reserved, used)
         
         raise Exception("所有OpenRouter模型都不可用")
 
@@ -315,6 +363,16 @@ class TogetherAIClient:
         else:
             logger.info("⚠️ Together AI API密钥未配置")
     
+    async def probe(self) -> Dict[str, Any]:
+        """探测API是否可达、密钥是否有效"""
+        async with httpx.AsyncClient(timeout=10.0) as client:
+            response = await client.get(
+                f"{self.base_url}/models",
+                headers={"Authorization": f"Bearer {self.api_key}"}
+            )
+        check_probe_response(response)
+        return {"status_code": response.status_code}
+    
     async def generate_text(self, prompt: str, **kwargs) -> str:
         """使用Together AI生成文本"""
         if not self.enabled:
@@ -325,8 +383,13 @@ class TogetherAIClient:
             "Content-Type": "application/json"
         }
         
+        limiter = rate_limiters.get("together")
+        max_tokens = min(kwargs.get("max_tokens", 200), 1000)
+        
         for model in self.models:
+            reserved, used = 0, 0  # 没有成功的尝试（非200、超时、异常）退还全部预留
             try:
+                reserved = await limiter.acquire(estimate_tokens(prompt, max_tokens))
                 logger.info(f"🚀 尝试Together AI模型: {model}")
                 
                 data = {
@@ -337,28 +400,37 @@ class TogetherAIClient:
                             "content": prompt
                         }
                     ],
-                    "max_tokens": min(kwargs.get("max_tokens", 200), 1000),
+                    "max_tokens": max_tokens,
                     "temperature": kwargs.get("temperature", 0.7)
                 }
                 
-                async with httpx.AsyncClient(timeout=30.0) as client:
-                    response = await client.post(
-                        f"{self.base_url}/chat/completions",
-                        headers=headers,
-                        json=data
-                    )
+                async with httpx.AsyncClient(timeout=timeout_for(30.0)) as client:
+                    with track_provider("together", model, "text") as call:
+                        response = await client.post(
+                            f"{self.base_url}/chat/completions",
+                            headers=headers,
+                            json=data
+                        )
+                        call.outcome = "success" if response.status_code == 200 else "error"
+                    limiter.update(response.status_code, response.headers)
                     
                     if response.status_code == 200:
                         result = response.json()
+                        used = result.get("usage", {}).get("total_tokens")
                         generated_text = result["choices"][0]["message"]["content"]
                         logger.info(f"✅ Together AI文本生成成功 ({model})")
                         return generated_text
                     
                     logger.warning(f"⚠️ Together AI模型 {model} 返回: {response.status_code}")
                     
+            except RateLimitExceeded as e:
+                logger.warning(f"⚠️ {e}，不再尝试其他Together AI模型")
+                break
             except Exception as e:
                 logger.warning(f"⚠️ Together AI模型 {model} 失败: {e}")
                 continue
+            finally:
+                limiter.settle(reserved, used)
         
         raise Exception("所有Together AI模型都不可用")
 
@@ -373,16 +445,6 @@ class MultiProviderAIClient:
             "openrouter": OpenRouterClient(),
             "together": TogetherAIClient()
         }
-        
-        # 等待Ollama检查完成
-        asyncio.create_task(self._initialize_async())
-    
-    async def _initialize_async(self):
-        """异步初始化"""
-        await asyncio.sleep(1)  # 等待Ollama检查完成
-        
-        enabled_providers = [name for name, client in self.providers.items() if client.enabled]
-        logger.info(f"🔄 可用的AI提供商: {enabled_providers}")
     
     async def generate_text(self, prompt: str, **kwargs) -> str:
         """尝试多个提供商生成文本"""
@@ -399,9 +461,11 @@ class MultiProviderAIClient:
                     return result
                 except Exception as e:
                     logger.warning(f"⚠️ {provider_name} 失败: {e}")
+                    PROVIDER_FALLBACKS.inc(component="text", provider=provider_name)
                     continue
         
         # 如果所有提供商都失败，返回备用内容
+        PLACEHOLDER_RESPONSES.inc(component="text")
         return self._generate_fallback_text(prompt, **kwargs)
     
     async def generate_code(self, prompt: str, **kwargs) -> str:
@@ -419,9 +483,11 @@ class MultiProviderAIClient:
                     return result
                 except Exception as e:
                     logger.warning(f"⚠️ {provider_name} 代码生成失败: {e}")
+                    PROVIDER_FALLBACKS.inc(component="code", provider=provider_name)
                     continue
         
         # 如果所有提供商都失败，返回增强模板
+        PLACEHOLDER_RESPONSES.inc(component="code")
         return self._generate_enhanced_code_template(prompt, kwargs.get("language", "python"))
     
     def _generate_fallback_text(self, prompt: str, **kwargs) -> str:
@@ -1,16 +1,21 @@
 """
 开源模型管理器
 集成多种开源AI模型
+
+torch 只在加载模型时导入，查询状态和清理资源不会触发导入
 """
 
 import os
-import torch
+import sys
 import asyncio
 import logging
 from typing import Dict, Any, Optional, List
 from pathlib import Path
 import gc
 
+from ..utils.device import get_device
+from ..utils.model_hub import model_hub
+
 logger = logging.getLogger(__name__)
 
 
@@ -19,7 +24,6 @@ class OpenSourceModelManager:
     
     def __init__(self):
         self.models: Dict[str, Any] = {}
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
         self.models_dir = Path(os.getenv("MODEL_CACHE_DIR", "./models"))
         self._initialized = False
         
@@ -47,6 +51,10 @@ class OpenSourceModelManager:
             }
         }
     
+    @property
+    def device(self) -> str:
+        return get_device()
+    
     async def initialize(self):
         """初始化所有模型"""
         if self._initialized:
@@ -55,6 +63,8 @@ class OpenSourceModelManager:
         logger.info("🚀 初始化开源AI模型...")
         
         try:
+            import torch
+            
             # 检查GPU内存
             if torch.cuda.is_available():
                 gpu_memory = torch.cuda.get_device_properties(0).total_memory / 1e9
@@ -87,6 +97,7 @@ class OpenSourceModelManager:
         try:
             logger.info("📝 加载文本生成模型...")
             
+            import torch
             from transformers import AutoTokenizer, AutoModelForCausalLM, pipeline
             
             config = self.model_configs["text"]
@@ -127,7 +138,6 @@ class OpenSourceModelManager:
         try:
             logger.info("🎨 加载图像生成模型...")
             
-            from diffusers import StableDiffusionPipeline
             import torch
             
             config = self.model_configs["image"]
@@ -140,20 +150,13 @@ class OpenSourceModelManager:
             else:
                 use_fp16 = False
             
-            self.models["image"] = StableDiffusionPipeline.from_pretrained(
+            # 与媒体服务共用同一份权重，CUDA上的内存优化由 model_hub 启用
+            self.models["image"] = model_hub.stable_diffusion(
                 model_path,
-                torch_dtype=torch.float16 if use_fp16 else torch.float32,
-                safety_checker=None,
-                requires_safety_checker=False,
-                use_safetensors=True
+                scheduler="default",
+                dtype="float16" if use_fp16 else "float32"
             )
             
-            if torch.cuda.is_available():
-                self.models["image"] = self.models["image"].to("cuda")
-                # 启用内存优化
-                self.models["image"].enable_attention_slicing()
-                self.models["image"].enable_vae_slicing()
-            
             logger.info("✅ 图像模型加载成功")
             
         except Exception as e:
@@ -178,6 +181,7 @@ class OpenSourceModelManager:
         try:
             logger.info("💻 加载代码生成模型...")
             
+            import torch
             from transformers import pipeline
             
             config = self.model_configs["code"]
@@ -251,19 +255,22 @@ class OpenSourceModelManager:
             # 优化提示词
             enhanced_prompt = f"{prompt}, high quality, detailed, masterpiece"
             
-            image = self.models["image"](
+            # 共享的流水线调用会等待其他请求的推理，在线程中执行
+            result = await asyncio.to_thread(
+                self.models["image"],
                 enhanced_prompt,
                 width=width,
                 height=height,
                 num_inference_steps=steps,
                 guidance_scale=guidance_scale,
                 negative_prompt="blurry, low quality, distorted"
-            ).images[0]
+            )
+            image = result.images[0]
             
             # 转换为bytes
             import io
             img_bytes = io.BytesIO()
-            image.save(img_bytes, format='PNG', quality=95)
+            image.save(img_bytes, format='PNG')
             return img_bytes.getvalue()
             
         except Exception as e:
@@ -356,7 +363,7 @@ func main() {{
         """获取模型状态"""
         return {
             "initialized": self._initialized,
-            "device": self.device,
+            "device": self.device if "torch" in sys.modules else "not_loaded",
             "available_models": {
                 "text": self.models.get("text") is not None,
                 "image": self.models.get("image") is not None,
@@ -376,7 +383,8 @@ func main() {{
     
     def _get_memory_usage(self) -> Dict[str, Any]:
         """获取内存使用情况"""
-        if torch.cuda.is_available():
+        torch = sys.modules.get("torch")
+        if torch is not None and torch.cuda.is_available():
             return {
                 "gpu_memory_allocated": f"{torch.cuda.memory_allocated() / 1e9:.2f}GB",
                 "gpu_memory_reserved": f"{torch.cuda.memory_reserved() / 1e9:.2f}GB",
@@ -394,7 +402,9 @@ func main() {{
         
         self.models.clear()
         
-        if torch.cuda.is_available():
+        # 没有导入过torch就没有需要释放的显存
+        torch = sys.modules.get("torch")
+        if torch is not None and torch.cuda.is_available():
             torch.cuda.empty_cache()
         
         gc.collect()
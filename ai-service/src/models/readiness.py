@@ -0,0 +1,130 @@
+"""
+提供商就绪探测
+所有提供商的健康探测并发执行，结果用于就绪/存活检查，并在后台定期刷新
+"""
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import httpx
+
+from ..utils.metrics import PROVIDER_UP
+
+logger = logging.getLogger(__name__)
+
+# 探测函数：成功时返回附加信息，失败时抛出异常
+ProbeFn = Callable[[], Awaitable[Optional[Dict[str, Any]]]]
+
+
+def check_probe_response(response: httpx.Response):
+    """服务可达且凭证有效即视为健康；鉴权失败和5xx视为不可用"""
+    if response.status_code in (401, 403) or response.status_code >= 500:
+        raise Exception(f"HTTP {response.status_code}")
+
+
+@dataclass
+class ProbeResult:
+    """单个提供商的探测结果"""
+    name: str
+    healthy: bool
+    latency_ms: float
+    checked_at: datetime
+    error: Optional[str] = None
+    detail: Dict[str, Any] = field(default_factory=dict)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "healthy": self.healthy,
+            "latency_ms": self.latency_ms,
+            "checked_at": self.checked_at.isoformat(),
+            "error": self.error,
+            "detail": self.detail
+        }
+
+
+class ReadinessMonitor:
+    """提供商就绪状态监控"""
+
+    def __init__(self, timeout: float = 5.0, interval: float = 60.0):
+        self.timeout = timeout
+        self.interval = interval
+        self.probes: Dict[str, ProbeFn] = {}
+        self.results: Dict[str, ProbeResult] = {}
+        self.last_round: Optional[datetime] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def register(self, name: str, probe: ProbeFn):
+        """注册探测函数，同名覆盖"""
+        self.probes[name] = probe
+
+    async def _run_probe(self, name: str, probe: ProbeFn) -> ProbeResult:
+        start = time.perf_counter()
+        try:
+            detail = await asyncio.wait_for(probe(), timeout=self.timeout)
+            result = ProbeResult(name, True, 0.0, datetime.now(), detail=detail or {})
+        except asyncio.TimeoutError:
+            result = ProbeResult(name, False, 0.0, datetime.now(), error=f"探测超时 ({self.timeout}s)")
+        except Exception as e:
+            result = ProbeResult(name, False, 0.0, datetime.now(), error=str(e) or type(e).__name__)
+        result.latency_ms = round((time.perf_counter() - start) * 1000, 1)
+        PROVIDER_UP.set(1 if result.healthy else 0, provider=name)
+        return result
+
+    async def run_once(self) -> Dict[str, ProbeResult]:
+        """并发执行所有探测，总耗时不超过单个探测的超时时间"""
+        results = await asyncio.gather(*(self._run_probe(name, probe) for name, probe in self.probes.items()))
+        for result in results:
+            if result.healthy != getattr(self.results.get(result.name), "healthy", None):
+                state = "可用" if result.healthy else f"不可用: {result.error}"
+                logger.info(f"🩺 提供商 {result.name} {state}")
+        self.results = {result.name: result for result in results}
+        self.last_round = datetime.now()
+        return self.results
+
+    def start(self):
+        """启动后台定期刷新"""
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._refresh_loop())
+
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"❌ 提供商探测失败: {e}")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def healthy_providers(self):
+        return [name for name, result in self.results.items() if result.healthy]
+
+    def is_ready(self, require_provider: bool = False) -> bool:
+        """
+        完成首轮探测即就绪
+
+        require_provider 为 True 时还要求至少一个提供商可用；
+        默认不要求，因为所有功能都有备用/占位方案。
+        """
+        if self.last_round is None:
+            return False
+        return not require_provider or bool(self.healthy_providers())
+
+    def is_live(self) -> bool:
+        """后台刷新任务异常退出时视为不存活"""
+        return self._task is None or not self._task.done()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "last_probe": self.last_round.isoformat() if self.last_round else None,
+            "healthy_providers": self.healthy_providers(),
+            "probes": {name: result.to_dict() for name, result in self.results.items()}
+        }
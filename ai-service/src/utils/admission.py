@@ -0,0 +1,239 @@
+"""
+请求准入控制
+按负载类型（文本、代码、图像、音乐、工作流）分别限制并发，超出时在有界优先队列中等待，
+交互请求优先于批量请求；队列已满时直接返回429并给出 Retry-After。
+所有类型的总并发再受 MAX_CONCURRENT_REQUESTS 限制。
+"""
+
+import asyncio
+import heapq
+import itertools
+import json
+import logging
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+from .deadline import remaining
+from .metrics import QUEUE_DEPTH, ADMISSION_REJECTED
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 1
+
+# 调用方可通过该请求头声明优先级: interactive / batch
+PRIORITY_HEADER = "x-request-priority"
+
+# (路径后缀, 负载类型)，只对POST请求生效，按顺序匹配
+_ROUTE_CLASSES: List[Tuple[str, str]] = [
+    ("/text/generate", "text"),
+    ("/code/generate", "code"),
+    ("/workflow/execute", "workflow"),
+    ("/batch-generate", "image"),
+    ("/complete-content", "image"),
+    ("/image/generate", "image"),
+    ("/text-to-image", "image"),
+    ("/text-to-image/stream", "image"),
+    ("/image-variations", "image"),
+    ("/upscale-image", "image"),
+    ("/upscale-image/stream", "image"),
+    ("/media/caption", "image"),
+    ("/music/generate", "music"),
+    ("/text-to-music", "music"),
+    ("/text-to-music/stream", "music"),
+    ("/image-to-music", "music"),
+    ("/upload-image-for-music", "music"),
+    ("/upload-image-to-music", "music"),
+]
+
+
+def classify(method: str, path: str) -> Optional[str]:
+    """返回请求的负载类型，不需要准入控制的请求返回None"""
+    if method != "POST":
+        return None
+    path = path.rstrip("/")
+    for suffix, workload in _ROUTE_CLASSES:
+        if path.endswith(suffix):
+            return workload
+    return None
+
+
+def request_priority(path: str, header: Optional[str]) -> int:
+    """请求头优先；未声明时批量接口为批量优先级，其余为交互优先级"""
+    if header in ("interactive", "batch"):
+        return PRIORITY_INTERACTIVE if header == "interactive" else PRIORITY_BATCH
+    return PRIORITY_BATCH if path.rstrip("/").endswith("/batch-generate") else PRIORITY_INTERACTIVE
+
+
+class QueueFull(Exception):
+    """等待队列已满或在截止时间前未获得执行槽位"""
+
+    def __init__(self, workload: str, retry_after: float, reason: str = "queue_full"):
+        super().__init__(f"{workload} 请求过多")
+        self.workload = workload
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class AdmissionPool:
+    """
+    单个负载类型的并发池
+
+    槽位释放时直接交给优先级最高、最早到达的等待者，不会被新到的请求插队。
+    """
+
+    def __init__(self, name: str, limit: int, queue_size: Optional[int] = None):
+        self.name = name
+        self.limit = max(1, limit)
+        self.queue_size = queue_size
+        self.active = 0
+        self.rejected = 0
+        self.avg_service_time = 1.0  # 服务时间的指数移动平均，用于估算 Retry-After
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+
+    @property
+    def queued(self) -> int:
+        return sum(1 for _, _, future in self._waiters if not future.done())
+
+    def retry_after(self) -> float:
+        """按排在前面的请求数和平均服务时间估算的等待时间"""
+        return (self.queued + 1) * self.avg_service_time / self.limit
+
+    def _update_gauge(self):
+        QUEUE_DEPTH.set(self.queued, queue=f"admission_{self.name}")
+
+    async def acquire(self, priority: int, timeout: Optional[float] = None):
+        if self.active < self.limit and not self.queued:
+            self.active += 1
+            return
+        if self.queue_size is not None and self.queued >= self.queue_size:
+            self.rejected += 1
+            raise QueueFull(self.name, self.retry_after())
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        self._update_gauge()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future.done() and not future.cancelled():
+                # 槽位已经交给了这个请求，归还后再退出
+                self.release()
+            else:
+                future.cancel()
+            if isinstance(e, asyncio.TimeoutError):
+                self.rejected += 1
+                raise QueueFull(self.name, self.retry_after(), reason="timeout")
+            raise
+        finally:
+            self._update_gauge()
+
+    def release(self):
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)  # 槽位直接转交，active 不变
+                self._update_gauge()
+                return
+        self.active -= 1
+
+    def record(self, elapsed: float):
+        self.avg_service_time = 0.8 * self.avg_service_time + 0.2 * elapsed
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active": self.active,
+            "limit": self.limit,
+            "queued": self.queued,
+            "queue_size": self.queue_size,
+            "rejected": self.rejected,
+            "avg_service_ms": round(self.avg_service_time * 1000, 1)
+        }
+
+
+class AdmissionController:
+    """各负载类型的并发池，外加一个总并发池"""
+
+    def __init__(self, max_concurrent: int, concurrency: Dict[str, int], queue_sizes: Dict[str, int]):
+        self.pools = {
+            name: AdmissionPool(name, min(limit, max_concurrent), queue_sizes.get(name, 0))
+            for name, limit in concurrency.items()
+        }
+        # 总并发池的等待者已经持有类型槽位，数量有上限，不再限制队列长度
+        self.total = AdmissionPool("total", max_concurrent)
+
+    @classmethod
+    def from_settings(cls, settings) -> "AdmissionController":
+        return cls(settings.MAX_CONCURRENT_REQUESTS, settings.ADMISSION_CONCURRENCY, settings.ADMISSION_QUEUE_SIZE)
+
+    @asynccontextmanager
+    async def admit(self, workload: str, priority: int = PRIORITY_INTERACTIVE):
+        """获取执行槽位，等待时间不超过请求剩余的预算"""
+        pool = self.pools[workload]
+        await pool.acquire(priority, remaining())
+        try:
+            try:
+                await self.total.acquire(priority, remaining())
+            except QueueFull as e:
+                raise QueueFull(workload, pool.retry_after(), reason=e.reason)
+            start = time.monotonic()
+            try:
+                yield
+            finally:
+                pool.record(time.monotonic() - start)
+                self.total.release()
+        finally:
+            pool.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_concurrent": self.total.limit,
+            "active": self.total.active,
+            "workloads": {name: pool.stats() for name, pool in self.pools.items()}
+        }
+
+
+class AdmissionMiddleware:
+    """ASGI中间件：对生成类请求做准入控制，放在截止时间中间件内层以便排队时间计入预算"""
+
+    def __init__(self, app, controller: AdmissionController):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        workload = classify(scope.get("method", ""), scope.get("path", "")) if scope["type"] == "http" else None
+        if workload is None or workload not in self.controller.pools:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        priority = request_priority(scope["path"], headers.get(PRIORITY_HEADER.encode(), b"").decode("latin-1"))
+        try:
+            async with self.controller.admit(workload, priority):
+                await self.app(scope, receive, send)
+        except QueueFull as e:
+            ADMISSION_REJECTED.inc(workload=workload, reason=e.reason)
+            logger.warning(f"🚧 {workload} 请求被拒绝（{e.reason}），Retry-After {e.retry_after:.1f}s")
+            await _reject(send, e)
+
+
+async def _reject(send, error: QueueFull):
+    retry_after = str(max(1, math.ceil(error.retry_after)))
+    body = json.dumps({
+        "detail": f"{error.workload} 请求过多，请稍后重试",
+        "workload": error.workload,
+        "retry_after": int(retry_after)
+    }, ensure_ascii=False).encode()
+    await send({
+        "type": "http.response.start",
+        "status": 429,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", retry_after.encode())
+        ]
+    })
+    await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,75 @@
+"""
+生成音频的内存处理
+响度归一化与 audiocraft audio_write 的 loudness 策略一致（ITU-R BS.1770，目标 -14 LUFS），
+直接在内存中的波形上计算，不经过临时文件；编码见 media_encoding。分段生成的音频用交叉淡化拼接。
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 静音片段（RMS低于该值）不做归一化，避免放大噪声
+_ENERGY_FLOOR = 2e-3
+
+
+def normalize_loudness(waveform, sample_rate: int, headroom_db: float = 14.0):
+    """
+    把波形的响度归一化到 -headroom_db LUFS，再截断到 [-1, 1]
+
+    Args:
+        waveform: (声道, 采样点) 的torch张量或NumPy数组
+        sample_rate: 采样率
+    """
+    gain = loudness_gain(waveform, sample_rate, headroom_db)
+    if hasattr(waveform, "detach"):
+        import torch
+
+        return torch.clamp(waveform.detach().float().cpu() * gain, -1.0, 1.0)
+
+    import numpy as np
+
+    return np.clip(np.asarray(waveform, dtype=np.float32) * gain, -1.0, 1.0)
+
+
+def loudness_gain(waveform, sample_rate: int, headroom_db: float = 14.0) -> float:
+    """把波形的响度调整到 -headroom_db LUFS 所需的增益，静音时为1"""
+    if hasattr(waveform, "detach"):
+        waveform = waveform.detach().float().cpu()
+        if waveform.pow(2).mean().sqrt().item() < _ENERGY_FLOOR:
+            return 1.0
+        try:
+            import torchaudio
+        except ImportError:
+            loudness = _rms_loudness(waveform.numpy())
+        else:
+            loudness = torchaudio.functional.loudness(waveform, sample_rate).item()
+    else:
+        import numpy as np
+
+        samples = np.asarray(waveform, dtype=np.float32)
+        if np.sqrt(np.mean(samples ** 2)) < _ENERGY_FLOOR:
+            return 1.0
+        loudness = _rms_loudness(samples)
+    return 10.0 ** ((-headroom_db - loudness) / 20.0)
+
+
+def crossfade(tail, head):
+    """
+    线性交叉淡化两段等长的 (声道, 采样点) NumPy波形，tail 淡出、head 淡入
+
+    用于拼接续写的音频：续写结果开头的提示部分是上一段音频重新编码再解码的结果，两段高度相关，
+    线性淡化保持幅度不变（等功率淡化在这种情况下会在中点抬高约3dB）。
+    """
+    import numpy as np
+
+    ramp = np.linspace(0.0, 1.0, tail.shape[-1], dtype=np.float32)
+    return tail * (1.0 - ramp) + head * ramp
+
+
+def _rms_loudness(samples) -> float:
+    """没有torchaudio时的近似响度：不做K加权和门限，各声道均方能量求和"""
+    import numpy as np
+
+    samples = np.atleast_2d(np.asarray(samples, dtype=np.float64))
+    mean_square = float(np.mean(samples ** 2, axis=-1).sum())
+    return -0.691 + 10 * np.log10(max(mean_square, 1e-10))
@@ -3,7 +3,7 @@ AI服务配置管理
 """
 
 import os
-from typing import List
+from typing import List, Dict
 from pydantic_settings import BaseSettings
 
 
@@ -27,9 +27,98 @@ class Settings(BaseSettings):
     MAX_MUSIC_DURATION: int = 60
     MAX_CODE_LENGTH: int = 5000
     
-    # 并发限制
+    # 部署模式
+    # full: 挂载本地模型路由（/api/v1/media、/api/v1/bagel），模型在第一次使用时加载
+    # api: 只使用外部API提供商，不挂载本地模型路由，进程内不会导入torch
+    DEPLOYMENT_PROFILE: str = "full"
+    
+    # 并发限制（所有生成类请求的总并发）
     MAX_CONCURRENT_REQUESTS: int = 10
-    REQUEST_TIMEOUT: int = 300
+    # 各负载类型的并发数和等待队列长度，队列满时返回429
+    ADMISSION_CONCURRENCY: Dict[str, int] = {
+        "text": 8,
+        "code": 8,
+        "image": 2,
+        "music": 2,
+        "workflow": 4
+    }
+    ADMISSION_QUEUE_SIZE: Dict[str, int] = {
+        "text": 32,
+        "code": 32,
+        "image": 8,
+        "music": 8,
+        "workflow": 16
+    }
+    REQUEST_TIMEOUT: int = 300  # 请求默认的截止时间（秒），客户端可通过 X-Request-Timeout 缩短
+    
+    # 工作流执行配置
+    WORKFLOW_EXECUTION_MODE: str = "inline"  # inline: API进程内执行, worker: 交给工作进程
+    WORKFLOW_BROKER_URL: str = "sqlite:///./workflow_broker.db"
+    WORKFLOW_WORKER_CONCURRENCY: int = 2
+    WORKFLOW_HEARTBEAT_INTERVAL: float = 5.0
+    WORKFLOW_LEASE_TIMEOUT: float = 30.0
+    WORKFLOW_DRAIN_TIMEOUT: float = 30.0
+    
+    # 工作流调度配置
+    WORKFLOW_MAX_CONCURRENT_EXECUTIONS: int = 4
+    WORKFLOW_NODE_CONCURRENCY: Dict[str, int] = {
+        "text_generation": 4,
+        "image_generation": 1,
+        "music_generation": 1
+    }
+    WORKFLOW_USER_QUOTA: int = 2  # 每个用户同时运行的执行数，0表示不限制
+    WORKFLOW_USER_WEIGHTS: Dict[str, float] = {}  # 用户权重，未配置的用户为1.0
+    
+    # 提供商就绪探测配置
+    PROVIDER_PROBE_TIMEOUT: float = 5.0  # 单个探测的超时时间（秒）
+    PROVIDER_PROBE_INTERVAL: float = 60.0  # 后台刷新间隔（秒），0表示只在启动时探测
+    READINESS_REQUIRE_PROVIDER: bool = False  # 就绪检查是否要求至少一个提供商可用
+    
+    # 提供商客户端限流（每分钟请求数/token数，未配置的提供商只按响应头和429限流）
+    PROVIDER_RATE_LIMITS: Dict[str, Dict[str, int]] = {
+        "groq": {"rpm": 30, "tpm": 6000},
+        "openrouter": {"rpm": 20},
+        "together": {"rpm": 60}
+    }
+    PROVIDER_RATE_LIMIT_MAX_WAIT: float = 10.0  # 配额在此时间内可用时排队等待，否则换下一个提供商
+    PROVIDER_RATE_LIMIT_DEFAULT_BACKOFF: float = 5.0  # 429未带Retry-After时的暂停时间（秒）
+    
+    # 提示缓存（按接口启用），规范化后的提示和生成参数都一致时直接返回缓存结果
+    PROMPT_CACHE_ENABLED: Dict[str, bool] = {"text": False, "code": False}
+    PROMPT_CACHE_TTL: int = 3600
+    PROMPT_CACHE_MAX_ENTRIES: int = 1000
+    
+    # 图片上传限制：请求体在接收时按字节数限制，图片按文件头中的像素数限制
+    MAX_UPLOAD_BYTES: int = 20 * 1024 * 1024
+    MAX_UPLOAD_PIXELS: int = 100_000_000
+    # 图片标注缓存（按解码后像素的内容哈希）
+    CAPTION_CACHE_MAX_ENTRIES: int = 1024
+    # 图片标注微批处理：并发请求在聚合窗口（秒）内合并为一次BLIP前向
+    CAPTION_MAX_BATCH_SIZE: int = 16
+    CAPTION_BATCH_WAIT: float = 0.02
+    # 扩散模型的CLIP文本嵌入缓存项数（SD1.5每项约240KB）
+    PROMPT_EMBEDDING_CACHE_SIZE: int = 128
+    # 少步数蒸馏LoRA适配器（draft/preview质量档位使用），按名称在第一次使用时加载
+    DIFFUSION_ADAPTERS: Dict[str, str] = {
+        "lcm": "latent-consistency/lcm-lora-sdv1-5",
+        "tcd": "h1t/TCD-SD15-LoRA"
+    }
+    # 分块放大：输入图按 UPSCALE_TILE_SIZE 像素分块，在线程池中并行放大，输出不超过 MAX_UPSCALE_PIXELS
+    UPSCALE_TILE_SIZE: int = 256
+    UPSCALE_WORKERS: int = 4
+    MAX_UPSCALE_PIXELS: int = 64_000_000
+    # 流式音乐生成：每段生成 MUSIC_STREAM_WINDOW 秒，其中前 MUSIC_STREAM_CONTEXT 秒是上一段末尾的续写提示，
+    # 相邻两段交叉淡化 MUSIC_STREAM_CROSSFADE 秒
+    MAX_STREAMING_MUSIC_DURATION: int = 300
+    MUSIC_STREAM_WINDOW: float = 15.0
+    MUSIC_STREAM_CONTEXT: float = 5.0
+    MUSIC_STREAM_CROSSFADE: float = 0.25
+    # 图片/音频按请求格式编码后的缓存容量（字节）
+    ENCODING_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    
+    # 链路追踪配置（未启用时仍传播traceparent，只是不导出span）
+    TRACING_ENABLED: bool = False
+    TRACE_EXPORT_PATH: str = "./traces.otlp.jsonl"
     
     class Config:
         env_file = ".env"
@@ -0,0 +1,150 @@
+"""
+请求级截止时间
+中间件根据请求头或默认值设置截止时间，保存在contextvar中，提供商调用据此计算每次尝试的超时，
+预算用完后不再尝试剩余的备用提供商；客户端断开连接时取消请求的处理。
+"""
+
+import asyncio
+import contextvars
+import logging
+import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# 客户端声明的超时时间（秒），只能缩短服务端默认的 REQUEST_TIMEOUT
+REQUEST_TIMEOUT_HEADER = "x-request-timeout"
+
+# 每次尝试至少保留的时间，剩余预算更少时直接放弃而不是发起注定超时的请求
+MIN_ATTEMPT_TIMEOUT = 0.5
+
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("request_deadline", default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    """请求的截止时间已过"""
+
+
+def set_deadline(seconds: Optional[float]) -> contextvars.Token:
+    """设置当前上下文的截止时间，None表示不限制"""
+    return _deadline.set(None if seconds is None else time.monotonic() + seconds)
+
+
+def reset_deadline(token: contextvars.Token):
+    _deadline.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """剩余的预算（秒），未设置截止时间时返回None"""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def timeout_for(default: float) -> float:
+    """
+    单次尝试的超时：取固定超时和剩余预算中较小的一个
+
+    剩余预算不足 MIN_ATTEMPT_TIMEOUT 时抛出 DeadlineExceeded。
+    """
+    left = remaining()
+    if left is None:
+        return default
+    if left < MIN_ATTEMPT_TIMEOUT:
+        raise DeadlineExceeded(f"请求预算已用完（剩余 {max(left, 0):.2f}s）")
+    return min(default, left)
+
+
+def parse_timeout_header(value: Optional[str], default: float) -> float:
+    """解析超时请求头，无效或超过默认值时使用默认值"""
+    try:
+        seconds = float(value) if value else default
+    except ValueError:
+        return default
+    return default if seconds <= 0 else min(seconds, default)
+
+
+def _has_body(headers) -> bool:
+    """请求是否带有请求体（HTTP/1.1 中既没有 Content-Length 也没有 Transfer-Encoding 的请求没有请求体）"""
+    if b"transfer-encoding" in headers:
+        return True
+    return headers.get(b"content-length", b"0").strip() not in (b"", b"0")
+
+
+class DeadlineMiddleware:
+    """
+    ASGI中间件：为每个HTTP请求设置截止时间，并在客户端断开时取消处理
+
+    请求体读完后（没有请求体的请求从一开始）由中间件独占 receive 监听断开事件；
+    响应发送完成后的断开（包括后台任务运行期间）不会触发取消。
+    """
+
+    def __init__(self, app, default_timeout: float):
+        self.app = app
+        self.default_timeout = default_timeout
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        timeout = parse_timeout_header(
+            headers.get(REQUEST_TIMEOUT_HEADER.encode(), b"").decode("latin-1"), self.default_timeout
+        )
+
+        body_done = asyncio.Event()
+        disconnected = asyncio.Event()
+        response_done = False
+        body_delivered = False
+        if not _has_body(headers):
+            body_done.set()
+
+        async def wrapped_receive():
+            nonlocal body_delivered
+            if body_done.is_set():
+                if not body_delivered:
+                    # 没有请求体：服务器发来的空消息由 watch_disconnect 读走，这里代为返回
+                    body_delivered = True
+                    return {"type": "http.request", "body": b"", "more_body": False}
+                # 请求体已读完，后续只可能是断开事件，由 watch_disconnect 负责读取
+                await disconnected.wait()
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                disconnected.set()
+            elif not message.get("more_body", False):
+                body_delivered = True
+                body_done.set()
+            return message
+
+        async def wrapped_send(message):
+            nonlocal response_done
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                response_done = True
+            await send(message)
+
+        token = set_deadline(timeout)
+        try:
+            app_task = asyncio.create_task(self.app(scope, wrapped_receive, wrapped_send))
+        finally:
+            reset_deadline(token)
+
+        async def watch_disconnect():
+            await body_done.wait()
+            while True:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    break
+            disconnected.set()
+            if not response_done and not app_task.done():
+                logger.info(f"🔌 客户端已断开，取消请求: {scope.get('method')} {scope.get('path')}")
+                app_task.cancel()
+
+        watcher = asyncio.create_task(watch_disconnect())
+        try:
+            await app_task
+        except asyncio.CancelledError:
+            if not disconnected.is_set():
+                raise
+        finally:
+            watcher.cancel()
@@ -0,0 +1,12 @@
+"""
+计算设备检测
+torch 在第一次需要时才导入，只使用API提供商的部署不会加载它
+"""
+from functools import lru_cache
+
+
+@lru_cache(maxsize=1)
+def get_device() -> str:
+    """返回 cuda 或 cpu"""
+    import torch
+    return "cuda" if torch.cuda.is_available() else "cpu"
@@ -0,0 +1,182 @@
+"""
+上传图片的流式接收和按需解码
+请求体在接收过程中限制大小，图片只读取文件头，描述/标注前按模型输入尺寸解码：
+JPEG通过 draft() 在DCT阶段直接缩小到1/2~1/8，其他格式用 reduce 整数倍缩小，
+大照片不会在内存中完整解压。已经标注过的图片按解码后像素的内容哈希复用之前的描述。
+"""
+
+import base64
+import hashlib
+import io
+import logging
+from collections import OrderedDict
+from typing import BinaryIO, Optional, Tuple, Union
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .config import settings
+from .metrics import record_cache
+
+logger = logging.getLogger(__name__)
+
+# BLIP 的输入尺寸
+CAPTION_IMAGE_SIZE: Tuple[int, int] = (384, 384)
+
+# multipart 边界和表单字段的额外开销
+_MULTIPART_OVERHEAD = 64 * 1024
+
+
+class ImageIngestError(ValueError):
+    """上传的图片无效或超过限制"""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def open_image(source: Union[bytes, bytearray, BinaryIO], max_pixels: Optional[int] = None) -> Image.Image:
+    """打开图片，只读取文件头并检查像素数，不解码像素数据"""
+    max_pixels = settings.MAX_UPLOAD_PIXELS if max_pixels is None else max_pixels
+    fp = io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source
+    try:
+        image = Image.open(fp)
+    except Image.DecompressionBombError as e:
+        raise ImageIngestError(f"图片像素过多: {e}", status_code=413)
+    except (UnidentifiedImageError, OSError):
+        raise ImageIngestError("无法识别的图片格式")
+
+    width, height = image.size
+    if width * height > max_pixels:
+        raise ImageIngestError(f"图片像素过多: {width}x{height}，上限 {max_pixels}", status_code=413)
+    return image
+
+
+def decode_reduced(image: Image.Image, size: Tuple[int, int] = CAPTION_IMAGE_SIZE) -> Image.Image:
+    """
+    按目标尺寸解码为RGB图片（保持宽高比，缩放到 size 以内）
+
+    draft() 只对JPEG生效，让解码器直接输出不小于目标尺寸两倍的缩小图像；
+    thumbnail 的 reducing_gap 对其他格式先用 reduce() 整数倍缩小再重采样。
+    """
+    image.draft("RGB", (size[0] * 2, size[1] * 2))
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail(size, Image.Resampling.BICUBIC, reducing_gap=2.0)
+    return image.convert("RGB")
+
+
+def load_image(image_data: Union[str, bytes, Image.Image], size: Tuple[int, int] = CAPTION_IMAGE_SIZE) -> Image.Image:
+    """接受base64字符串、字节或已打开的图片，返回按目标尺寸解码的RGB图片"""
+    if isinstance(image_data, str):
+        if image_data.startswith("data:image"):
+            image_data = image_data.split(",", 1)[1]
+        try:
+            image_data = base64.b64decode(image_data)
+        except ValueError:
+            raise ImageIngestError("无效的base64图片数据")
+    if not isinstance(image_data, Image.Image):
+        image_data = open_image(image_data)
+    return decode_reduced(image_data, size)
+
+
+async def open_upload(file, max_bytes: Optional[int] = None) -> Image.Image:
+    """
+    检查上传文件并打开图片（不解码）
+
+    请求体大小已由 UploadLimitMiddleware 在接收时限制，这里直接从上传的临时文件读取，不再复制到内存。
+    """
+    max_bytes = settings.MAX_UPLOAD_BYTES if max_bytes is None else max_bytes
+    if not (file.content_type or "").startswith("image/"):
+        raise ImageIngestError("请上传图片文件")
+    size = getattr(file, "size", None)
+    if size is not None and size > max_bytes:
+        raise ImageIngestError(f"图片过大: {size} 字节，上限 {max_bytes}", status_code=413)
+    await file.seek(0)
+    return open_image(file.file)
+
+
+def image_digest(image: Image.Image) -> bytes:
+    """
+    解码后像素的内容哈希（含模式和尺寸）
+
+    只有像素完全相同的图片才相同：颜色不同的图片、纯色图片之间不会互相命中。
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{image.mode}:{image.width}x{image.height}".encode())
+    digest.update(image.tobytes())
+    return digest.digest()
+
+
+class ContentHashCache:
+    """按图片内容哈希缓存图片描述（LRU）"""
+
+    def __init__(self, name: str, max_entries: int = 1024):
+        self.name = name
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[bytes, str]" = OrderedDict()
+
+    def get(self, key: bytes) -> Optional[str]:
+        value = self._entries.get(key)
+        record_cache(self.name, value is not None)
+        if value is not None:
+            self._entries.move_to_end(key)
+        return value
+
+    def put(self, key: bytes, value: str):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+# 图片标注缓存，见 services/captioning.py
+caption_cache = ContentHashCache("caption", max_entries=settings.CAPTION_CACHE_MAX_ENTRIES)
+
+
+class UploadLimitMiddleware:
+    """
+    ASGI中间件：限制图片上传接口的请求体大小
+
+    Content-Length 超限时直接返回413；分块传输时在接收过程中累计字节数，超限即中止读取。
+    """
+
+    def __init__(self, app, max_bytes: int):
+        self.app = app
+        self.max_bytes = max_bytes + _MULTIPART_OVERHEAD
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or "/upload-image" not in scope.get("path", ""):
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        try:
+            declared = int(headers.get(b"content-length", b"0"))
+        except ValueError:
+            declared = 0
+        if declared > self.max_bytes:
+            await _payload_too_large(send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    from fastapi import HTTPException
+                    raise HTTPException(status_code=413, detail="上传的图片过大")
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+async def _payload_too_large(send):
+    body = '{"detail": "上传的图片过大"}'.encode()
+    await send({
+        "type": "http.response.start",
+        "status": 413,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+    })
+    await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,82 @@
+"""
+扩散过程的中间预览
+把潜变量直接线性投影到RGB（SD1.x 4个潜通道到RGB的近似系数），不经过VAE解码，
+每次预览只是一次 4x3 的矩阵乘法，得到 1/8 分辨率的近似图像，足以判断构图和配色。
+"""
+
+import base64
+import io
+import logging
+import threading
+from typing import Callable, Optional
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# SD1.x 潜通道 -> RGB 的线性近似（行为潜通道，列为R/G/B），输出范围约为 [-1, 1]
+SD15_LATENT_RGB_FACTORS = [
+    [0.3512, 0.2297, 0.3227],
+    [0.3250, 0.4974, 0.2350],
+    [-0.2829, 0.1762, 0.2721],
+    [-0.2120, -0.2616, -0.7177],
+]
+
+
+class GenerationCancelled(Exception):
+    """调用方取消了生成，在某一步结束时中止采样"""
+
+    def __init__(self, step: int):
+        super().__init__(f"Generation cancelled after {step} steps")
+        self.step = step
+
+
+def latents_to_image(latents) -> Image.Image:
+    """把一批潜变量中的第一张投影为RGB预览图"""
+    import torch
+
+    latent = latents[0].float()
+    factors = torch.tensor(SD15_LATENT_RGB_FACTORS, dtype=latent.dtype, device=latent.device)
+    rgb = torch.einsum("chw,cr->hwr", latent, factors)
+    rgb = ((rgb + 1) / 2).clamp(0, 1).mul(255).to(torch.uint8)
+    return Image.fromarray(rgb.cpu().numpy())
+
+
+def encode_preview(image: Image.Image, quality: int = 70) -> str:
+    """预览图编码为JPEG data URL"""
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=quality)
+    return "data:image/jpeg;base64," + base64.b64encode(buffer.getvalue()).decode()
+
+
+class PreviewCallback:
+    """
+    diffusers 的 callback_on_step_end
+
+    每 interval 步把当前潜变量投影为预览图交给 on_preview(步数, 总步数, 图片)，最后一步不出预览；
+    cancel 被设置后在下一步结束时抛出 GenerationCancelled，剩余步数不再计算。
+    回调在推理线程中执行。
+    """
+
+    def __init__(self, total_steps: int, interval: int = 0,
+                 on_preview: Optional[Callable[[int, int, Image.Image], None]] = None,
+                 cancel: Optional[threading.Event] = None):
+        self.total_steps = total_steps
+        self.interval = interval
+        self.on_preview = on_preview
+        self.cancel = cancel
+        self.cancelled_at: Optional[int] = None
+
+    def __call__(self, pipeline, step: int, timestep, callback_kwargs):
+        completed = step + 1
+        if self.cancel is not None and self.cancel.is_set():
+            self.cancelled_at = completed
+            raise GenerationCancelled(completed)
+        if (self.on_preview is not None and self.interval > 0
+                and completed % self.interval == 0 and completed < self.total_steps):
+            try:
+                self.on_preview(completed, self.total_steps, latents_to_image(callback_kwargs["latents"]))
+            except Exception as e:
+                # 预览失败不影响生成
+                logger.warning(f"⚠️ 第 {completed} 步预览失败: {e}")
+        return callback_kwargs
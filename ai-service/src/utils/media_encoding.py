@@ -0,0 +1,370 @@
+"""
+输出编码和内容协商
+图片支持 PNG/JPEG/WebP/AVIF，音频支持 WAV/FLAC/MP3/Opus。格式由请求参数指定，未指定时按 Accept 头协商，
+都没有时保持原来的 PNG/WAV。AVIF 取决于Pillow的编译选项，FLAC/MP3/Opus 由 soundfile（libsndfile）编码，
+不可用的格式不参与协商。编码在线程中执行，结果按 (内容哈希, 格式, 质量) 缓存。
+"""
+
+import asyncio
+import base64
+import functools
+import hashlib
+import io
+import logging
+import struct
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from PIL import Image, features
+
+from .config import settings
+from .metrics import record_cache
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class MediaFormat:
+    """输出格式：名称、MIME类型、文件扩展名，有损格式带默认质量"""
+    name: str
+    media_type: str
+    extension: str
+    default_quality: Optional[int] = None
+
+
+IMAGE_FORMATS: Dict[str, MediaFormat] = {
+    "png": MediaFormat("png", "image/png", "png"),
+    "jpeg": MediaFormat("jpeg", "image/jpeg", "jpg", 85),
+    "webp": MediaFormat("webp", "image/webp", "webp", 80),
+    "avif": MediaFormat("avif", "image/avif", "avif", 60),
+}
+
+AUDIO_FORMATS: Dict[str, MediaFormat] = {
+    "wav": MediaFormat("wav", "audio/wav", "wav"),
+    "flac": MediaFormat("flac", "audio/flac", "flac"),
+    "mp3": MediaFormat("mp3", "audio/mpeg", "mp3"),
+    "opus": MediaFormat("opus", "audio/ogg; codecs=opus", "opus"),
+}
+
+# 格式别名和 Accept 中的MIME类型
+_ALIASES = {
+    "jpg": "jpeg", "image/jpg": "jpeg", "image/jpeg": "jpeg", "image/png": "png",
+    "image/webp": "webp", "image/avif": "avif",
+    "audio/wav": "wav", "audio/x-wav": "wav", "audio/wave": "wav", "audio/flac": "flac", "audio/x-flac": "flac",
+    "audio/mpeg": "mp3", "audio/mp3": "mp3", "audio/ogg": "opus", "audio/opus": "opus", "ogg": "opus",
+}
+
+# soundfile 的 (格式, 子类型)
+_SOUNDFILE_TYPES = {
+    "wav": ("WAV", "PCM_16"),
+    "flac": ("FLAC", "PCM_16"),
+    "mp3": ("MP3", "MPEG_LAYER_III"),
+    "opus": ("OGG", "OPUS"),
+}
+
+# Opus 只支持这些采样率，其他采样率先重采样到48kHz
+_OPUS_SAMPLE_RATES = (8000, 12000, 16000, 24000, 48000)
+
+
+class UnsupportedFormat(ValueError):
+    """请求的输出格式不可用"""
+
+
+@functools.lru_cache(maxsize=None)
+def supported_formats(kind: str) -> List[str]:
+    """当前环境可以编码的格式"""
+    if kind == "image":
+        names = ["png", "jpeg"]
+        if features.check("webp"):
+            names.append("webp")
+        if ".avif" in Image.registered_extensions():
+            names.append("avif")
+        return names
+
+    names = ["wav"]
+    try:
+        import soundfile
+    except ImportError:
+        return names
+    formats = soundfile.available_formats()
+    if "FLAC" in formats:
+        names.append("flac")
+    if "MP3" in formats:
+        names.append("mp3")
+    if "OGG" in formats and "OPUS" in soundfile.available_subtypes("OGG"):
+        names.append("opus")
+    return names
+
+
+def _formats(kind: str) -> Dict[str, MediaFormat]:
+    return IMAGE_FORMATS if kind == "image" else AUDIO_FORMATS
+
+
+def _parse_accept(accept: str) -> List[str]:
+    """按q值降序返回 Accept 中的MIME类型，q=0 的类型被排除"""
+    entries = []
+    for part in accept.split(","):
+        media_type, *params = [item.strip() for item in part.split(";")]
+        q = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        if media_type and q > 0:
+            entries.append((q, media_type.lower()))
+    entries.sort(key=lambda entry: -entry[0])
+    return [media_type for _, media_type in entries]
+
+
+def negotiate(kind: str, requested: Optional[str] = None, accept: Optional[str] = None) -> MediaFormat:
+    """
+    选择输出格式
+
+    Args:
+        kind: image 或 audio
+        requested: 请求参数指定的格式（名称或MIME类型），不可用时抛出 UnsupportedFormat
+        accept: Accept 请求头，没有可用的格式时使用默认格式（PNG/WAV）
+    """
+    formats = _formats(kind)
+    supported = supported_formats(kind)
+    default = formats["png" if kind == "image" else "wav"]
+    if requested:
+        name = requested.strip().lower()
+        name = _ALIASES.get(name, name)
+        if name not in supported:
+            raise UnsupportedFormat(f"不支持的输出格式: {requested}，可用: {', '.join(supported)}")
+        return formats[name]
+    for media_type in _parse_accept(accept or ""):
+        if media_type in ("*/*", f"{kind}/*"):
+            return default
+        name = _ALIASES.get(media_type)
+        if name in supported and name in formats:
+            return formats[name]
+    return default
+
+
+def sniff_format(data: bytes) -> Optional[str]:
+    """按文件头识别已编码的图片/音频格式"""
+    if data.startswith(b"\x89PNG"):
+        return "png"
+    if data.startswith(b"\xff\xd8"):
+        return "jpeg"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "webp"
+    if data[4:12] in (b"ftypavif", b"ftypavis"):
+        return "avif"
+    if data[:4] == b"RIFF" and data[8:12] == b"WAVE":
+        return "wav"
+    if data.startswith(b"fLaC"):
+        return "flac"
+    if data.startswith(b"OggS"):
+        return "opus"
+    if data.startswith(b"ID3") or data[:2] in (b"\xff\xfb", b"\xff\xf3", b"\xff\xf2"):
+        return "mp3"
+    return None
+
+
+def to_data_url(data: bytes, fmt: MediaFormat) -> str:
+    return f"data:{fmt.media_type};base64,{base64.b64encode(data).decode()}"
+
+
+def response_headers(fmt: MediaFormat, filename: str) -> Dict[str, str]:
+    """二进制响应的头：带扩展名的文件名，并声明响应随 Accept 变化"""
+    return {"Content-Disposition": f"attachment; filename={filename}.{fmt.extension}", "Vary": "Accept"}
+
+
+def encode_image_sync(image: Image.Image, fmt: MediaFormat, quality: Optional[int] = None) -> bytes:
+    """把图片编码为指定格式，有损格式按 quality（1~100）压缩"""
+    quality = quality or fmt.default_quality
+    if fmt.name == "jpeg" and image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    params: Dict[str, Any] = {}
+    if fmt.default_quality is not None:
+        params["quality"] = quality
+    if fmt.name == "webp":
+        params["method"] = 4
+    buffer = io.BytesIO()
+    image.save(buffer, format=fmt.name.upper(), **params)
+    return buffer.getvalue()
+
+
+def _to_frames(waveform) -> Any:
+    """把 (声道, 采样点) 或 (采样点,) 的torch/NumPy波形转为 (采样点, 声道) 的float32数组"""
+    import numpy as np
+
+    if hasattr(waveform, "detach"):
+        waveform = waveform.detach().float().cpu().numpy()
+    samples = np.asarray(waveform, dtype=np.float32)
+    if samples.ndim == 1:
+        samples = samples[None, :]
+    return np.ascontiguousarray(samples.T)
+
+
+def _resample(samples, sample_rate: int, target_rate: int):
+    import numpy as np
+
+    try:
+        from scipy.signal import resample_poly
+    except ImportError:
+        positions = np.arange(int(len(samples) * target_rate / sample_rate)) * (sample_rate / target_rate)
+        indices = np.arange(len(samples))
+        return np.stack([np.interp(positions, indices, channel) for channel in samples.T], axis=1).astype(np.float32)
+    divisor = np.gcd(sample_rate, target_rate)
+    return resample_poly(samples, target_rate // divisor, sample_rate // divisor, axis=0).astype(np.float32)
+
+
+def wav_header(sample_rate: int, channels: int, frames: int) -> bytes:
+    """16位PCM WAV文件头，流式输出时按预先确定的总采样点数写出"""
+    data_size = frames * channels * 2
+    return (
+        b"RIFF" + struct.pack("<I", 36 + data_size) + b"WAVE"
+        + b"fmt " + struct.pack("<IHHIIHH", 16, 1, channels, sample_rate, sample_rate * channels * 2, channels * 2, 16)
+        + b"data" + struct.pack("<I", data_size)
+    )
+
+
+def pcm16(samples) -> bytes:
+    """(采样点, 声道) 的float数组转为交错的16位PCM"""
+    import numpy as np
+
+    return (np.clip(samples, -1.0, 1.0) * 32767).astype("<i2").tobytes()
+
+
+def wav_bytes(samples, sample_rate: int) -> bytes:
+    """(采样点, 声道) 的float数组写为16位PCM WAV，不依赖soundfile"""
+    return wav_header(sample_rate, samples.shape[1], samples.shape[0]) + pcm16(samples)
+
+
+def encode_audio_sync(samples, sample_rate: int, fmt: MediaFormat) -> bytes:
+    """把 (采样点, 声道) 的float数组编码为指定格式"""
+    if fmt.name == "wav":
+        return wav_bytes(samples, sample_rate)
+
+    import soundfile
+
+    if fmt.name == "opus" and sample_rate not in _OPUS_SAMPLE_RATES:
+        samples, sample_rate = _resample(samples, sample_rate, 48000), 48000
+    container, subtype = _SOUNDFILE_TYPES[fmt.name]
+    buffer = io.BytesIO()
+    soundfile.write(buffer, samples, sample_rate, format=container, subtype=subtype)
+    return buffer.getvalue()
+
+
+def _decode_audio(data: bytes) -> Tuple[Any, int]:
+    import soundfile
+
+    samples, sample_rate = soundfile.read(io.BytesIO(data), dtype="float32", always_2d=True)
+    return samples, sample_rate
+
+
+class EncodedMediaCache:
+    """编码结果的LRU缓存，按总字节数限制容量"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[tuple, bytes]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple) -> Optional[bytes]:
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+        record_cache("media_encoding", data is not None)
+        return data
+
+    def put(self, key: tuple, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = data
+            self._size += len(data)
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+
+# 全局编码缓存
+encoding_cache = EncodedMediaCache(settings.ENCODING_CACHE_MAX_BYTES)
+
+
+def _digest(*parts: bytes) -> bytes:
+    digest = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        digest.update(part)
+    return digest.digest()
+
+
+def _encode_image_cached(source: Union[bytes, Image.Image], fmt: MediaFormat, quality: Optional[int]) -> bytes:
+    if isinstance(source, (bytes, bytearray)):
+        if sniff_format(source) == fmt.name and quality is None:
+            return bytes(source)
+        key = (_digest(source), fmt.name, quality)
+    else:
+        key = (_digest(source.mode.encode(), repr(source.size).encode(), source.tobytes()), fmt.name, quality)
+
+    data = encoding_cache.get(key)
+    if data is None:
+        image = Image.open(io.BytesIO(source)) if isinstance(source, (bytes, bytearray)) else source
+        data = encode_image_sync(image, fmt, quality)
+        encoding_cache.put(key, data)
+    return data
+
+
+def _encode_audio_cached(source: Union[bytes, Tuple[Any, int]], fmt: MediaFormat) -> bytes:
+    if isinstance(source, (bytes, bytearray)):
+        if sniff_format(source) == fmt.name:
+            return bytes(source)
+        key = (_digest(source), fmt.name)
+    else:
+        waveform, sample_rate = source
+        samples = _to_frames(waveform)
+        key = (_digest(str(sample_rate).encode(), repr(samples.shape).encode(), samples.tobytes()), fmt.name)
+
+    data = encoding_cache.get(key)
+    if data is None:
+        if isinstance(source, (bytes, bytearray)):
+            samples, sample_rate = _decode_audio(source)
+        data = encode_audio_sync(samples, sample_rate, fmt)
+        encoding_cache.put(key, data)
+    return data
+
+
+async def encode_image(source: Union[bytes, Image.Image], fmt: MediaFormat, quality: Optional[int] = None) -> bytes:
+    """
+    在线程中把图片（已打开的图片或任意格式的图片字节）编码为指定格式
+
+    字节已经是目标格式且未指定质量时原样返回。
+    """
+    return await asyncio.to_thread(_encode_image_cached, source, fmt, quality)
+
+
+async def encode_audio(source: Union[bytes, Tuple[Any, int]], fmt: MediaFormat) -> bytes:
+    """
+    在线程中把音频编码为指定格式
+
+    Args:
+        source: 已编码的音频字节，或 (波形, 采样率)，波形为 (声道, 采样点) 的torch/NumPy数组
+    """
+    return await asyncio.to_thread(_encode_audio_cached, source, fmt)
+
+
+async def transcode_audio(data: bytes, fmt: MediaFormat) -> Tuple[bytes, MediaFormat]:
+    """
+    把提供商返回的音频转为指定格式，返回 (字节, 实际格式)
+
+    无法解码时（如libsndfile不支持源格式）原样返回，格式按文件头识别。
+    """
+    try:
+        return await encode_audio(data, fmt), fmt
+    except Exception as e:
+        source_format = AUDIO_FORMATS.get(sniff_format(data) or "wav", AUDIO_FORMATS["wav"])
+        logger.warning(f"⚠️ 音频无法转为 {fmt.name}，返回原始 {source_format.name}: {e}")
+        return data, source_format
@@ -0,0 +1,354 @@
+"""
+进程内指标注册表
+以Prometheus文本格式导出，不依赖 prometheus_client
+"""
+
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Tuple
+
+from .tracing import STATUS_ERROR, start_span
+
+# 默认延迟分桶（秒），覆盖从缓存命中到本地扩散模型推理的范围
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labelnames: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    """指标基类"""
+    type_name = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} 需要标签 {self.labelnames}，实际为 {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """只增计数器"""
+    type_name = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def get(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Gauge(_Metric):
+    """可增可减的瞬时值"""
+    type_name = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def remove(self, **labels):
+        with self._lock:
+            self._values.pop(self._key(labels), None)
+
+    def get(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Histogram(_Metric):
+    """分桶直方图"""
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._values: Dict[Tuple[str, ...], Dict[str, object]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["counts"][i] += 1
+                    break
+            state["sum"] += value
+            state["count"] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """统计代码块耗时"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = [(key, list(state["counts"]), state["sum"], state["count"]) for key, state in self._values.items()]
+        lines = []
+        for key, counts, total, count in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """指标注册表"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                  buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def register_collector(self, collector: Callable[[], None]):
+        """注册抓取前回调，用于刷新队列深度等按需计算的指标"""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        """导出Prometheus文本格式"""
+        for collector in list(self._collectors):
+            try:
+                collector()
+            except Exception:
+                # 单个回调失败不影响其他指标导出
+                pass
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+# 全局指标注册表
+registry = MetricsRegistry()
+
+HTTP_REQUEST_DURATION = registry.histogram(
+    "http_request_duration_seconds", "HTTP请求耗时", ["method", "route", "status"]
+)
+PROVIDER_REQUEST_DURATION = registry.histogram(
+    "ai_provider_request_duration_seconds", "AI提供商/本地模型调用耗时",
+    ["provider", "model", "operation", "outcome"]
+)
+PROVIDER_FALLBACKS = registry.counter(
+    "ai_provider_fallbacks_total", "提供商失败后切换到下一个提供商的次数", ["component", "provider"]
+)
+class _PlaceholderCounter(Counter):
+    """占位响应计数器，同时通知当前的 track_placeholders 作用域"""
+
+    def inc(self, amount: float = 1.0, **labels):
+        super().inc(amount, **labels)
+        components = _placeholder_tracker.get()
+        if components is not None:
+            components.append(labels.get("component"))
+
+
+_placeholder_tracker: contextvars.ContextVar = contextvars.ContextVar("placeholder_tracker", default=None)
+
+PLACEHOLDER_RESPONSES = registry._register(_PlaceholderCounter(
+    "ai_placeholder_responses_total", "所有提供商失败后返回备用/占位内容的次数", ["component"]
+))
+PROVIDER_UP = registry.gauge("ai_provider_up", "提供商最近一次健康探测结果（1为可用）", ["provider"])
+PROVIDER_RATE_LIMITED = registry.counter(
+    "ai_provider_rate_limited_total", "提供商限流次数（queued: 排队等待配额, rejected: 等待超过上限, upstream: 提供商返回429）",
+    ["provider", "reason"]
+)
+ADMISSION_REJECTED = registry.counter(
+    "ai_admission_rejected_total", "准入控制拒绝的请求数（queue_full: 队列已满, timeout: 截止时间前未获得槽位）",
+    ["workload", "reason"]
+)
+QUEUE_DEPTH = registry.gauge("ai_queue_depth", "排队中的请求数量", ["queue"])
+CACHE_REQUESTS = registry.counter("ai_cache_requests_total", "缓存查询次数", ["cache", "result"])
+CAPTION_BATCH_SIZE = registry.histogram(
+    "ai_caption_batch_size", "每次BLIP前向标注的图片数", buckets=(1, 2, 4, 8, 16, 32, 64)
+)
+MODEL_LOAD_DURATION = registry.gauge("ai_model_load_duration_seconds", "模型加载耗时", ["model"])
+MODEL_RESIDENT_MEMORY = registry.gauge(
+    "ai_model_resident_memory_bytes", "模型参数和缓冲区占用的内存", ["model", "device"]
+)
+WORKFLOW_EXECUTIONS = registry.counter("workflow_executions_total", "工作流执行次数", ["status"])
+WORKFLOW_NODE_DURATION = registry.histogram(
+    "workflow_node_duration_seconds", "工作流节点执行耗时", ["node_type", "status"]
+)
+PROCESS_RESIDENT_MEMORY = registry.gauge("process_resident_memory_bytes", "进程常驻内存")
+
+
+class _Call:
+    """一次提供商调用，outcome 可在调用过程中修改"""
+    __slots__ = ("outcome",)
+
+    def __init__(self):
+        self.outcome = "success"
+
+
+@contextmanager
+def track_provider(provider: str, model: str, operation: str):
+    """
+    统计一次提供商调用的耗时，同时记录一个 client span
+
+    抛出异常时记为 error；调用方也可以在未抛异常的失败分支中设置 call.outcome。
+    """
+    call = _Call()
+    attributes = {"ai.provider": provider, "ai.model": model, "ai.operation": operation}
+    with start_span(f"{provider} {operation}", kind="client", attributes=attributes) as span:
+        start = time.perf_counter()
+        try:
+            yield call
+        except BaseException:
+            call.outcome = "error"
+            raise
+        finally:
+            PROVIDER_REQUEST_DURATION.observe(
+                time.perf_counter() - start,
+                provider=provider, model=model, operation=operation, outcome=call.outcome
+            )
+            span.set_attribute("ai.outcome", call.outcome)
+            if call.outcome != "success" and span.status_code != STATUS_ERROR:
+                span.set_status(STATUS_ERROR, call.outcome)
+
+
+@contextmanager
+def track_placeholders():
+    """
+    记录作用域内（包括其中创建的子任务）返回的占位内容
+
+    用于判断结果是否来自真实提供商，例如占位内容不应写入缓存。
+    """
+    components: List[str] = []
+    token = _placeholder_tracker.set(components)
+    try:
+        yield components
+    finally:
+        _placeholder_tracker.reset(token)
+
+
+def record_cache(cache: str, hit: bool):
+    """记录一次缓存查询"""
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+def model_memory_bytes(model) -> int:
+    """估算模型参数和缓冲区占用的字节数，支持 torch 模块和 diffusers 管线"""
+    modules = []
+    if hasattr(model, "parameters"):
+        modules.append(model)
+    elif hasattr(model, "components"):
+        modules.extend(component for component in model.components.values() if hasattr(component, "parameters"))
+    elif hasattr(model, "lm"):
+        # audiocraft 的 MusicGen 包装了语言模型和压缩模型
+        modules.extend(getattr(model, name) for name in ("lm", "compression_model") if hasattr(model, name))
+
+    total = 0
+    for module in modules:
+        for tensor in list(module.parameters()) + list(getattr(module, "buffers", lambda: [])()):
+            total += tensor.numel() * tensor.element_size()
+    return total
+
+
+def record_model_load(model_name: str, seconds: float, model=None, device: str = "cpu"):
+    """记录模型加载耗时和内存占用"""
+    MODEL_LOAD_DURATION.set(seconds, model=model_name)
+    if model is not None:
+        try:
+            MODEL_RESIDENT_MEMORY.set(model_memory_bytes(model), model=model_name, device=device)
+        except Exception:
+            pass
+
+
+def _collect_process_memory():
+    """从 /proc 读取常驻内存，非Linux系统退化为 resource 的峰值内存"""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        PROCESS_RESIDENT_MEMORY.set(pages * os.sysconf("SC_PAGE_SIZE"))
+    except (OSError, ValueError, IndexError):
+        import resource
+        # macOS 返回字节，Linux 返回KB
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        PROCESS_RESIDENT_MEMORY.set(peak if os.uname().sysname == "Darwin" else peak * 1024)
+
+
+registry.register_collector(_collect_process_memory)
@@ -0,0 +1,285 @@
+"""
+进程内共享的本地模型
+媒体服务、Bagel生成器和开源模型管理器加载同一份权重时只加载一次：
+Stable Diffusion 的 UNet/VAE/文本编码器按 (模型ID, 精度) 共享，
+不同调度器、文生图/图生图的流水线都由同一组组件构建，只有调度器各自独立。
+LoRA适配器的启用状态在共享的UNet上，返回的流水线绑定了各自的适配器，每次调用都经过该组组件的适配器门，
+保证推理过程中适配器不会被其他请求切换；流水线对象本身带有调用状态，同一条流水线一次只运行一个调用。
+torch/diffusers/audiocraft 在第一次加载对应模型时才导入。
+"""
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+from .config import settings
+from .device import get_device
+from .metrics import record_model_load
+
+logger = logging.getLogger(__name__)
+
+# 调度器简称到 diffusers 类名
+SCHEDULERS = {
+    "default": None,
+    "dpm": "DPMSolverMultistepScheduler",
+    "euler_a": "EulerAncestralDiscreteScheduler",
+    "lcm": "LCMScheduler",
+    "tcd": "TCDScheduler",
+}
+
+# 流水线任务到 diffusers 类名
+PIPELINE_TASKS = {
+    "txt2img": "StableDiffusionPipeline",
+    "img2img": "StableDiffusionImg2ImgPipeline",
+}
+
+
+class _AdapterGate:
+    """
+    一组共享组件上的适配器切换
+
+    使用同一适配器（包括都不使用适配器）的调用可以同时进入，切换到其他适配器要等已进入的调用全部结束；
+    有请求在等待其他适配器时，当前适配器的新请求也排队，避免切换一直等不到空闲。
+    门只管适配器状态：同一组组件上的不同流水线（文生图/图生图、不同调度器）可以并发推理，
+    同一条流水线上的调用由流水线的推理锁串行执行。
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self.active: Optional[str] = None  # 初始时没有加载任何适配器
+        self._users = 0
+        self._waiting: Dict[Optional[str], int] = {}
+
+    def _can_enter(self, adapter: Optional[str]) -> bool:
+        # 其他 adapter 在等待时当前 adapter 不再放行新调用，避免切换被持续到来的请求饿死
+        others_waiting = any(count for name, count in self._waiting.items() if name != adapter)
+        if adapter == self.active and others_waiting:
+            return False
+        if self._users == 0:
+            return True
+        return adapter == self.active
+
+    @contextmanager
+    def use(self, adapter: Optional[str], switch: Callable[[Optional[str]], None]):
+        """在 adapter 启用的状态下执行，需要切换时在没有其他推理运行时调用 switch(adapter)"""
+        with self._condition:
+            self._waiting[adapter] = self._waiting.get(adapter, 0) + 1
+            try:
+                self._condition.wait_for(lambda: self._can_enter(adapter))
+            finally:
+                self._waiting[adapter] -= 1
+                if not self._waiting[adapter]:
+                    del self._waiting[adapter]
+            try:
+                if adapter != self.active:
+                    switch(adapter)
+                    self.active = adapter
+            except BaseException:
+                self._condition.notify_all()
+                raise
+            self._users += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._users -= 1
+                self._condition.notify_all()
+
+
+class _AdapterPipeline:
+    """
+    绑定适配器的流水线：调用时持有适配器门和流水线的推理锁，其他属性转发给共享的流水线
+
+    diffusers 流水线的调度器保存了采样过程的状态（timesteps、步数计数、多步求解器的历史输出），
+    __call__ 还会把 guidance_scale 等参数写到流水线对象上，同一条流水线上的两个调用同时运行会互相破坏。
+    """
+
+    def __init__(self, pipeline, gate: _AdapterGate, adapter: Optional[str], switch: Callable[[Optional[str]], None],
+                 lock: threading.Lock):
+        self._pipeline = pipeline
+        self._gate = gate
+        self._adapter = adapter
+        self._switch = switch
+        self._lock = lock
+
+    def __call__(self, *args, **kwargs):
+        with self._gate.use(self._adapter, self._switch), self._lock:
+            return self._pipeline(*args, **kwargs)
+
+    def ensure_adapter(self):
+        """切换到绑定的适配器（第一次使用时加载），不运行推理"""
+        with self._gate.use(self._adapter, self._switch):
+            pass
+
+    def __getattr__(self, name):
+        return getattr(self._pipeline, name)
+
+
+class ModelHub:
+    """按键懒加载模型，同一个键只加载一次，并发请求等待同一次加载"""
+
+    def __init__(self):
+        self._models: Dict[Hashable, Any] = {}
+        self._names: Dict[Hashable, str] = {}
+        self._locks: Dict[Hashable, threading.Lock] = {}
+        self._lock = threading.Lock()
+        # 每组 Stable Diffusion 组件的适配器门、已加载的LoRA适配器，以及绑定了适配器的流水线
+        self._gates: Dict[Hashable, _AdapterGate] = {}
+        self._loaded_adapters: Dict[Hashable, set] = {}
+        self._bound: Dict[Hashable, _AdapterPipeline] = {}
+        # 带有调用状态的模型（diffusers 流水线、MusicGen）各自的推理锁
+        self._generation_locks: Dict[int, threading.Lock] = {}
+
+    @property
+    def device(self) -> str:
+        return get_device()
+
+    def get(self, key: Hashable, loader: Callable[[], Any], name: Optional[str] = None) -> Any:
+        """返回 key 对应的模型，不存在时调用 loader 加载"""
+        model = self._models.get(key)
+        if model is not None:
+            return model
+        with self._lock:
+            key_lock = self._locks.setdefault(key, threading.Lock())
+        with key_lock:
+            if key not in self._models:
+                self._models[key] = loader()
+                self._names[key] = name or str(key)
+            return self._models[key]
+
+    def _default_dtype(self) -> str:
+        return "float16" if self.device == "cuda" else "float32"
+
+    def _sd_components(self, model_id: str, dtype: str, **load_kwargs):
+        """加载一份 Stable Diffusion 权重，返回基础流水线（组件供其他流水线共用）"""
+        def load():
+            import torch
+            from diffusers import StableDiffusionPipeline
+
+            logger.info(f"Loading Stable Diffusion weights: {model_id} ({dtype})")
+            start = time.perf_counter()
+            pipeline = StableDiffusionPipeline.from_pretrained(
+                model_id,
+                torch_dtype=getattr(torch, dtype),
+                safety_checker=None,
+                requires_safety_checker=False,
+                **load_kwargs
+            ).to(self.device)
+            if self.device == "cuda":
+                pipeline.enable_attention_slicing()
+                pipeline.enable_vae_slicing()
+                try:
+                    pipeline.enable_xformers_memory_efficient_attention()
+                except Exception:
+                    pass
+            record_model_load(model_id.split("/")[-1], time.perf_counter() - start, pipeline, self.device)
+            return pipeline
+
+        return self.get(("sd", model_id, dtype), load, name=f"{model_id} ({dtype})")
+
+    def stable_diffusion(self, model_id: str, task: str = "txt2img", scheduler: str = "dpm",
+                         dtype: Optional[str] = None, adapter: Optional[str] = None, **load_kwargs):
+        """
+        返回 Stable Diffusion 流水线
+
+        返回的流水线绑定了 adapter，每次调用时该适配器处于启用状态，期间其他适配器的调用等待；
+        同一条流水线（模型、精度、调度器、任务相同）上的调用依次执行，调用会阻塞，应在线程中进行。
+        适配器在这里预先加载，加载失败时直接抛出异常。
+
+        Args:
+            model_id: 模型ID或本地路径
+            task: txt2img 或 img2img
+            scheduler: SCHEDULERS 中的调度器简称，default 保留模型自带的调度器
+            dtype: float16/float32，默认CUDA上为float16
+            adapter: 启用的LoRA适配器（settings.DIFFUSION_ADAPTERS 中的名称），None 表示不使用适配器
+            load_kwargs: 第一次加载权重时传给 from_pretrained 的额外参数
+        """
+        dtype = dtype or self._default_dtype()
+        pipeline = self._sd_pipeline(model_id, task, scheduler, dtype, **load_kwargs)
+        components_key = ("sd", model_id, dtype)
+        bound_key = ("sd", model_id, dtype, scheduler, task, adapter)
+        bound = self._bound.get(bound_key)
+        if bound is None:
+            lock = self.generation_lock(pipeline)
+            with self._lock:
+                gate = self._gates.setdefault(components_key, _AdapterGate())
+                bound = self._bound.setdefault(bound_key, _AdapterPipeline(
+                    pipeline, gate, adapter,
+                    lambda target: self._switch_adapter(pipeline, components_key, target),
+                    lock
+                ))
+        if adapter is not None and adapter not in self._loaded_adapters.get(components_key, ()):
+            bound.ensure_adapter()
+        return bound
+
+    def _sd_pipeline(self, model_id: str, task: str, scheduler: str, dtype: str, **load_kwargs):
+        def build():
+            import diffusers
+
+            base = self._sd_components(model_id, dtype, **load_kwargs)
+            components = dict(base.components)
+            scheduler_class = SCHEDULERS[scheduler]
+            if scheduler_class is not None:
+                # 调度器保存每次推理的步数状态，每条流水线单独一个
+                components["scheduler"] = getattr(diffusers, scheduler_class).from_config(base.scheduler.config)
+            return getattr(diffusers, PIPELINE_TASKS[task])(**components, requires_safety_checker=False)
+
+        return self.get(("sd", model_id, dtype, scheduler, task), build, name=f"{model_id} {task}/{scheduler}")
+
+    def _switch_adapter(self, pipeline, components_key: Hashable, adapter: Optional[str]):
+        """
+        切换共享UNet上启用的适配器，只在适配器门内没有推理运行时调用
+
+        适配器只在第一次使用时加载，之后切换只是启用/停用，不重新加载基础权重。
+        """
+        loaded = self._loaded_adapters.setdefault(components_key, set())
+        if adapter is None:
+            pipeline.disable_lora()
+            return
+        if adapter not in loaded:
+            source = settings.DIFFUSION_ADAPTERS[adapter]
+            logger.info(f"Loading diffusion adapter {adapter}: {source}")
+            start = time.perf_counter()
+            pipeline.load_lora_weights(source, adapter_name=adapter)
+            loaded.add(adapter)
+            record_model_load(f"adapter-{adapter}", time.perf_counter() - start)
+        pipeline.enable_lora()
+        pipeline.set_adapters([adapter], adapter_weights=[1.0])
+
+    def musicgen(self, model_id: str = "facebook/musicgen-medium"):
+        """返回 MusicGen 模型"""
+        def load():
+            from audiocraft.models import MusicGen
+
+            logger.info(f"Loading MusicGen model: {model_id}")
+            start = time.perf_counter()
+            model = MusicGen.get_pretrained(model_id)
+            record_model_load(model_id.split("/")[-1], time.perf_counter() - start, model, self.device)
+            return model
+
+        return self.get(("musicgen", model_id), load, name=model_id)
+
+    def generation_lock(self, model) -> threading.Lock:
+        """
+        返回模型的推理锁
+
+        带有调用状态的模型同一时间只能运行一个调用：Stable Diffusion 流水线的调用由 stable_diffusion()
+        返回的流水线自动持有这把锁；MusicGen 的生成参数通过 set_generation_params 保存在模型上，
+        设置参数和随后的推理要在这把锁内完成，否则并发请求会用别人的时长和采样参数生成。
+        模型由模型中心一直持有，按对象 id 区分。
+        """
+        with self._lock:
+            return self._generation_locks.setdefault(id(model), threading.Lock())
+
+    def is_loaded(self, key: Hashable) -> bool:
+        return key in self._models
+
+    def loaded(self) -> List[str]:
+        """已加载的模型和流水线"""
+        return [self._names[key] for key in list(self._models)]
+
+
+# 全局模型中心
+model_hub = ModelHub()
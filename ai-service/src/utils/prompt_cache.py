@@ -0,0 +1,119 @@
+"""
+提示缓存
+文本/代码生成的提示经常来自同一组模板（创作工具的 create_poem、_build_code_prompt 等），
+同一需求会反复提交。命中缓存时直接返回之前的生成结果，省去一次提供商调用。
+
+只缓存规范化后完全相同的提示：同一模板填入不同内容的提示（如主题"春天的花园"和"秋天的花园"）
+按向量相似度可以超过0.94，却需要不同的结果，所以不做近似匹配。
+生成参数（语言、长度、温度）是键的一部分，必须完全一致才会命中。
+"""
+
+import logging
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from .config import settings
+from .metrics import record_cache
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_prompt(prompt: str) -> str:
+    """全角转半角、合并空白；大小写和标点保留（代码提示中它们有意义）"""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", prompt)).strip()
+
+
+class PromptCache:
+    """单个接口的提示缓存（带过期时间的LRU）"""
+
+    def __init__(self, name: str, ttl: float = 3600, max_entries: int = 1000):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        # (参数签名, 规范化后的提示) -> (过期时间, 结果)
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, prompt: str, key: str) -> Optional[Any]:
+        """查找缓存，未命中或已过期时返回None"""
+        entry_key = (key, normalize_prompt(prompt))
+        with self._lock:
+            entry = self._entries.get(entry_key)
+            if entry is not None and entry[0] <= time.time():
+                del self._entries[entry_key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._entries.move_to_end(entry_key)
+        record_cache(f"prompt_{self.name}", entry is not None)
+        return None if entry is None else entry[1]
+
+    def put(self, prompt: str, key: str, value: Any):
+        """写入缓存，满时淘汰最久未使用的一项"""
+        entry_key = (key, normalize_prompt(prompt))
+        with self._lock:
+            self._entries[entry_key] = (time.time() + self.ttl, value)
+            self._entries.move_to_end(entry_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0
+        }
+
+
+def cache_key(**params) -> str:
+    """生成参数签名，温度保留一位小数"""
+    parts = []
+    for name in sorted(params):
+        value = params[name]
+        if isinstance(value, float):
+            value = f"{value:.1f}"
+        parts.append(f"{name}={value}")
+    return "&".join(parts)
+
+
+class PromptCacheRegistry:
+    """按接口懒创建缓存，未启用的接口返回None"""
+
+    def __init__(self):
+        self._caches: Dict[str, PromptCache] = {}
+
+    def get(self, endpoint: str) -> Optional[PromptCache]:
+        if not settings.PROMPT_CACHE_ENABLED.get(endpoint, False):
+            return None
+        if endpoint not in self._caches:
+            self._caches[endpoint] = PromptCache(
+                endpoint,
+                ttl=settings.PROMPT_CACHE_TTL,
+                max_entries=settings.PROMPT_CACHE_MAX_ENTRIES
+            )
+            logger.info(f"🧠 {endpoint} 提示缓存已启用")
+        return self._caches[endpoint]
+
+    def stats(self) -> Dict[str, Any]:
+        return {name: cache.stats() for name, cache in self._caches.items()}
+
+
+# 全局提示缓存
+prompt_caches = PromptCacheRegistry()
@@ -0,0 +1,85 @@
+"""
+CLIP文本嵌入缓存
+扩散模型每次生成都要用文本编码器编码提示词和负面提示词，而负面提示词通常是固定的几条，
+变体和批量生成也会反复使用同一个提示词。这里按 (文本编码器, 分词结果) 缓存编码结果，
+直接以 prompt_embeds / negative_prompt_embeds 传给流水线。
+分词结果按模型的最大长度截断，超出部分不影响编码，所以只在截断部分不同的提示词共用同一项。
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional
+
+from .config import settings
+from .metrics import record_cache
+
+logger = logging.getLogger(__name__)
+
+
+class PromptEmbeddingCache:
+    """文本嵌入的LRU缓存，所有流水线共用；同一文本编码器的流水线（见 model_hub）共用缓存项"""
+
+    def __init__(self, max_entries: int = 128):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[tuple, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(pipeline, text: str) -> tuple:
+        tokenizer = pipeline.tokenizer
+        token_ids = tokenizer(
+            text, padding="max_length", max_length=tokenizer.model_max_length, truncation=True
+        ).input_ids
+        # 文本编码器由 model_hub 持有到进程退出，id 不会被复用
+        return id(pipeline.text_encoder), tuple(token_ids)
+
+    def _encode(self, pipeline, text: str):
+        import torch
+
+        with torch.no_grad():
+            embeds, _ = pipeline.encode_prompt(text, pipeline.device, 1, False)
+        return embeds
+
+    def encode(self, pipeline, text: str, record: bool = True):
+        """返回文本的嵌入，形状为 (1, 序列长度, 隐藏维度)"""
+        key = self._key(pipeline, text)
+        with self._lock:
+            embeds = self._entries.get(key)
+            if embeds is not None:
+                self._entries.move_to_end(key)
+        if record:
+            record_cache("prompt_embeds", embeds is not None)
+        if embeds is not None:
+            return embeds
+
+        embeds = self._encode(pipeline, text)
+        with self._lock:
+            self._entries[key] = embeds
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return embeds
+
+    def embed_kwargs(self, pipeline, prompt: str, negative_prompt: Optional[str] = None) -> Dict[str, Any]:
+        """
+        代替 prompt/negative_prompt 传给流水线的参数
+
+        未指定负面提示词时使用空字符串的嵌入，与流水线在无分类器引导时的默认行为一致。
+        """
+        return {
+            "prompt_embeds": self.encode(pipeline, prompt),
+            "negative_prompt_embeds": self.encode(pipeline, negative_prompt or "")
+        }
+
+    def warm(self, pipeline, texts: Iterable[str]):
+        """预先编码固定的提示词（如各风格的负面提示词）"""
+        for text in dict.fromkeys(texts):
+            self.encode(pipeline, text, record=False)
+        logger.info(f"🧊 文本嵌入已预计算，共 {len(self._entries)} 项")
+
+    def stats(self) -> Dict[str, Any]:
+        return {"entries": len(self._entries), "max_entries": self.max_entries}
+
+
+# 全局文本嵌入缓存
+prompt_embeddings = PromptEmbeddingCache(settings.PROMPT_EMBEDDING_CACHE_SIZE)
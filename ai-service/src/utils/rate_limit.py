@@ -0,0 +1,201 @@
+"""
+提供商客户端限流
+按提供商的RPM/TPM配额在本地用令牌桶限流，并根据响应中的 Retry-After 和 x-ratelimit-* 头调整，
+配额在请求的截止时间前可用时排队等待，否则直接放弃该提供商，避免429后继续重试其他模型。
+限流状态在进程内所有调用方之间共享。
+"""
+
+import asyncio
+import logging
+import re
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, Mapping, Optional
+
+from .config import settings
+from .deadline import MIN_ATTEMPT_TIMEOUT, remaining
+from .metrics import PROVIDER_RATE_LIMITED
+
+logger = logging.getLogger(__name__)
+
+_DURATION = re.compile(r"^(?:(\d+)h)?(?:(\d+)m(?!s))?(?:(\d+(?:\.\d+)?)s)?(?:(\d+(?:\.\d+)?)ms)?$")
+
+# (剩余量, 重置时间) 头，依次为 Groq/OpenAI、OpenRouter/Together 的格式
+_RATE_LIMIT_HEADERS = [
+    ("x-ratelimit-remaining-requests", "x-ratelimit-reset-requests"),
+    ("x-ratelimit-remaining-tokens", "x-ratelimit-reset-tokens"),
+    ("x-ratelimit-remaining", "x-ratelimit-reset"),
+]
+
+
+class RateLimitExceeded(Exception):
+    """配额在允许的等待时间内不可用"""
+
+    def __init__(self, provider: str, retry_after: float):
+        super().__init__(f"{provider} 限流，{retry_after:.1f}s 后才有配额")
+        self.provider = provider
+        self.retry_after = retry_after
+
+
+def parse_reset(value: Optional[str], now: Optional[float] = None) -> Optional[float]:
+    """
+    解析重置时间，返回距现在的秒数
+
+    支持秒数（"7"、"0.5"）、Go风格时长（"2m59.56s"、"120ms"）、毫秒/秒级Unix时间戳和HTTP日期。
+    """
+    if not value:
+        return None
+    value = value.strip()
+    now = time.time() if now is None else now
+    try:
+        number = float(value)
+    except ValueError:
+        match = _DURATION.match(value)
+        if match and any(match.groups()):
+            hours, minutes, seconds, millis = (float(group or 0) for group in match.groups())
+            return hours * 3600 + minutes * 60 + seconds + millis / 1000
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - now)
+        except (TypeError, ValueError):
+            return None
+    if number > 1e12:  # 毫秒时间戳
+        return max(0.0, number / 1000 - now)
+    if number > 1e9:  # 秒级时间戳
+        return max(0.0, number - now)
+    return max(0.0, number)
+
+
+def estimate_tokens(prompt: str, max_tokens: int) -> int:
+    """预估一次请求占用的TPM配额：提示按每2个字符1个token粗略估计，加上最大生成长度"""
+    return len(prompt) // 2 + max_tokens
+
+
+class TokenBucket:
+    """
+    令牌桶，容量为每分钟配额，匀速补充
+
+    取令牌时允许余额为负（预留），后来的请求据此计算需要等待的时间。
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        self._refill(now)
+        return max(0.0, (amount - self.tokens) / self.rate)
+
+    def consume(self, amount: float):
+        self.tokens -= amount
+
+    def refund(self, amount: float):
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class ProviderRateLimiter:
+    """单个提供商的限流器"""
+
+    def __init__(self, name: str, rpm: Optional[int] = None, tpm: Optional[int] = None):
+        self.name = name
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.blocked_until = 0.0  # 提供商要求暂停到的时间（monotonic）
+
+    def _block_for(self, seconds: float):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    async def acquire(self, tokens: int = 0, max_wait: Optional[float] = None) -> int:
+        """
+        获取一次请求的配额，返回实际预留的token数（用于 settle）
+
+        需要等待的时间不超过 max_wait（以及请求剩余的预算）时排队等待，否则抛出 RateLimitExceeded。
+        """
+        max_wait = settings.PROVIDER_RATE_LIMIT_MAX_WAIT if max_wait is None else max_wait
+        left = remaining()
+        if left is not None:
+            # 等待之后至少还要留出发起请求的时间
+            max_wait = min(max_wait, left - MIN_ATTEMPT_TIMEOUT)
+        now = time.monotonic()
+        if self.tokens:
+            tokens = min(tokens, int(self.tokens.capacity))
+        else:
+            tokens = 0
+
+        wait = max(
+            self.blocked_until - now,
+            self.requests.wait_time(1, now) if self.requests else 0.0,
+            self.tokens.wait_time(tokens, now) if self.tokens else 0.0
+        )
+        if wait > max_wait:
+            PROVIDER_RATE_LIMITED.inc(provider=self.name, reason="rejected")
+            raise RateLimitExceeded(self.name, wait)
+
+        if self.requests:
+            self.requests.consume(1)
+        if self.tokens:
+            self.tokens.consume(tokens)
+        if wait > 0:
+            PROVIDER_RATE_LIMITED.inc(provider=self.name, reason="queued")
+            try:
+                await asyncio.sleep(wait)
+            except asyncio.CancelledError:
+                if self.requests:
+                    self.requests.refund(1)
+                if self.tokens:
+                    self.tokens.refund(tokens)
+                raise
+        return tokens
+
+    def settle(self, reserved: int, used: Optional[int]):
+        """按响应中的实际用量退还多预留的token"""
+        if self.tokens and used is not None and used < reserved:
+            self.tokens.refund(reserved - used)
+
+    def update(self, status_code: int, headers: Mapping[str, str]):
+        """根据响应头同步配额；429时按 Retry-After 暂停该提供商"""
+        for remaining_key, reset_key in _RATE_LIMIT_HEADERS:
+            quota = headers.get(remaining_key)
+            if quota is None:
+                continue
+            try:
+                quota = float(quota)
+            except ValueError:
+                continue
+            bucket = self.tokens if remaining_key.endswith("-tokens") else self.requests
+            if bucket:
+                bucket.tokens = min(bucket.tokens, quota)
+            if quota <= 0:
+                reset = parse_reset(headers.get(reset_key))
+                if reset:
+                    self._block_for(reset)
+
+        if status_code == 429:
+            PROVIDER_RATE_LIMITED.inc(provider=self.name, reason="upstream")
+            retry_after = parse_reset(headers.get("retry-after"))
+            if retry_after is None:
+                retry_after = settings.PROVIDER_RATE_LIMIT_DEFAULT_BACKOFF
+            self._block_for(retry_after)
+            logger.warning(f"⏳ {self.name} 返回429，暂停 {retry_after:.1f}s")
+
+
+class RateLimiterRegistry:
+    """进程内共享的限流器，按提供商名懒创建"""
+
+    def __init__(self):
+        self._limiters: Dict[str, ProviderRateLimiter] = {}
+
+    def get(self, provider: str) -> ProviderRateLimiter:
+        if provider not in self._limiters:
+            quota = settings.PROVIDER_RATE_LIMITS.get(provider, {})
+            self._limiters[provider] = ProviderRateLimiter(provider, quota.get("rpm"), quota.get("tpm"))
+        return self._limiters[provider]
+
+
+# 全局限流器
+rate_limiters = RateLimiterRegistry()
@@ -0,0 +1,159 @@
+"""
+分块放大
+输入图片按固定大小分块，每块连同四周的重叠边距一起在线程池中放大（PIL的重采样和zlib压缩都释放GIL），
+放大后裁掉边距再拼回，接缝两侧的像素都由完整的邻域计算，结果与整图放大一致。
+输出按行带流式编码为PNG：同一时刻内存中只有一行分块的放大结果，与输出图片的总尺寸无关。
+放大算法可替换为CPU超分辨率模型（见 TileUpscaler）。
+"""
+
+import logging
+import struct
+import zlib
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Iterator, List, Optional, Tuple
+
+from PIL import Image
+
+from .config import settings
+from .image_ingest import ImageIngestError
+
+logger = logging.getLogger(__name__)
+
+# 放大单个分块：(分块, 倍数) -> 放大后的分块，尺寸必须为输入的整数倍
+TileUpscaler = Callable[[Image.Image, int], Image.Image]
+
+_PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+_PNG_COLOR_TYPES = {"L": 0, "RGB": 2, "RGBA": 6}
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.UPSCALE_WORKERS, thread_name_prefix="upscale")
+    return _executor
+
+
+def resample_upscaler(resample: Image.Resampling = Image.Resampling.LANCZOS) -> TileUpscaler:
+    """按重采样滤波器放大"""
+    def upscale(tile: Image.Image, scale: int) -> Image.Image:
+        return tile.resize((tile.width * scale, tile.height * scale), resample)
+    return upscale
+
+
+def _png_chunk(tag: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data))
+
+
+class PngStreamWriter:
+    """
+    逐行带写出PNG，所有行带共用一个zlib压缩流，每次写出一个IDAT块
+
+    安装了numpy时每行使用Up过滤（与上一行逐字节相减，跨行带保留上一行），
+    照片类图像的压缩结果约为不过滤时的一半；否则不过滤。
+    """
+
+    def __init__(self, width: int, height: int, mode: str = "RGB", level: int = 6):
+        if mode not in _PNG_COLOR_TYPES:
+            raise ValueError(f"Unsupported PNG mode: {mode}")
+        self.width = width
+        self.height = height
+        self.mode = mode
+        self._stride = width * len(mode)
+        self._compressor = zlib.compressobj(level)
+        self._previous = None
+
+    def header(self) -> bytes:
+        ihdr = struct.pack(">IIBBBBB", self.width, self.height, 8, _PNG_COLOR_TYPES[self.mode], 0, 0, 0)
+        return _PNG_SIGNATURE + _png_chunk(b"IHDR", ihdr)
+
+    def rows(self, band: Image.Image) -> bytes:
+        """写出一个行带（宽度与图片相同）"""
+        raw = band.tobytes()
+        try:
+            import numpy as np
+        except ImportError:
+            scanlines = b"".join(
+                b"\x00" + raw[offset:offset + self._stride] for offset in range(0, len(raw), self._stride)
+            )
+        else:
+            current = np.frombuffer(raw, dtype=np.uint8).reshape(-1, self._stride)
+            previous = np.zeros((1, self._stride), dtype=np.uint8) if self._previous is None else self._previous
+            filtered = np.empty((current.shape[0], self._stride + 1), dtype=np.uint8)
+            filtered[:, 0] = 2
+            filtered[:, 1:] = current - np.vstack([previous, current[:-1]])
+            self._previous = current[-1:].copy()
+            scanlines = filtered.tobytes()
+        data = self._compressor.compress(scanlines)
+        return _png_chunk(b"IDAT", data) if data else b""
+
+    def finish(self) -> bytes:
+        return _png_chunk(b"IDAT", self._compressor.flush()) + _png_chunk(b"IEND", b"")
+
+
+def _upscale_tile(image: Image.Image, box: Tuple[int, int, int, int], scale: int,
+                  overlap: int, upscaler: TileUpscaler) -> Image.Image:
+    """放大一个分块：带边距裁剪、放大，再按倍数裁掉边距"""
+    left, top, right, bottom = box
+    padded = (max(left - overlap, 0), max(top - overlap, 0),
+              min(right + overlap, image.width), min(bottom + overlap, image.height))
+    upscaled = upscaler(image.crop(padded), scale)
+    offset_x, offset_y = (left - padded[0]) * scale, (top - padded[1]) * scale
+    return upscaled.crop((offset_x, offset_y,
+                          offset_x + (right - left) * scale, offset_y + (bottom - top) * scale))
+
+
+def iter_upscaled_png(image: Image.Image, scale: int,
+                      upscaler: Optional[TileUpscaler] = None,
+                      tile_size: Optional[int] = None,
+                      overlap: int = 8) -> Iterator[bytes]:
+    """
+    分块放大图片，逐块产出PNG字节
+
+    下一行分块在当前行编码期间已提交到线程池；迭代提前停止时取消尚未开始的分块。
+
+    Args:
+        image: 输入图片（L/RGB/RGBA，其他模式转换为RGB）
+        scale: 整数放大倍数
+        upscaler: 分块放大算法，默认Lanczos重采样
+        tile_size: 输入分块边长，默认 settings.UPSCALE_TILE_SIZE
+        overlap: 分块四周的重叠边距（输入像素），需不小于放大算法的感受野半径
+    """
+    out_width, out_height = image.width * scale, image.height * scale
+    if out_width * out_height > settings.MAX_UPSCALE_PIXELS:
+        raise ImageIngestError(
+            f"放大后像素过多: {out_width}x{out_height}，上限 {settings.MAX_UPSCALE_PIXELS}", status_code=413
+        )
+    if image.mode not in _PNG_COLOR_TYPES:
+        image = image.convert("RGB")
+    image.load()  # 各线程只读取已解码的像素
+    upscaler = upscaler or resample_upscaler()
+    tile_size = tile_size or settings.UPSCALE_TILE_SIZE
+    executor = _get_executor()
+
+    rows = [(top, min(top + tile_size, image.height)) for top in range(0, image.height, tile_size)]
+    columns = [(left, min(left + tile_size, image.width)) for left in range(0, image.width, tile_size)]
+
+    def submit(top: int, bottom: int) -> List[Future]:
+        return [executor.submit(_upscale_tile, image, (left, top, right, bottom), scale, overlap, upscaler)
+                for left, right in columns]
+
+    writer = PngStreamWriter(out_width, out_height, image.mode)
+    yield writer.header()
+    pending = submit(*rows[0])
+    try:
+        for index, (top, bottom) in enumerate(rows):
+            current = pending
+            pending = submit(*rows[index + 1]) if index + 1 < len(rows) else []
+            band = Image.new(image.mode, (out_width, (bottom - top) * scale))
+            for (left, _), future in zip(columns, current):
+                band.paste(future.result(), (left * scale, 0))
+            chunk = writer.rows(band)
+            del band
+            if chunk:
+                yield chunk
+        yield writer.finish()
+    finally:
+        for future in pending:
+            future.cancel()
@@ -0,0 +1,245 @@
+"""
+轻量链路追踪
+兼容W3C traceparent传播，span以OTLP/JSON格式写入本地文件，不依赖 opentelemetry SDK
+"""
+
+import contextvars
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# OTLP SpanKind
+SPAN_KINDS = {"internal": 1, "server": 2, "client": 3, "producer": 4, "consumer": 5}
+# OTLP StatusCode
+STATUS_UNSET, STATUS_OK, STATUS_ERROR = 0, 1, 2
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+
+
+class SpanContext:
+    """跨进程传播的链路上下文"""
+    __slots__ = ("trace_id", "span_id", "sampled")
+
+    def __init__(self, trace_id: str, span_id: str, sampled: bool = True):
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.sampled = sampled
+
+
+def parse_traceparent(header: Optional[str]) -> Optional[SpanContext]:
+    """解析 traceparent: 00-<trace-id>-<parent-id>-<flags>，格式不合法时返回None"""
+    if not header:
+        return None
+    parts = header.strip().lower().split("-")
+    if len(parts) < 4 or len(parts[0]) != 2 or parts[0] == "ff":
+        return None
+    version, trace_id, span_id, flags = parts[:4]
+    if version == "00" and len(parts) != 4:
+        return None
+    if len(trace_id) != 32 or len(span_id) != 16 or len(flags) != 2:
+        return None
+    try:
+        int(trace_id, 16), int(span_id, 16)
+        sampled = bool(int(flags, 16) & 0x01)
+    except ValueError:
+        return None
+    if trace_id == "0" * 32 or span_id == "0" * 16:
+        return None
+    return SpanContext(trace_id, span_id, sampled)
+
+
+class Span:
+    """一个计时操作"""
+
+    def __init__(self, name: str, trace_id: str, parent_span_id: Optional[str], kind: str = "internal",
+                 attributes: Optional[Dict[str, Any]] = None, remote_parent: bool = False, sampled: bool = True):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_span_id = parent_span_id
+        # 上游未采样的链路只传播不导出
+        self.sampled = sampled
+        self.kind = kind
+        self.attributes: Dict[str, Any] = dict(attributes or {})
+        self.events: List[Dict[str, Any]] = []
+        self.status_code = STATUS_UNSET
+        self.status_message = ""
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        # 本进程内的根span结束时批量写出
+        self.is_local_root = parent_span_id is None or remote_parent
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def add_event(self, name: str, attributes: Optional[Dict[str, Any]] = None):
+        self.events.append({"name": name, "time_ns": time.time_ns(), "attributes": attributes or {}})
+
+    def set_status(self, code: int, message: str = ""):
+        self.status_code = code
+        self.status_message = message
+
+    def record_exception(self, exc: BaseException):
+        self.add_event("exception", {"exception.type": type(exc).__name__, "exception.message": str(exc)})
+        self.set_status(STATUS_ERROR, str(exc))
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def to_otlp(self) -> Dict[str, Any]:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": SPAN_KINDS.get(self.kind, 1),
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or time.time_ns()),
+            "attributes": _otlp_attributes(self.attributes),
+            "status": {"code": self.status_code, "message": self.status_message}
+        }
+        if self.parent_span_id:
+            span["parentSpanId"] = self.parent_span_id
+        if self.events:
+            span["events"] = [
+                {"name": event["name"], "timeUnixNano": str(event["time_ns"]),
+                 "attributes": _otlp_attributes(event["attributes"])}
+                for event in self.events
+            ]
+        return span
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [{"key": key, "value": _otlp_value(value)} for key, value in attributes.items() if value is not None]
+
+
+class OTLPJsonFileExporter:
+    """
+    把span以OTLP/JSON格式追加写入本地文件，每行一个 ExportTraceServiceRequest
+
+    可以直接用 otel-cli / Jaeger 的 OTLP 文件导入，也方便离线测试时断言。
+    """
+
+    def __init__(self, path: str, service_name: str = "youcreator-ai-service", max_batch: int = 256):
+        self.path = path
+        self.service_name = service_name
+        self.max_batch = max_batch
+        self._buffer: List[Span] = []
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+    def export(self, span: Span):
+        with self._lock:
+            self._buffer.append(span)
+            if not span.is_local_root and len(self._buffer) < self.max_batch:
+                return
+            batch, self._buffer = self._buffer, []
+        self._write(batch)
+
+    def flush(self):
+        with self._lock:
+            batch, self._buffer = self._buffer, []
+        if batch:
+            self._write(batch)
+
+    def _write(self, spans: List[Span]):
+        payload = {
+            "resourceSpans": [{
+                "resource": {"attributes": _otlp_attributes({
+                    "service.name": self.service_name,
+                    "process.pid": os.getpid()
+                })},
+                "scopeSpans": [{
+                    "scope": {"name": "youcreator.ai.tracing"},
+                    "spans": [span.to_otlp() for span in spans]
+                }]
+            }]
+        }
+        try:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(payload, ensure_ascii=False) + "\n")
+        except OSError as e:
+            logger.warning(f"⚠️ 链路数据写入失败: {e}")
+
+
+class Tracer:
+    """链路追踪器"""
+
+    def __init__(self):
+        self.exporter: Optional[OTLPJsonFileExporter] = None
+
+    def configure(self, enabled: bool, export_path: str, service_name: str = "youcreator-ai-service"):
+        """根据配置启用文件导出"""
+        if enabled:
+            self.exporter = OTLPJsonFileExporter(export_path, service_name)
+            logger.info(f"🔍 链路追踪已启用，导出到 {export_path}")
+        else:
+            self.exporter = None
+
+    @contextmanager
+    def start_span(self, name: str, kind: str = "internal", attributes: Optional[Dict[str, Any]] = None,
+                   parent: Optional[SpanContext] = None):
+        """
+        开启一个span并设为当前span
+
+        未指定parent时使用当前上下文中的span；asyncio任务创建时会复制上下文，
+        因此 gather 出去的子任务会自动挂在发起方的span下。子span继承父span的采样标记。
+        """
+        current = _current_span.get()
+        if parent is not None:
+            span = Span(name, parent.trace_id, parent.span_id, kind, attributes,
+                        remote_parent=True, sampled=parent.sampled)
+        elif current is not None:
+            span = Span(name, current.trace_id, current.span_id, kind, attributes, sampled=current.sampled)
+        else:
+            span = Span(name, secrets.token_hex(16), None, kind, attributes)
+
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.record_exception(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end_ns = time.time_ns()
+            if self.exporter is not None and span.sampled:
+                self.exporter.export(span)
+
+    def flush(self):
+        if self.exporter is not None:
+            self.exporter.flush()
+
+
+def current_span() -> Optional[Span]:
+    """当前上下文中的span"""
+    return _current_span.get()
+
+
+def current_traceparent() -> Optional[str]:
+    """当前span的traceparent，用于继续向下游传播"""
+    span = _current_span.get()
+    return span.traceparent if span else None
+
+
+# 全局追踪器
+tracer = Tracer()
+start_span = tracer.start_span
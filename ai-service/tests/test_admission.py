@@ -0,0 +1,188 @@
+"""
+准入控制：路由分类与优先级，有界优先队列，队列已满或等待超时返回429，被拒绝的请求带有跨域响应头
+"""
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from src.utils.admission import (
+    PRIORITY_BATCH, PRIORITY_INTERACTIVE, AdmissionController, AdmissionMiddleware, AdmissionPool, QueueFull,
+    classify, request_priority
+)
+
+ORIGIN = "http://localhost:3000"
+
+
+def test_route_classes():
+    assert classify("POST", "/api/v1/multimodal/text-to-image") == "image"
+    assert classify("POST", "/api/v1/music/generate/") == "music"
+    assert classify("GET", "/api/v1/multimodal/text-to-image") is None
+    assert classify("POST", "/api/v1/workflow/execute") == "workflow"
+    assert classify("POST", "/api/v1/workflow/validate") is None
+
+
+def test_caption_is_image_workload():
+    assert classify("POST", "/api/v1/media/caption") == "image"
+    assert classify("GET", "/api/v1/media/caption") is None
+
+
+def test_priority_from_header_or_route():
+    assert request_priority("/api/v1/batch-generate", None) == PRIORITY_BATCH
+    assert request_priority("/api/v1/batch-generate", "interactive") == PRIORITY_INTERACTIVE
+    assert request_priority("/api/v1/text/generate", "batch") == PRIORITY_BATCH
+    assert request_priority("/api/v1/text/generate", "urgent") == PRIORITY_INTERACTIVE
+
+
+def test_full_queue_rejects_immediately():
+    async def run():
+        pool = AdmissionPool("image", limit=1, queue_size=1)
+        await pool.acquire(PRIORITY_INTERACTIVE)
+        waiter = asyncio.create_task(pool.acquire(PRIORITY_INTERACTIVE))
+        await asyncio.sleep(0)
+        with pytest.raises(QueueFull) as error:
+            await pool.acquire(PRIORITY_INTERACTIVE)
+        pool.release()
+        await waiter
+        return error.value, pool.stats()
+
+    error, stats = asyncio.run(run())
+
+    assert (error.workload, error.reason) == ("image", "queue_full")
+    # 前面排着一个请求，平均服务时间1秒
+    assert error.retry_after == pytest.approx(2)
+    assert (stats["active"], stats["queued"], stats["rejected"]) == (1, 0, 1)
+
+
+def test_interactive_requests_go_before_batch():
+    async def run():
+        pool = AdmissionPool("image", limit=1, queue_size=10)
+        await pool.acquire(PRIORITY_INTERACTIVE)
+        order = []
+
+        async def request(name, priority):
+            await pool.acquire(priority)
+            order.append(name)
+            pool.release()
+
+        tasks = []
+        for name, priority in [("batch-1", PRIORITY_BATCH), ("batch-2", PRIORITY_BATCH),
+                               ("interactive", PRIORITY_INTERACTIVE)]:
+            tasks.append(asyncio.create_task(request(name, priority)))
+            await asyncio.sleep(0)
+        pool.release()
+        await asyncio.gather(*tasks)
+        return order, pool.active
+
+    order, active = asyncio.run(run())
+
+    assert order == ["interactive", "batch-1", "batch-2"]
+    assert active == 0
+
+
+def test_wait_past_the_deadline_is_rejected_and_does_not_leak_a_slot():
+    async def run():
+        pool = AdmissionPool("text", limit=1, queue_size=10)
+        await pool.acquire(PRIORITY_INTERACTIVE)
+        with pytest.raises(QueueFull) as error:
+            await pool.acquire(PRIORITY_INTERACTIVE, timeout=0.01)
+        cancelled = asyncio.create_task(pool.acquire(PRIORITY_INTERACTIVE))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        await asyncio.gather(cancelled, return_exceptions=True)
+        pool.release()
+        return error.value.reason, pool.stats()
+
+    reason, stats = asyncio.run(run())
+
+    assert reason == "timeout"
+    assert (stats["active"], stats["queued"]) == (0, 0)
+
+
+def _middleware(concurrency, queue_sizes, max_concurrent=8):
+    release = asyncio.Event()
+
+    async def app(scope, receive, send):
+        await release.wait()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    controller = AdmissionController(max_concurrent, concurrency, queue_sizes)
+    return AdmissionMiddleware(app, controller), controller, release
+
+
+async def _call(middleware, path: str, method: str = "POST"):
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    await middleware({"type": "http", "method": method, "path": path, "headers": []}, receive, send)
+    return sent
+
+
+def test_middleware_returns_429_with_retry_after_when_the_queue_is_full():
+    async def run():
+        middleware, controller, release = _middleware({"music": 1}, {"music": 1})
+        running = [asyncio.create_task(_call(middleware, "/api/v1/music/generate")) for _ in range(2)]
+        await asyncio.sleep(0)
+        rejected = await _call(middleware, "/api/v1/music/generate")
+        # 不需要准入控制的请求不受影响
+        release.set()
+        other = await _call(middleware, "/api/v1/text/generate")
+        return rejected, await asyncio.gather(*running), other, controller.stats()
+
+    rejected, running, other, stats = asyncio.run(run())
+
+    start, body = rejected
+    assert start["status"] == 429
+    assert dict(start["headers"])[b"retry-after"] == b"2"
+    assert json.loads(body["body"]) == {"detail": "music 请求过多，请稍后重试", "workload": "music", "retry_after": 2}
+    assert [sent[0]["status"] for sent in running] == [200, 200]
+    assert other[0]["status"] == 200
+    assert stats["active"] == 0 and stats["workloads"]["music"]["rejected"] == 1
+
+
+def test_total_limit_is_shared_across_workloads():
+    async def run():
+        middleware, controller, release = _middleware({"text": 2, "image": 2}, {"text": 4, "image": 4},
+                                                      max_concurrent=2)
+        tasks = [asyncio.create_task(_call(middleware, path))
+                 for path in ("/api/v1/text/generate", "/api/v1/image/generate", "/api/v1/text/generate")]
+        await asyncio.sleep(0.01)
+        busy = (controller.total.active, controller.total.queued)
+        release.set()
+        await asyncio.gather(*tasks)
+        return busy, controller.total.active
+
+    busy, active = asyncio.run(run())
+
+    assert busy == (2, 1)
+    assert active == 0
+
+
+def test_rejected_request_carries_cors_headers():
+    import main
+
+    pool = main.admission_controller.pools["image"]
+    saved = pool.active, pool.queue_size
+    pool.active, pool.queue_size = pool.limit, 0
+
+    async def post():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+            return await client.post("/api/v1/multimodal/text-to-image", headers={"Origin": ORIGIN}, json={})
+
+    try:
+        response = asyncio.run(post())
+    finally:
+        pool.active, pool.queue_size = saved
+
+    assert response.status_code == 429
+    assert response.headers["access-control-allow-origin"] == ORIGIN
+    assert "retry-after" in response.headers["access-control-expose-headers"].lower()
+    assert int(response.headers["retry-after"]) >= 1
@@ -0,0 +1,70 @@
+"""
+图片标注：并发请求合并为一批，缓存按解码后像素的内容哈希命中
+"""
+import asyncio
+from typing import List
+
+import pytest
+from PIL import Image
+
+from services import captioning
+from services.captioning import CaptionService
+from src.utils.image_ingest import ContentHashCache
+
+
+class FakeCaptionService(CaptionService):
+    """按图片中心像素的颜色标注，记录每批的大小"""
+
+    def __init__(self):
+        super().__init__(max_batch_size=16, max_wait=0.01)
+        self.batches: List[int] = []
+
+    def _caption_batch(self, images: List[Image.Image]) -> List[str]:
+        self.batches.append(len(images))
+        return ["a {} square".format("-".join(map(str, image.getpixel((image.width // 2, image.height // 2)))))
+                for image in images]
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache(monkeypatch):
+    monkeypatch.setattr(captioning, "caption_cache", ContentHashCache("caption", max_entries=16))
+
+
+def _square(color, size=64) -> Image.Image:
+    return Image.new("RGB", (size, size), color)
+
+
+def test_recolored_and_flat_images_get_their_own_captions():
+    service = FakeCaptionService()
+
+    captions = asyncio.run(service.caption_many([_square("red"), _square("blue"), _square("black"), _square("white")]))
+
+    assert captions == ["a 255-0-0 square", "a 0-0-255 square", "a 0-0-0 square", "a 255-255-255 square"]
+
+
+def test_identical_images_are_captioned_once():
+    service = FakeCaptionService()
+
+    async def run():
+        first = await service.caption_many([_square("red"), _square("red")])
+        second = await service.caption(_square("red"))
+        return first, second
+
+    first, second = asyncio.run(run())
+
+    assert first == ["a 255-0-0 square"] * 2
+    assert second == "a 255-0-0 square"
+    assert service.batches == [1]
+
+
+def test_concurrent_requests_share_one_batch():
+    service = FakeCaptionService()
+    colors = [(i * 20, 0, 0) for i in range(6)]
+
+    async def run():
+        return await asyncio.gather(*(service.caption(_square(color)) for color in colors))
+
+    captions = asyncio.run(run())
+
+    assert captions == [f"a {r}-0-0 square" for r, _, _ in colors]
+    assert service.batches == [6]
@@ -0,0 +1,151 @@
+"""
+请求截止时间：超时请求头只能缩短默认值，客户端断开时取消请求的处理（包括没有请求体的请求）
+"""
+import asyncio
+from typing import Dict, List
+
+import pytest
+
+from src.utils import deadline
+from src.utils.deadline import DeadlineExceeded, DeadlineMiddleware, parse_timeout_header, timeout_for
+
+
+@pytest.mark.parametrize("value,expected", [
+    (None, 60), ("", 60), ("10", 10), ("120", 60), ("-1", 60), ("soon", 60),
+])
+def test_timeout_header_can_only_shorten_the_default(value, expected):
+    assert parse_timeout_header(value, 60) == expected
+
+
+def test_timeout_for_uses_the_remaining_budget():
+    async def run():
+        assert timeout_for(30) == 30
+        token = deadline.set_deadline(5)
+        try:
+            assert timeout_for(30) == pytest.approx(5, abs=0.1)
+            assert timeout_for(2) == 2
+            deadline.set_deadline(0.1)
+            with pytest.raises(DeadlineExceeded):
+                timeout_for(30)
+        finally:
+            deadline.reset_deadline(token)
+
+    asyncio.run(run())
+
+
+class Client:
+    """模拟ASGI服务器：按顺序发送请求消息，可在之后发送断开事件"""
+
+    def __init__(self, body_messages: List[Dict]):
+        self.incoming: asyncio.Queue = asyncio.Queue()
+        for message in body_messages:
+            self.incoming.put_nowait(message)
+        self.sent: List[Dict] = []
+
+    async def receive(self):
+        return await self.incoming.get()
+
+    async def send(self, message):
+        self.sent.append(message)
+
+    def disconnect(self):
+        self.incoming.put_nowait({"type": "http.disconnect"})
+
+
+def _scope(method: str = "GET", headers=()):
+    return {"type": "http", "method": method, "path": "/slow", "headers": list(headers)}
+
+
+async def _respond(send, body: bytes = b"ok"):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": body})
+
+
+def _serve(app, client: Client, scope, disconnect_after: float = None):
+    async def run():
+        middleware = DeadlineMiddleware(app, default_timeout=60)
+        if disconnect_after is not None:
+            asyncio.get_running_loop().call_later(disconnect_after, client.disconnect)
+        await asyncio.wait_for(middleware(scope, client.receive, client.send), timeout=2)
+
+    asyncio.run(run())
+
+
+def test_disconnect_cancels_request_without_body():
+    events = []
+
+    async def app(scope, receive, send):
+        try:
+            await asyncio.sleep(30)
+        except asyncio.CancelledError:
+            events.append("cancelled")
+            raise
+
+    _serve(app, Client([{"type": "http.request", "body": b"", "more_body": False}]), _scope(),
+           disconnect_after=0.05)
+
+    assert events == ["cancelled"]
+
+
+def test_request_without_body_can_still_read_an_empty_body():
+    async def app(scope, receive, send):
+        message = await receive()
+        await _respond(send, b"body=" + message["body"])
+
+    client = Client([{"type": "http.request", "body": b"", "more_body": False}])
+    _serve(app, client, _scope())
+
+    assert client.sent[-1]["body"] == b"body="
+
+
+def test_disconnect_after_the_body_cancels_request_with_body():
+    events = []
+
+    async def app(scope, receive, send):
+        chunks = []
+        while True:
+            message = await receive()
+            chunks.append(message["body"])
+            if not message.get("more_body"):
+                break
+        events.append(b"".join(chunks))
+        try:
+            await asyncio.sleep(30)
+        except asyncio.CancelledError:
+            events.append("cancelled")
+            raise
+
+    client = Client([
+        {"type": "http.request", "body": b"he", "more_body": True},
+        {"type": "http.request", "body": b"llo", "more_body": False},
+    ])
+    _serve(app, client, _scope("POST", [(b"content-length", b"5")]), disconnect_after=0.05)
+
+    assert events == [b"hello", "cancelled"]
+
+
+def test_disconnect_after_the_response_does_not_cancel():
+    events = []
+
+    async def app(scope, receive, send):
+        await _respond(send)
+        await asyncio.sleep(0.1)
+        events.append("finished")
+
+    _serve(app, Client([{"type": "http.request", "body": b"", "more_body": False}]), _scope(),
+           disconnect_after=0.01)
+
+    assert events == ["finished"]
+
+
+def test_timeout_header_sets_the_request_deadline():
+    budgets = []
+
+    async def app(scope, receive, send):
+        budgets.append(deadline.remaining())
+        await _respond(send)
+
+    _serve(app, Client([{"type": "http.request", "body": b"", "more_body": False}]),
+           _scope(headers=[(b"x-request-timeout", b"5")]))
+
+    assert budgets[0] == pytest.approx(5, abs=0.1)
@@ -0,0 +1,88 @@
+"""
+图片特征：主色、明暗、饱和度和边缘密度，以及由此得到的配乐提示
+"""
+import sys
+
+import pytest
+from PIL import Image, ImageDraw
+
+pytest.importorskip("numpy")
+
+from src.utils.image_features import describe, extract_features, music_hints
+
+
+def _stripes(colors, size=(256, 256), width=8) -> Image.Image:
+    """竖条纹，颜色依次循环"""
+    image = Image.new("RGB", size)
+    draw = ImageDraw.Draw(image)
+    for i, x in enumerate(range(0, size[0], width)):
+        draw.rectangle([x, 0, x + width - 1, size[1]], fill=colors[i % len(colors)])
+    return image
+
+
+def test_flat_color_image():
+    features = extract_features(Image.new("RGB", (300, 200), (255, 0, 0)))
+
+    assert features["brightness"] == pytest.approx(0.299, abs=0.01)
+    assert features["contrast"] == pytest.approx(0, abs=0.01)
+    assert features["saturation"] == pytest.approx(1)
+    assert features["edge_density"] == 0
+    assert features["warmth"] == 1
+    assert features["dominant_colors"] == [{"hex": "#ff0000", "name": "red", "share": 1.0}]
+    assert sum(features["brightness_histogram"]) == pytest.approx(1)
+
+
+def test_dominant_colors_are_ordered_by_share():
+    image = Image.new("RGB", (200, 200), (0, 0, 255))
+    ImageDraw.Draw(image).rectangle([0, 0, 59, 199], fill=(0, 160, 0))
+
+    colors = extract_features(image)["dominant_colors"]
+
+    assert [color["name"] for color in colors[:2]] == ["blue", "green"]
+    assert colors[0]["share"] == pytest.approx(0.7, abs=0.05)
+
+
+def test_gray_image_gets_monochrome_hints():
+    features = extract_features(Image.new("L", (64, 64), 128))
+
+    assert features["saturation"] == 0
+    assert music_hints(features) == {"mood": "nostalgic, reflective, monochrome", "tempo": "slow",
+                                     "genre": "solo piano, minimal"}
+
+
+def test_dark_high_contrast_image_is_dramatic():
+    image = Image.new("RGB", (256, 256), (10, 10, 40))
+    ImageDraw.Draw(image).rectangle([96, 96, 159, 159], fill=(250, 240, 200))
+
+    hints = music_hints(extract_features(image))
+
+    assert hints["mood"] == "dramatic, mysterious, tense"
+    assert hints["genre"] == "cinematic orchestral"
+
+
+def test_bright_warm_busy_image_is_fast_and_joyful():
+    features = extract_features(_stripes([(255, 200, 0), (255, 120, 60)]))
+
+    assert features["edge_density"] > 0.1
+    assert features["warmth"] > 0.9
+    assert music_hints(features) == {"mood": "joyful, uplifting, sunny", "tempo": "fast", "genre": "electronic pop"}
+
+
+def test_features_are_deterministic_and_use_a_thumbnail():
+    image = _stripes([(20, 120, 200), (240, 240, 240)], size=(2000, 1200), width=40)
+
+    assert extract_features(image) == extract_features(image.copy())
+
+
+def test_describe_with_and_without_features():
+    features = extract_features(Image.new("RGB", (120, 80), (0, 160, 0)))
+
+    assert describe((1200, 800), "RGB", features) == \
+        "landscape image, 1200x800 pixels, balanced smooth, dominant colors: green"
+    assert describe((600, 900), "L", None) == "portrait grayscale image, 600x900 pixels, high resolution, detailed"
+
+
+def test_without_numpy_returns_none(monkeypatch):
+    monkeypatch.setitem(sys.modules, "numpy", None)
+
+    assert extract_features(Image.new("RGB", (8, 8))) is None
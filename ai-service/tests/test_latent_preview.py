@@ -0,0 +1,114 @@
+"""
+扩散过程的中间预览：按间隔发出预览，取消后在下一步结束时中止，流式接口提前停止时取消生成
+"""
+import asyncio
+import threading
+
+import pytest
+from PIL import Image
+
+from services.media_generation_bagel import BagelMediaGenerationService
+from src.utils import latent_preview
+from src.utils.latent_preview import GenerationCancelled, PreviewCallback, encode_preview
+
+
+@pytest.fixture(autouse=True)
+def fake_projection(monkeypatch):
+    # 潜变量投影依赖torch，这里直接返回一张小图
+    monkeypatch.setattr(latent_preview, "latents_to_image", lambda latents: Image.new("RGB", (8, 8), "red"))
+
+
+def _run_steps(callback: PreviewCallback, steps: int):
+    for step in range(steps):
+        callback(None, step, None, {"latents": None})
+
+
+def test_previews_every_interval_except_last_step():
+    previews = []
+    callback = PreviewCallback(6, interval=2, on_preview=lambda step, total, image: previews.append((step, total)))
+
+    _run_steps(callback, 6)
+
+    assert previews == [(2, 6), (4, 6)]
+
+
+def test_preview_failure_does_not_stop_generation():
+    def fail(step, total, image):
+        raise RuntimeError("encoder broke")
+
+    callback = PreviewCallback(4, interval=1, on_preview=fail)
+    _run_steps(callback, 4)
+    assert callback.cancelled_at is None
+
+
+def test_cancel_stops_at_the_next_step():
+    cancel = threading.Event()
+    callback = PreviewCallback(10, cancel=cancel)
+    _run_steps(callback, 3)
+
+    cancel.set()
+    with pytest.raises(GenerationCancelled):
+        callback(None, 3, None, {"latents": None})
+    assert callback.cancelled_at == 4
+
+
+def test_encode_preview_is_a_jpeg_data_url():
+    assert encode_preview(Image.new("RGB", (8, 8))).startswith("data:image/jpeg;base64,")
+
+
+class FakeSteppingService(BagelMediaGenerationService):
+    """text_to_image 在线程中逐步运行 PreviewCallback，记录在哪一步被取消"""
+
+    def __init__(self, steps: int):
+        self.steps = steps
+        self.step_done = threading.Event()
+        self.cancelled_at = None
+
+    async def text_to_image(self, on_preview=None, preview_interval=0, cancel=None, **kwargs):
+        callback = PreviewCallback(self.steps, preview_interval, on_preview, cancel)
+
+        def run():
+            try:
+                for step in range(self.steps):
+                    callback(None, step, None, {"latents": None})
+                    self.step_done.wait(0.02)
+            except GenerationCancelled:
+                self.cancelled_at = callback.cancelled_at
+                return {"success": False, "cancelled": True, "error": "cancelled"}
+            return {"success": True, "images": []}
+
+        return await asyncio.to_thread(run)
+
+
+def test_stream_yields_previews_then_result():
+    service = FakeSteppingService(steps=6)
+
+    async def collect():
+        return [event async for event in service.stream_text_to_image(preview_interval=2, text="海边")]
+
+    events = asyncio.run(collect())
+
+    assert [name for name, _ in events] == ["preview", "preview", "result"]
+    assert [data["step"] for _, data in events[:2]] == [2, 4]
+    assert events[-1][1]["success"]
+
+
+def test_stopping_the_stream_cancels_generation():
+    service = FakeSteppingService(steps=50)
+
+    async def first_preview_then_stop():
+        stream = service.stream_text_to_image(preview_interval=1, text="海边")
+        async for name, _ in stream:
+            assert name == "preview"
+            break
+        await stream.aclose()
+        # 等推理线程在下一步结束时退出
+        for _ in range(100):
+            if service.cancelled_at is not None:
+                break
+            await asyncio.sleep(0.01)
+
+    asyncio.run(first_preview_then_stop())
+
+    assert service.cancelled_at is not None
+    assert service.cancelled_at < 50
@@ -0,0 +1,148 @@
+"""
+输出编码：按参数或 Accept 头协商格式，编码结果缓存，已是目标格式的字节原样返回
+"""
+import asyncio
+import importlib
+import io
+import wave
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from PIL import Image
+
+from src.utils import media_encoding
+from src.utils.media_encoding import (
+    IMAGE_FORMATS, AUDIO_FORMATS, EncodedMediaCache, UnsupportedFormat, encode_audio, encode_image, negotiate,
+    sniff_format
+)
+
+
+@pytest.fixture(autouse=True)
+def known_formats(monkeypatch):
+    """固定可用格式，不依赖Pillow和libsndfile的编译选项"""
+    available = {"image": ["png", "jpeg", "webp"], "audio": ["wav", "flac"]}
+    monkeypatch.setattr(media_encoding, "supported_formats", lambda kind: available[kind])
+    monkeypatch.setattr(media_encoding, "encoding_cache", EncodedMediaCache(1 << 20))
+
+
+@pytest.mark.parametrize("requested,name", [("jpg", "jpeg"), ("JPEG", "jpeg"), ("image/webp", "webp"), ("png", "png")])
+def test_requested_format_wins_over_accept(requested, name):
+    assert negotiate("image", requested, "image/png").name == name
+
+
+@pytest.mark.parametrize("requested", ["gif", "avif"])
+def test_unavailable_requested_format_is_an_error(requested):
+    with pytest.raises(UnsupportedFormat):
+        negotiate("image", requested)
+
+
+@pytest.mark.parametrize("kind,accept,name", [
+    ("image", None, "png"),
+    ("image", "image/avif, image/webp;q=0.9, image/jpeg;q=0.8", "webp"),
+    ("image", "image/jpeg;q=0.5, image/webp;q=0", "jpeg"),
+    ("image", "text/html, image/*;q=0.8", "png"),
+    ("image", "*/*", "png"),
+    ("image", "image/gif", "png"),
+    ("audio", "audio/mpeg, audio/flac;q=0.9", "flac"),
+    ("audio", "audio/x-wav", "wav"),
+    ("audio", "image/webp", "wav"),
+])
+def test_accept_negotiation(kind, accept, name):
+    assert negotiate(kind, None, accept).name == name
+
+
+def _png(size=(32, 24), mode="RGB") -> bytes:
+    buffer = io.BytesIO()
+    Image.new(mode, size, "orange").save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def test_bytes_already_in_the_target_format_are_returned_as_is():
+    data = _png()
+    assert asyncio.run(encode_image(data, IMAGE_FORMATS["png"])) is data
+    assert asyncio.run(encode_image(data, IMAGE_FORMATS["png"], quality=90)) is not data
+
+
+def test_transparent_image_is_encoded_as_jpeg():
+    data = asyncio.run(encode_image(_png(mode="RGBA"), IMAGE_FORMATS["jpeg"], quality=70))
+
+    assert sniff_format(data) == "jpeg"
+    assert Image.open(io.BytesIO(data)).size == (32, 24)
+
+
+def test_encoded_images_are_cached_by_content_format_and_quality(monkeypatch):
+    calls = []
+    encode = media_encoding.encode_image_sync
+    monkeypatch.setattr(media_encoding, "encode_image_sync", lambda *args: calls.append(args[1:]) or encode(*args))
+    image = Image.new("RGB", (16, 16), "teal")
+
+    async def run():
+        first = await encode_image(image, IMAGE_FORMATS["jpeg"])
+        again = await encode_image(image.copy(), IMAGE_FORMATS["jpeg"])
+        await encode_image(image, IMAGE_FORMATS["jpeg"], quality=40)
+        await encode_image(Image.new("RGB", (16, 16), "navy"), IMAGE_FORMATS["jpeg"])
+        return first, again
+
+    first, again = asyncio.run(run())
+
+    assert first == again
+    assert [(fmt.name, quality) for fmt, quality in calls] == [("jpeg", None), ("jpeg", 40), ("jpeg", None)]
+
+
+def test_cache_evicts_least_recently_used_by_size():
+    cache = EncodedMediaCache(max_bytes=10)
+    cache.put("a", b"1234")
+    cache.put("b", b"5678")
+    cache.get("a")
+    cache.put("c", b"90ab")
+    cache.put("huge", b"x" * 11)
+
+    assert [cache.get(key) for key in ("a", "b", "c", "huge")] == [b"1234", None, b"90ab", None]
+
+
+def test_waveform_is_encoded_as_wav_without_soundfile():
+    np = pytest.importorskip("numpy")
+    waveform = np.stack([np.linspace(-1, 1, 800), np.zeros(800)]).astype(np.float32)
+
+    data = asyncio.run(encode_audio((waveform, 8000), AUDIO_FORMATS["wav"]))
+
+    with wave.open(io.BytesIO(data)) as reader:
+        assert (reader.getnchannels(), reader.getframerate(), reader.getnframes()) == (2, 8000, 800)
+        frames = np.frombuffer(reader.readframes(800), dtype="<i2").reshape(-1, 2)
+    assert (frames[0, 0], frames[-1, 0], frames[:, 1].any()) == (-32767, 32767, False)
+
+
+@pytest.mark.parametrize("data,name", [
+    (b"\x89PNG\r\n\x1a\n", "png"), (b"\xff\xd8\xff\xe0", "jpeg"), (b"RIFF\0\0\0\0WEBPVP8 ", "webp"),
+    (b"RIFF\0\0\0\0WAVEfmt ", "wav"), (b"fLaC\0", "flac"), (b"OggS\0", "opus"), (b"ID3\4", "mp3"), (b"GIF89a", None),
+])
+def test_sniff_format(data, name):
+    assert sniff_format(data) == name
+
+
+def test_binary_endpoint_negotiates_from_accept(monkeypatch):
+    main = importlib.import_module("main")
+
+    async def generate_image_for_text(**kwargs):
+        return _png()
+
+    manager = SimpleNamespace(multimodal_matcher=SimpleNamespace(
+        image_client=SimpleNamespace(generate_image_for_text=generate_image_for_text)
+    ))
+    monkeypatch.setattr(main.app.state, "model_manager", manager, raising=False)
+
+    async def post(**kwargs):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+            return await client.post("/api/v1/multimodal/text-to-image", json={"text": "海边日落"}, **kwargs)
+
+    negotiated = asyncio.run(post(headers={"Accept": "image/jpeg, image/png;q=0.5"}))
+    rejected = asyncio.run(post(params={"output_format": "gif"}))
+
+    assert negotiated.status_code == 200
+    assert negotiated.headers["content-type"] == "image/jpeg"
+    assert negotiated.headers["vary"] == "Accept"
+    assert negotiated.headers["content-disposition"].endswith("text_to_image.jpg")
+    assert sniff_format(negotiated.content) == "jpeg"
+    assert rejected.status_code == 400
@@ -0,0 +1,103 @@
+"""
+指标注册表：Prometheus文本格式导出，提供商调用计时，/metrics 接口
+"""
+import asyncio
+import importlib
+
+import httpx
+import pytest
+
+from src.utils.metrics import PROVIDER_REQUEST_DURATION, MetricsRegistry, track_provider
+
+
+def test_counter_and_gauge_exposition():
+    registry = MetricsRegistry()
+    requests = registry.counter("demo_requests_total", "请求数", ["route"])
+    depth = registry.gauge("demo_queue_depth", "排队数量")
+
+    requests.inc(route="/a")
+    requests.inc(2, route='/b"\n')
+    depth.set(3)
+    depth.dec()
+
+    assert registry.render() == "\n".join([
+        "# HELP demo_requests_total 请求数",
+        "# TYPE demo_requests_total counter",
+        'demo_requests_total{route="/a"} 1',
+        'demo_requests_total{route="/b\\"\\n"} 2',
+        "# HELP demo_queue_depth 排队数量",
+        "# TYPE demo_queue_depth gauge",
+        "demo_queue_depth 2",
+    ]) + "\n"
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = MetricsRegistry()
+    latency = registry.histogram("demo_seconds", "耗时", ["op"], buckets=(0.1, 1))
+
+    for value in (0.05, 0.5, 0.7, 5):
+        latency.observe(value, op="x")
+
+    assert registry.render().splitlines()[2:] == [
+        'demo_seconds_bucket{op="x",le="0.1"} 1',
+        'demo_seconds_bucket{op="x",le="1"} 3',
+        'demo_seconds_bucket{op="x",le="+Inf"} 4',
+        'demo_seconds_sum{op="x"} 6.25',
+        'demo_seconds_count{op="x"} 4',
+    ]
+
+
+def test_labels_must_match_and_names_are_registered_once():
+    registry = MetricsRegistry()
+    counter = registry.counter("demo_total", "计数", ["a"])
+
+    with pytest.raises(ValueError):
+        counter.inc(b="1")
+    assert registry.counter("demo_total", "计数", ["a"]) is counter
+
+
+def test_failing_collector_does_not_break_exposition():
+    registry = MetricsRegistry()
+    gauge = registry.gauge("demo_value", "值")
+    registry.register_collector(lambda: 1 / 0)
+    registry.register_collector(lambda: gauge.set(7))
+
+    assert "demo_value 7" in registry.render()
+
+
+def _count(**labels) -> int:
+    state = PROVIDER_REQUEST_DURATION._values.get(PROVIDER_REQUEST_DURATION._key(labels))
+    return state["count"] if state else 0
+
+
+def test_track_provider_records_outcome():
+    labels = dict(provider="demo", model="m", operation="text")
+    before = {outcome: _count(**labels, outcome=outcome) for outcome in ("success", "error", "empty")}
+
+    with track_provider(**labels):
+        pass
+    with track_provider(**labels) as call:
+        call.outcome = "empty"
+    with pytest.raises(RuntimeError), track_provider(**labels):
+        raise RuntimeError("boom")
+
+    assert {outcome: _count(**labels, outcome=outcome) - count for outcome, count in before.items()} == {
+        "success": 1, "error": 1, "empty": 1
+    }
+
+
+def test_metrics_endpoint_reports_requests():
+    main = importlib.import_module("main")
+
+    async def scrape():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            await client.get("/health")
+            return await client.get("/metrics")
+
+    response = asyncio.run(scrape())
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'http_request_duration_seconds_count{method="GET",route="/health",status="200"}' in response.text
+    assert "# TYPE process_resident_memory_bytes gauge" in response.text
@@ -0,0 +1,121 @@
+"""
+共享UNet上的LoRA适配器：推理过程中不会被其他请求切换；同一条流水线上的调用依次执行
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src.utils.model_hub import ModelHub
+
+MODEL_ID = "fake/sd"
+
+
+class FakeUNet:
+    """所有流水线共用的UNet，记录当前启用的适配器和正在运行的推理数"""
+
+    def __init__(self):
+        self.loaded = set()
+        self.active = None
+        self.running = 0
+        self.max_running = 0
+        self.lock = threading.Lock()
+
+
+class FakePipeline:
+    def __init__(self, unet: FakeUNet):
+        self.unet = unet
+        self.running = 0
+        self.max_running = 0
+
+    def load_lora_weights(self, source, adapter_name):
+        assert self.unet.running == 0, "适配器在推理过程中加载"
+        self.unet.loaded.add(adapter_name)
+
+    def enable_lora(self):
+        assert self.unet.running == 0, "适配器在推理过程中启用"
+
+    def set_adapters(self, names, adapter_weights):
+        self.unet.active = names[0]
+
+    def disable_lora(self):
+        assert self.unet.running == 0, "适配器在推理过程中停用"
+        self.unet.active = None
+
+    def __call__(self, steps: int = 4):
+        with self.unet.lock:
+            self.unet.running += 1
+            self.unet.max_running = max(self.unet.max_running, self.unet.running)
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        seen = []
+        for _ in range(steps):
+            seen.append(self.unet.active)
+            time.sleep(0.002)
+        with self.unet.lock:
+            self.unet.running -= 1
+            self.running -= 1
+        return seen
+
+
+def _hub():
+    hub, unet = ModelHub(), FakeUNet()
+    for scheduler in ("dpm", "lcm"):
+        for task in ("txt2img", "img2img"):
+            hub.get(("sd", MODEL_ID, "float32", scheduler, task), lambda: FakePipeline(unet))
+    return hub, unet
+
+
+def _pipelines(hub):
+    return [hub.get(key, None) for key in list(hub._models)]
+
+
+def test_adapter_is_stable_for_the_whole_call():
+    hub, unet = _hub()
+    draft = hub.stable_diffusion(MODEL_ID, scheduler="lcm", dtype="float32", adapter="lcm")
+    normal = hub.stable_diffusion(MODEL_ID, dtype="float32")
+    img2img = hub.stable_diffusion(MODEL_ID, task="img2img", dtype="float32")
+
+    jobs = [(draft, "lcm"), (normal, None), (img2img, None)] * 20
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(lambda job: (job[0](), job[1]), jobs))
+
+    for seen, expected in results:
+        assert seen == [expected] * len(seen)
+    assert unet.loaded == {"lcm"}
+    # 同一适配器下文生图和图生图可以并发，同一条流水线上的调用不会重叠
+    assert unet.max_running > 1
+    assert all(pipeline.max_running <= 1 for pipeline in _pipelines(hub))
+
+
+def test_adapter_is_loaded_when_pipeline_is_requested():
+    hub, unet = _hub()
+    hub.stable_diffusion(MODEL_ID, scheduler="lcm", dtype="float32", adapter="lcm")
+    assert unet.loaded == {"lcm"} and unet.active == "lcm"
+
+    # 取流水线本身不切换，调用时才切换
+    normal = hub.stable_diffusion(MODEL_ID, dtype="float32")
+    assert unet.active == "lcm"
+    assert normal(steps=1) == [None]
+
+
+def test_waiting_adapter_is_not_starved():
+    hub, unet = _hub()
+    normal = hub.stable_diffusion(MODEL_ID, dtype="float32")
+    draft = hub.stable_diffusion(MODEL_ID, scheduler="lcm", dtype="float32", adapter="lcm")
+    stop = threading.Event()
+
+    def keep_busy():
+        while not stop.is_set():
+            normal(steps=5)
+
+    threads = [threading.Thread(target=keep_busy) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    try:
+        start = time.monotonic()
+        assert draft(steps=1) == ["lcm"]
+        assert time.monotonic() - start < 2.0
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
@@ -0,0 +1,124 @@
+"""
+共享的MusicGen模型：并发请求的生成参数不会互相覆盖
+"""
+import asyncio
+import threading
+import time
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from services.media_generation import MediaGenerationService
+from services.media_generation_bagel import BagelMediaGenerationService
+from services.music_streaming import iter_music_segments
+
+
+class FakeTensor(np.ndarray):
+    """只实现 iter_music_segments 和响度计算用到的torch张量方法"""
+
+    def detach(self):
+        return self
+
+    def float(self):
+        return self
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return np.asarray(self)
+
+    def pow(self, exponent):
+        return self ** exponent
+
+    def mean(self, *args, **kwargs):
+        return np.asarray(np.ndarray.mean(self, *args, **kwargs)).view(FakeTensor)
+
+    def sqrt(self):
+        return np.sqrt(self)
+
+
+class FakeMusicGen:
+    """生成参数保存在模型上，generate 按调用时的参数生成，并记录参数在生成过程中是否被改动"""
+
+    sample_rate = 100
+    audio_channels = 1
+
+    def __init__(self):
+        self.params = {}
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def set_generation_params(self, **params):
+        self.params = params
+
+    def _record(self, texts):
+        params = dict(self.params)
+        time.sleep(0.01)
+        with self.lock:
+            self.calls.append((texts[0], params, params == self.params))
+        frames = int(round(params["duration"] * self.sample_rate))
+        return [self._waveform(frames)]
+
+    def _waveform(self, frames):
+        return np.full((1, frames), 0.1, dtype=np.float32)
+
+    def generate(self, texts):
+        return self._record(texts)
+
+
+
+class FakeStreamingMusicGen(FakeMusicGen):
+    """分段生成时模型返回torch张量"""
+
+    def _waveform(self, frames):
+        return super()._waveform(frames).view(FakeTensor)
+
+    def generate_continuation(self, prompt, prompt_sample_rate, texts):
+        return self._record(texts)
+
+
+@pytest.mark.parametrize("service_class", [MediaGenerationService, BagelMediaGenerationService])
+def test_concurrent_requests_use_their_own_params(service_class):
+    model = FakeMusicGen()
+    service = service_class()
+    service._get_music_pipeline = lambda: model
+
+    async def run():
+        return await asyncio.gather(*[
+            service.text_to_music(f"music {i}", duration=1 + i % 3, temperature=0.5 + i / 10)
+            for i in range(8)
+        ])
+
+    results = asyncio.run(run())
+
+    assert all(result["success"] for result in results)
+    assert len(model.calls) == 8
+    for text, params, unchanged in model.calls:
+        i = int(text.split()[1])
+        assert unchanged
+        assert params["duration"] == 1 + i % 3
+        assert params["temperature"] == pytest.approx(0.5 + i / 10)
+
+
+def test_streamed_segments_use_their_own_params():
+    model = FakeStreamingMusicGen()
+    lengths = {}
+
+    def consume(i):
+        segments = iter_music_segments(model, f"music {i}", duration=6, temperature=0.5 + i / 10,
+                                       window=2, context=0.5, fade=0.1)
+        lengths[i] = sum(segment.shape[0] for segment in segments)
+
+    threads = [threading.Thread(target=consume, args=(i,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert lengths == {i: 6 * model.sample_rate for i in range(4)}
+    assert len(model.calls) > 4
+    for text, params, unchanged in model.calls:
+        assert unchanged
+        assert params["temperature"] == pytest.approx(0.5 + int(text.split()[1]) / 10)
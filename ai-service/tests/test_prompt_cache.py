@@ -0,0 +1,83 @@
+"""
+提示缓存：只有规范化后相同的提示和相同的生成参数才命中，同一模板填入不同内容的提示不能互相命中
+"""
+import pytest
+
+from src.utils import prompt_cache
+from src.utils.prompt_cache import PromptCache, cache_key, normalize_prompt
+
+# 与 text_creator.create_poem 的提示模板相同
+POEM_TEMPLATE = """
+        请创作一首现代诗，主题是：{theme}
+
+        要求：
+        - 情感基调：抒情
+        - 意境优美，富有诗意
+        - 语言精练，韵律和谐
+        - 表达深刻的思想感情
+        - 结构完整，层次分明
+        """
+
+
+def _poem_cache(**kwargs) -> PromptCache:
+    cache = PromptCache("text", **kwargs)
+    cache.put(POEM_TEMPLATE.format(theme="春天的花园"), "max_length=500", "春天的诗")
+    return cache
+
+
+@pytest.mark.parametrize("theme", ["秋天的花园", "春天", "春天的花", "夏天的花园", "春天的花园。"])
+def test_templated_prompt_with_different_theme_misses(theme):
+    assert _poem_cache().get(POEM_TEMPLATE.format(theme=theme), "max_length=500") is None
+
+
+def test_same_prompt_hits_after_normalization():
+    cache = _poem_cache()
+    prompt = POEM_TEMPLATE.format(theme="春天的花园")
+    for variant in [prompt, prompt.replace("        ", "    "), prompt.replace("：", ":"), prompt.strip()]:
+        assert cache.get(variant, "max_length=500") == "春天的诗"
+    assert cache.stats()["hits"] == 4
+
+
+def test_code_prompts_keep_case_and_punctuation():
+    cache = PromptCache("code")
+    cache.put("def add(a, b): return a + b", "language=python", "加法")
+
+    assert cache.get("def add(a, b): return a - b", "language=python") is None
+    assert cache.get("def Add(a, b): return a + b", "language=python") is None
+    assert cache.get("def add(a, b):\n    return a + b", "language=python") == "加法"
+
+
+def test_generation_parameters_must_match():
+    cache = _poem_cache()
+    key = cache_key(max_length=500, temperature=0.7)
+    cache.put("写一首诗", key, "诗")
+
+    assert cache.get(POEM_TEMPLATE.format(theme="春天的花园"), "max_length=200") is None
+    assert cache.get("写一首诗", cache_key(temperature=0.71, max_length=500)) == "诗"
+    assert cache.get("写一首诗", cache_key(max_length=500, temperature=0.9)) is None
+
+
+def test_expired_entries_miss(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(prompt_cache.time, "time", lambda: now[0])
+    cache = _poem_cache(ttl=60)
+
+    now[0] += 59
+    assert cache.get(POEM_TEMPLATE.format(theme="春天的花园"), "max_length=500") == "春天的诗"
+    now[0] += 2
+    assert cache.get(POEM_TEMPLATE.format(theme="春天的花园"), "max_length=500") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = PromptCache("text", max_entries=2)
+    cache.put("a", "", 1)
+    cache.put("b", "", 2)
+    cache.get("a", "")
+    cache.put("c", "", 3)
+
+    assert [cache.get(prompt, "") for prompt in "abc"] == [1, None, 3]
+
+
+def test_normalize_prompt():
+    assert normalize_prompt("  主题：　Ｓｐｒｉｎｇ\n\n花园 ") == "主题: Spring 花园"
@@ -0,0 +1,128 @@
+"""
+提供商令牌桶：预留与按实际用量结算，429暂停，失败的请求退还预留的配额
+"""
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from src.models import groq_client
+from src.models.groq_client import GroqClient
+from src.utils.rate_limit import (
+    ProviderRateLimiter, RateLimitExceeded, TokenBucket, estimate_tokens, parse_reset, rate_limiters
+)
+
+
+def test_bucket_reservation_can_go_negative_and_refund_is_capped():
+    bucket = TokenBucket(60)
+    now = time.monotonic()
+
+    bucket.consume(90)
+    assert bucket.wait_time(1, now) == pytest.approx(31, abs=0.1)
+
+    bucket.refund(1000)
+    assert bucket.tokens == bucket.capacity
+
+
+def test_acquire_reserves_and_settle_refunds_unused_tokens():
+    limiter = ProviderRateLimiter("test", rpm=60, tpm=1000)
+
+    reserved = asyncio.run(limiter.acquire(400))
+    assert reserved == 400
+    assert limiter.tokens.tokens == pytest.approx(600, abs=1)
+
+    limiter.settle(reserved, 150)
+    assert limiter.tokens.tokens == pytest.approx(850, abs=1)
+
+
+def test_settle_without_usage_keeps_the_reservation():
+    limiter = ProviderRateLimiter("test", tpm=1000)
+    reserved = asyncio.run(limiter.acquire(400))
+
+    limiter.settle(reserved, None)
+    assert limiter.tokens.tokens == pytest.approx(600, abs=1)
+
+
+def test_acquire_rejects_when_the_wait_is_too_long():
+    limiter = ProviderRateLimiter("test", rpm=60)
+    limiter.requests.consume(limiter.requests.tokens)
+
+    with pytest.raises(RateLimitExceeded) as error:
+        asyncio.run(limiter.acquire(max_wait=0.1))
+    assert error.value.retry_after == pytest.approx(1, abs=0.1)
+
+
+def test_retry_after_blocks_the_provider():
+    limiter = ProviderRateLimiter("test", rpm=600)
+    limiter.update(429, {"retry-after": "30"})
+
+    with pytest.raises(RateLimitExceeded) as error:
+        asyncio.run(limiter.acquire(max_wait=5))
+    assert error.value.retry_after == pytest.approx(30, abs=0.5)
+
+
+@pytest.mark.parametrize("value,seconds", [
+    ("7", 7), ("0.5", 0.5), ("2m59.56s", 179.56), ("120ms", 0.12), ("1h", 3600), (None, None), ("soon", None)
+])
+def test_parse_reset(value, seconds):
+    assert parse_reset(value) == (pytest.approx(seconds) if seconds is not None else None)
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("x" * 100, 200) == 250
+
+
+@pytest.fixture
+def groq(monkeypatch):
+    """GroqClient 通过 MockTransport 访问按 handler 返回的假接口，使用独立的限流器"""
+    monkeypatch.setenv("GROQ_API_KEY", "test-key")
+    limiter = ProviderRateLimiter("groq", rpm=1000, tpm=10000)
+    monkeypatch.setitem(rate_limiters._limiters, "groq", limiter)
+    real_client = httpx.AsyncClient
+
+    def use(handler):
+        monkeypatch.setattr(groq_client.httpx, "AsyncClient",
+                            lambda **kwargs: real_client(transport=httpx.MockTransport(handler)))
+        return GroqClient(), limiter
+
+    return use
+
+
+def test_failed_attempts_refund_their_reservation(groq):
+    def handler(request):
+        return httpx.Response(500, json={"error": "upstream down"})
+
+    client, limiter = groq(handler)
+    text = asyncio.run(client.generate_text("写一首诗", max_tokens=500))
+
+    assert text  # 所有模型失败后返回备用文本
+    assert limiter.tokens.tokens == pytest.approx(limiter.tokens.capacity, abs=1)
+
+
+def test_successful_attempt_settles_to_actual_usage(groq):
+    def handler(request):
+        return httpx.Response(200, json={
+            "choices": [{"message": {"content": "春风"}}],
+            "usage": {"total_tokens": 42}
+        })
+
+    client, limiter = groq(handler)
+    assert asyncio.run(client.generate_text("写一首诗", max_tokens=500)) == "春风"
+    assert limiter.tokens.tokens == pytest.approx(limiter.tokens.capacity - 42, abs=1)
+
+
+def test_failed_stream_refunds_its_reservation(groq):
+    def handler(request):
+        if b'"stream": true' in request.content or b'"stream":true' in request.content:
+            return httpx.Response(503, text="overloaded")
+        return httpx.Response(200, json={"choices": [{"message": {"content": "备用"}}], "usage": {"total_tokens": 10}})
+
+    client, limiter = groq(handler)
+
+    async def collect():
+        return [chunk async for chunk in client.generate_text_stream("写一首诗", max_tokens=500)]
+
+    assert asyncio.run(collect()) == ["备用"]
+    # 流式请求的预留全部退还，只扣除非流式重试的实际用量
+    assert limiter.tokens.tokens == pytest.approx(limiter.tokens.capacity - 10, abs=1)
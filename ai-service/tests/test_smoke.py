@@ -0,0 +1,17 @@
+"""
+启动冒烟测试：main 能被导入，各路由按部署模式挂载
+路由导入失败时 main 只捕获 ImportError，其他异常（如缺少类型导入的 NameError）会让服务无法启动。
+"""
+import importlib
+
+
+def test_import_main():
+    main = importlib.import_module("main")
+    paths = {route.path for route in main.app.routes}
+    assert {"/", "/health", "/health/ready"} <= paths
+
+
+def test_workflow_router_mounted():
+    main = importlib.import_module("main")
+    paths = {route.path for route in main.app.routes}
+    assert any(path.startswith("/api/v1/workflow/") for path in paths)
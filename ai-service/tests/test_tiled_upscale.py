@@ -0,0 +1,95 @@
+"""
+分块放大：拼接结果与整图放大一致，按行带流式输出合法的PNG，超过像素上限时拒绝
+"""
+import io
+import sys
+
+import pytest
+from PIL import Image, ImageChops
+
+from src.utils import tiled_upscale
+from src.utils.image_ingest import ImageIngestError
+from src.utils.tiled_upscale import iter_upscaled_png, resample_upscaler
+
+
+def _gradient(size=(100, 70), mode="RGB") -> Image.Image:
+    """带噪声的渐变，分块接缝处的错误会显示为像素差异"""
+    image = Image.effect_mandelbrot(size, (-2, -1.2, 0.8, 1.2), 60).convert("RGB")
+    return image.convert(mode)
+
+
+def _decode(chunks) -> Image.Image:
+    image = Image.open(io.BytesIO(b"".join(chunks)))
+    image.load()
+    return image
+
+
+def _identical(a: Image.Image, b: Image.Image) -> bool:
+    return ImageChops.difference(a, b).getbbox() is None
+
+
+@pytest.mark.parametrize("mode", ["RGB", "RGBA", "L"])
+def test_tiles_match_whole_image_upscale(mode):
+    image = _gradient(mode=mode)
+
+    result = _decode(iter_upscaled_png(image, 3, tile_size=32))
+
+    assert (result.mode, result.size) == (mode, (300, 210))
+    expected = image.resize((300, 210), Image.Resampling.LANCZOS)
+    assert _identical(result, expected)
+
+
+def test_output_is_streamed_band_by_band():
+    # 噪声几乎不可压缩，每个行带都会产出压缩数据
+    image = Image.merge("RGB", [Image.effect_noise((128, 128), 80)] * 3)
+
+    chunks = list(iter_upscaled_png(image, 2, tile_size=32))
+
+    # 签名和IHDR、每个行带一个IDAT、最后的IDAT和IEND
+    assert chunks[0].startswith(b"\x89PNG\r\n\x1a\n")
+    assert [chunk[4:8] for chunk in chunks[1:-1]] == [b"IDAT"] * 4
+    assert chunks[-1].endswith(b"IEND\xaeB`\x82")
+    assert _decode(chunks).size == (256, 256)
+
+
+def test_custom_upscaler_sees_padded_tiles():
+    seen = []
+
+    def upscaler(tile, scale):
+        seen.append(tile.size)
+        return resample_upscaler(Image.Resampling.NEAREST)(tile, scale)
+
+    image = _gradient((64, 64))
+    result = _decode(iter_upscaled_png(image, 2, upscaler=upscaler, tile_size=32, overlap=4))
+
+    assert sorted(seen) == [(36, 36)] * 4
+    assert _identical(result, image.resize((128, 128), Image.Resampling.NEAREST))
+
+
+def test_palette_image_is_converted_to_rgb():
+    result = _decode(iter_upscaled_png(_gradient().convert("P"), 2))
+    assert result.mode == "RGB"
+
+
+def test_unfiltered_rows_without_numpy(monkeypatch):
+    monkeypatch.setitem(sys.modules, "numpy", None)
+    image = _gradient()
+
+    result = _decode(iter_upscaled_png(image, 2, tile_size=24))
+
+    assert _identical(result, image.resize((200, 140), Image.Resampling.LANCZOS))
+
+
+def test_rejects_outputs_over_the_pixel_limit(monkeypatch):
+    monkeypatch.setattr(tiled_upscale.settings, "MAX_UPSCALE_PIXELS", 100 * 70 * 4 - 1)
+
+    with pytest.raises(ImageIngestError) as error:
+        next(iter_upscaled_png(_gradient(), 2))
+    assert error.value.status_code == 413
+
+
+def test_stopping_early_closes_cleanly():
+    chunks = iter_upscaled_png(_gradient((200, 200)), 2, tile_size=16)
+    next(chunks)
+    next(chunks)
+    chunks.close()
@@ -0,0 +1,85 @@
+"""
+链路追踪：traceparent 解析与传播，按上游的采样标记决定是否导出
+"""
+import asyncio
+import json
+
+import pytest
+
+from src.utils.tracing import Tracer, parse_traceparent
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+PARENT_ID = "00f067aa0ba902b7"
+
+
+@pytest.mark.parametrize("header,sampled", [
+    (f"00-{TRACE_ID}-{PARENT_ID}-01", True),
+    (f"00-{TRACE_ID}-{PARENT_ID}-00", False),
+    (f"01-{TRACE_ID}-{PARENT_ID}-03-extra", True),
+])
+def test_parse_valid_traceparent(header, sampled):
+    context = parse_traceparent(header)
+    assert (context.trace_id, context.span_id, context.sampled) == (TRACE_ID, PARENT_ID, sampled)
+
+
+@pytest.mark.parametrize("header", [
+    None, "", "garbage", f"ff-{TRACE_ID}-{PARENT_ID}-01", f"00-{TRACE_ID}-{PARENT_ID}-01-extra",
+    f"00-{'0' * 32}-{PARENT_ID}-01", f"00-{TRACE_ID}-{'0' * 16}-01", f"00-{TRACE_ID}-{PARENT_ID}-zz",
+])
+def test_parse_invalid_traceparent(header):
+    assert parse_traceparent(header) is None
+
+
+def _exported(path):
+    if not path.exists():
+        return []
+    return [span for line in path.read_text().splitlines()
+            for resource in json.loads(line)["resourceSpans"]
+            for scope in resource["scopeSpans"]
+            for span in scope["spans"]]
+
+
+@pytest.fixture
+def tracer(tmp_path):
+    tracer = Tracer()
+    tracer.configure(True, str(tmp_path / "spans.jsonl"))
+    return tracer
+
+
+def test_sampled_parent_exports_children_in_the_same_trace(tracer, tmp_path):
+    async def run():
+        with tracer.start_span("server", kind="server", parent=parse_traceparent(f"00-{TRACE_ID}-{PARENT_ID}-01")) as root:
+            await asyncio.gather(*(child(i) for i in range(2)))
+        return root
+
+    async def child(i):
+        with tracer.start_span(f"child {i}", kind="client") as span:
+            return span
+
+    root = asyncio.run(run())
+    spans = {span["name"]: span for span in _exported(tmp_path / "spans.jsonl")}
+
+    assert root.traceparent == f"00-{TRACE_ID}-{root.span_id}-01"
+    assert spans["server"]["parentSpanId"] == PARENT_ID
+    assert {spans[f"child {i}"]["parentSpanId"] for i in range(2)} == {root.span_id}
+    assert {span["traceId"] for span in spans.values()} == {TRACE_ID}
+
+
+def test_unsampled_parent_propagates_without_exporting(tracer, tmp_path):
+    parent = parse_traceparent(f"00-{TRACE_ID}-{PARENT_ID}-00")
+    with tracer.start_span("server", kind="server", parent=parent) as root:
+        with tracer.start_span("child") as child:
+            pass
+    tracer.flush()
+
+    assert root.traceparent == f"00-{TRACE_ID}-{root.span_id}-00"
+    assert child.traceparent.endswith("-00")
+    assert _exported(tmp_path / "spans.jsonl") == []
+
+
+def test_new_traces_are_sampled(tracer, tmp_path):
+    with tracer.start_span("job") as span:
+        pass
+
+    assert span.traceparent.endswith("-01")
+    assert [exported["name"] for exported in _exported(tmp_path / "spans.jsonl")] == ["job"]
@@ -0,0 +1,181 @@
+"""
+SQLite Broker 与工作进程：按租约认领、租约过期后回收、取消，心跳失败时交还任务
+"""
+import asyncio
+from typing import Any, Dict
+
+import pytest
+
+from services.workflow_broker import SQLiteWorkflowBroker
+from services.workflow_engine import NodeType, WorkflowEngine, WorkflowNode, WorkflowNodeExecutor
+from services.workflow_worker import WorkflowWorker
+
+WORKFLOW = {
+    "id": "sleepy",
+    "nodes": [{"id": "wait", "type": NodeType.TEXT_GENERATION.value, "config": {"seconds": 0.05}}],
+    "edges": []
+}
+
+
+class SleepExecutor(WorkflowNodeExecutor):
+    """等待配置的时间后返回"""
+
+    async def execute(self, node: WorkflowNode, context: Dict[str, Any]) -> Any:
+        await asyncio.sleep(node.config["seconds"])
+        return {node.id: "done"}
+
+    def validate_config(self, config: Dict[str, Any]) -> bool:
+        return "seconds" in config
+
+
+@pytest.fixture
+def broker(tmp_path):
+    broker = SQLiteWorkflowBroker(str(tmp_path / "broker.db"))
+    yield broker
+    asyncio.run(broker.close())
+
+
+def _workflow(seconds: float) -> Dict[str, Any]:
+    return {**WORKFLOW, "nodes": [{**WORKFLOW["nodes"][0], "config": {"seconds": seconds}}]}
+
+
+def test_jobs_are_claimed_once_in_submission_order(broker):
+    async def run():
+        await broker.enqueue("first", WORKFLOW, {"n": 1})
+        await broker.enqueue("second", WORKFLOW, {"n": 2})
+        return [await broker.claim(f"worker-{i}", 30) for i in range(3)]
+
+    first, second, none = asyncio.run(run())
+
+    assert (first["id"], first["attempts"], first["input_data"]) == ("first", 1, {"n": 1})
+    assert first["workflow"]["id"] == "sleepy"
+    assert second["id"] == "second"
+    assert none is None
+    assert asyncio.run(broker.get("first"))["worker_id"] == "worker-0"
+
+
+def test_expired_lease_is_reclaimed_by_another_worker(broker):
+    async def run():
+        await broker.enqueue("job", WORKFLOW, {})
+        await broker.claim("crashed", lease_timeout=-1)
+        reclaimed = await broker.claim("healthy", lease_timeout=30)
+        # 失去租约的工作进程的心跳和上报不会覆盖新的持有者
+        await broker.heartbeat("job", "crashed", {"status": "running"}, 30)
+        await broker.complete("job", "crashed", {"status": "failed"})
+        return reclaimed, await broker.get("job")
+
+    reclaimed, job = asyncio.run(run())
+
+    assert reclaimed["attempts"] == 2
+    assert (job["status"], job["worker_id"], job["snapshot"]) == ("running", "healthy", None)
+
+
+def test_cancel_pending_and_running_jobs(broker):
+    async def run():
+        await broker.enqueue("pending", WORKFLOW, {})
+        await broker.enqueue("running", WORKFLOW, {})
+        await broker.claim("worker", 30)  # 认领 pending
+        cancelled_pending = await broker.request_cancel("running")
+        await broker.enqueue("later", WORKFLOW, {})
+        claimed = await broker.claim("worker", 30)
+        cancel_running = await broker.request_cancel("pending")
+        seen_by_worker = await broker.heartbeat("pending", "worker", {"status": "running"}, 30)
+        return cancelled_pending, claimed, cancel_running, seen_by_worker
+
+    cancelled_pending, claimed, cancel_running, seen_by_worker = asyncio.run(run())
+
+    assert cancelled_pending
+    assert asyncio.run(broker.get("running"))["status"] == "cancelled"
+    assert claimed["id"] == "later"
+    assert cancel_running and seen_by_worker
+    assert not asyncio.run(broker.request_cancel("missing"))
+
+
+def test_release_returns_the_job_to_the_queue(broker):
+    async def run():
+        await broker.enqueue("job", WORKFLOW, {})
+        await broker.claim("draining", 30)
+        await broker.release("job", "draining")
+        return await broker.claim("other", 30)
+
+    assert asyncio.run(run())["attempts"] == 2
+
+
+def _worker(broker, **kwargs) -> WorkflowWorker:
+    engine = WorkflowEngine()
+    engine.register_executor(NodeType.TEXT_GENERATION, SleepExecutor())
+    return WorkflowWorker(engine, broker, worker_id="worker", poll_interval=0.01,
+                          heartbeat_interval=0.01, **kwargs)
+
+
+async def _wait_for(broker, execution_id: str, statuses, timeout: float = 5.0) -> Dict[str, Any]:
+    for _ in range(int(timeout / 0.01)):
+        job = await broker.get(execution_id)
+        if job["status"] in statuses:
+            return job
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"{execution_id} stuck in {job['status']}")
+
+
+def test_worker_completes_job_and_forgets_it(broker):
+    worker = _worker(broker)
+
+    async def run():
+        await broker.enqueue("job", WORKFLOW, {})
+        running = asyncio.create_task(worker.run(drain_timeout=1.0))
+        job = await _wait_for(broker, "job", {"completed", "failed"})
+        worker.request_stop()
+        await running
+        return job
+
+    job = asyncio.run(run())
+
+    assert job["status"] == "completed"
+    assert job["snapshot"]["output_data"]["wait"] == "done"
+    assert worker.engine.workflows == {} and worker.engine.executions == {}
+
+
+def test_worker_cancels_job_on_request(broker):
+    worker = _worker(broker)
+
+    async def run():
+        await broker.enqueue("job", _workflow(30), {})
+        running = asyncio.create_task(worker.run(drain_timeout=1.0))
+        await _wait_for(broker, "job", {"running"})
+        await broker.request_cancel("job")
+        job = await _wait_for(broker, "job", {"cancelled"})
+        worker.request_stop()
+        await running
+        return job
+
+    assert asyncio.run(run())["snapshot"]["status"] == "cancelled"
+    assert worker.active_jobs == {}
+
+
+class FlakyHeartbeatBroker(SQLiteWorkflowBroker):
+    """心跳总是失败"""
+
+    async def heartbeat(self, *args, **kwargs):
+        raise ConnectionError("broker unreachable")
+
+
+def test_worker_releases_job_when_heartbeat_fails(tmp_path):
+    broker = FlakyHeartbeatBroker(str(tmp_path / "broker.db"))
+    worker = _worker(broker, concurrency=1)
+
+    async def run():
+        await broker.enqueue("job", _workflow(30), {})
+        claimed = asyncio.create_task(worker.run(drain_timeout=1.0))
+        while (await broker.get("job"))["attempts"] < 2:
+            await asyncio.sleep(0.01)
+        worker.request_stop()
+        await claimed
+        return await broker.get("job")
+
+    job = asyncio.run(run())
+    asyncio.run(broker.close())
+
+    # 每次心跳失败都交还了任务，随后被重新认领；停止后任务留在队列中
+    assert job["attempts"] >= 2
+    assert job["status"] == "pending"
+    assert worker.active_jobs == {} and worker.engine.workflows == {}
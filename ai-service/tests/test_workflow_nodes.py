@@ -0,0 +1,47 @@
+"""
+内置的输入/输出节点：不注册任何服务时也能执行，缺少输入字段时执行失败
+"""
+import asyncio
+from typing import Any, Dict
+
+from benchmarks.scenarios import TEXT_WORKFLOW
+from services.workflow_engine import (
+    NodeType, TextGenerationExecutor, WorkflowDefinition, WorkflowEngine, WorkflowStatus
+)
+
+
+class EchoTextService:
+    """把提示词原样作为生成结果"""
+
+    async def generate_text(self, prompt: str, **kwargs) -> Dict[str, Any]:
+        return {"text": f"<{prompt}>"}
+
+
+def _run(input_data: Dict[str, Any]):
+    engine = WorkflowEngine()
+    engine.register_executor(NodeType.TEXT_GENERATION, TextGenerationExecutor(EchoTextService()))
+    workflow = WorkflowDefinition.from_dict({**TEXT_WORKFLOW, "id": "text_workflow"})
+    engine.create_workflow(workflow)
+
+    async def execute():
+        execution_id = await engine.execute_workflow(workflow.id, input_data)
+        await engine.running_executions[execution_id]
+        return engine.executions[execution_id]
+
+    return asyncio.run(execute())
+
+
+def test_text_workflow_runs_with_builtin_input_and_output_nodes():
+    execution = _run({"topic": "海边日落", "target_audience": "大众读者", "tone": "轻松"})
+
+    assert execution.status == WorkflowStatus.COMPLETED
+    text = execution.output_data["output"]["text"]
+    # 正文的提示词包含大纲，大纲的提示词包含输入的主题
+    assert text.startswith("<根据以下大纲写一篇完整的博客文章：<为主题'海边日落'")
+
+
+def test_missing_input_field_fails_the_execution():
+    execution = _run({"topic": "海边日落"})
+
+    assert execution.status == WorkflowStatus.FAILED
+    assert "target_audience" in execution.error
@@ -0,0 +1,120 @@
+"""
+公平队列：容量与每用户配额，按开始时间公平排队，取消的请求不占用槽位
+"""
+import asyncio
+from typing import List
+
+from services.workflow_scheduler import FairQueue, WorkflowScheduler
+
+
+async def _take_turn(queue: FairQueue, order: List[str], user_id: str, name: str, weight: float = 1.0):
+    await queue.acquire(user_id, weight=weight)
+    order.append(name)
+    await asyncio.sleep(0)
+    queue.release(user_id)
+
+
+async def _queue_behind_holder(queue: FairQueue, requests) -> List[str]:
+    """先占满槽位，让请求依次排队，再放开槽位，返回放行顺序"""
+    order: List[str] = []
+    for _ in range(queue.capacity):
+        await queue.acquire("holder")
+    tasks = []
+    for args in requests:
+        tasks.append(asyncio.create_task(_take_turn(queue, order, *args)))
+        await asyncio.sleep(0)
+    for _ in range(queue.capacity):
+        queue.release("holder")
+    await asyncio.gather(*tasks)
+    return order
+
+
+def test_grants_immediately_up_to_capacity():
+    async def run():
+        queue = FairQueue("test", capacity=2)
+        await queue.acquire("a")
+        await queue.acquire("b")
+        third = asyncio.create_task(queue.acquire("c"))
+        await asyncio.sleep(0)
+        blocked = (not third.done(), queue.waiting)
+        queue.release("a")
+        await third
+        return blocked, queue.get_stats()
+
+    blocked, stats = asyncio.run(run())
+
+    assert blocked == (True, 1)
+    assert stats["active"] == 2 and stats["waiting"] == 0
+    assert stats["active_by_user"] == {"b": 1, "c": 1}
+
+
+def test_user_over_quota_waits_while_others_run():
+    async def run():
+        queue = FairQueue("test", capacity=3, per_user_limit=1)
+        await queue.acquire("a")
+        second_a = asyncio.create_task(queue.acquire("a"))
+        await asyncio.sleep(0)
+        await asyncio.wait_for(queue.acquire("b"), timeout=1)
+        waiting = not second_a.done()
+        queue.release("a")
+        await asyncio.wait_for(second_a, timeout=1)
+        return waiting, queue.get_stats()["active_by_user"]
+
+    waiting, active = asyncio.run(run())
+
+    assert waiting
+    assert active == {"a": 1, "b": 1}
+
+
+def test_interactive_user_is_not_stuck_behind_a_bulk_submitter():
+    requests = [("bulk", f"bulk-{i}") for i in range(5)] + [("interactive", "interactive")]
+
+    order = asyncio.run(_queue_behind_holder(FairQueue("test", capacity=1), requests))
+
+    assert order[:2] == ["bulk-0", "interactive"]
+    assert order[2:] == [f"bulk-{i}" for i in range(1, 5)]
+
+
+def test_heavier_user_gets_more_turns():
+    requests = []
+    for i in range(4):
+        requests += [("light", f"light-{i}", 1.0), ("heavy", f"heavy-{i}", 3.0)]
+
+    order = asyncio.run(_queue_behind_holder(FairQueue("test", capacity=1), requests))
+
+    # 权重为3的用户每轮放行三次
+    assert order.index("heavy-3") < order.index("light-2")
+    assert sum(name.startswith("heavy") for name in order[:6]) == 4
+
+
+def test_cancelled_waiter_does_not_take_a_slot():
+    async def run():
+        queue = FairQueue("test", capacity=1)
+        await queue.acquire("a")
+        cancelled = asyncio.create_task(queue.acquire("b"))
+        later = asyncio.create_task(queue.acquire("c"))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        await asyncio.gather(cancelled, return_exceptions=True)
+        queue.release("a")
+        await asyncio.wait_for(later, timeout=1)
+        return queue.get_stats()
+
+    stats = asyncio.run(run())
+
+    assert stats["active_by_user"] == {"c": 1}
+    assert stats["waiting"] == 0
+
+
+def test_node_types_without_limit_are_not_queued():
+    scheduler = WorkflowScheduler(max_concurrent_executions=1, node_type_limits={"image_generation": 1})
+
+    async def run():
+        async with scheduler.node_slot("text_generation", "a"), scheduler.node_slot("text_generation", "b"):
+            pass
+        async with scheduler.node_slot("image_generation", "a"):
+            return scheduler.get_stats()["node_types"]
+
+    assert asyncio.run(run()) == {"image_generation": {
+        "capacity": 1, "per_user_limit": None, "active": 1, "waiting": 0, "active_by_user": {"a": 1}
+    }}
@@ -0,0 +1,133 @@
+"""
+流式推测执行：上游流式产出标题后下游提前启动，最终结果与推测时的部分不一致时取消并重新执行
+"""
+import asyncio
+from typing import Any, Dict, List
+
+from services.workflow_engine import (
+    NodeType, TextGenerationExecutor, WorkflowDefinition, WorkflowEngine, WorkflowNode, WorkflowNodeExecutor,
+    WorkflowStatus
+)
+
+
+class FakeStreamingTextExecutor(WorkflowNodeExecutor):
+    """依次产出若干部分结果，最后一个为完整结果"""
+
+    def __init__(self, partials: List[str], final: str):
+        self.partials = partials
+        self.final = final
+
+    async def execute(self, node: WorkflowNode, context: Dict[str, Any]) -> Any:
+        return {"text": self.final}
+
+    async def execute_stream(self, node: WorkflowNode, context: Dict[str, Any]):
+        for text in self.partials:
+            yield {"text": text, "partial": True}
+            await asyncio.sleep(0.02)
+        yield {"text": self.final}
+
+    def validate_config(self, config: Dict[str, Any]) -> bool:
+        return True
+
+
+class FakeStreamingTextService:
+    """按块产出文本的文本服务，接口与 ModelManagerTextService 相同"""
+
+    def __init__(self, chunks: List[str]):
+        self.chunks = chunks
+
+    async def generate_text(self, prompt: str, **kwargs) -> Dict[str, Any]:
+        return {"text": "".join(self.chunks)}
+
+    async def generate_text_stream(self, prompt: str, **kwargs):
+        for chunk in self.chunks:
+            yield chunk
+            await asyncio.sleep(0.02)
+
+
+class RecordingCoverExecutor(WorkflowNodeExecutor):
+    """记录每次执行收到的标题，被取消的执行单独记录"""
+
+    def __init__(self):
+        self.started: List[str] = []
+        self.cancelled: List[str] = []
+
+    async def execute(self, node: WorkflowNode, context: Dict[str, Any]) -> Any:
+        title = context["title"]
+        self.started.append(title)
+        try:
+            await asyncio.sleep(0.1)
+        except asyncio.CancelledError:
+            self.cancelled.append(title)
+            raise
+        return {"cover_title": title}
+
+    def validate_config(self, config: Dict[str, Any]) -> bool:
+        return True
+
+
+def _run(partials: List[str], final: str, text_executor: WorkflowNodeExecutor = None):
+    engine = WorkflowEngine()
+    cover = RecordingCoverExecutor()
+    engine.register_executor(NodeType.TEXT_GENERATION, text_executor or FakeStreamingTextExecutor(partials, final))
+    engine.register_executor(NodeType.IMAGE_GENERATION, cover)
+    workflow = WorkflowDefinition(
+        id="speculation_test",
+        name="speculation",
+        description="",
+        version="1.0",
+        nodes=[
+            WorkflowNode(id="copy", type=NodeType.TEXT_GENERATION, name="文案", description="",
+                         config={"prompt": "写文案"}),
+            WorkflowNode(id="cover", type=NodeType.IMAGE_GENERATION, name="封面", description="",
+                         config={"stream_from": {"node": "copy", "field": "title"}})
+        ],
+        edges=[{"from": "copy", "to": "cover"}]
+    )
+    engine.create_workflow(workflow)
+
+    async def execute():
+        execution_id = await engine.execute_workflow(workflow.id, {})
+        await engine.running_executions[execution_id]
+        return engine.executions[execution_id]
+
+    return asyncio.run(execute()), cover
+
+
+def test_speculation_hit_reuses_speculative_result():
+    execution, cover = _run(["春日\n花", "春日\n花开"], "春日\n花开满园")
+
+    assert execution.status == WorkflowStatus.COMPLETED
+    assert cover.started == ["春日"]
+    assert cover.cancelled == []
+    assert execution.output_data["cover_title"] == "春日"
+    assert execution.node_timings["cover"]["speculation"] == "hit"
+
+
+def test_speculation_miss_cancels_and_reruns_with_final_output():
+    execution, cover = _run(["春日\n花", "春日\n花开"], "秋夕\n落叶满阶")
+
+    assert execution.status == WorkflowStatus.COMPLETED
+    assert cover.started == ["春日", "秋夕"]
+    assert cover.cancelled == ["春日"]
+    assert execution.output_data["cover_title"] == "秋夕"
+    assert execution.node_timings["cover"]["speculation"] == "miss"
+
+
+def test_no_speculation_before_title_line_completes():
+    execution, cover = _run(["春", "春日"], "春日\n花开满园")
+
+    assert execution.status == WorkflowStatus.COMPLETED
+    assert cover.started == ["春日"]
+    assert "speculative" not in execution.node_timings["cover"]
+
+
+def test_text_generation_executor_streams_into_speculation():
+    executor = TextGenerationExecutor(FakeStreamingTextService(["春日\n", "花开", "满园"]))
+    execution, cover = _run([], "", text_executor=executor)
+
+    assert execution.status == WorkflowStatus.COMPLETED
+    assert execution.output_data["text"] == "春日\n花开满园"
+    assert cover.started == ["春日"]
+    assert execution.node_timings["cover"]["speculative"] is True
+    assert execution.node_timings["cover"]["speculation"] == "hit"
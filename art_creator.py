@@ -41,8 +41,10 @@ class ArtCreator:
                       quality: str = "high") -> Dict:
         """创作艺术作品"""
         
-        # 质量设置映射
+        # 质量设置映射（服务端按 quality 档位选择采样器，preview/draft 使用少步数蒸馏模型，
+        # 这里的步数只在服务端不支持该档位时使用）
         quality_settings = {
+            "preview": {"steps": 10, "guidance": 6.0},
             "draft": {"steps": 15, "guidance": 6.0},
             "normal": {"steps": 20, "guidance": 7.5},
             "high": {"steps": 25, "guidance": 8.0},
@@ -61,7 +63,8 @@ class ArtCreator:
                     "height": height,
                     "num_inference_steps": settings["steps"],
                     "guidance_scale": settings["guidance"],
-                    "num_images": 1
+                    "num_images": 1,
+                    "quality": quality
                 },
                 timeout=120
             )
@@ -75,7 +78,8 @@ class ArtCreator:
                         "prompt": result["data"]["prompt"],
                         "style": style,
                         "dimensions": {"width": width, "height": height},
-                        "quality": quality
+                        # 服务端实际运行的档位（适配器不可用时会回退到 normal）
+                        "quality": (result["data"].get("quality") or {}).get("tier") or quality
                     }
                 else:
                     return {"success": False, "error": result.get("error", "生成失败")}
@@ -217,7 +221,7 @@ def free_creation(creator):
     width, height = sizes.get(size_choice, (512, 512))
     
     # 选择质量
-    quality = input("请选择质量 (draft/normal/high/ultra) [high]: ").strip() or "high"
+    quality = input("请选择质量 (preview/draft/normal/high/ultra) [high]: ").strip() or "high"
     
     print(f"\n🎯 开始创作 {creator.styles[style_key]} 作品...")
     print(f"   描述: {prompt}")
@@ -0,0 +1,20 @@
+package handler
+
+import (
+	"github.com/gin-gonic/gin"
+
+	"youcreator.ai/backend/internal/service"
+)
+
+// Traceparent 读取或生成 W3C traceparent，并通过请求上下文传递给AI服务调用
+func Traceparent() gin.HandlerFunc {
+	return func(c *gin.Context) {
+		traceparent := c.GetHeader(service.TraceparentHeader)
+		if !service.ValidTraceparent(traceparent) {
+			traceparent = service.NewTraceparent()
+		}
+		c.Request = c.Request.WithContext(service.ContextWithTraceparent(c.Request.Context(), traceparent))
+		c.Header(service.TraceparentHeader, traceparent)
+		c.Next()
+	}
+}
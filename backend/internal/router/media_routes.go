@@ -17,6 +17,9 @@ func SetupMediaRoutes(r *gin.RouterGroup, mediaHandler *handler.MediaHandler) {
 	// 应用速率限制中间件
 	media.Use(middleware.RateLimit(10, 60)) // 每分钟10次请求
 	
+	// 传递 W3C traceparent 到AI服务
+	media.Use(handler.Traceparent())
+	
 	// 文字生成图片
 	media.POST("/text-to-image", mediaHandler.TextToImage)
 	
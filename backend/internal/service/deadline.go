@@ -0,0 +1,24 @@
+package service
+
+import (
+	"net/http"
+	"strconv"
+	"time"
+)
+
+// RequestTimeoutHeader 告知AI服务本次请求剩余的时间（秒），AI服务据此限制提供商调用和备用方案的总耗时
+const RequestTimeoutHeader = "X-Request-Timeout"
+
+// setRequestTimeout 按上下文的截止时间设置超时头，上下文没有截止时间时使用HTTP客户端的超时
+func setRequestTimeout(req *http.Request, clientTimeout time.Duration) {
+	timeout := clientTimeout
+	if deadline, ok := req.Context().Deadline(); ok {
+		if remaining := time.Until(deadline); remaining < timeout || timeout == 0 {
+			timeout = remaining
+		}
+	}
+	if timeout <= 0 {
+		return
+	}
+	req.Header.Set(RequestTimeoutHeader, strconv.FormatFloat(timeout.Seconds(), 'f', 3, 64))
+}
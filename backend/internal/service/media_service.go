@@ -144,6 +144,8 @@ func (s *MediaService) BatchGenerate(ctx context.Context, req *BatchGenerateRequ
 	if err != nil {
 		return nil, fmt.Errorf("failed to create request: %w", err)
 	}
+	setTraceparent(ctx, httpReq)
+	setRequestTimeout(httpReq, s.client.Timeout)
 
 	httpReq.Header.Set("Content-Type", "application/json")
 
@@ -198,6 +200,8 @@ func (s *MediaService) UploadImageAndGenerateMusic(ctx context.Context, imageDat
 	if err != nil {
 		return nil, fmt.Errorf("failed to create request: %w", err)
 	}
+	setTraceparent(ctx, httpReq)
+	setRequestTimeout(httpReq, s.client.Timeout)
 
 	httpReq.Header.Set("Content-Type", writer.FormDataContentType())
 
@@ -230,6 +234,8 @@ func (s *MediaService) GetAvailableStyles(ctx context.Context) (map[string]inter
 	if err != nil {
 		return nil, fmt.Errorf("failed to create request: %w", err)
 	}
+	setTraceparent(ctx, httpReq)
+	setRequestTimeout(httpReq, s.client.Timeout)
 
 	resp, err := s.client.Do(httpReq)
 	if err != nil {
@@ -265,6 +271,8 @@ func (s *MediaService) callAIService(ctx context.Context, endpoint string, data
 	if err != nil {
 		return nil, fmt.Errorf("failed to create request: %w", err)
 	}
+	setTraceparent(ctx, httpReq)
+	setRequestTimeout(httpReq, s.client.Timeout)
 
 	httpReq.Header.Set("Content-Type", "application/json")
 
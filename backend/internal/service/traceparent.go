@@ -0,0 +1,59 @@
+package service
+
+import (
+	"context"
+	"crypto/rand"
+	"encoding/hex"
+	"net/http"
+	"strings"
+)
+
+// TraceparentHeader W3C Trace Context 请求头
+const TraceparentHeader = "traceparent"
+
+type traceparentKey struct{}
+
+// ContextWithTraceparent 把入站请求的 traceparent 放入上下文，调用AI服务时继续传递
+func ContextWithTraceparent(ctx context.Context, traceparent string) context.Context {
+	return context.WithValue(ctx, traceparentKey{}, traceparent)
+}
+
+// TraceparentFromContext 读取上下文中的 traceparent
+func TraceparentFromContext(ctx context.Context) string {
+	if value, ok := ctx.Value(traceparentKey{}).(string); ok {
+		return value
+	}
+	return ""
+}
+
+// ValidTraceparent 检查 traceparent 格式: 00-<32位trace-id>-<16位parent-id>-<2位flags>
+func ValidTraceparent(value string) bool {
+	parts := strings.Split(value, "-")
+	if len(parts) != 4 || len(parts[0]) != 2 || len(parts[1]) != 32 || len(parts[2]) != 16 || len(parts[3]) != 2 {
+		return false
+	}
+	for _, part := range parts {
+		if _, err := hex.DecodeString(part); err != nil {
+			return false
+		}
+	}
+	return parts[1] != strings.Repeat("0", 32) && parts[2] != strings.Repeat("0", 16)
+}
+
+// NewTraceparent 生成新的链路
+func NewTraceparent() string {
+	traceID := make([]byte, 16)
+	spanID := make([]byte, 8)
+	rand.Read(traceID)
+	rand.Read(spanID)
+	return "00-" + hex.EncodeToString(traceID) + "-" + hex.EncodeToString(spanID) + "-01"
+}
+
+// setTraceparent 为发往AI服务的请求设置 traceparent，上下文中没有时开启新的链路
+func setTraceparent(ctx context.Context, req *http.Request) {
+	traceparent := TraceparentFromContext(ctx)
+	if traceparent == "" {
+		traceparent = NewTraceparent()
+	}
+	req.Header.Set(TraceparentHeader, traceparent)
+}
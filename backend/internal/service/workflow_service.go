@@ -540,6 +540,8 @@ func (s *WorkflowService) callAIService(ctx context.Context, method, endpoint st
 	if err != nil {
 		return nil, fmt.Errorf("failed to create request: %w", err)
 	}
+	setTraceparent(ctx, req)
+	setRequestTimeout(req, s.client.Timeout)
 
 	if data != nil {
 		req.Header.Set("Content-Type", "application/json")
@@ -22,6 +22,7 @@ export interface ImageVariationsRequest {
   prompt: string;
   num_variations?: number;
   variation_strength?: number;
+  seed?: number;
 }
 
 export interface ImageUpscaleRequest {